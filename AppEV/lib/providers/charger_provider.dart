@@ -2,6 +2,7 @@ import 'dart:async';
 import 'package:flutter/foundation.dart';
 import 'package:geolocator/geolocator.dart';
 import '../services/api_service.dart';
+import '../services/live_status_service.dart';
 
 class ChargerProvider with ChangeNotifier {
   List<Map<String, dynamic>> _nearbyChargers = [];
@@ -9,6 +10,8 @@ class ChargerProvider with ChangeNotifier {
   String? _error;
   Position? _currentPosition;
   Timer? _pollTimer;
+  LiveStatusStream? _live;
+  StreamSubscription<LiveEvent>? _liveSub;
 
   List<Map<String, dynamic>> get nearbyChargers => _nearbyChargers;
   bool get isLoading => _isLoading;
@@ -18,20 +21,87 @@ class ChargerProvider with ChangeNotifier {
   ChargerProvider() {
     // Auto-load chargers on init
     loadNearbyChargers();
-    // Start polling for live status updates (every 5s)
+    // Live status updates pushed by the server (falls back to 5s polling
+    // while the stream is down)
     startAutoRefresh();
   }
 
   void startAutoRefresh() {
-    _pollTimer?.cancel();
-    _pollTimer = Timer.periodic(const Duration(seconds: 5), (_) {
-      silentRefresh();
-    });
+    stopAutoRefresh();
+    final live = LiveStatusStream();
+    _live = live;
+    _liveSub = live.events.listen(_onLiveEvent);
+    live.connected.addListener(_onLiveConnectionChanged);
+    _onLiveConnectionChanged();
+    live.start();
   }
 
   void stopAutoRefresh() {
     _pollTimer?.cancel();
     _pollTimer = null;
+    _liveSub?.cancel();
+    _liveSub = null;
+    _live?.close();
+    _live = null;
+  }
+
+  void _onLiveConnectionChanged() {
+    _pollTimer?.cancel();
+    _pollTimer = null;
+    if (_live?.connected.value != true) {
+      _pollTimer = Timer.periodic(const Duration(seconds: 5), (_) {
+        silentRefresh();
+      });
+    }
+  }
+
+  void _onLiveEvent(LiveEvent event) {
+    if (event.type == 'snapshot' && event.data is List) {
+      _nearbyChargers = _onlineWithDistance(
+        (event.data as List).whereType<Map<String, dynamic>>().toList(),
+      );
+      notifyListeners();
+    } else if (event.type == 'charger' && event.data is Map<String, dynamic>) {
+      final diff = event.data as Map<String, dynamic>;
+      final cpId = diff['charge_point_id']?.toString();
+      final index = _nearbyChargers.indexWhere((c) => c['charge_point_id'] == cpId);
+      if (index < 0) {
+        // Not in the (online-only) list yet — e.g. came back online.
+        if (diff['status'] == 'online') silentRefresh();
+        return;
+      }
+      final merged = {..._nearbyChargers[index], ...diff};
+      if ((merged['status']?.toString() ?? 'unknown') != 'online') {
+        _nearbyChargers.removeAt(index);
+      } else {
+        _nearbyChargers[index] = merged;
+      }
+      notifyListeners();
+    } else if (event.type == 'removed' && event.data is Map) {
+      final cpId = (event.data as Map)['charge_point_id']?.toString();
+      _nearbyChargers.removeWhere((c) => c['charge_point_id'] == cpId);
+      notifyListeners();
+    }
+  }
+
+  List<Map<String, dynamic>> _onlineWithDistance(List<Map<String, dynamic>> chargers) {
+    final onlineChargers = chargers.where((c) {
+      return (c['status']?.toString() ?? 'unknown') == 'online';
+    }).toList();
+    return onlineChargers.map((c) {
+      double distance = 0;
+      if (_currentPosition != null) {
+        final id = c['id'] ?? 0;
+        distance = 1.0 + (id % 10) * 0.5;
+      }
+      return {
+        ...c,
+        'distance': distance,
+        'charge_point_id': c['charge_point_id']?.toString() ?? '',
+        'availability': c['availability']?.toString() ?? 'unknown',
+        'status': c['status']?.toString() ?? 'unknown',
+      };
+    }).toList();
   }
 
   /// Refresh charger list without showing loading spinner
@@ -41,24 +111,7 @@ class ChargerProvider with ChangeNotifier {
         _currentPosition?.latitude ?? 0,
         _currentPosition?.longitude ?? 0,
       );
-      final onlineChargers = chargers.where((c) {
-        return (c['status']?.toString() ?? 'unknown') == 'online';
-      }).toList();
-      final withDistance = onlineChargers.map((c) {
-        double distance = 0;
-        if (_currentPosition != null) {
-          final id = c['id'] ?? 0;
-          distance = 1.0 + (id % 10) * 0.5;
-        }
-        return {
-          ...c,
-          'distance': distance,
-          'charge_point_id': c['charge_point_id']?.toString() ?? '',
-          'availability': c['availability']?.toString() ?? 'unknown',
-          'status': c['status']?.toString() ?? 'unknown',
-        };
-      }).toList();
-      _nearbyChargers = withDistance;
+      _nearbyChargers = _onlineWithDistance(chargers);
       notifyListeners();
     } catch (_) {
       // Silent fail
@@ -75,7 +128,7 @@ class ChargerProvider with ChangeNotifier {
 
   @override
   void dispose() {
-    _pollTimer?.cancel();
+    stopAutoRefresh();
     super.dispose();
   }
 
@@ -1,6 +1,7 @@
 import 'dart:async';
 import 'package:flutter/foundation.dart';
 import '../services/api_service.dart';
+import '../services/live_status_service.dart';
 
 class SessionProvider with ChangeNotifier {
   Map<String, dynamic>? _activeSession;
@@ -8,6 +9,9 @@ class SessionProvider with ChangeNotifier {
   bool _isLoading = false;
   String? _error;
   Timer? _pollingTimer;
+  LiveStatusStream? _live;
+  StreamSubscription<LiveEvent>? _liveSub;
+  String? _liveChargePointId;
   // When true, keep polling even if _activeSession is null (waiting for OCPP StartTransaction).
   bool _expectingSession = false;
   DateTime? _expectingUntil;
@@ -63,7 +67,22 @@ class SessionProvider with ChangeNotifier {
     // Session energy — API field is `energy_consumed`.
     s['energy'] = s['energy'] ?? s['energy_consumed'] ?? 0;
 
-    // Duration — computed from start_time (treated as MYT if no offset).
+    _updateDuration(s);
+
+    // Live power/voltage/current — from the metering endpoint (power is kW).
+    final cp = s['charge_point_id']?.toString();
+    if (cp != null && cp.isNotEmpty) {
+      final m = await ApiService.getLatestMetering(cp);
+      if (m != null) {
+        s['power'] = m['power'] ?? 0;
+        s['voltage'] = m['voltage'] ?? 0;
+        s['current'] = m['current'] ?? 0;
+      }
+    }
+  }
+
+  /// Duration — computed from start_time (treated as MYT if no offset).
+  void _updateDuration(Map<String, dynamic> s) {
     final st = s['start_time']?.toString();
     if (st != null && st.isNotEmpty) {
       try {
@@ -78,17 +97,6 @@ class SessionProvider with ChangeNotifier {
             : '${m.toString().padLeft(2, '0')}:${sec.toString().padLeft(2, '0')}';
       } catch (_) {}
     }
-
-    // Live power/voltage/current — from the metering endpoint (power is kW).
-    final cp = s['charge_point_id']?.toString();
-    if (cp != null && cp.isNotEmpty) {
-      final m = await ApiService.getLatestMetering(cp);
-      if (m != null) {
-        s['power'] = m['power'] ?? 0;
-        s['voltage'] = m['voltage'] ?? 0;
-        s['current'] = m['current'] ?? 0;
-      }
-    }
   }
 
   Future<void> loadHistory() async {
@@ -110,12 +118,24 @@ class SessionProvider with ChangeNotifier {
     notifyListeners();
   }
 
+  /// Follow the active session live. Session start/stop and meter samples
+  /// for its charger are pushed by the server's status stream; the 5s tick
+  /// only refreshes the duration locally, and hits the API only while the
+  /// stream is down.
   void startPolling() {
     _pollingTimer?.cancel();
+    _connectLive();
     _pollingTimer = Timer.periodic(const Duration(seconds: 5), (_) {
+      final streaming = _live?.connected.value == true;
       // Poll if we have a real session OR we're waiting for one (within window).
       if (_activeSession != null) {
-        loadActiveSession();
+        _connectLive();
+        if (streaming && _activeSession!['pending'] != true) {
+          _updateDuration(_activeSession!);
+          notifyListeners();
+        } else {
+          loadActiveSession();
+        }
       } else if (_expectingSession &&
           _expectingUntil != null &&
           DateTime.now().isBefore(_expectingUntil!)) {
@@ -135,6 +155,52 @@ class SessionProvider with ChangeNotifier {
   void stopPolling() {
     _pollingTimer?.cancel();
     _pollingTimer = null;
+    _disconnectLive();
+  }
+
+  /// (Re)subscribe the live stream to the active session's charger.
+  void _connectLive() {
+    final s = _activeSession;
+    final cpId = (s?['charge_point_id'] ?? s?['charger_id'])?.toString();
+    if (cpId == null || cpId.isEmpty) return;
+    if (_live != null && cpId == _liveChargePointId) return;
+    _disconnectLive();
+    final live = LiveStatusStream(chargePointId: cpId, topics: 'sessions');
+    _live = live;
+    _liveChargePointId = cpId;
+    _liveSub = live.events.listen(_onLiveEvent);
+    live.start();
+  }
+
+  void _disconnectLive() {
+    _liveSub?.cancel();
+    _liveSub = null;
+    _live?.close();
+    _live = null;
+    _liveChargePointId = null;
+  }
+
+  void _onLiveEvent(LiveEvent event) {
+    if (event.type != 'session' || event.data is! Map) return;
+    final data = event.data as Map;
+    final s = _activeSession;
+    if (data['event'] == 'meter' &&
+        s != null &&
+        s['pending'] != true &&
+        data['transaction_id'] == s['transaction_id']) {
+      // Apply the pushed sample directly — no round trip.
+      if (data['energy_kwh'] != null) {
+        s['energy'] = data['energy_kwh'];
+        s['energy_consumed'] = data['energy_kwh'];
+      }
+      if (data['power'] != null) s['power'] = data['power'];
+      if (data['voltage'] != null) s['voltage'] = data['voltage'];
+      if (data['current'] != null) s['current'] = data['current'];
+      _updateDuration(s);
+      notifyListeners();
+    } else if (data['event'] == 'started' || data['event'] == 'stopped') {
+      loadActiveSession();
+    }
   }
 
   Future<bool> stopCharging() async {
@@ -1,4 +1,3 @@
-import 'dart:async';
 import 'package:flutter/material.dart';
 import 'package:flutter/services.dart';
 import 'package:provider/provider.dart';
@@ -27,30 +26,30 @@ class _ChargerDetailScreenState extends State<ChargerDetailScreen> {
   double _avgRating = 0;
   int _reviewCount = 0;
   late Map<String, dynamic> _charger;
-  Timer? _statusTimer;
+  late ChargerProvider _chargerProvider;
 
   @override
   void initState() {
     super.initState();
     _charger = Map<String, dynamic>.from(widget.charger);
     _loadRating();
-    // Poll charger status every 5s for live availability updates
-    _statusTimer = Timer.periodic(const Duration(seconds: 5), (_) => _refreshStatus());
+    // Live availability updates: ChargerProvider applies the server's status
+    // stream and notifies us — no per-screen polling.
+    _chargerProvider = Provider.of<ChargerProvider>(context, listen: false);
+    _chargerProvider.addListener(_refreshStatus);
   }
 
   @override
   void dispose() {
-    _statusTimer?.cancel();
+    _chargerProvider.removeListener(_refreshStatus);
     super.dispose();
   }
 
-  Future<void> _refreshStatus() async {
+  void _refreshStatus() {
     if (!mounted) return;
-    final provider = Provider.of<ChargerProvider>(context, listen: false);
-    await provider.silentRefresh();
     final chargerId = widget.charger['charge_point_id']?.toString() ?? '';
-    final updated = provider.findChargerById(chargerId);
-    if (updated != null && mounted) {
+    final updated = _chargerProvider.findChargerById(chargerId);
+    if (updated != null) {
       setState(() {
         _charger = {..._charger, ...updated};
       });
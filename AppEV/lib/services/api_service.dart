@@ -263,6 +263,24 @@ class ApiService {
     }
   }
 
+  /// Open /api/live/chargers (Server-Sent Events). The caller owns [client]
+  /// and closes it to end the stream — see LiveStatusStream.
+  static Future<http.StreamedResponse> openLiveStream(
+    http.Client client, {
+    String? chargePointId,
+    String topics = 'chargers',
+  }) async {
+    final headers = await _getHeaders();
+    final uri = Uri.parse('$baseUrl/live/chargers').replace(queryParameters: {
+      'topics': topics,
+      if (chargePointId != null && chargePointId.isNotEmpty) 'charge_point_id': chargePointId,
+    });
+    final request = http.Request('GET', uri)
+      ..headers.addAll(headers)
+      ..headers['Accept'] = 'text/event-stream';
+    return client.send(request);
+  }
+
   /// Latest live meter reading for a charger (voltage/current/power/total_kwh).
   /// `power` is already in kW.
   static Future<Map<String, dynamic>?> getLatestMetering(String chargePointId) async {
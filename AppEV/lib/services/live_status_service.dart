@@ -0,0 +1,99 @@
+import 'dart:async';
+import 'dart:convert';
+import 'dart:math';
+import 'package:flutter/foundation.dart';
+import 'package:http/http.dart' as http;
+import 'api_service.dart';
+
+/// One Server-Sent Event from /api/live/chargers.
+///   type: 'snapshot' (data = List), 'charger' (data = Map diff),
+///         'removed', 'session', 'fault'
+class LiveEvent {
+  final String type;
+  final dynamic data;
+  const LiveEvent(this.type, this.data);
+}
+
+/// Long-lived subscription to the server's live charger status stream.
+///
+/// Replaces the 5s Timer.periodic polls: the server pushes a snapshot on
+/// connect and diffs afterwards. Reconnects with backoff (1s → 30s);
+/// [connected] lets callers fall back to polling while the stream is down.
+class LiveStatusStream {
+  LiveStatusStream({this.chargePointId, this.topics = 'chargers'});
+
+  final String? chargePointId;
+  final String topics;
+
+  final StreamController<LiveEvent> _events = StreamController<LiveEvent>.broadcast();
+  final ValueNotifier<bool> connected = ValueNotifier<bool>(false);
+  http.Client? _client;
+  bool _closed = false;
+  int _backoffSeconds = 1;
+
+  Stream<LiveEvent> get events => _events.stream;
+
+  void start() {
+    _run();
+  }
+
+  Future<void> _run() async {
+    while (!_closed) {
+      final client = http.Client();
+      _client = client;
+      try {
+        final response = await ApiService.openLiveStream(
+          client,
+          chargePointId: chargePointId,
+          topics: topics,
+        );
+        if (response.statusCode != 200) {
+          throw http.ClientException('live stream HTTP ${response.statusCode}');
+        }
+        var event = 'message';
+        final data = StringBuffer();
+        final lines = response.stream.transform(utf8.decoder).transform(const LineSplitter());
+        await for (final line in lines) {
+          if (line.isEmpty) {
+            if (data.isNotEmpty) _emit(event, data.toString());
+            event = 'message';
+            data.clear();
+          } else if (line.startsWith('event:')) {
+            event = line.substring(6).trim();
+          } else if (line.startsWith('data:')) {
+            data.write(line.substring(5).trim());
+          }
+        }
+      } catch (e) {
+        if (!_closed) debugPrint('Live stream dropped: $e');
+      } finally {
+        client.close();
+      }
+      if (_closed) break;
+      connected.value = false;
+      await Future.delayed(Duration(seconds: _backoffSeconds));
+      _backoffSeconds = min(_backoffSeconds * 2, 30);
+    }
+  }
+
+  void _emit(String type, String raw) {
+    dynamic decoded;
+    try {
+      decoded = json.decode(raw);
+    } catch (_) {
+      return;
+    }
+    if (type == 'snapshot') {
+      _backoffSeconds = 1;
+      connected.value = true;
+    }
+    if (!_events.isClosed) _events.add(LiveEvent(type, decoded));
+  }
+
+  void close() {
+    _closed = true;
+    _client?.close();
+    _events.close();
+    connected.dispose();
+  }
+}
@@ -0,0 +1,220 @@
+"""
+PlagSini EV — Pre-aggregated Analytics Facts
+
+/api/analytics/overview issued ~30 SUM queries for daily revenue, ~30 COUNTs
+for daily users and ~30 for daily sessions, three queries per charger, and
+loaded every session ever to bucket them by hour; /api/analytics/insights
+repeated half of it. Cost grew with history.
+
+analytics_facts holds the history metrics pre-aggregated per day, hour of
+day, charger, tenant and dimension:
+
+  metric       source                                     value        dimension
+  revenue      completed wallet top-ups (created_at)      RM           payment method
+  sessions     charging sessions (start_time)             count        —
+  energy_kwh   charging sessions (start_time)             kWh          —
+  new_users    users (created_at)                         count        —
+
+A background job (analytics_facts_worker, API process) rebuilds the trailing
+ANALYTICS_REFRESH_DAYS every ANALYTICS_REFRESH_SECONDS, and once a day the
+trailing ANALYTICS_RECONCILE_DAYS so late edits (session energy settling,
+refunds flipping a top-up's status) land too. The first run backfills all
+history. Each rebuilt day is replaced wholesale (delete + insert), so
+re-running is harmless.
+
+Reads are hour-granular: "since 30 days ago" counts the whole hour bucket
+that contains the cut-off. Current-state numbers (chargers online, open
+tickets, wallet balances) are not history and stay live queries.
+
+Usage:
+    from analytics_facts import fact_total, fact_daily
+    revenue, topups = fact_total(db, "revenue", since=now - timedelta(days=30))
+    daily = fact_daily(db, "sessions", first_day, 30)
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, insert, or_
+
+from database import AnalyticsFact, Charger, ChargingSession, User, WalletTransaction, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+ANALYTICS_REFRESH_DAYS = max(1, int(os.getenv("ANALYTICS_REFRESH_DAYS", "2")))
+ANALYTICS_RECONCILE_DAYS = max(1, int(os.getenv("ANALYTICS_RECONCILE_DAYS", "35")))
+# Days rebuilt per transaction during a backfill.
+_CHUNK_DAYS = 31
+
+METRICS = ("revenue", "sessions", "energy_kwh", "new_users")
+
+
+# ─── Build ─────────────────────────────────────────────────────────────────
+
+def _collect(db, start: datetime, end: datetime) -> Dict[Tuple, List]:
+    """{(day, hour, metric, charger_id, tenant, dimension): [value, events]}
+    for source rows in [start, end)."""
+    acc: Dict[Tuple, List] = defaultdict(lambda: [0.0, 0])
+
+    def add(ts: datetime, metric: str, value: float, charger_id=None, tenant=None, dimension=None):
+        key = (ts.date(), ts.hour, metric, charger_id or 0, tenant or "", (dimension or "")[:64])
+        acc[key][0] += value
+        acc[key][1] += 1
+
+    topups = (
+        db.query(WalletTransaction.created_at, WalletTransaction.amount, WalletTransaction.payment_method)
+        .filter(WalletTransaction.transaction_type == "topup",
+                WalletTransaction.status == "completed",
+                WalletTransaction.created_at >= start, WalletTransaction.created_at < end)
+        .yield_per(5000)
+    )
+    for created_at, amount, method in topups:
+        add(created_at, "revenue", float(amount or 0), dimension=method)
+
+    sessions = (
+        db.query(ChargingSession.start_time, ChargingSession.charger_id,
+                 ChargingSession.energy_consumed, Charger.tenant)
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+        .filter(ChargingSession.start_time >= start, ChargingSession.start_time < end)
+        .yield_per(5000)
+    )
+    for start_time, charger_id, energy, tenant in sessions:
+        add(start_time, "sessions", 1, charger_id, tenant)
+        add(start_time, "energy_kwh", float(energy or 0), charger_id, tenant)
+
+    users = db.query(User.created_at).filter(User.created_at >= start, User.created_at < end).yield_per(5000)
+    for (created_at,) in users:
+        add(created_at, "new_users", 1)
+    return acc
+
+
+def rebuild_facts(db, first_day: date, end_day: date) -> int:
+    """Recompute every fact for days [first_day, end_day) in one transaction."""
+    acc = _collect(db, datetime.combine(first_day, time.min), datetime.combine(end_day, time.min))
+    db.query(AnalyticsFact).filter(AnalyticsFact.day >= first_day, AnalyticsFact.day < end_day).delete(
+        synchronize_session=False
+    )
+    rows = [
+        {"day": day, "hour": hour, "metric": metric, "charger_id": charger_id, "tenant": tenant,
+         "dimension": dimension, "value": round(value, 3), "events": events}
+        for (day, hour, metric, charger_id, tenant, dimension), (value, events) in acc.items()
+    ]
+    if rows:
+        db.execute(insert(AnalyticsFact), rows)
+    db.commit()
+    return len(rows)
+
+
+def _earliest_source_day(db) -> Optional[date]:
+    firsts = [
+        db.query(func.min(WalletTransaction.created_at)).scalar(),
+        db.query(func.min(ChargingSession.start_time)).scalar(),
+        db.query(func.min(User.created_at)).scalar(),
+    ]
+    firsts = [f for f in firsts if f is not None]
+    return min(firsts).date() if firsts else None
+
+
+def refresh_facts(db, days: int = ANALYTICS_REFRESH_DAYS, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Rebuild the trailing `days` (through today), or all history if the
+    fact table is still empty."""
+    today = (now or _utcnow()).date()
+    first = today - timedelta(days=days - 1)
+    if db.query(AnalyticsFact.id).first() is None:
+        first = min(first, _earliest_source_day(db) or first)
+    stats = {"days": (today - first).days + 1, "rows": 0}
+    cursor = first
+    while cursor <= today:
+        chunk_end = min(cursor + timedelta(days=_CHUNK_DAYS), today + timedelta(days=1))
+        stats["rows"] += rebuild_facts(db, cursor, chunk_end)
+        cursor = chunk_end
+    return stats
+
+
+async def analytics_facts_worker(interval_seconds: float = ANALYTICS_REFRESH_SECONDS):
+    """Background loop (API process): short refresh every interval, the
+    wider reconcile on the first pass of each day."""
+    logger.info("Analytics facts worker started (every %.0fs)", interval_seconds)
+    await asyncio.sleep(10)  # let the app finish starting
+    reconciled_on: Optional[date] = None
+    while True:
+        try:
+            today = _utcnow().date()
+            days = ANALYTICS_RECONCILE_DAYS if reconciled_on != today else ANALYTICS_REFRESH_DAYS
+            stats = await run_db(refresh_facts, days)
+            if reconciled_on != today:
+                reconciled_on = today
+                logger.info(f"[analytics-facts] reconciled: {stats}")
+        except Exception as e:
+            logger.error(f"[analytics-facts] refresh failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
+
+
+# ─── Reads ─────────────────────────────────────────────────────────────────
+
+def _window(query, since: Optional[datetime], until: Optional[datetime]):
+    F = AnalyticsFact
+    if since is not None:
+        query = query.filter(or_(F.day > since.date(), and_(F.day == since.date(), F.hour >= since.hour)))
+    if until is not None:
+        query = query.filter(or_(F.day < until.date(), and_(F.day == until.date(), F.hour < until.hour)))
+    return query
+
+
+def fact_total(db, metric: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> Tuple[float, int]:
+    """(sum of value, sum of events) for `metric` in [since, until)."""
+    q = db.query(func.coalesce(func.sum(AnalyticsFact.value), 0),
+                 func.coalesce(func.sum(AnalyticsFact.events), 0)).filter(AnalyticsFact.metric == metric)
+    value, events = _window(q, since, until).one()
+    return float(value), int(events)
+
+
+def fact_daily(db, metric: str, first_day: date, days: int) -> List[Tuple[date, float, int]]:
+    """[(day, value, events)] for `days` consecutive days, zero-filled."""
+    last_day = first_day + timedelta(days=days)
+    rows = (
+        db.query(AnalyticsFact.day, func.sum(AnalyticsFact.value), func.sum(AnalyticsFact.events))
+        .filter(AnalyticsFact.metric == metric, AnalyticsFact.day >= first_day, AnalyticsFact.day < last_day)
+        .group_by(AnalyticsFact.day)
+        .all()
+    )
+    by_day = {day: (float(value), int(events)) for day, value, events in rows}
+    return [(d, *by_day.get(d, (0.0, 0))) for d in (first_day + timedelta(days=i) for i in range(days))]
+
+
+def fact_by_hour(db, metric: str, since: Optional[datetime] = None) -> Dict[int, int]:
+    """{hour of day: events} — only hours that had any."""
+    q = (
+        db.query(AnalyticsFact.hour, func.sum(AnalyticsFact.events))
+        .filter(AnalyticsFact.metric == metric)
+    )
+    rows = _window(q, since, None).group_by(AnalyticsFact.hour).all()
+    return {int(hour): int(events) for hour, events in rows if events}
+
+
+def fact_by_charger(db, metric: str) -> Dict[int, Tuple[float, int]]:
+    """{charger_id: (value, events)} over all history."""
+    rows = (
+        db.query(AnalyticsFact.charger_id, func.sum(AnalyticsFact.value), func.sum(AnalyticsFact.events))
+        .filter(AnalyticsFact.metric == metric)
+        .group_by(AnalyticsFact.charger_id)
+        .all()
+    )
+    return {charger_id: (float(value), int(events)) for charger_id, value, events in rows}
+
+
+def fact_by_dimension(db, metric: str) -> List[Tuple[str, float, int]]:
+    """[(dimension, value, events)] over all history."""
+    rows = (
+        db.query(AnalyticsFact.dimension, func.sum(AnalyticsFact.value), func.sum(AnalyticsFact.events))
+        .filter(AnalyticsFact.metric == metric)
+        .group_by(AnalyticsFact.dimension)
+        .all()
+    )
+    return [(dimension, float(value), int(events)) for dimension, value, events in rows]
@@ -21,14 +21,15 @@ import time
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, ConfigDict, Field, field_serializer
-from sqlalchemy import and_, desc, func, or_, text
+from sqlalchemy import and_, case, desc, func, literal, or_, select, text, union_all
 from sqlalchemy.orm import Session
 
 from database import (
@@ -38,11 +39,29 @@ from database import (
     Notification,
     OTPVerification, PartnerAPIKey, PaymentGatewayConfig, PaymentTerminal, PaymentTransaction, TerminalCharger,
     Pricing, StaffSession, SupportStaff, SupportTicket, SystemSetting, TicketMessage,
-    User, Vehicle, Wallet, WalletTransaction,
+    User, Vehicle, Wallet, WalletTransaction, WebhookOutbox, BulkCommandJob, BulkCommandResult,
     SessionLocal, get_db, init_db, get_hold_amount_rm,
 )
 from email_service import generate_otp, send_otp_email, send_ticket_confirmation, send_ticket_update, send_ticket_reminder, send_ticket_notification_to_staff, send_charging_receipt
-from ocpp_server import get_active_charge_point, active_charge_points, firmware_events, force_close_charge_point, ocpp_state_healer_loop
+from heartbeat_coalescer import heartbeat_coalescer
+from change_feed import ENTITIES as CHANGE_FEED_ENTITIES, change_feed_worker, changes_after, oldest_seq as change_feed_oldest_seq
+from keyset import InvalidCursor, estimated_count, keyset_page, offset_page
+from bulk_commands import (
+    BULK_COMMAND_TIMEOUT_SECONDS, create_job as create_bulk_job, finished_results as bulk_finished_results,
+    interrupt_stale_jobs as interrupt_stale_bulk_jobs,
+    request_cancel as request_bulk_cancel, resolve_targets as resolve_bulk_targets, run_job as run_bulk_job,
+    serialize_job as serialize_bulk_job, serialize_result as serialize_bulk_result, start_job as start_bulk_job,
+    validate_params as validate_bulk_params, wait_for_progress as wait_for_bulk_progress,
+)
+from charging_scheduler import charging_scheduler
+from webhook_delivery import EVENT_TYPES as WEBHOOK_EVENT_TYPES, subscribed_events, webhook_delivery_worker
+from invoice_export import EXPORT_FORMATS, charger_totals, columnar_available, invoice_prices, parse_invoice_range, session_rows, stream_csv, stream_parquet
+from live_status import live_status
+from analytics_facts import analytics_facts_worker, fact_by_charger, fact_by_dimension, fact_by_hour, fact_daily, fact_total
+from meter_latest import latest_for_charger
+from meter_timeseries import meter_series
+from time_buckets import bucket_counts, bucket_series
+from ocpp_server import get_active_charge_point, active_charge_points, connected_charge_point_ids, firmware_events, force_close_charge_point, ocpp_state_healer_loop, invalidate_charger_cache, run_relayed_command
 from payment_gateway import (
     get_gateway,
     generate_transaction_ref,
@@ -56,6 +75,7 @@ from security import (
     verify_refresh_token,
     get_current_user,
     get_current_user_optional,
+    _bearer_scheme,
     require_admin,
     verify_resource_owner,
     validate_topup_amount,
@@ -463,6 +483,31 @@ async def require_admin_or_staff_manager(
 
     raise HTTPException(status_code=401, detail="Authentication required")
 
+
+async def _authorize_in_own_session(
+    request: Request, credentials: Optional[HTTPAuthorizationCredentials], authorize,
+):
+    """Run `authorize(request, db, current_user)` on a short-lived session.
+
+    FastAPI only closes yield dependencies (get_db) after a StreamingResponse
+    body has finished, so a stream that depends on get_db keeps a pooled
+    connection checked out for its whole life. Streaming endpoints
+    authenticate through this instead and stream without holding one."""
+    db = SessionLocal()
+    try:
+        current_user = await get_current_user_optional(credentials, db)
+        return await authorize(request, db, current_user)
+    finally:
+        db.close()
+
+
+async def require_admin_or_staff_admin_stream(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer_scheme),
+):
+    """require_admin_or_staff_admin for streaming endpoints (no get_db)."""
+    return await _authorize_in_own_session(request, credentials, require_admin_or_staff_admin)
+
 # ── CORS — restrict origins in production ──
 _allowed_origins = os.getenv("CORS_ORIGINS", "").split(",")
 _allowed_origins = [o.strip() for o in _allowed_origins if o.strip()]
@@ -561,6 +606,8 @@ async def health_check() -> dict:
     """
     Health check endpoint for load balancers and monitoring.
     Returns 200 if the API is up and can connect to the database.
+    In multi-process OCPP mode (OCPP_WORKERS > 1) also reports each
+    worker's pid, liveness, connection count and restarts.
 
     Accepts both GET (returns JSON body) and HEAD (status code only) —
     many uptime monitors (UptimeRobot, Pingdom, etc.) send HEAD by default
@@ -572,7 +619,12 @@ async def health_check() -> dict:
         db = SessionLocal()
         db.execute(text("SELECT 1"))
         db.close()
-        return {"status": "ok", "database": "connected"}
+        health = {"status": "ok", "database": "connected"}
+        from ocpp_workers import supervisor_status
+        ocpp_workers = supervisor_status()
+        if ocpp_workers is not None:
+            health["ocpp_workers"] = ocpp_workers
+        return health
     except Exception as e:
         logger.error("Health check failed: %s", e)
         raise HTTPException(status_code=503, detail="Service unavailable")
@@ -659,7 +711,7 @@ class ChargingSessionResponse(BaseModel):
 class MeterValueResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
-    id: int
+    id: Optional[int] = None  # null for the cached latest sample
     timestamp: datetime
     voltage: Optional[float]
     current: Optional[float]
@@ -673,6 +725,35 @@ class MeterValueResponse(BaseModel):
         return out if out is not None else ""
 
 
+class MeterSeriesPoint(BaseModel):
+    timestamp: datetime
+    voltage: Optional[float] = None
+    current: Optional[float] = None
+    power: Optional[float] = None
+    total_kwh: Optional[float] = None
+    transaction_id: Optional[int] = None
+    samples: Optional[int] = None     # rollup resolutions only
+    power_max: Optional[float] = None  # rollup resolutions only
+
+    @field_serializer("timestamp")
+    def _ser_series_ts(self, v: datetime, _info) -> str:
+        out = _iso_myt_naive_local(v)
+        return out if out is not None else ""
+
+
+class MeterSeriesResponse(BaseModel):
+    charge_point_id: str
+    resolution: str  # raw | 1m | 15m
+    start: datetime
+    end: datetime
+    points: List[MeterSeriesPoint]
+
+    @field_serializer("start", "end")
+    def _ser_series_range(self, v: datetime, _info) -> str:
+        out = _iso_myt_naive_local(v)
+        return out if out is not None else ""
+
+
 class FaultResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -898,47 +979,58 @@ def invalidate_chargers_cache() -> None:
     _CHARGERS_CACHE.clear()
 
 
-@app.get("/api/chargers", response_model=List[ChargerStatus])
-async def get_chargers(
-    request: Request,
-    db: Session = Depends(get_db),
-    online_only: Optional[str] = Query(
-        None,
-        description="If 1/true: only chargers that are OCPP-online OR charging/preparing OR have an active transaction id.",
-    ),
-    tenant: Optional[str] = Query(
-        None,
-        description="Filter chargers by tenant (fleet operator). Omit or pass 'all' for the combined view.",
-    ),
-):
-    """Get all chargers with their status. Use online_only=1 for dropdowns (metering, sessions, operations).
+# Fields nulled in /api/chargers (and the live stream) for unauthenticated callers.
+_CHARGER_SENSITIVE_FIELDS = frozenset({
+    "vendor", "model", "firmware_version", "last_heartbeat",
+    "active_transaction_id", "ws_connected",
+})
 
-    Cached in-memory for `_CHARGERS_CACHE_TTL` seconds: a single dashboard
-    user polls this every 5s, so without caching N concurrent users produce
-    N DB queries per 5s. With the cache it's always 1 query per 5s regardless
-    of N. Filter parameters are part of the cache key.
+
+def _active_transaction_ids(db: Session) -> Dict[int, int]:
+    """charger_id → transaction_id of its latest live session, in ONE query.
+
+    "Live" = active / interrupted / stopping (so the Stop button still gets a
+    real OCPP transaction id) or pending within PENDING_SESSION_WINDOW_MINUTES.
+    ROW_NUMBER() picks the newest per charger (MySQL 8 / SQLite 3.25+).
+    Pending placeholders (transaction_id <= 0) never drive the UI.
     """
-    import time
-    _now = time.time()
-    # Auth-aware caching: anon and admin get the same DB result but the
-    # response payload differs (stripped vs full). Splitting the cache key
-    # avoids serving admin-only fields to an anonymous follow-up request.
-    _is_admin = bool(request.headers.get("x-staff-token") or request.headers.get("authorization"))
-    _tenant_norm = (tenant or "").strip().lower()
-    _tenant_key = _tenant_norm if _tenant_norm and _tenant_norm != "all" else "all"
-    _cache_key = (
-        ("online" if (online_only in ("1", "true", "True")) else "all")
-        + ("|admin" if _is_admin else "|anon")
-        + f"|t:{_tenant_key}"
+    pending_cutoff = _utcnow() - timedelta(minutes=PENDING_SESSION_WINDOW_MINUTES)
+    rn = func.row_number().over(
+        partition_by=ChargingSession.charger_id,
+        order_by=(desc(ChargingSession.start_time), desc(ChargingSession.id)),
+    ).label("rn")
+    ranked = (
+        db.query(ChargingSession.charger_id, ChargingSession.transaction_id, rn)
+        .filter(
+            ChargingSession.transaction_id > 0,
+            or_(
+                ChargingSession.status.in_(["active", "interrupted", "stopping"]),
+                and_(
+                    ChargingSession.status == "pending",
+                    ChargingSession.start_time >= pending_cutoff,
+                ),
+            ),
+        )
+        .subquery()
     )
-    _cached = _CHARGERS_CACHE.get(_cache_key)
-    if _cached and _cached["exp"] > _now:
-        return _cached["data"]
+    rows = db.query(ranked.c.charger_id, ranked.c.transaction_id).filter(ranked.c.rn == 1).all()
+    return {charger_id: int(txn_id) for charger_id, txn_id in rows}
 
-    q = db.query(Charger)
-    if _tenant_key != "all":
-        q = q.filter(Charger.tenant == _tenant_key)
-    chargers = q.all()
+
+def _chargers_snapshot(db: Session) -> dict:
+    """Every charger as a full ChargerStatus, built with a fixed number of
+    queries (chargers, pricing, live sessions) regardless of fleet size.
+
+    Cached for `_CHARGERS_CACHE_TTL` seconds and shared by every tenant /
+    role / online_only view of /api/chargers — those are in-memory filters
+    over this snapshot, memoised in its "views" dict.
+    """
+    _now = time.time()
+    snapshot = _CHARGERS_CACHE.get("snapshot")
+    if snapshot and snapshot["exp"] > _now:
+        return snapshot
+
+    chargers = db.query(Charger).all()
 
     # Load pricing once: per-charger entries keyed by charger_id; fallback = charger_id IS NULL
     all_pricing = db.query(Pricing).filter(Pricing.is_active == True).all()
@@ -950,32 +1042,20 @@ async def get_chargers(
         else:
             pricing_by_charger[p.charger_id] = float(p.price_per_kwh)
 
-    # Add active transaction_id for each charger
-    result = []
-    for charger in chargers:
-        # Find active session for this charger
-        # Include both active and recent pending sessions (within PENDING_SESSION_WINDOW_MINUTES)
-        pending_cutoff = _utcnow() - timedelta(minutes=PENDING_SESSION_WINDOW_MINUTES)
-        # Include interrupted/stopping so Stop button still gets a real OCPP transaction id
-        active_session = db.query(ChargingSession).filter(
-            ChargingSession.charger_id == charger.id,
-            ChargingSession.transaction_id > 0,
-            or_(
-                ChargingSession.status.in_(["active", "interrupted", "stopping"]),
-                and_(
-                    ChargingSession.status == "pending",
-                    ChargingSession.start_time >= pending_cutoff
-                ),
-            ),
-        ).order_by(desc(ChargingSession.start_time)).first()
+    active_txn_ids = _active_transaction_ids(db)
+    ws_connected_ids = connected_charge_point_ids()
 
+    rows = []
+    for charger in chargers:
         # Compute effective status: recent heartbeat = online.
         # active_charge_points is in-memory and can desync on race conditions;
         # last_heartbeat in DB is the reliable source of truth.
         # If heartbeat is stale (> threshold), charger is offline regardless.
+        # The coalescer holds heartbeats not yet flushed to the DB.
+        last_heartbeat = heartbeat_coalescer.effective(charger.charge_point_id, charger.last_heartbeat)
         heartbeat_age_ok = False
-        if charger.last_heartbeat:
-            age = _utcnow() - charger.last_heartbeat.replace(tzinfo=None)
+        if last_heartbeat:
+            age = _utcnow() - last_heartbeat.replace(tzinfo=None)
             heartbeat_age_ok = age.total_seconds() < (OFFLINE_THRESHOLD_MINUTES * 60)
 
         if heartbeat_age_ok:
@@ -983,11 +1063,7 @@ async def get_chargers(
         else:
             effective_status = "offline"
 
-        # Only expose a valid active transaction id (>0). Pending placeholders (<=0) shouldn't drive UI.
-        active_txn_id = None
-        if active_session and getattr(active_session, "transaction_id", None):
-            if int(active_session.transaction_id) > 0:
-                active_txn_id = int(active_session.transaction_id)
+        active_txn_id = active_txn_ids.get(charger.id)
 
         # Trust charger.availability from StatusNotification (source of truth from device)
         # Don't use active_txn_id to force "charging" - session can be stale if charger stopped locally
@@ -995,15 +1071,6 @@ async def get_chargers(
         if effective_status == "offline":
             effective_availability = "unavailable"
 
-        if _want_online_only_list(online_only):
-            include = (
-                effective_status == "online"
-                or effective_availability in ("charging", "preparing")
-                or (active_txn_id is not None and active_txn_id > 0)
-            )
-            if not include:
-                continue
-
         price_per_kwh = pricing_by_charger.get(charger.id, default_price)
 
         # Fill max_power_kw / connector_type from model name if not manually set
@@ -1020,7 +1087,7 @@ async def get_chargers(
             "status": effective_status,
             "availability": effective_availability,
             "connector_status": _conn_status_dict(charger.connector_status),
-            "last_heartbeat": charger.last_heartbeat,
+            "last_heartbeat": last_heartbeat,
             "active_transaction_id": active_txn_id,
             "number_of_connectors": charger.number_of_connectors,
             "location": charger.location,
@@ -1029,9 +1096,68 @@ async def get_chargers(
             "connector_type": eff_connector,
             "max_power_kw": eff_power,
             "price_per_kwh": price_per_kwh,
-            "ws_connected": charger.charge_point_id in active_charge_points,
+            "ws_connected": charger.charge_point_id in ws_connected_ids,
         }
-        result.append(ChargerStatus(**charger_dict))
+        rows.append({
+            # Lower-cased to match MySQL's case-insensitive `tenant = :t`.
+            "tenant": (charger.tenant or "").lower(),
+            # online_only=1 keeps chargers that are OCPP-online OR
+            # charging/preparing OR have an active transaction id.
+            "online_list": (
+                effective_status == "online"
+                or effective_availability in ("charging", "preparing")
+                or active_txn_id is not None
+            ),
+            "status": ChargerStatus(**charger_dict),
+        })
+
+    snapshot = {"exp": _now + _CHARGERS_CACHE_TTL, "rows": rows, "views": {}}
+    _CHARGERS_CACHE["snapshot"] = snapshot
+    return snapshot
+
+
+@app.get("/api/chargers", response_model=List[ChargerStatus])
+async def get_chargers(
+    request: Request,
+    db: Session = Depends(get_db),
+    online_only: Optional[str] = Query(
+        None,
+        description="If 1/true: only chargers that are OCPP-online OR charging/preparing OR have an active transaction id.",
+    ),
+    tenant: Optional[str] = Query(
+        None,
+        description="Filter chargers by tenant (fleet operator). Omit or pass 'all' for the combined view.",
+    ),
+):
+    """Get all chargers with their status. Use online_only=1 for dropdowns (metering, sessions, operations).
+
+    Cached in-memory for `_CHARGERS_CACHE_TTL` seconds: a single dashboard
+    user polls this every 5s, so without caching N concurrent users produce
+    N DB queries per 5s. With the cache it's always one snapshot (3 queries,
+    independent of fleet size) per 5s regardless of N, shared by every
+    tenant / role / online_only combination — see _chargers_snapshot.
+    """
+    # Auth-aware views: anon and admin share the same DB snapshot but the
+    # response payload differs (stripped vs full), so each (role, tenant,
+    # online_only) combination gets its own memoised view of the snapshot.
+    _is_admin = bool(request.headers.get("x-staff-token") or request.headers.get("authorization"))
+    _tenant_norm = (tenant or "").strip().lower()
+    _tenant_key = _tenant_norm if _tenant_norm and _tenant_norm != "all" else "all"
+    _online_only = _want_online_only_list(online_only)
+    _view_key = (_online_only, _is_admin, _tenant_key)
+
+    snapshot = _chargers_snapshot(db)
+    cached = snapshot["views"].get(_view_key)
+    if cached is not None:
+        return cached
+
+    result = []
+    for row in snapshot["rows"]:
+        if _tenant_key != "all" and row["tenant"] != _tenant_key:
+            continue
+        if _online_only and not row["online_list"]:
+            continue
+        result.append(row["status"])
 
     # Strip operational/competitive fields for unauthenticated callers.
     # Authenticated admin/staff (X-Staff-Token header) get the full payload;
@@ -1042,16 +1168,9 @@ async def get_chargers(
     if _is_admin:
         out = result
     else:
-        SENSITIVE = {"vendor", "model", "firmware_version", "last_heartbeat",
-                     "active_transaction_id", "ws_connected"}
-        out = []
-        for cs in result:
-            d = cs.model_dump()
-            for k in SENSITIVE:
-                d[k] = None
-            out.append(ChargerStatus(**d))
+        out = [cs.model_copy(update={k: None for k in _CHARGER_SENSITIVE_FIELDS}) for cs in result]
 
-    _CHARGERS_CACHE[_cache_key] = {"data": out, "exp": _now + _CHARGERS_CACHE_TTL}
+    snapshot["views"][_view_key] = out
     return out
 
 
@@ -1062,9 +1181,10 @@ async def get_charger_status(charge_point_id: str, db: Session = Depends(get_db)
     if not charger:
         raise HTTPException(status_code=404, detail="Charger not found")
 
+    last_heartbeat = heartbeat_coalescer.effective(charger.charge_point_id, charger.last_heartbeat)
     heartbeat_age_ok = False
-    if charger.last_heartbeat:
-        age = _utcnow() - charger.last_heartbeat.replace(tzinfo=None)
+    if last_heartbeat:
+        age = _utcnow() - last_heartbeat.replace(tzinfo=None)
         heartbeat_age_ok = age.total_seconds() < (OFFLINE_THRESHOLD_MINUTES * 60)
 
     if heartbeat_age_ok:
@@ -1085,11 +1205,171 @@ async def get_charger_status(charge_point_id: str, db: Session = Depends(get_db)
         status=effective_status,
         availability=effective_availability,
         connector_status=_conn_status_dict(charger.connector_status),
-        last_heartbeat=charger.last_heartbeat,
+        last_heartbeat=last_heartbeat,
         active_transaction_id=None,
     )
 
 
+# ─── Live charger status stream (SSE) ──────────────────────────────────────
+# Replaces the 3-5s polling of /api/chargers, /api/sessions and /api/faults.
+# The OCPP handlers publish events on event_bus; live_status (live_status.py)
+# turns them into dicts and each stream forwards them as diffs. A periodic resync against the shared
+# /api/chargers snapshot catches what no handler publishes (heartbeat
+# timeouts → offline, admin edits, new chargers).
+
+LIVE_STREAM_KEEPALIVE_SECONDS = 15.0
+LIVE_STREAM_RESYNC_SECONDS = float(os.getenv("LIVE_STREAM_RESYNC_SECONDS", "30"))
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _live_view(tenant_key: str, cp_filter: set, full: bool) -> Dict[str, dict]:
+    """charge_point_id → JSON-ready ChargerStatus for one stream's scope."""
+    db = SessionLocal()
+    try:
+        snapshot = _chargers_snapshot(db)
+    finally:
+        db.close()
+    view = {}
+    for row in snapshot["rows"]:
+        if tenant_key != "all" and row["tenant"] != tenant_key:
+            continue
+        cs = row["status"]
+        if cp_filter and cs.charge_point_id not in cp_filter:
+            continue
+        d = cs.model_dump(mode="json")
+        if not full:
+            for k in _CHARGER_SENSITIVE_FIELDS:
+                d[k] = None
+        view[cs.charge_point_id] = d
+    return view
+
+
+def _live_diff(old: Dict[str, dict], new: Dict[str, dict]) -> List[str]:
+    """SSE frames turning `old` into `new`. last_heartbeat alone ticks every
+    heartbeat, so it only rides along with a real change."""
+    frames = []
+    for cp_id, cur in new.items():
+        prev = old.get(cp_id)
+        if prev is None:
+            frames.append(_sse("charger", cur))
+            continue
+        changes = {k: v for k, v in cur.items() if k != "last_heartbeat" and prev.get(k) != v}
+        if changes:
+            changes["last_heartbeat"] = cur.get("last_heartbeat")
+            frames.append(_sse("charger", {"charge_point_id": cp_id, **changes}))
+    for cp_id in old.keys() - new.keys():
+        frames.append(_sse("removed", {"charge_point_id": cp_id}))
+    return frames
+
+
+async def _live_stream_access(request: Request, db: Session, current_user: Optional[User]) -> Tuple[bool, bool]:
+    """(full charger view, session/fault topics). The charger view follows
+    /api/chargers; session and fault events follow /api/sessions and
+    /api/faults, which are admin / staff-admin only."""
+    try:
+        await require_admin_or_staff_admin(request, db, current_user)
+        return True, True
+    except HTTPException:
+        pass
+    if current_user is not None:
+        return True, False
+    staff_token = _extract_staff_token(request)
+    return bool(staff_token) and _get_staff_session_db(staff_token, db) is not None, False
+
+
+@app.get("/api/live/chargers")
+async def live_chargers_stream(
+    request: Request,
+    tenant: Optional[str] = Query(None, description="Tenant scope; omit or 'all' for every charger."),
+    charge_point_id: Optional[str] = Query(None, description="Comma-separated charge_point_ids to narrow the stream."),
+    topics: str = Query("chargers", description="Comma-separated: chargers, sessions, faults."),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer_scheme),
+):
+    """Server-Sent Events stream of charger status.
+
+    Sends `snapshot` (full list, same shape as /api/chargers) on subscribe,
+    then `charger` diffs ({charge_point_id, <changed fields>}), `removed`,
+    and — for admin / staff-admin callers who ask for them — `session` /
+    `fault` events. Auth is the usual header (X-Staff-Token / Bearer), so browsers
+    consume it with fetch() streaming rather than EventSource. Unauthenticated
+    callers get the same stripped view as /api/chargers.
+    """
+    full, admin = await _authorize_in_own_session(request, credentials, _live_stream_access)
+
+    tenant_norm = (tenant or "").strip().lower()
+    tenant_key = tenant_norm if tenant_norm and tenant_norm != "all" else "all"
+    cp_filter = {c.strip() for c in (charge_point_id or "").split(",") if c.strip()}
+    wanted = {t.strip() for t in topics.split(",") if t.strip()}
+    event_topics = {"session": admin and "sessions" in wanted, "fault": admin and "faults" in wanted}
+
+    async def _events():
+        loop = asyncio.get_running_loop()
+        sub = live_status.subscribe()
+        patched: Dict[str, float] = {}  # cp_id → loop time of the last event applied to `state`
+        try:
+            state = _live_view(tenant_key, cp_filter, full)
+            yield _sse("snapshot", list(state.values()))
+            next_resync = loop.time() + LIVE_STREAM_RESYNC_SECONDS
+            while not await request.is_disconnected():
+                timeout = max(0.0, min(LIVE_STREAM_KEEPALIVE_SECONDS, next_resync - loop.time()))
+                event = await sub.get(timeout)
+
+                if sub.overflowed:
+                    # Fell behind — drop the backlog and start over from a snapshot.
+                    sub.overflowed = False
+                    sub.drain()
+                    state = _live_view(tenant_key, cp_filter, full)
+                    yield _sse("snapshot", list(state.values()))
+                    next_resync = loop.time() + LIVE_STREAM_RESYNC_SECONDS
+                    continue
+
+                if event is None:
+                    if loop.time() >= next_resync:
+                        fresh = _live_view(tenant_key, cp_filter, full)
+                        # The shared snapshot may predate an event this stream
+                        # already applied — keep those rows until the next resync.
+                        cutoff = loop.time() - _CHARGERS_CACHE_TTL
+                        for cp_id, at in list(patched.items()):
+                            if at < cutoff:
+                                del patched[cp_id]
+                            elif cp_id in fresh and cp_id in state:
+                                fresh[cp_id] = state[cp_id]
+                        for frame in _live_diff(state, fresh):
+                            yield frame
+                        state = fresh
+                        next_resync = loop.time() + LIVE_STREAM_RESYNC_SECONDS
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+
+                cp_id = event.get("charge_point_id")
+                if cp_id not in state:
+                    continue  # other tenant / filtered out / not yet in a snapshot
+                if event["type"] == "charger":
+                    cur = state[cp_id]
+                    changes = {
+                        k: v for k, v in event["changes"].items()
+                        if k in cur and (full or k not in _CHARGER_SENSITIVE_FIELDS) and cur[k] != v
+                    }
+                    if changes:
+                        cur.update(changes)
+                        patched[cp_id] = loop.time()
+                        yield _sse("charger", {"charge_point_id": cp_id, **changes})
+                elif event_topics.get(event["type"]):
+                    yield _sse(event["type"], event)
+        finally:
+            live_status.unsubscribe(sub)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/events/firmware")
 async def get_firmware_events(since: str = ""):
     """
@@ -1097,15 +1377,23 @@ async def get_firmware_events(since: str = ""):
     Frontend polls this to show toast notifications.
     Optional ?since=<ISO timestamp> to get only events after that time.
     """
+    recent = list(firmware_events)  # snapshot — the OCPP thread appends concurrently
     if not since:
-        return {"events": firmware_events[-20:]}
+        return {"events": recent[-20:]}
     try:
         from datetime import datetime, timezone, timedelta
         since_dt = datetime.fromisoformat(since)
-        filtered = [e for e in firmware_events if datetime.fromisoformat(e["timestamp"]) > since_dt]
-        return {"events": filtered}
+        # Events are appended in time order: walk back from the newest and
+        # stop at the first one the client has already seen.
+        fresh = []
+        for e in reversed(recent):
+            if datetime.fromisoformat(e["timestamp"]) <= since_dt:
+                break
+            fresh.append(e)
+        fresh.reverse()
+        return {"events": fresh}
     except Exception:
-        return {"events": firmware_events[-20:]}
+        return {"events": recent[-20:]}
 
 
 @app.post("/api/admin/chargers", response_model=ChargerStatus)
@@ -1138,6 +1426,7 @@ async def admin_create_charger(
     db.add(charger)
     db.commit()
     db.refresh(charger)
+    invalidate_charger_cache(cp_id)
     logger.info(f"Charger {cp_id} manually registered by admin")
     return charger
 
@@ -1172,6 +1461,7 @@ async def update_charger_info(
     if req.max_power_kw is not None:
         charger.max_power_kw = req.max_power_kw
     db.commit()
+    invalidate_charger_cache(charge_point_id)
     logger.info(f"Charger {charge_point_id} info updated by admin")
     eff_power, eff_connector = _effective_charger_specs(charger.max_power_kw, charger.connector_type, charger.model)
     return {
@@ -1220,6 +1510,7 @@ async def update_charger_idle_fee(
         except (TypeError, ValueError):
             raise HTTPException(status_code=400, detail="grace_minutes must be an integer")
     db.commit()
+    invalidate_charger_cache(charge_point_id)
     return {
         "success": True,
         "charge_point_id": charge_point_id,
@@ -1343,6 +1634,7 @@ async def auto_detect_charger_info(
             logger.warning(f"GetConfiguration for GPS failed on {charge_point_id}: {e}")
 
     db.commit()
+    invalidate_charger_cache(charge_point_id)
     return {
         "success": True,
         "charge_point_id": charge_point_id,
@@ -1354,37 +1646,44 @@ async def auto_detect_charger_info(
 
 @app.get("/api/sessions", response_model=List[ChargingSessionResponse])
 async def get_sessions(
+    request: Request,
+    response: Response,
     limit: int = 50,
     charger_id: Optional[int] = None,
     charge_point_id: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     _: dict = Depends(require_admin_or_staff_admin),
 ):
-    """Get charging sessions"""
-    query = db.query(ChargingSession)
+    """Get charging sessions, newest first.
+
+    When more rows exist the response carries `Link: <…&cursor=…>; rel="next"`
+    (keyset paging, see keyset.py)."""
+    query = (
+        db.query(ChargingSession, Charger.charge_point_id)
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+    )
     
     if charger_id:
         query = query.filter(ChargingSession.charger_id == charger_id)
     elif charge_point_id:
-        charger = db.query(Charger).filter(Charger.charge_point_id == charge_point_id).first()
-        if charger:
-            query = query.filter(ChargingSession.charger_id == charger.id)
-        else:
-            return []
-    
-    sessions = query.order_by(desc(ChargingSession.start_time)).limit(limit).all()
+        query = query.filter(Charger.charge_point_id == charge_point_id)
     
-    # Add charge_point_id to each session
-    result = []
-    for session in sessions:
-        charger = db.query(Charger).filter(Charger.id == session.charger_id).first()
-        session_dict = {
-            **session.__dict__,
-            "charge_point_id": charger.charge_point_id if charger else "Unknown"
-        }
-        result.append(ChargingSessionResponse(**session_dict))
+    try:
+        rows, next_cursor = keyset_page(
+            query, (ChargingSession.start_time, ChargingSession.id), cursor=cursor, limit=limit,
+            key=lambda row: row[0],
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     
-    return result
+    # charge_point_id comes from the join — no per-row Charger lookup
+    return [
+        ChargingSessionResponse(**{**session.__dict__, "charge_point_id": cp_id or "Unknown"})
+        for session, cp_id in rows
+    ]
 
 
 @app.get("/api/metering/{charge_point_id}", response_model=List[MeterValueResponse])
@@ -1406,6 +1705,50 @@ async def get_metering(
     return meter_values
 
 
+@app.get("/api/metering/{charge_point_id}/series", response_model=MeterSeriesResponse)
+async def get_metering_series(
+    charge_point_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    hours: float = Query(24, gt=0, le=24 * 366),
+    max_points: int = Query(500, ge=10, le=5000),
+    transaction_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Meter chart data over a time range.
+
+    Resolution is picked server-side (raw / 1-minute / 15-minute rollups,
+    see meter_timeseries.py) so a month-long chart returns ~max_points
+    buckets instead of every 10-second sample. Without `end` the window
+    ends at the charger's newest sample; without `start` it spans `hours`.
+    """
+    charger = db.query(Charger).filter(Charger.charge_point_id == charge_point_id).first()
+    if not charger:
+        raise HTTPException(status_code=404, detail="Charger not found")
+
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone(MYT).replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone(MYT).replace(tzinfo=None)
+    if end is None:
+        newest = latest_for_charger(db, charger.id)
+        end = (newest.timestamp if newest else _utcnow()) + timedelta(seconds=1)
+    if start is None:
+        start = end - timedelta(hours=hours)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    resolution, points = meter_series(
+        db, charger_id=charger.id, transaction_id=transaction_id,
+        start=start, end=end, max_points=max_points,
+    )
+    return MeterSeriesResponse(
+        charge_point_id=charge_point_id, resolution=resolution,
+        start=start, end=end, points=points,
+    )
+
+
 @app.get("/api/metering/{charge_point_id}/latest", response_model=Optional[MeterValueResponse])
 async def get_latest_metering(
     charge_point_id: str,
@@ -1414,7 +1757,8 @@ async def get_latest_metering(
 ):
     """Get latest metering data for a charger.
 
-    Returns the most recent MeterValue, or `null` (HTTP 200) if the charger
+    Returns the most recent sample (from the charger_meter_latest cache, see
+    meter_latest.py — `id` is null then), or `null` (HTTP 200) if the charger
     exists but has never sent meter readings yet. Only an unknown charger id
     yields a 404 — so the dashboard does not paint red errors in the console
     for brand-new / never-charged chargers.
@@ -1423,9 +1767,7 @@ async def get_latest_metering(
     if not charger:
         raise HTTPException(status_code=404, detail="Charger not found")
 
-    meter_value = db.query(MeterValue).filter(
-        MeterValue.charger_id == charger.id
-    ).order_by(desc(MeterValue.timestamp)).first()
+    meter_value = latest_for_charger(db, charger.id)
 
     # Graceful empty: 200 with null body, NOT a 404. The frontend treats null
     # as "no readings yet" and keeps any cached state instead of flashing red.
@@ -1440,7 +1782,7 @@ async def get_faults(
     _: dict = Depends(require_admin_or_staff_admin),
 ):
     """Get faults"""
-    query = db.query(Fault)
+    query = db.query(Fault, Charger.charge_point_id).outerjoin(Charger, Charger.id == Fault.charger_id)
     
     if cleared is not None:
         query = query.filter(Fault.cleared == cleared)
@@ -1448,19 +1790,12 @@ async def get_faults(
     if charger_id:
         query = query.filter(Fault.charger_id == charger_id)
     
-    faults = query.order_by(desc(Fault.timestamp)).all()
-    
-    # Add charge_point_id to each fault
-    result = []
-    for fault in faults:
-        charger = db.query(Charger).filter(Charger.id == fault.charger_id).first()
-        fault_dict = {
-            **fault.__dict__,
-            "charge_point_id": charger.charge_point_id if charger else "Unknown"
-        }
-        result.append(FaultResponse(**fault_dict))
+    rows = query.order_by(desc(Fault.timestamp)).all()
     
-    return result
+    return [
+        FaultResponse(**{**fault.__dict__, "charge_point_id": cp_id or "Unknown"})
+        for fault, cp_id in rows
+    ]
 
 
 @app.get("/api/device/{charge_point_id}", response_model=DeviceInfo)
@@ -1595,6 +1930,7 @@ async def change_charger_configuration(
             try:
                 charger.heartbeat_interval = int(request.value)
                 db.commit()
+                invalidate_charger_cache(charge_point_id)
             except Exception as e:
                 logger.error(f"Failed to persist HeartbeatInterval={request.value} for {charge_point_id}: {e}", exc_info=True)
                 db.rollback()
@@ -1655,6 +1991,24 @@ class BulkUpdateFirmwareRequest(BaseModel):
     delay_between_seconds: Optional[float] = 1.0  # stagger commands to avoid flood
 
 
+class BulkCommandTarget(BaseModel):
+    tenant: Optional[str] = None
+    model: Optional[str] = None
+    charge_point_ids: List[str] = []
+    all: bool = False  # required to target the whole fleet with no filter
+
+
+class BulkCommandRequest(BaseModel):
+    command: str  # reset, change_configuration, get_configuration, trigger_message, send_local_list, ...
+    params: Dict[str, Any] = {}  # kwargs of the ChargePoint method, e.g. {"type": "Soft"}
+    target: BulkCommandTarget
+    concurrency: int = 20
+    timeout_seconds: float = BULK_COMMAND_TIMEOUT_SECONDS
+    wave_size: int = 0  # 0 = all targets in one wave
+    wave_delay_seconds: float = 0.0
+    max_failure_ratio: Optional[float] = None  # 0..1; halt after a wave above it
+
+
 class ReserveNowRequest(BaseModel):
     connector_id: int = 0
     expiry_date: str  # ISO 8601 datetime
@@ -1895,6 +2249,7 @@ async def admin_disable_charger(
     # Reflect in availability so admin dashboards/UI render correctly
     charger.availability = "unavailable"
     db.commit()
+    invalidate_charger_cache(charger_id)
 
     ocpp_result = {"sent": False, "status": None}
     if req.notify_charger:
@@ -1948,6 +2303,7 @@ async def admin_enable_charger(
     if charger.availability == "unavailable":
         charger.availability = "available" if charger.status == "online" else "unknown"
     db.commit()
+    invalidate_charger_cache(charger_id)
 
     ocpp_result = {"sent": False, "status": None}
     cp = get_active_charge_point(charger_id)
@@ -2316,7 +2672,86 @@ async def partner_get_session(
     )
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    return {"success": True, "transaction": _serialize_sync_transaction(txn, db)}
+    return {"success": True, "transaction": _serialize_sync_transaction(txn, *_sync_related(db, [txn]).get(txn.id, ()))}
+
+
+# ─── Partner webhooks ────────────────────────────────────────────────────────
+# Partners register one HTTPS endpoint and receive session.started /
+# session.stopped instead of polling /api/partner/charging/sessions/{ref}.
+# Delivery, signing and retries live in webhook_delivery.py.
+
+class PartnerWebhookRequest(BaseModel):
+    url: str = Field(..., min_length=12, max_length=500, description="HTTPS endpoint receiving POSTed event batches")
+    events: Optional[List[str]] = Field(
+        default=None,
+        description="Event types to receive (session.started, session.stopped). Omit for all.",
+    )
+
+
+def _serialize_webhook(db: Session, partner: "PartnerAPIKey") -> dict:
+    counts = dict(
+        db.query(WebhookOutbox.status, func.count(WebhookOutbox.id))
+        .filter(WebhookOutbox.partner_id == partner.id, WebhookOutbox.status.in_(["pending", "dead"]))
+        .group_by(WebhookOutbox.status)
+        .all()
+    )
+    return {
+        "url": partner.webhook_url,
+        "events": list(subscribed_events(partner)) if partner.webhook_url else [],
+        "pending": counts.get("pending", 0),
+        "dead": counts.get("dead", 0),
+    }
+
+
+@app.put("/api/partner/webhook")
+async def partner_register_webhook(
+    req: PartnerWebhookRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """Register (or replace) the partner's webhook endpoint. A fresh signing
+    secret is returned ONCE — verify each delivery's X-PlagSini-Signature
+    header: t=<unix ts>,v1=hex(HMAC-SHA256(secret, "<t>.<raw body>"))."""
+    partner_row = _authenticate_partner(request, db)
+    url = req.url.strip()
+    if not url.lower().startswith("https://"):
+        raise HTTPException(status_code=400, detail="Webhook url must use https://")
+    events = req.events or list(WEBHOOK_EVENT_TYPES)
+    unknown = sorted(set(events) - set(WEBHOOK_EVENT_TYPES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(unknown)}")
+
+    secret = secrets.token_hex(32)
+    partner_row.webhook_url = url
+    partner_row.webhook_secret = secret
+    partner_row.webhook_events = ",".join(e for e in WEBHOOK_EVENT_TYPES if e in events)
+    db.commit()
+    logger.info(f"[partner:{partner_row.partner_name}] registered webhook {url} ({partner_row.webhook_events})")
+    return {
+        "success": True,
+        "webhook": _serialize_webhook(db, partner_row),
+        "secret": secret,
+        "warning": "Store this secret now — it will not be shown again.",
+    }
+
+
+@app.get("/api/partner/webhook")
+async def partner_get_webhook(request: Request, db: Session = Depends(get_db)):
+    """Current webhook registration and delivery backlog. The secret is never returned."""
+    partner_row = _authenticate_partner(request, db)
+    return {"success": True, "webhook": _serialize_webhook(db, partner_row)}
+
+
+@app.delete("/api/partner/webhook")
+async def partner_delete_webhook(request: Request, db: Session = Depends(get_db)):
+    """Stop webhook deliveries. Events still queued are dead-lettered."""
+    partner_row = _authenticate_partner(request, db)
+    partner_row.webhook_url = None
+    partner_row.webhook_secret = None
+    partner_row.webhook_events = None
+    db.commit()
+    logger.info(f"[partner:{partner_row.partner_name}] removed webhook")
+    return {"success": True}
 
 
 # ─── Partner key management (admin-only) ─────────────────────────────────────
@@ -2384,6 +2819,7 @@ async def admin_list_partner_keys(
                 "revoked_at": r.revoked_at.isoformat() if r.revoked_at else None,
                 "last_used_at": r.last_used_at.isoformat() if r.last_used_at else None,
                 "key_hint": r.key_hash[:8] + "…",
+                "webhook_url": r.webhook_url,
             }
             for r in rows
         ],
@@ -2436,6 +2872,32 @@ async def admin_revoke_partner_key(
     return {"success": True, "id": row.id, "partner_name": row.partner_name, "active": False}
 
 
+@app.post("/api/admin/partners/{partner_id}/webhook/replay")
+async def admin_replay_partner_webhooks(
+    partner_id: int,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Re-queue a partner's dead-lettered webhook events (e.g. after their
+    endpoint outage is fixed). Attempts restart from zero."""
+    row = db.query(PartnerAPIKey).filter(PartnerAPIKey.id == partner_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Partner id {partner_id} not found")
+    if not row.webhook_url:
+        raise HTTPException(status_code=409, detail="Partner has no webhook registered")
+    requeued = db.query(WebhookOutbox).filter(
+        WebhookOutbox.partner_id == partner_id, WebhookOutbox.status == "dead",
+    ).update({
+        WebhookOutbox.status: "pending",
+        WebhookOutbox.attempts: 0,
+        WebhookOutbox.next_attempt_at: _utcnow(),
+        WebhookOutbox.last_error: None,
+    }, synchronize_session=False)
+    db.commit()
+    logger.info(f"[admin] re-queued {requeued} dead webhook events for '{row.partner_name}' (id={row.id})")
+    return {"success": True, "id": row.id, "requeued": requeued}
+
+
 # ─── Partner ownership management removed (v1.0) ────────────────────────────
 # Assign/unassign/lookup/list-by-owner endpoints removed. Perodua manages the
 # user↔charger mapping on their side; we act as a pure OCPP relay authenticated
@@ -2450,54 +2912,98 @@ async def admin_revoke_partner_key(
 # us and mirrors them on his side. Designed for incremental polling — pass
 # `since=<last_sync_ts>` and we return everything that paid_at after that.
 
-def _serialize_sync_transaction(t: "PaymentTransaction", db: Session) -> dict:
+# Transactions matched per statement in _sync_related (keeps the windows
+# table under SQLite's 500-term compound SELECT limit).
+_SYNC_MATCH_CHUNK = 250
+
+
+def _sync_related(db: Session, txns: List["PaymentTransaction"]) -> Dict[int, tuple]:
+    """{PaymentTransaction.id: (Charger, matched ChargingSession)} for a page
+    of transactions — two queries for the whole page, not two per row.
+
+    The session match is the first one on the same charger starting within
+    [paid_at − 2 min, paid_at + 12 h]. The windows go to the DB as a derived
+    table and ROW_NUMBER() keeps the first session of each, so at most one
+    session per transaction is loaded however busy the chargers are."""
+    cp_ids = {t.charger_id for t in txns if t.charger_id}
+    if not cp_ids:
+        return {}
+    chargers = {c.charge_point_id: c for c in db.query(Charger).filter(Charger.charge_point_id.in_(cp_ids))}
+    related = {t.id: (chargers[t.charger_id], None) for t in txns if t.charger_id in chargers}
+
+    windows = [t for t in txns if t.paid_at and t.charger_id in chargers]
+    for i in range(0, len(windows), _SYNC_MATCH_CHUNK):
+        rows = [
+            select(
+                literal(t.id).label("txn_id"),
+                literal(chargers[t.charger_id].id).label("charger_id"),
+                literal(t.paid_at - timedelta(minutes=2)).label("window_start"),
+                literal(t.paid_at + timedelta(hours=12)).label("window_end"),
+            )
+            for t in windows[i:i + _SYNC_MATCH_CHUNK]
+        ]
+        win = (rows[0] if len(rows) == 1 else union_all(*rows)).subquery("w")
+        rn = func.row_number().over(
+            partition_by=win.c.txn_id,
+            order_by=(ChargingSession.start_time.asc(), ChargingSession.id.asc()),
+        ).label("rn")
+        ranked = (
+            db.query(win.c.txn_id, ChargingSession.id.label("session_id"), rn)
+            .join(ChargingSession, and_(
+                ChargingSession.charger_id == win.c.charger_id,
+                ChargingSession.start_time >= win.c.window_start,
+                ChargingSession.start_time <= win.c.window_end,
+            ))
+            .subquery()
+        )
+        matched = (
+            db.query(ranked.c.txn_id, ChargingSession)
+            .join(ChargingSession, ChargingSession.id == ranked.c.session_id)
+            .filter(ranked.c.rn == 1)
+        )
+        for txn_id, session in matched:
+            related[txn_id] = (related[txn_id][0], session)
+    return related
+
+
+def _serialize_sync_session(session: ChargingSession) -> dict:
+    duration = None
+    if session.start_time and session.stop_time:
+        duration = int((session.stop_time - session.start_time).total_seconds())
+    return {
+        "transaction_id": session.transaction_id,
+        "status": session.status,
+        "start_time": session.start_time.isoformat() if session.start_time else None,
+        "stop_time": session.stop_time.isoformat() if session.stop_time else None,
+        "duration_seconds": duration,
+        "energy_consumed_kwh": float(session.energy_consumed or 0),
+        "energy_kwh_limit": float(session.energy_kwh_limit) if session.energy_kwh_limit else None,
+        "auto_stopped": bool(session.auto_stopped),
+        "stop_reason": session.stop_reason,
+        "meter_start_wh": session.meter_start,
+        "meter_stop_wh": session.meter_stop,
+    }
+
+
+def _serialize_sync_transaction(t: "PaymentTransaction", charger: Optional[Charger] = None,
+                                session: Optional[ChargingSession] = None) -> dict:
     """Build the rich payload for one PaymentTransaction — includes the
-    matched ChargingSession + Charger + parsed gateway response."""
-    # Match charging session: same charger, start_time near paid_at (±30 min)
+    matched ChargingSession + Charger (see _sync_related) + parsed gateway
+    response."""
     session_payload = None
     charger_payload = None
-    if t.charger_id:
-        charger = db.query(Charger).filter(Charger.charge_point_id == t.charger_id).first()
-        if charger:
-            charger_payload = {
-                "id": charger.charge_point_id,
-                "name": charger.name,
-                "connector_id": t.connector_id,
-                "connector_type": charger.connector_type,
-                "max_power_kw": charger.max_power_kw,
-                "tariff_per_kwh": float(charger.tariff_per_kwh or Decimal("0.10")),
-                "location": charger.location,
-            }
-            if t.paid_at:
-                window_start = t.paid_at - timedelta(minutes=2)
-                window_end = t.paid_at + timedelta(hours=12)
-                session = (
-                    db.query(ChargingSession)
-                    .filter(
-                        ChargingSession.charger_id == charger.id,
-                        ChargingSession.start_time >= window_start,
-                        ChargingSession.start_time <= window_end,
-                    )
-                    .order_by(ChargingSession.start_time.asc())
-                    .first()
-                )
-                if session:
-                    duration = None
-                    if session.start_time and session.stop_time:
-                        duration = int((session.stop_time - session.start_time).total_seconds())
-                    session_payload = {
-                        "transaction_id": session.transaction_id,
-                        "status": session.status,
-                        "start_time": session.start_time.isoformat() if session.start_time else None,
-                        "stop_time": session.stop_time.isoformat() if session.stop_time else None,
-                        "duration_seconds": duration,
-                        "energy_consumed_kwh": float(session.energy_consumed or 0),
-                        "energy_kwh_limit": float(session.energy_kwh_limit) if session.energy_kwh_limit else None,
-                        "auto_stopped": bool(session.auto_stopped),
-                        "stop_reason": session.stop_reason,
-                        "meter_start_wh": session.meter_start,
-                        "meter_stop_wh": session.meter_stop,
-                    }
+    if charger:
+        charger_payload = {
+            "id": charger.charge_point_id,
+            "name": charger.name,
+            "connector_id": t.connector_id,
+            "connector_type": charger.connector_type,
+            "max_power_kw": charger.max_power_kw,
+            "tariff_per_kwh": float(charger.tariff_per_kwh or Decimal("0.10")),
+            "location": charger.location,
+        }
+    if session:
+        session_payload = _serialize_sync_session(session)
 
     # Parse gateway_response JSON safely
     raw_response = None
@@ -2541,6 +3047,8 @@ async def sync_list_transactions(
     status: Optional[str] = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db),
     _: dict = Depends(require_admin_or_staff_admin),
 ):
@@ -2549,11 +3057,16 @@ async def sync_list_transactions(
 
     Typical usage from Jeffrey's app:
         GET /api/sync/transactions?since=2026-04-29T00:00:00Z&limit=200
+        GET /api/sync/transactions?since=...&limit=200&cursor=<next_cursor>
 
     Returns every PaymentTransaction whose `paid_at` (fallback `created_at`)
     falls in [since, until], joined with the matched ChargingSession + Charger
     metadata + parsed gateway_response, so the partner mirrors a single rich
     record per charge.
+
+    Paging: follow `next_cursor` (keyset, see keyset.py — constant cost per
+    page). Cursor pages skip the COUNT; pass include_total=true for an
+    estimated `total`. `offset` still works for the first page / old clients.
     """
     if limit < 1 or limit > 500:
         raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
@@ -2589,21 +3102,28 @@ async def sync_list_transactions(
         statuses = [s.strip() for s in status.split(",") if s.strip()]
         q = q.filter(PaymentTransaction.status.in_(statuses))
 
-    total = q.count()
-    txns = (
-        q.order_by(PaymentTransaction.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    keys = (PaymentTransaction.created_at, PaymentTransaction.id)
+    if cursor:
+        try:
+            txns, next_cursor = keyset_page(q, keys, cursor=cursor, limit=limit)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = estimated_count(db, q) if include_total else None
+        next_offset = None
+    else:
+        txns, next_cursor = offset_page(q, keys, offset=offset, limit=limit)
+        total = q.count()
+        next_offset = offset + len(txns) if next_cursor else None
+    related = _sync_related(db, txns)
 
     return {
         "success": True,
         "total": total,
         "limit": limit,
         "offset": offset,
-        "next_offset": offset + len(txns) if (offset + len(txns)) < total else None,
-        "transactions": [_serialize_sync_transaction(t, db) for t in txns],
+        "next_offset": next_offset,
+        "next_cursor": next_cursor,
+        "transactions": [_serialize_sync_transaction(t, *related.get(t.id, ())) for t in txns],
     }
 
 
@@ -2623,7 +3143,71 @@ async def sync_get_transaction(
     )
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    return {"success": True, "transaction": _serialize_sync_transaction(txn, db)}
+    return {"success": True, "transaction": _serialize_sync_transaction(txn, *_sync_related(db, [txn]).get(txn.id, ()))}
+
+
+@app.get("/api/sync/changes")
+async def sync_list_changes(
+    after_seq: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    entities: Optional[str] = None,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Partner-backend change feed — every PaymentTransaction / ChargingSession
+    insert, update or delete after `after_seq`, oldest first (change_feed.py).
+
+        GET /api/sync/changes?after_seq=0
+        GET /api/sync/changes?after_seq=<last_seq>&entities=charging_session
+
+    Each change carries the entity's current state in `data` (null once
+    deleted); store `last_seq` and pass it back as after_seq. `has_more`
+    means call again right away. If after_seq < oldest_seq − 1 the feed no
+    longer covers the gap — re-sync via /api/sync/transactions.
+    """
+    wanted = [e.strip() for e in (entities or "").split(",") if e.strip()]
+    unknown = set(wanted) - set(CHANGE_FEED_ENTITIES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown entities: {', '.join(sorted(unknown))}")
+
+    changes, has_more = changes_after(db, after_seq, limit=limit, entities=wanted or None)
+
+    # Current state of everything touched — one query per entity type.
+    txn_ids = {c.entity_id for c in changes if c.entity == "payment_transaction"}
+    session_ids = {c.entity_id for c in changes if c.entity == "charging_session"}
+    txns = {t.id: t for t in db.query(PaymentTransaction).filter(PaymentTransaction.id.in_(txn_ids))} if txn_ids else {}
+    related = _sync_related(db, list(txns.values()))
+    sessions = (
+        {
+            s.id: {**_serialize_sync_session(s), "charge_point_id": cp_id, "user_id": s.user_id}
+            for s, cp_id in db.query(ChargingSession, Charger.charge_point_id)
+            .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+            .filter(ChargingSession.id.in_(session_ids))
+        }
+        if session_ids else {}
+    )
+    txn_data = {tid: _serialize_sync_transaction(t, *related.get(tid, ())) for tid, t in txns.items()}
+
+    return {
+        "success": True,
+        "after_seq": after_seq,
+        "last_seq": changes[-1].seq if changes else after_seq,
+        "has_more": has_more,
+        "oldest_seq": change_feed_oldest_seq(db),
+        "changes": [
+            {
+                "seq": c.seq,
+                "entity": c.entity,
+                "id": c.entity_id,
+                "ref": c.entity_ref,
+                "op": c.op,
+                "fields": json.loads(c.fields) if c.fields else None,
+                "changed_at": c.created_at.isoformat() if c.created_at else None,
+                "data": (txn_data if c.entity == "payment_transaction" else sessions).get(c.entity_id),
+            }
+            for c in changes
+        ],
+    }
 
 
 @app.get("/api/admin/charger/{charger_id}/status")
@@ -2764,52 +3348,214 @@ async def ocpp_get_diagnostics(charge_point_id: str, request: GetDiagnosticsRequ
 # route comes first, "bulk" gets bound to charge_point_id and the request hits
 # the single-charger handler, which 404s because no charger has id "bulk".
 @app.post("/api/ocpp/bulk/update-firmware")
-async def ocpp_bulk_update_firmware(request: BulkUpdateFirmwareRequest, db: Session = Depends(get_db), _: dict = Depends(require_admin_or_staff_admin)):
-    """Send UpdateFirmware to multiple chargers at once. If charge_point_ids is empty, targets all currently connected chargers."""
-    from ocpp_server import active_charge_points
+async def ocpp_bulk_update_firmware(request: BulkUpdateFirmwareRequest, db: Session = Depends(get_db), admin_ctx: dict = Depends(require_admin_or_staff_admin)):
+    """Send UpdateFirmware to multiple chargers at once. If charge_point_ids is empty, targets all currently connected chargers.
 
-    if request.charge_point_ids:
-        target_ids = request.charge_point_ids
-    else:
-        target_ids = list(active_charge_points.keys())
+    Runs as a bulk command job (bulk_commands.py): chargers go out in waves
+    of BULK_FIRMWARE_WAVE_SIZE in parallel, delay_between_seconds apart, so
+    downloads stay staggered. Waits for the job so the operations page gets
+    its per-charger results; /api/admin/bulk-commands is the non-blocking
+    path."""
+    connected = await asyncio.to_thread(connected_charge_point_ids)
+    target_ids = list(dict.fromkeys(request.charge_point_ids)) if request.charge_point_ids else sorted(connected)
 
     if not target_ids:
         return {"success": False, "message": "No chargers specified and none are currently connected.", "results": []}
 
-    delay = max(0.0, min(float(request.delay_between_seconds or 1.0), 10.0))
-    results = []
-
-    for idx, cp_id in enumerate(target_ids):
-        if idx > 0 and delay > 0:
-            await asyncio.sleep(delay)
-
-        cp = get_active_charge_point(cp_id)
-        if not cp:
-            results.append({"charge_point_id": cp_id, "success": False, "message": "Not connected"})
-            continue
-
-        try:
-            await cp.update_firmware(
-                location=request.location,
-                retrieve_date=request.retrieve_date,
-                retries=request.retries,
-                retry_interval=request.retry_interval,
-            )
-            results.append({"charge_point_id": cp_id, "success": True, "message": "Command sent"})
-            logger.info(f"Bulk UpdateFirmware sent to {cp_id}")
-        except Exception as e:
-            results.append({"charge_point_id": cp_id, "success": False, "message": str(e)})
-            logger.error(f"Bulk UpdateFirmware error for {cp_id}: {e}")
-
+    params = {"location": request.location, "retrieve_date": request.retrieve_date,
+              "retries": request.retries, "retry_interval": request.retry_interval}
+    job = create_bulk_job(
+        db, "update_firmware", params, target_ids, connected,
+        concurrency=BULK_FIRMWARE_WAVE_SIZE, wave_size=BULK_FIRMWARE_WAVE_SIZE,
+        wave_delay_seconds=max(0.0, min(float(request.delay_between_seconds or 1.0), 10.0)),
+        target={"charge_point_ids": target_ids}, created_by=_bulk_job_actor(admin_ctx),
+    )
+    await run_bulk_job(job.id)
+
+    rows = db.query(BulkCommandResult).filter(BulkCommandResult.job_id == job.id).all()
+    order = {cp_id: i for i, cp_id in enumerate(target_ids)}
+    results = [
+        {"charge_point_id": r.charge_point_id, "success": r.status == "success",
+         "message": "Command sent" if r.status == "success" else (r.error or r.status)}
+        for r in sorted(rows, key=lambda r: order.get(r.charge_point_id, 0))
+    ]
     sent = sum(1 for r in results if r["success"])
     failed = len(results) - sent
     return {
         "success": failed == 0,
         "message": f"Sent to {sent}/{len(results)} charger(s). {failed} failed.",
+        "job_id": job.id,
         "results": results,
     }
 
 
+# ==================== BULK OCPP COMMANDS ====================
+
+# Chargers per UpdateFirmware wave on /api/ocpp/bulk/update-firmware.
+BULK_FIRMWARE_WAVE_SIZE = int(os.getenv("BULK_FIRMWARE_WAVE_SIZE", "10"))
+BULK_STREAM_POLL_SECONDS = 2.0  # fallback when the job runs in another API process
+_BULK_TERMINAL = ("completed", "halted", "cancelled", "interrupted")
+
+
+def _bulk_job_actor(admin_ctx: dict) -> str:
+    if admin_ctx.get("staff_id") is not None:
+        return f"staff:{admin_ctx['staff_id']}"
+    return f"user:{admin_ctx.get('user_id')}"
+
+
+@app.post("/api/admin/bulk-commands", status_code=202)
+async def admin_create_bulk_command(
+    req: BulkCommandRequest,
+    db: Session = Depends(get_db),
+    admin_ctx: dict = Depends(require_admin_or_staff_admin),
+):
+    """Run one OCPP command across a set of chargers in the background.
+
+        {"command": "change_configuration",
+         "params": {"key": "HeartbeatInterval", "value": "300"},
+         "target": {"tenant": "czero-tng", "model": "AION-7"},
+         "concurrency": 20, "timeout_seconds": 30,
+         "wave_size": 50, "wave_delay_seconds": 60, "max_failure_ratio": 0.2}
+
+    Returns the queued job at once; follow it with
+    GET /api/admin/bulk-commands/{id}/stream or poll GET .../{id}.
+    """
+    try:
+        validate_bulk_params(req.command, req.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if req.max_failure_ratio is not None and not 0 <= req.max_failure_ratio <= 1:
+        raise HTTPException(status_code=400, detail="max_failure_ratio must be between 0 and 1")
+    target = req.target
+    if not (target.tenant or target.model or target.charge_point_ids or target.all):
+        raise HTTPException(status_code=400, detail="Specify tenant, model or charge_point_ids (or all=true for the whole fleet)")
+
+    target_ids, unknown = resolve_bulk_targets(db, target.tenant, target.model, target.charge_point_ids)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown chargers: {', '.join(unknown[:20])}")
+    if not target_ids:
+        raise HTTPException(status_code=400, detail="No chargers match the target")
+
+    connected = await asyncio.to_thread(connected_charge_point_ids)
+    job = create_bulk_job(
+        db, req.command, req.params, target_ids, connected,
+        concurrency=req.concurrency, timeout_seconds=req.timeout_seconds,
+        wave_size=req.wave_size, wave_delay_seconds=req.wave_delay_seconds,
+        max_failure_ratio=req.max_failure_ratio, target=target.model_dump(exclude_defaults=True),
+        created_by=_bulk_job_actor(admin_ctx),
+    )
+    start_bulk_job(job.id)
+    logger.info(f"Bulk {req.command} job #{job.id} queued for {len(target_ids)} charger(s)")
+    return {"success": True, "job": serialize_bulk_job(job)}
+
+
+@app.get("/api/admin/bulk-commands")
+async def admin_list_bulk_commands(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Most recent bulk command jobs, newest first."""
+    jobs = db.query(BulkCommandJob).order_by(BulkCommandJob.id.desc()).limit(limit).all()
+    return {"success": True, "jobs": [serialize_bulk_job(j) for j in jobs]}
+
+
+@app.get("/api/admin/bulk-commands/{job_id}")
+async def admin_get_bulk_command(
+    job_id: int,
+    status: Optional[str] = None,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Job record with its per-charger results (optionally one status)."""
+    job = db.get(BulkCommandJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk command job not found")
+    q = db.query(BulkCommandResult).filter(BulkCommandResult.job_id == job_id)
+    if status:
+        q = q.filter(BulkCommandResult.status == status)
+    rows = q.order_by(BulkCommandResult.wave, BulkCommandResult.charge_point_id).all()
+    return {"success": True, "job": serialize_bulk_job(job), "results": [serialize_bulk_result(r) for r in rows]}
+
+
+@app.post("/api/admin/bulk-commands/{job_id}/cancel")
+async def admin_cancel_bulk_command(
+    job_id: int,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_admin_or_staff_admin),
+):
+    """Stop a queued / running job; commands already in flight finish."""
+    if not db.get(BulkCommandJob, job_id):
+        raise HTTPException(status_code=404, detail="Bulk command job not found")
+    if not request_bulk_cancel(db, job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return {"success": True, "message": f"Cancelling job #{job_id}"}
+
+
+def _bulk_progress(job_id: int, since: Optional[datetime]):
+    db = SessionLocal()
+    try:
+        job = db.get(BulkCommandJob, job_id)
+        if job is None:
+            return None, []
+        return serialize_bulk_job(job), [serialize_bulk_result(r) for r in bulk_finished_results(db, job_id, since)]
+    finally:
+        db.close()
+
+
+@app.get("/api/admin/bulk-commands/{job_id}/stream")
+async def admin_stream_bulk_command(
+    job_id: int,
+    request: Request,
+    _: dict = Depends(require_admin_or_staff_admin_stream),
+):
+    """Server-Sent Events for one job:
+
+        event: job      — counters / status (first frame and on every change)
+        event: result   — a charger finished (every finished result is sent once)
+        event: done     — job reached a final status; the stream ends
+
+    Wakes on each progress flush of a job running in this process and
+    re-reads every BULK_STREAM_POLL_SECONDS otherwise.
+    """
+    job, _ = await asyncio.to_thread(_bulk_progress, job_id, datetime.max)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Bulk command job not found")
+
+    async def _events():
+        # Results are written in finished_at order, so a watermark plus the
+        # chargers already sent at that exact timestamp never repeats or skips one.
+        mark: Optional[str] = None
+        sent_at_mark: set = set()
+        last_job = None
+        while True:
+            since = datetime.fromisoformat(mark) if mark else None
+            job, results = await asyncio.to_thread(_bulk_progress, job_id, since)
+            for r in results:
+                if r["finished_at"] == mark and r["charge_point_id"] in sent_at_mark:
+                    continue
+                yield _sse("result", r)
+                if r["finished_at"] != mark:
+                    mark, sent_at_mark = r["finished_at"], set()
+                sent_at_mark.add(r["charge_point_id"])
+            if job != last_job:
+                yield _sse("job", job)
+                last_job = job
+            if job is None or job["status"] in _BULK_TERMINAL:
+                yield _sse("done", job)
+                return
+            if await request.is_disconnected():
+                return
+            if not await wait_for_bulk_progress(job_id, BULK_STREAM_POLL_SECONDS):
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/ocpp/{charge_point_id}/update-firmware", response_model=OcppOperationResponse)
 async def ocpp_update_firmware(charge_point_id: str, request: UpdateFirmwareRequest, db: Session = Depends(get_db), _: dict = Depends(require_admin_or_staff_admin)):
     """OCPP 1.6 UpdateFirmware"""
@@ -3492,6 +4238,7 @@ async def create_charging_schedule(
         existing.enabled       = payload.enabled
         db.commit()
         db.refresh(existing)
+        charging_scheduler.upsert(existing)
         logger.info(f"Updated schedule #{existing.id} for user {current_user.id} / {charge_point_id}")
         await _push_schedule_to_aion_charger(charge_point_id, payload)
         return existing
@@ -3510,6 +4257,7 @@ async def create_charging_schedule(
     db.add(row)
     db.commit()
     db.refresh(row)
+    charging_scheduler.upsert(row)
     logger.info(f"Created schedule #{row.id} for user {current_user.id} / {charge_point_id}")
     # Push the schedule to the physical charger too — otherwise the DB row is
     # a dead record. AION firmware >= V2.0.04 handles the actual timer.
@@ -3519,14 +4267,14 @@ async def create_charging_schedule(
 
 async def _push_schedule_to_aion_charger(charge_point_id: str, payload) -> None:
     """Disable the charger's built-in scheduler and let the backend
-    schedule_worker() loop drive RemoteStart / RemoteStop instead.
+    charging_scheduler drive RemoteStart / RemoteStop instead.
 
     AION firmware V2.0.04 only supports one day per schedule and its
     Sch_Day is a single 0..6 value — insufficient for the multi-day
     (daily / weekdays / weekends) UI the AppEV exposes. We disable the
     firmware timer (Sch_State=0) after every save so it can never fire
     on its own; the authoritative schedule lives in the ChargingSchedule
-    DB rows and is enforced by schedule_worker() every minute.
+    DB rows and is enforced by charging_scheduler.
     """
     cp = get_active_charge_point(charge_point_id)
     if cp is None:
@@ -3562,6 +4310,7 @@ async def toggle_charging_schedule(
     row.enabled = not row.enabled
     db.commit()
     db.refresh(row)
+    charging_scheduler.upsert(row)
     return row
 
 
@@ -3580,6 +4329,7 @@ async def delete_charging_schedule(
         raise HTTPException(status_code=404, detail="Schedule not found")
     db.delete(row)
     db.commit()
+    charging_scheduler.remove(schedule_id)
     return {"success": True, "message": "Schedule deleted"}
 
 
@@ -5184,26 +5934,27 @@ async def admin_user_report(
     if not admin:
         raise HTTPException(status_code=403, detail="Admin access required")
 
-    total = db.query(User).count()
-    active = db.query(User).filter(User.is_active == True).count()
-    verified = db.query(User).filter(User.is_verified == True).count()
-    admins = db.query(User).filter(User.is_admin == True).count()
+    now = _utcnow()
+    week_ago = now - timedelta(days=7)
+    total, active, verified, admins, recent_logins, never_logged_in = (
+        int(v or 0) for v in db.query(
+            func.count(User.id),
+            func.sum(case((User.is_active == True, 1), else_=0)),
+            func.sum(case((User.is_verified == True, 1), else_=0)),
+            func.sum(case((User.is_admin == True, 1), else_=0)),
+            func.sum(case((User.last_login >= week_ago, 1), else_=0)),  # recent logins (last 7 days)
+            func.sum(case((User.last_login == None, 1), else_=0)),  # noqa: E711
+        ).one()
+    )
     inactive = total - active
     unverified = total - verified
 
     # Registration trend (last 30 days, grouped by day)
-    now = _utcnow()
-    trend = []
-    for i in range(29, -1, -1):
-        day_start = (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        count = db.query(User).filter(User.created_at >= day_start, User.created_at < day_end).count()
-        trend.append({"date": day_start.strftime("%Y-%m-%d"), "count": count})
-
-    # Recent logins (last 7 days)
-    week_ago = now - timedelta(days=7)
-    recent_logins = db.query(User).filter(User.last_login >= week_ago).count()
-    never_logged_in = db.query(User).filter(User.last_login == None).count()
+    trend_start = (now - timedelta(days=29)).replace(hour=0, minute=0, second=0, microsecond=0)
+    trend = [
+        {"date": day, "count": count}
+        for day, count in bucket_series(db, User.created_at, trend_start, trend_start + timedelta(days=30))
+    ]
 
     # Top 10 newest users
     newest = db.query(User).order_by(desc(User.created_at)).limit(10).all()
@@ -5227,9 +5978,10 @@ async def admin_wallet_report(
     if not admin:
         raise HTTPException(status_code=403, detail="Admin access required")
 
-    total_balance = float(db.query(func.sum(Wallet.balance)).scalar() or 0)
-    total_points = int(db.query(func.sum(Wallet.points)).scalar() or 0)
-    wallet_count = db.query(Wallet).count()
+    total_balance, total_points, wallet_count = db.query(
+        func.coalesce(func.sum(Wallet.balance), 0), func.coalesce(func.sum(Wallet.points), 0), func.count(Wallet.id)
+    ).one()
+    total_balance, total_points = float(total_balance), int(total_points)
     avg_balance = round(float(total_balance) / max(wallet_count, 1), 2)
 
     # Top 10 wallet holders
@@ -5238,10 +5990,15 @@ async def admin_wallet_report(
 
     # Recent transactions (last 20)
     from database import WalletTransaction
-    recent_txns = db.query(WalletTransaction).order_by(desc(WalletTransaction.created_at)).limit(20).all()
+    recent_txns = (
+        db.query(WalletTransaction, User)
+        .outerjoin(User, User.id == WalletTransaction.user_id)
+        .order_by(desc(WalletTransaction.created_at))
+        .limit(20)
+        .all()
+    )
     txn_list = []
-    for t in recent_txns:
-        user = db.query(User).filter(User.id == t.user_id).first()
+    for t, user in recent_txns:
         txn_list.append({
             "id": t.id,
             "user": user.name or user.email if user else "Unknown",
@@ -5252,17 +6009,19 @@ async def admin_wallet_report(
         })
 
     # Balance distribution
-    zero = db.query(Wallet).filter(Wallet.balance == 0).count()
-    low = db.query(Wallet).filter(Wallet.balance > 0, Wallet.balance <= 10).count()
-    mid = db.query(Wallet).filter(Wallet.balance > 10, Wallet.balance <= 50).count()
-    high = db.query(Wallet).filter(Wallet.balance > 50, Wallet.balance <= 100).count()
-    premium = db.query(Wallet).filter(Wallet.balance > 100).count()
+    distribution = bucket_counts(db, Wallet.balance, [
+        ("zero", Wallet.balance == 0),
+        ("low_1_10", and_(Wallet.balance > 0, Wallet.balance <= 10)),
+        ("mid_10_50", and_(Wallet.balance > 10, Wallet.balance <= 50)),
+        ("high_50_100", and_(Wallet.balance > 50, Wallet.balance <= 100)),
+        ("premium_100_plus", Wallet.balance > 100),
+    ])
 
     return {
         "summary": {"total_balance": round(total_balance, 2), "total_points": total_points, "wallet_count": wallet_count, "avg_balance": avg_balance},
         "top_wallets": top_list,
         "recent_transactions": txn_list,
-        "distribution": {"zero": zero, "low_1_10": low, "mid_10_50": mid, "high_50_100": high, "premium_100_plus": premium},
+        "distribution": distribution,
     }
 
 
@@ -5289,10 +6048,13 @@ async def admin_activity_report(
         events.append({"time": u.last_login.isoformat() if u.last_login else None, "type": "login", "icon": "🔑", "desc": f"User logged in: {u.name or u.email}", "detail": u.email})
 
     # Recent charging sessions (last 20)
-    recent_sessions = db.query(ChargingSession).order_by(desc(ChargingSession.start_time)).limit(20).all()
-    for s in recent_sessions:
-        charger = db.query(Charger).filter(Charger.id == s.charger_id).first()
-        cp_id = charger.charge_point_id if charger else "Unknown"
+    recent_sessions = (
+        db.query(ChargingSession, Charger.charge_point_id)
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+        .order_by(desc(ChargingSession.start_time)).limit(20).all()
+    )
+    for s, cp_id in recent_sessions:
+        cp_id = cp_id or "Unknown"
         events.append({"time": s.start_time.isoformat() if s.start_time else None, "type": "session", "icon": "⚡", "desc": f"Charging session on {cp_id}", "detail": f"Status: {s.status}, Energy: {round(s.energy_consumed or 0, 2)} kWh"})
 
     # Recent tickets (last 20)
@@ -5301,10 +6063,13 @@ async def admin_activity_report(
         events.append({"time": t.created_at.isoformat() if t.created_at else None, "type": "ticket", "icon": "🎫", "desc": f"Ticket {t.ticket_number}: {t.subject}", "detail": f"By {t.user_email} — {t.status}"})
 
     # Recent maintenance (last 20)
-    recent_maint = db.query(MaintenanceRecord).order_by(desc(MaintenanceRecord.date_reported)).limit(20).all()
-    for m in recent_maint:
-        charger = db.query(Charger).filter(Charger.id == m.charger_id).first()
-        cp_id = charger.charge_point_id if charger else "Unknown"
+    recent_maint = (
+        db.query(MaintenanceRecord, Charger.charge_point_id)
+        .outerjoin(Charger, Charger.id == MaintenanceRecord.charger_id)
+        .order_by(desc(MaintenanceRecord.date_reported)).limit(20).all()
+    )
+    for m, cp_id in recent_maint:
+        cp_id = cp_id or "Unknown"
         events.append({"time": m.date_reported.isoformat() if m.date_reported else None, "type": "maintenance", "icon": "🔧", "desc": f"Maintenance on {cp_id}: {m.issue_description[:60] if m.issue_description else 'N/A'}", "detail": f"Status: {m.status}, Cost: RM {float(round(m.cost or 0, 2)):.2f}"})
 
     # Recent staff logins
@@ -5563,90 +6328,39 @@ async def get_invoice_summary(
     db: Session = Depends(get_db),
     _: dict = Depends(require_admin_or_staff_admin),
 ):
-    """Get invoice summary with totals (admin/staff only)"""
-    # Parse dates
-    start_dt = None
-    end_dt = None
-    if start_date:
-        try:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        except:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    if end_date:
-        try:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        except:
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            end_dt = end_dt.replace(hour=23, minute=59, second=59)
-    
-    # Build query
-    query = db.query(ChargingSession)
-    
-    if charger_id:
-        charger = db.query(Charger).filter(Charger.charge_point_id == charger_id).first()
-        if charger:
-            query = query.filter(ChargingSession.charger_id == charger.id)
-    
-    if start_dt:
-        query = query.filter(ChargingSession.start_time >= start_dt)
-    if end_dt:
-        query = query.filter(ChargingSession.start_time <= end_dt)
-    
-    sessions = query.all()
-    
-    # Calculate totals
-    total_sessions = len(sessions)
-    completed_sessions = len([s for s in sessions if s.status == 'completed'])
-    active_sessions = len([s for s in sessions if s.status == 'active'])
-    total_energy = float(sum(s.energy_consumed or 0 for s in sessions))
-    
-    # Get pricing (use default if not set)
-    pricing = db.query(Pricing).filter(Pricing.is_active == True).first()
-    price_per_kwh = float(pricing.price_per_kwh) if pricing else 0.50  # Default RM 0.50/kWh
-    
-    total_revenue = total_energy * price_per_kwh
-    
-    # Calculate total duration
-    total_duration_minutes = 0
-    for s in sessions:
-        if s.start_time and s.stop_time:
-            duration = (s.stop_time - s.start_time).total_seconds() / 60
-            total_duration_minutes += duration
-    
-    # Get charger breakdown
-    charger_breakdown = {}
-    for s in sessions:
-        charger = db.query(Charger).filter(Charger.id == s.charger_id).first()
-        if charger:
-            cp_id = charger.charge_point_id
-            if cp_id not in charger_breakdown:
-                charger_breakdown[cp_id] = {
-                    "sessions": 0,
-                    "energy_kwh": 0,
-                    "revenue": 0,
-                    "duration_minutes": 0
-                }
-            charger_breakdown[cp_id]["sessions"] += 1
-            charger_breakdown[cp_id]["energy_kwh"] += s.energy_consumed or 0
-            charger_breakdown[cp_id]["revenue"] += (s.energy_consumed or 0) * price_per_kwh
-            if s.start_time and s.stop_time:
-                charger_breakdown[cp_id]["duration_minutes"] += (s.stop_time - s.start_time).total_seconds() / 60
-    
-    # Round values and ensure float (not Decimal)
-    for cp_id in charger_breakdown:
-        charger_breakdown[cp_id]["energy_kwh"] = float(round(charger_breakdown[cp_id]["energy_kwh"], 2))
-        charger_breakdown[cp_id]["revenue"] = float(round(charger_breakdown[cp_id]["revenue"], 2))
-        charger_breakdown[cp_id]["duration_minutes"] = float(round(charger_breakdown[cp_id]["duration_minutes"], 1))
-    
-    # Get maintenance costs in period
-    maintenance_query = db.query(MaintenanceRecord)
+    """Get invoice summary with totals (admin/staff only).
+    Aggregated per charger in SQL; revenue uses each charger's price."""
+    start_dt, end_dt = parse_invoice_range(start_date, end_date)
+    prices = invoice_prices(db)
+    totals = charger_totals(db, start_dt, end_dt, charger_id, prices)
+
+    total_sessions = sum(t["sessions"] for t in totals)
+    completed_sessions = sum(t["completed"] for t in totals)
+    active_sessions = sum(t["active"] for t in totals)
+    total_energy = sum(t["energy_kwh"] for t in totals)
+    total_revenue = sum(t["revenue"] for t in totals)
+    total_duration_minutes = sum(t["duration_minutes"] for t in totals)
+    price_per_kwh = prices[1]  # default tariff, for display
+
+    charger_breakdown = {
+        t["charge_point_id"]: {
+            "sessions": t["sessions"],
+            "energy_kwh": float(round(t["energy_kwh"], 2)),
+            "revenue": float(round(t["revenue"], 2)),
+            "duration_minutes": float(round(t["duration_minutes"], 1)),
+            "price_per_kwh": t["price_per_kwh"],
+        }
+        for t in totals if t["charge_point_id"]
+    }
+
+    # Maintenance costs in period
+    maintenance_query = db.query(func.count(MaintenanceRecord.id), func.coalesce(func.sum(MaintenanceRecord.cost), 0))
     if start_dt:
         maintenance_query = maintenance_query.filter(MaintenanceRecord.date_reported >= start_dt)
     if end_dt:
         maintenance_query = maintenance_query.filter(MaintenanceRecord.date_reported <= end_dt)
-    
-    maintenance_records = maintenance_query.all()
-    total_maintenance_cost = float(sum(float(m.cost or 0) for m in maintenance_records))
+    maintenance_records, total_maintenance_cost = maintenance_query.one()
+    total_maintenance_cost = float(total_maintenance_cost)
     
     return {
         "period": {
@@ -5671,7 +6385,7 @@ async def get_invoice_summary(
             "total_hours": round(total_duration_minutes / 60, 2)
         },
         "maintenance": {
-            "total_records": len(maintenance_records),
+            "total_records": int(maintenance_records),
             "total_cost": float(round(total_maintenance_cost, 2))
         },
         "net_profit": float(round(total_revenue - total_maintenance_cost, 2)),
@@ -5687,66 +6401,66 @@ async def get_invoice_sessions(
     db: Session = Depends(get_db),
     _: dict = Depends(require_admin_or_staff_admin),
 ):
-    """Get detailed session list for invoice (admin/staff only)"""
-    # Parse dates
-    start_dt = None
-    end_dt = None
-    if start_date:
-        try:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        except:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    if end_date:
-        try:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        except:
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            end_dt = end_dt.replace(hour=23, minute=59, second=59)
-    
-    # Build query
-    query = db.query(ChargingSession)
-    
-    if charger_id:
-        charger = db.query(Charger).filter(Charger.charge_point_id == charger_id).first()
-        if charger:
-            query = query.filter(ChargingSession.charger_id == charger.id)
-    
-    if start_dt:
-        query = query.filter(ChargingSession.start_time >= start_dt)
-    if end_dt:
-        query = query.filter(ChargingSession.start_time <= end_dt)
-    
-    sessions = query.order_by(desc(ChargingSession.start_time)).all()
-    
-    # Get pricing
-    pricing = db.query(Pricing).filter(Pricing.is_active == True).first()
-    price_per_kwh = float(pricing.price_per_kwh) if pricing else 0.50
-    
-    result = []
-    for s in sessions:
-        charger = db.query(Charger).filter(Charger.id == s.charger_id).first()
-        
-        duration_minutes = 0
-        if s.start_time and s.stop_time:
-            duration_minutes = (s.stop_time - s.start_time).total_seconds() / 60
-        
-        amount = float(s.energy_consumed or 0) * price_per_kwh
-        
-        result.append({
-            "id": s.id,
-            "transaction_id": s.transaction_id,
-            "charge_point_id": charger.charge_point_id if charger else "Unknown",
-            "start_time": s.start_time.isoformat() if s.start_time else None,
-            "stop_time": s.stop_time.isoformat() if s.stop_time else None,
-            "duration_minutes": round(duration_minutes, 1),
-            "energy_kwh": float(round(s.energy_consumed or 0, 2)),
-            "price_per_kwh": float(price_per_kwh),
-            "amount": float(round(amount, 2)),
-            "status": s.status,
-            "user_id": s.user_id
-        })
-    
-    return result
+    """Get detailed session list for invoice (admin/staff only).
+    For large periods use /api/invoice/sessions/export instead."""
+    start_dt, end_dt = parse_invoice_range(start_date, end_date)
+    return [
+        {
+            "id": sid,
+            "transaction_id": txn,
+            "charge_point_id": cp_id,
+            "start_time": start_time.isoformat() if start_time else None,
+            "stop_time": stop_time.isoformat() if stop_time else None,
+            "duration_minutes": duration_minutes,
+            "energy_kwh": energy_kwh,
+            "price_per_kwh": price_per_kwh,
+            "amount": amount,
+            "status": status,
+            "user_id": user_id,
+        }
+        for (sid, txn, cp_id, start_time, stop_time, duration_minutes, energy_kwh,
+             price_per_kwh, amount, status, user_id) in session_rows(db, start_dt, end_dt, charger_id)
+    ]
+
+
+@app.get("/api/invoice/sessions/export")
+def export_invoice_sessions(
+    format: str = Query("csv", description="csv, parquet or arrow"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    charger_id: Optional[str] = None,
+    _: dict = Depends(require_admin_or_staff_admin_stream),
+):
+    """Stream the invoice session list as CSV, Parquet or Arrow (admin/staff only).
+
+    Rows are read through a server-side cursor and written chunk by chunk,
+    so month-end exports run in constant memory."""
+    fmt = format.lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}' (use csv, parquet or arrow)")
+    if fmt != "csv" and not columnar_available():
+        raise HTTPException(status_code=501, detail=f"{fmt} export needs pyarrow on the server; use format=csv")
+    start_dt, end_dt = parse_invoice_range(start_date, end_date)
+
+    # The stream outlives the request, so it holds the only session.
+    export_db = SessionLocal()
+    if fmt == "csv":
+        body = stream_csv(export_db, start_dt, end_dt, charger_id)
+    else:
+        body = stream_parquet(export_db, start_dt, end_dt, charger_id, fmt=fmt)
+    media_type, ext = EXPORT_FORMATS[fmt]
+    period = "_".join(d.strftime("%Y%m%d") for d in (start_dt, end_dt) if d) or "all"
+    cp_part = re.sub(r"[^A-Za-z0-9_-]", "", charger_id or "")
+    filename = f"invoice_sessions_{cp_part + '_' if cp_part else ''}{period}.{ext}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 # ============================================================
@@ -5940,10 +6654,15 @@ async def list_tickets(
     search: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db),
     _auth: dict = Depends(require_admin_or_staff_admin),
 ):
-    """List support tickets. Supports filtering by staff/department for hierarchy."""
+    """List support tickets. Supports filtering by staff/department for hierarchy.
+
+    Page with `next_cursor` (keyset); cursor pages only report an (estimated)
+    `total` when include_total=true."""
     q = db.query(SupportTicket)
     if status:
         q = q.filter(SupportTicket.status == status)
@@ -5966,11 +6685,28 @@ async def list_tickets(
             )
         )
 
-    total = q.count()
-    tickets = q.order_by(desc(SupportTicket.created_at)).offset(offset).limit(limit).all()
+    # Correlated COUNT instead of loading every ticket's messages
+    message_count = (
+        select(func.count(TicketMessage.id))
+        .where(TicketMessage.ticket_id == SupportTicket.id)
+        .correlate(SupportTicket)
+        .scalar_subquery()
+    )
+    keys = (SupportTicket.created_at, SupportTicket.id)
+    page_q = q.add_columns(message_count)
+    if cursor:
+        try:
+            tickets, next_cursor = keyset_page(page_q, keys, cursor=cursor, limit=limit, key=lambda row: row[0])
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = estimated_count(db, q) if include_total else None
+    else:
+        total = q.count()
+        tickets, next_cursor = offset_page(page_q, keys, offset=offset, limit=limit, key=lambda row: row[0])
 
     return {
         "total": total,
+        "next_cursor": next_cursor,
         "tickets": [
             {
                 "id": t.id,
@@ -5993,9 +6729,9 @@ async def list_tickets(
                 "due_at": t.due_at.isoformat() if t.due_at else None,
                 "escalated": t.escalated or False,
                 "is_overdue": (t.due_at is not None and _utcnow() > t.due_at and t.status not in ("resolved", "closed")),
-                "message_count": len(t.messages),
+                "message_count": int(n_messages or 0),
             }
-            for t in tickets
+            for t, n_messages in tickets
         ],
     }
 
@@ -6368,7 +7104,13 @@ async def staff_my_tickets(
     if priority:
         q = q.filter(SupportTicket.priority == priority)
 
-    tickets = q.order_by(desc(SupportTicket.created_at)).limit(100).all()
+    message_count = (
+        select(func.count(TicketMessage.id))
+        .where(TicketMessage.ticket_id == SupportTicket.id)
+        .correlate(SupportTicket)
+        .scalar_subquery()
+    )
+    tickets = q.add_columns(message_count).order_by(desc(SupportTicket.created_at)).limit(100).all()
 
     return {
         "total": len(tickets),
@@ -6393,9 +7135,9 @@ async def staff_my_tickets(
                 "due_at": t.due_at.isoformat() if t.due_at else None,
                 "escalated": t.escalated or False,
                 "is_overdue": (t.due_at is not None and _utcnow() > t.due_at and t.status not in ("resolved", "closed")),
-                "message_count": len(t.messages),
+                "message_count": int(n_messages or 0),
             }
-            for t in tickets
+            for t, n_messages in tickets
         ],
     }
 
@@ -7606,183 +8348,119 @@ async def analytics_overview(
     """
     now = _utcnow()
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_ago = now - timedelta(days=7)
     month_ago = now - timedelta(days=30)
     prev_month_start = now - timedelta(days=60)
     prev_month_end = now - timedelta(days=30)
+    first_day = (now - timedelta(days=29)).date()
+
+    # History (revenue, sessions, energy, sign-ups) is read from the
+    # pre-aggregated analytics_facts table (analytics_facts.py); only
+    # current-state numbers below still query the live tables.
 
     # ── REVENUE ──
-    total_revenue_all = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed")
-        .scalar()
-    )
-    revenue_this_month = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed",
-                WalletTransaction.created_at >= month_ago)
-        .scalar()
-    )
-    revenue_prev_month = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed",
-                WalletTransaction.created_at >= prev_month_start,
-                WalletTransaction.created_at < prev_month_end)
-        .scalar()
-    )
-    revenue_today = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed",
-                WalletTransaction.created_at >= today_start)
-        .scalar()
-    )
+    total_revenue_all, total_topups = fact_total(db, "revenue")
+    revenue_this_month, _ = fact_total(db, "revenue", since=month_ago)
+    revenue_prev_month, _ = fact_total(db, "revenue", since=prev_month_start, until=prev_month_end)
+    revenue_today, _ = fact_total(db, "revenue", since=today_start)
     revenue_growth = (
         round(((revenue_this_month - revenue_prev_month) / revenue_prev_month) * 100, 1)
         if revenue_prev_month > 0 else 0.0
     )
 
     # ── DAILY REVENUE (last 30 days) ──
-    daily_revenue = []
-    for i in range(30):
-        day = now - timedelta(days=29 - i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        amt = float(
-            db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-            .filter(WalletTransaction.transaction_type == "topup",
-                    WalletTransaction.status == "completed",
-                    WalletTransaction.created_at >= day_start,
-                    WalletTransaction.created_at < day_end)
-            .scalar()
-        )
-        daily_revenue.append({"date": day_start.strftime("%Y-%m-%d"), "amount": round(amt, 2)})
+    daily_revenue = [
+        {"date": day.strftime("%Y-%m-%d"), "amount": round(amount, 2)}
+        for day, amount, _ in fact_daily(db, "revenue", first_day, 30)
+    ]
 
     # ── USERS ──
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    new_users_this_month = db.query(User).filter(User.created_at >= month_ago).count()
-    new_users_prev_month = db.query(User).filter(
-        User.created_at >= prev_month_start, User.created_at < prev_month_end
-    ).count()
+    total_users, active_users = db.query(
+        func.count(User.id), func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0)
+    ).one()
+    active_users = int(active_users)  # SUM comes back as Decimal on MySQL
+    _, new_users_this_month = fact_total(db, "new_users", since=month_ago)
+    _, new_users_prev_month = fact_total(db, "new_users", since=prev_month_start, until=prev_month_end)
     user_growth = (
         round(((new_users_this_month - new_users_prev_month) / new_users_prev_month) * 100, 1)
         if new_users_prev_month > 0 else 0.0
     )
 
     # Daily user registrations (last 30 days)
-    daily_users = []
-    for i in range(30):
-        day = now - timedelta(days=29 - i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        cnt = db.query(User).filter(
-            User.created_at >= day_start, User.created_at < day_end
-        ).count()
-        daily_users.append({"date": day_start.strftime("%Y-%m-%d"), "count": cnt})
+    daily_users = [
+        {"date": day.strftime("%Y-%m-%d"), "count": count}
+        for day, _, count in fact_daily(db, "new_users", first_day, 30)
+    ]
 
     # ── CHARGING SESSIONS ──
-    total_sessions = db.query(ChargingSession).count()
-    sessions_this_month = db.query(ChargingSession).filter(
-        ChargingSession.start_time >= month_ago
-    ).count()
-    sessions_today = db.query(ChargingSession).filter(
-        ChargingSession.start_time >= today_start
-    ).count()
-    active_sessions = db.query(ChargingSession).filter(
-        ChargingSession.status == "active"
-    ).count()
-    completed_sessions = db.query(ChargingSession).filter(
-        ChargingSession.status == "completed"
-    ).count()
+    _, total_sessions = fact_total(db, "sessions")
+    _, sessions_this_month = fact_total(db, "sessions", since=month_ago)
+    _, sessions_today = fact_total(db, "sessions", since=today_start)
+    status_counts = dict(
+        db.query(ChargingSession.status, func.count(ChargingSession.id))
+        .filter(ChargingSession.status.in_(["active", "completed"]))
+        .group_by(ChargingSession.status)
+        .all()
+    )
+    active_sessions = status_counts.get("active", 0)
+    completed_sessions = status_counts.get("completed", 0)
 
     # Daily sessions (last 30 days)
-    daily_sessions = []
-    for i in range(30):
-        day = now - timedelta(days=29 - i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        cnt = db.query(ChargingSession).filter(
-            ChargingSession.start_time >= day_start,
-            ChargingSession.start_time < day_end
-        ).count()
-        daily_sessions.append({"date": day_start.strftime("%Y-%m-%d"), "count": cnt})
+    daily_sessions = [
+        {"date": day.strftime("%Y-%m-%d"), "count": count}
+        for day, _, count in fact_daily(db, "sessions", first_day, 30)
+    ]
 
     # ── ENERGY ──
-    total_energy = float(
-        db.query(func.coalesce(func.sum(ChargingSession.energy_consumed), 0)).scalar()
-    )
-    energy_this_month = float(
-        db.query(func.coalesce(func.sum(ChargingSession.energy_consumed), 0))
-        .filter(ChargingSession.start_time >= month_ago)
-        .scalar()
-    )
+    total_energy, _ = fact_total(db, "energy_kwh")
+    energy_this_month, _ = fact_total(db, "energy_kwh", since=month_ago)
 
     # ── CHARGERS ──
-    total_chargers = db.query(Charger).count()
-    online_chargers = db.query(Charger).filter(Charger.status == "online").count()
-    offline_chargers = db.query(Charger).filter(Charger.status == "offline").count()
-    faulted_chargers = db.query(Charger).filter(Charger.availability == "faulted").count()
-
     # Charger utilization: sessions per charger
+    sessions_by_charger = fact_by_charger(db, "sessions")
+    energy_by_charger = fact_by_charger(db, "energy_kwh")
+    faults_by_charger = dict(
+        db.query(Fault.charger_id, func.count(Fault.id))
+        .filter(Fault.cleared == False)
+        .group_by(Fault.charger_id)
+        .all()
+    )
     charger_stats = []
     chargers = db.query(Charger).all()
+    total_chargers = len(chargers)
+    online_chargers = sum(1 for c in chargers if c.status == "online")
+    offline_chargers = sum(1 for c in chargers if c.status == "offline")
+    faulted_chargers = sum(1 for c in chargers if c.availability == "faulted")
     for c in chargers:
-        c_sessions = db.query(ChargingSession).filter(
-            ChargingSession.charger_id == c.id
-        ).count()
-        c_energy = float(
-            db.query(func.coalesce(func.sum(ChargingSession.energy_consumed), 0))
-            .filter(ChargingSession.charger_id == c.id)
-            .scalar()
-        )
-        c_faults = db.query(Fault).filter(
-            Fault.charger_id == c.id, Fault.cleared == False
-        ).count()
         charger_stats.append({
             "id": c.id,
             "charge_point_id": c.charge_point_id,
             "vendor": c.vendor,
             "status": c.status,
             "availability": c.availability,
-            "total_sessions": c_sessions,
-            "total_energy_kwh": round(c_energy, 2),
-            "active_faults": c_faults,
+            "total_sessions": sessions_by_charger.get(c.id, (0.0, 0))[1],
+            "total_energy_kwh": round(energy_by_charger.get(c.id, (0.0, 0))[0], 2),
+            "active_faults": faults_by_charger.get(c.id, 0),
         })
 
     # ── WALLET ──
     total_wallet_balance = float(
         db.query(func.coalesce(func.sum(Wallet.balance), 0)).scalar()
     )
-    total_topups = db.query(WalletTransaction).filter(
-        WalletTransaction.transaction_type == "topup",
-        WalletTransaction.status == "completed"
-    ).count()
 
     # Top-up by payment method
-    topup_by_method = (
-        db.query(
-            WalletTransaction.payment_method,
-            func.count(WalletTransaction.id),
-            func.coalesce(func.sum(WalletTransaction.amount), 0)
-        )
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed")
-        .group_by(WalletTransaction.payment_method)
-        .all()
-    )
     payment_methods = [
-        {"method": m or "unknown", "count": c, "total": round(float(t), 2)}
-        for m, c, t in topup_by_method
+        {"method": m or "unknown", "count": c, "total": round(t, 2)}
+        for m, t, c in fact_by_dimension(db, "revenue")
     ]
 
     # ── FAULTS ──
-    total_faults = db.query(Fault).count()
-    active_faults = db.query(Fault).filter(Fault.cleared == False).count()
-    faults_this_month = db.query(Fault).filter(Fault.timestamp >= month_ago).count()
+    total_faults, active_faults, faults_this_month = (
+        int(v or 0) for v in db.query(
+            func.count(Fault.id),
+            func.sum(case((Fault.cleared == False, 1), else_=0)),
+            func.sum(case((Fault.timestamp >= month_ago, 1), else_=0)),
+        ).one()
+    )
 
     # Faults by type
     fault_types = (
@@ -7793,36 +8471,30 @@ async def analytics_overview(
     fault_breakdown = [{"type": ft, "count": c} for ft, c in fault_types]
 
     # ── MAINTENANCE ──
-    total_maintenance = db.query(MaintenanceRecord).count()
-    total_maintenance_cost = float(
-        db.query(func.coalesce(func.sum(MaintenanceRecord.cost), 0)).scalar()
-    )
-    maintenance_this_month = db.query(MaintenanceRecord).filter(
-        MaintenanceRecord.created_at >= month_ago
-    ).count()
+    total_maintenance, total_maintenance_cost, maintenance_this_month = db.query(
+        func.count(MaintenanceRecord.id),
+        func.coalesce(func.sum(MaintenanceRecord.cost), 0),
+        func.coalesce(func.sum(case((MaintenanceRecord.created_at >= month_ago, 1), else_=0)), 0),
+    ).one()
+    total_maintenance_cost = float(total_maintenance_cost)
+    maintenance_this_month = int(maintenance_this_month)
 
     # ── SUPPORT TICKETS ──
-    total_tickets = db.query(SupportTicket).count()
-    open_tickets = db.query(SupportTicket).filter(SupportTicket.status == "open").count()
-    resolved_tickets = db.query(SupportTicket).filter(
-        SupportTicket.status.in_(["resolved", "closed"])
-    ).count()
-
     tickets_by_category = (
-        db.query(SupportTicket.category, func.count(SupportTicket.id))
-        .group_by(SupportTicket.category)
+        db.query(SupportTicket.category, SupportTicket.status, func.count(SupportTicket.id))
+        .group_by(SupportTicket.category, SupportTicket.status)
         .all()
     )
-    ticket_categories = [{"category": cat, "count": cnt} for cat, cnt in tickets_by_category]
+    total_tickets = sum(cnt for _, _, cnt in tickets_by_category)
+    open_tickets = sum(cnt for _, status, cnt in tickets_by_category if status == "open")
+    resolved_tickets = sum(cnt for _, status, cnt in tickets_by_category if status in ("resolved", "closed"))
+    per_category = {}
+    for cat, _, cnt in tickets_by_category:
+        per_category[cat] = per_category.get(cat, 0) + cnt
+    ticket_categories = [{"category": cat, "count": cnt} for cat, cnt in per_category.items()]
 
     # ── PEAK HOURS (from sessions) ──
-    peak_hours = {}
-    sessions_with_time = db.query(ChargingSession).filter(
-        ChargingSession.start_time.isnot(None)
-    ).all()
-    for s in sessions_with_time:
-        hour = s.start_time.hour
-        peak_hours[hour] = peak_hours.get(hour, 0) + 1
+    peak_hours = fact_by_hour(db, "sessions")
     hourly_traffic = [{"hour": h, "sessions": peak_hours.get(h, 0)} for h in range(24)]
 
     # ── PRICING ──
@@ -7919,21 +8591,9 @@ async def analytics_insights(
     insights = []  # {"type": "warning|success|info|action", "category": "...", "title": "...", "message": "...", "priority": 1-5}
 
     # ═══ 1. REVENUE INSIGHTS ═══
-    revenue_this_month = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed",
-                WalletTransaction.created_at >= month_ago)
-        .scalar()
-    )
-    revenue_prev_month = float(
-        db.query(func.coalesce(func.sum(WalletTransaction.amount), 0))
-        .filter(WalletTransaction.transaction_type == "topup",
-                WalletTransaction.status == "completed",
-                WalletTransaction.created_at >= prev_month_start,
-                WalletTransaction.created_at < prev_month_end)
-        .scalar()
-    )
+    # History metrics come from analytics_facts, as in analytics_overview.
+    revenue_this_month, _ = fact_total(db, "revenue", since=month_ago)
+    revenue_prev_month, _ = fact_total(db, "revenue", since=prev_month_start, until=prev_month_end)
 
     if revenue_prev_month > 0:
         rev_change = ((revenue_this_month - revenue_prev_month) / revenue_prev_month) * 100
@@ -8004,9 +8664,7 @@ async def analytics_insights(
             })
 
     # ═══ 3. UTILIZATION INSIGHTS ═══
-    sessions_this_month = db.query(ChargingSession).filter(
-        ChargingSession.start_time >= month_ago
-    ).count()
+    _, sessions_this_month = fact_total(db, "sessions", since=month_ago)
 
     if total_chargers > 0 and sessions_this_month > 0:
         avg_sessions_per_charger = sessions_this_month / total_chargers
@@ -8024,14 +8682,7 @@ async def analytics_insights(
             })
 
     # Peak hour analysis
-    sessions_with_time = db.query(ChargingSession).filter(
-        ChargingSession.start_time.isnot(None),
-        ChargingSession.start_time >= month_ago
-    ).all()
-    peak_hours = {}
-    for s in sessions_with_time:
-        h = s.start_time.hour
-        peak_hours[h] = peak_hours.get(h, 0) + 1
+    peak_hours = fact_by_hour(db, "sessions", since=month_ago)
 
     if peak_hours:
         peak_hour = max(peak_hours, key=peak_hours.get)
@@ -8045,10 +8696,8 @@ async def analytics_insights(
 
     # ═══ 4. USER GROWTH INSIGHTS ═══
     total_users = db.query(User).count()
-    new_users_month = db.query(User).filter(User.created_at >= month_ago).count()
-    new_users_prev = db.query(User).filter(
-        User.created_at >= prev_month_start, User.created_at < prev_month_end
-    ).count()
+    _, new_users_month = fact_total(db, "new_users", since=month_ago)
+    _, new_users_prev = fact_total(db, "new_users", since=prev_month_start, until=prev_month_end)
 
     if total_users > 0:
         # Users with wallet but zero balance
@@ -8159,9 +8808,7 @@ async def analytics_insights(
             "message": f"You have {total_chargers} charger(s). Industry data shows networks with 10+ chargers see 3x more repeat users. Target high-traffic locations: malls, offices, highways."
         })
 
-    total_energy = float(
-        db.query(func.coalesce(func.sum(ChargingSession.energy_consumed), 0)).scalar()
-    )
+    total_energy, _ = fact_total(db, "energy_kwh")
     if total_energy > 0:
         co2_saved = total_energy * 0.585  # kg CO2 per kWh saved vs petrol
         insights.append({
@@ -8482,6 +9129,40 @@ async def _start_reminder_scheduler():
     asyncio.create_task(_ticket_reminder_loop())
 
 
+@app.on_event("startup")
+async def _start_analytics_facts_worker():
+    """Keep analytics_facts (pre-aggregated revenue / sessions / energy /
+    sign-ups) current for /api/analytics — see analytics_facts.py."""
+    asyncio.create_task(analytics_facts_worker())
+
+
+@app.on_event("startup")
+async def _start_change_feed_worker():
+    """Prune expired /api/sync/changes rows — see change_feed.py."""
+    asyncio.create_task(change_feed_worker())
+
+
+@app.on_event("startup")
+async def _start_webhook_delivery_worker():
+    """Deliver queued partner webhooks — see webhook_delivery.py."""
+    asyncio.create_task(webhook_delivery_worker())
+
+
+@app.on_event("startup")
+async def _interrupt_stale_bulk_jobs():
+    """Bulk command jobs whose runner died with its process (bulk_commands.py)
+    would otherwise show `running` forever."""
+    db = SessionLocal()
+    try:
+        count = interrupt_stale_bulk_jobs(db)
+        if count:
+            logger.warning(f"Marked {count} stale bulk command job(s) as interrupted")
+    except Exception as e:
+        logger.error(f"Bulk command job cleanup failed: {e}")
+    finally:
+        db.close()
+
+
 @app.on_event("startup")
 async def _start_refund_worker():
     """Background loop that processes pending TNG refunds from completed
@@ -8493,159 +9174,37 @@ async def _start_refund_worker():
 async def _start_ocpp_state_healer():
     """Background loop that detects + cleans state mismatch between the
     in-memory active_charge_points pool and DB heartbeat. Saves admins
-    from SSHing to fix 'DB says online, RemoteStart says not connected'."""
+    from SSHing to fix 'DB says online, RemoteStart says not connected'.
+    With OCPP_WORKERS > 1 each worker runs its own healer instead — this
+    process holds no sockets and sees none of their liveness events."""
+    from ocpp_workers import ocpp_workers_running
+    if ocpp_workers_running():
+        return
     asyncio.create_task(ocpp_state_healer_loop(interval_seconds=60))
 
 
 @app.on_event("startup")
 async def _start_schedule_worker():
-    """Background loop that drives the ChargingSchedule DB rows — fires
-    RemoteStart at start_time and RemoteStop at stop_time on each matched
-    day. Owns scheduling completely so the AppEV UI can offer daily /
-    weekdays / weekends without depending on AION firmware limitations."""
-    asyncio.create_task(_schedule_worker_loop())
-
-
-# ─── Charging Schedule Worker ────────────────────────────────────────────────
-# In-memory dedup: (schedule_id, "start"|"stop", YYYY-MM-DD HH:MM) → True
-# once fired for a given minute we don't re-fire until the minute rolls over.
-_SCHEDULE_FIRED: dict = {}
-_SCHEDULE_FIRED_MAX_ENTRIES = 2000  # bound the dict so it never grows unbounded
-
-
-def _schedule_matches_today(days_of_week: str, today_dow: int) -> bool:
-    """days_of_week format:
-       - "" or "daily"    → every day
-       - "weekdays"       → 1..5 (Mon..Fri)
-       - "weekends"       → 0, 6  (Sun, Sat)
-       - "0,1,3"          → comma list of ints 0..6 (0=Sun … 6=Sat)
-    """
-    dow = (days_of_week or "").strip().lower()
-    if dow in ("", "daily", "everyday", "all"):
-        return True
-    if dow == "weekdays":
-        return 1 <= today_dow <= 5
-    if dow == "weekends":
-        return today_dow in (0, 6)
-    try:
-        days = {int(x.strip()) for x in dow.split(",") if x.strip()}
-    except ValueError:
-        return False
-    return today_dow in days
-
-
-async def _schedule_worker_loop() -> None:
-    """Every 30s: scan enabled schedules; fire RemoteStart at start_time,
-    RemoteStop at stop_time when the current MYT day/time matches. Dedup
-    per (schedule_id, action, minute-bucket) so a slow tick doesn't double
-    fire within the same minute."""
-    await asyncio.sleep(20)  # let the app fully start
-    while True:
-        try:
-            now_my = datetime.now(MYT)
-            hhmm = now_my.strftime("%H:%M")
-            # Python weekday(): Mon=0..Sun=6. We use Sun=0..Sat=6 to match
-            # AION firmware convention, so remap.
-            today_dow = (now_my.weekday() + 1) % 7
-            minute_bucket = now_my.strftime("%Y-%m-%d %H:%M")
-
-            db = SessionLocal()
-            try:
-                due_start = (
-                    db.query(ChargingSchedule)
-                    .filter(
-                        ChargingSchedule.enabled.is_(True),
-                        ChargingSchedule.start_time == hhmm,
-                    )
-                    .all()
-                )
-                due_stop = (
-                    db.query(ChargingSchedule)
-                    .filter(
-                        ChargingSchedule.enabled.is_(True),
-                        ChargingSchedule.stop_time == hhmm,
-                    )
-                    .all()
-                )
-                for sch in due_start:
-                    if not _schedule_matches_today(sch.days_of_week, today_dow):
-                        continue
-                    dedup_key = (sch.id, "start", minute_bucket)
-                    if _SCHEDULE_FIRED.get(dedup_key):
-                        continue
-                    await _fire_scheduled_start(sch)
-                    _SCHEDULE_FIRED[dedup_key] = True
-                for sch in due_stop:
-                    if not _schedule_matches_today(sch.days_of_week, today_dow):
-                        continue
-                    dedup_key = (sch.id, "stop", minute_bucket)
-                    if _SCHEDULE_FIRED.get(dedup_key):
-                        continue
-                    await _fire_scheduled_stop(sch, db)
-                    _SCHEDULE_FIRED[dedup_key] = True
-
-                # Bound the dedup dict — drop oldest entries when large
-                if len(_SCHEDULE_FIRED) > _SCHEDULE_FIRED_MAX_ENTRIES:
-                    keep = dict(list(_SCHEDULE_FIRED.items())[-_SCHEDULE_FIRED_MAX_ENTRIES // 2:])
-                    _SCHEDULE_FIRED.clear()
-                    _SCHEDULE_FIRED.update(keep)
-            finally:
-                db.close()
-        except Exception as e:
-            logger.error(f"[schedule-worker] tick failed: {e}", exc_info=True)
-        await asyncio.sleep(30)
+    """Drives the ChargingSchedule DB rows — fires RemoteStart at start_time
+    and RemoteStop at stop_time on each matched day (charging_scheduler.py).
+    Owns scheduling completely so the AppEV UI can offer daily / weekdays /
+    weekends without depending on AION firmware limitations."""
+    asyncio.create_task(charging_scheduler.run())
 
 
-async def _fire_scheduled_start(sch: "ChargingSchedule") -> None:
-    """Fire OCPP RemoteStartTransaction for a scheduled row."""
-    cp = get_active_charge_point(sch.charge_point_id)
-    if cp is None:
-        logger.warning(f"[schedule-worker] schedule #{sch.id} start due on "
-                       f"{sch.charge_point_id} but charger offline — skipped")
-        return
-    try:
-        resp = await cp.remote_start_transaction(
-            connector_id=int(sch.connector_id or 1),
-            id_tag=sch.id_tag or "DASHBOARD_USER",
-        )
-        status = getattr(resp, "status", None) if resp else None
-        logger.info(f"[schedule-worker] schedule #{sch.id} START → "
-                    f"{sch.charge_point_id} c{sch.connector_id} status={status}")
-    except Exception as e:
-        logger.error(f"[schedule-worker] schedule #{sch.id} start on "
-                     f"{sch.charge_point_id} failed: {e}", exc_info=True)
+@app.on_event("shutdown")
+async def _drain_meter_ingest_buffer():
+    """Flush write-behind MeterValues rows (meter_ingest.py) before the
+    process exits — the buffer lives on the OCPP thread's loop."""
+    from meter_ingest import drain_meter_buffer
+    await drain_meter_buffer()
 
 
-async def _fire_scheduled_stop(sch: "ChargingSchedule", db: Session) -> None:
-    """Fire OCPP RemoteStopTransaction for the active session on this
-    charger — best effort. No-op if there's no active session."""
-    cp = get_active_charge_point(sch.charge_point_id)
-    if cp is None:
-        logger.warning(f"[schedule-worker] schedule #{sch.id} stop due on "
-                       f"{sch.charge_point_id} but charger offline — skipped")
-        return
-    active = (
-        db.query(ChargingSession)
-        .filter(
-            ChargingSession.charger_id == sch.charger_id,
-            ChargingSession.transaction_id > 0,
-            ChargingSession.status.in_(["active", "interrupted", "stopping"]),
-        )
-        .order_by(ChargingSession.start_time.desc())
-        .first()
-    )
-    if not active:
-        logger.info(f"[schedule-worker] schedule #{sch.id} stop due on "
-                    f"{sch.charge_point_id} but no active session")
-        return
-    try:
-        resp = await cp.remote_stop_transaction(transaction_id=active.transaction_id)
-        status = getattr(resp, "status", None) if resp else None
-        logger.info(f"[schedule-worker] schedule #{sch.id} STOP → "
-                    f"{sch.charge_point_id} txn={active.transaction_id} status={status}")
-    except Exception as e:
-        logger.error(f"[schedule-worker] schedule #{sch.id} stop on "
-                     f"{sch.charge_point_id} failed: {e}", exc_info=True)
+@app.on_event("shutdown")
+async def _drain_heartbeat_coalescer():
+    """Write pending last_seen timestamps (heartbeat_coalescer.py)."""
+    from heartbeat_coalescer import drain_heartbeats
+    await drain_heartbeats()
 
 
 @app.post("/api/admin/chargers/{charge_point_id}/force-reconnect")
@@ -8679,21 +9238,71 @@ async def admin_force_reconnect_charger(
     }
 
 
-@app.on_event("startup")
-async def _capture_api_loop_for_ocpp_dispatch():
-    """
-    Publish the FastAPI event loop to ocpp_server so the scheduled
-    charging worker (running inside the OCPP thread's loop) can
-    dispatch ChargePoint calls here.
-
-    Why: python-ocpp's ChargePoint binds its internal Queue/Lock to
-    whichever loop first touches it. API handlers are that first
-    toucher, so all subsequent calls must come from this loop too,
-    otherwise we get 'Queue bound to a different event loop'.
-    """
-    import ocpp_server  # local import avoids circular
-    ocpp_server.API_LOOP = asyncio.get_running_loop()
-    logger.info("API_LOOP captured for OCPP scheduler dispatch")
+@app.get("/api/admin/ocpp/metrics")
+async def admin_ocpp_metrics(_: dict = Depends(require_admin_or_staff_admin)):
+    """OCPP tier internals for this process: handshake admission (reconnect
+    storms), DB executor queue, write-behind buffers, event bus, orphan
+    session sweep timing, state healer, outbound command queues. In
+    multi-process mode (OCPP_WORKERS > 1) the per-connection figures live in
+    the workers' logs; `ocpp_workers` summarises them."""
+    from event_bus import event_bus
+    from meter_ingest import meter_buffer
+    from ocpp_admission import admission
+    from ocpp_command_queue import command_queue_stats
+    from ocpp_db import db_executor_stats
+    from ocpp_registry import OCPP_NODE_ID, connection_registry
+    from ocpp_liveness import liveness
+    from ocpp_server import healer_stats, orphan_watchdog_stats
+    from ocpp_workers import supervisor_status
+    depths = {
+        cp_id: cp.command_queue.depth
+        for cp_id, cp in list(active_charge_points.items())
+        if getattr(cp, "command_queue", None) is not None and cp.command_queue.depth
+    }
+    return {
+        "node_id": OCPP_NODE_ID,
+        "registry": connection_registry.kind,
+        "local_connections": len(active_charge_points),
+        "admission": admission.snapshot(),
+        "db_executor": db_executor_stats(),
+        "meter_buffer": {**meter_buffer.stats, "pending": meter_buffer.pending},
+        "heartbeat_coalescer": dict(heartbeat_coalescer.stats),
+        "event_bus": dict(event_bus.stats),
+        "orphan_watchdog": dict(orphan_watchdog_stats),
+        "state_healer": {**healer_stats, **liveness.snapshot()},
+        "command_queue": {
+            **command_queue_stats,
+            "queued": sum(depths.values()),
+            "deepest": dict(sorted(depths.items(), key=lambda kv: -kv[1])[:10]),
+        },
+        "ocpp_workers": supervisor_status(),
+    }
+
+
+# ─── OCPP command relay (multi-node) ───────────────────────────────────────
+# Peer nodes POST here when this node holds the charger's WebSocket
+# (ocpp_registry.RemoteChargePoint). Not for browsers or partners.
+
+class OcppRelayRequest(BaseModel):
+    charge_point_id: str
+    command: str
+    args: List[Any] = []
+    kwargs: Dict[str, Any] = {}
+
+
+@app.post("/api/internal/ocpp/relay", include_in_schema=False)
+async def ocpp_relay_command(req: OcppRelayRequest, request: Request):
+    """Run a relayed OCPP command on the socket this node owns."""
+    from ocpp_registry import OCPP_RELAY_SECRET, relay_secret_ok
+    if not OCPP_RELAY_SECRET:
+        raise HTTPException(status_code=503, detail="OCPP relay secret is not configured on this node")
+    if not relay_secret_ok(request.headers.get("X-Relay-Secret", "")):
+        logger.warning("Rejected OCPP relay for %s: invalid relay secret", req.charge_point_id)
+        raise HTTPException(status_code=401, detail="Invalid relay secret")
+    try:
+        return await run_relayed_command(req.charge_point_id, req.command, req.args, req.kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.on_event("startup")
@@ -9012,7 +9621,8 @@ async def terminal_list_chargers(
     online_cutoff = _utcnow() - timedelta(minutes=OFFLINE_THRESHOLD_MINUTES)
     out = []
     for tc, c in rows:
-        is_online = c.last_heartbeat is not None and c.last_heartbeat >= online_cutoff
+        last_heartbeat = heartbeat_coalescer.effective(c.charge_point_id, c.last_heartbeat)
+        is_online = last_heartbeat is not None and last_heartbeat >= online_cutoff
         avail = (c.availability or "unknown").lower()
         available_for_payment = (
             is_online
@@ -0,0 +1,409 @@
+"""
+PlagSini EV — Bulk OCPP Command Jobs
+
+Fleet operations went one charger at a time: /api/ocpp/bulk/update-firmware
+awaited each UpdateFirmware in turn inside the HTTP request, and Reset,
+ChangeConfiguration, GetConfiguration, TriggerMessage and SendLocalList had
+no bulk path at all — an operator clicked through chargers one by one.
+
+A bulk job runs one ChargePoint method against a target set in the
+background and records every charger's outcome:
+
+  * target  — chargers by tenant, by model, or an explicit id list
+              (resolve_targets). Chargers not connected anywhere are
+              recorded as `offline` when the job is created and not tried.
+  * plan    — one bulk_command_results row per charger, inserted `pending`
+              with its wave number, so the rollout is visible up front.
+  * run     — waves of wave_size chargers (0 = all at once), wave_delay
+              seconds apart; inside a wave at most `concurrency` commands
+              are in flight, each bounded by timeout_seconds. A wave whose
+              failure ratio exceeds max_failure_ratio halts the job — a bad
+              firmware image or config value stops at the first wave.
+  * persist — finished results are buffered and written every
+              BULK_COMMAND_FLUSH_SECONDS in one executemany UPDATE, together
+              with the job counters and heartbeat, so DB writes stay flat
+              however many chargers answer at once.
+  * cancel  — request_cancel flips the job to `cancelling`; the runner sees
+              it on its next flush, lets in-flight commands finish and marks
+              the rest `skipped`.
+
+Jobs run on the API loop that created them (get_active_charge_point relays
+to the owning OCPP node when needed). A job whose heartbeat stops — its
+process died — is marked `interrupted` at the next API startup.
+
+Env:
+    BULK_COMMAND_MAX_CONCURRENCY     upper bound for a job's concurrency (50)
+    BULK_COMMAND_TIMEOUT_SECONDS     default per-charger timeout (30)
+    BULK_COMMAND_FLUSH_SECONDS       result / progress write interval (1)
+
+Usage:
+    job = create_job(db, "reset", {"type": "Soft"}, target_ids, connected_ids)
+    start_job(job.id)                      # background task on this loop
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, update
+
+from database import BulkCommandJob, BulkCommandResult, Charger, _utcnow
+from ocpp_db import run_db
+from ocpp_registry import serialize_ocpp_result
+from ocpp_server import ChargePoint, get_active_charge_point
+
+logger = logging.getLogger(__name__)
+
+BULK_COMMAND_MAX_CONCURRENCY = int(os.getenv("BULK_COMMAND_MAX_CONCURRENCY", "50"))
+BULK_COMMAND_TIMEOUT_SECONDS = float(os.getenv("BULK_COMMAND_TIMEOUT_SECONDS", "30"))
+BULK_COMMAND_FLUSH_SECONDS = float(os.getenv("BULK_COMMAND_FLUSH_SECONDS", "1"))
+
+# ChargePoint method → response statuses that count as success
+# (None: any response does — the command has no status field).
+BULK_COMMANDS: Dict[str, Optional[frozenset]] = {
+    "reset": frozenset({"Accepted"}),
+    "change_configuration": frozenset({"Accepted", "RebootRequired"}),
+    "get_configuration": None,
+    "trigger_message": frozenset({"Accepted"}),
+    "send_local_list": frozenset({"Accepted"}),
+    "update_firmware": None,
+    "change_availability": frozenset({"Accepted", "Scheduled"}),
+    "clear_cache": frozenset({"Accepted"}),
+}
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+# A running job refreshes heartbeat_at every flush; this much silence means
+# its process is gone.
+STALE_HEARTBEAT = timedelta(minutes=2)
+
+# Strong refs to running job tasks (the loop only keeps weak ones).
+_running: Set[asyncio.Task] = set()
+# job_id → Event set on every flush; progress streams wait on it.
+_progress: Dict[int, asyncio.Event] = {}
+
+
+def validate_params(command: str, params: Dict[str, Any]) -> None:
+    """ValueError unless `command` is bulk-capable and `params` bind to the
+    ChargePoint method's signature."""
+    if command not in BULK_COMMANDS:
+        raise ValueError(f"Unsupported bulk command '{command}'. Allowed: {', '.join(sorted(BULK_COMMANDS))}")
+    try:
+        inspect.signature(getattr(ChargePoint, command)).bind(None, **params)
+    except TypeError as e:
+        raise ValueError(f"Invalid params for {command}: {e}")
+
+
+def resolve_targets(db, tenant: Optional[str] = None, model: Optional[str] = None,
+                    charge_point_ids: Optional[Iterable[str]] = None) -> Tuple[List[str], List[str]]:
+    """Selector → (known charge_point_ids sorted, unknown explicit ids).
+    Filters combine (tenant AND model AND in-list)."""
+    q = db.query(Charger.charge_point_id)
+    if tenant:
+        q = q.filter(Charger.tenant == tenant)
+    if model:
+        q = q.filter(Charger.model == model)
+    wanted = list(dict.fromkeys(charge_point_ids or []))
+    if wanted:
+        q = q.filter(Charger.charge_point_id.in_(wanted))
+    found = sorted(row.charge_point_id for row in q)
+    known = set(found)
+    return found, [cp_id for cp_id in wanted if cp_id not in known]
+
+
+def create_job(db, command: str, params: Dict[str, Any], target_ids: List[str], connected_ids: Set[str], *,
+               concurrency: int = 20, timeout_seconds: float = BULK_COMMAND_TIMEOUT_SECONDS,
+               wave_size: int = 0, wave_delay_seconds: float = 0.0,
+               max_failure_ratio: Optional[float] = None, target: Optional[Dict[str, Any]] = None,
+               created_by: Optional[str] = None) -> BulkCommandJob:
+    """Insert the job and its pending / offline result rows, commit, and
+    return the job. Call validate_params first."""
+    wave_size = max(0, int(wave_size))
+    online = [cp_id for cp_id in target_ids if cp_id in connected_ids]
+    offline = [cp_id for cp_id in target_ids if cp_id not in connected_ids]
+    job = BulkCommandJob(
+        command=command, params=json.dumps(params), target=json.dumps(target or {}),
+        status="queued", concurrency=max(1, min(int(concurrency), BULK_COMMAND_MAX_CONCURRENCY)),
+        timeout_seconds=max(1.0, float(timeout_seconds)), wave_size=wave_size,
+        wave_delay_seconds=max(0.0, float(wave_delay_seconds)), max_failure_ratio=max_failure_ratio,
+        total=len(target_ids), skipped=len(offline), created_by=created_by,
+    )
+    db.add(job)
+    db.flush()
+    now = _utcnow()
+    rows = [
+        {"job_id": job.id, "charge_point_id": cp_id, "wave": idx // wave_size if wave_size else 0, "status": "pending"}
+        for idx, cp_id in enumerate(online)
+    ] + [
+        {"job_id": job.id, "charge_point_id": cp_id, "wave": 0, "status": "offline",
+         "error": "Not connected", "finished_at": now}
+        for cp_id in offline
+    ]
+    if rows:
+        db.execute(insert(BulkCommandResult), rows)
+    db.commit()
+    return job
+
+
+def request_cancel(db, job_id: int) -> bool:
+    """Ask a queued / running job to stop. True if it was still active."""
+    changed = db.query(BulkCommandJob).filter(
+        BulkCommandJob.id == job_id, BulkCommandJob.status.in_(("queued", "running")),
+    ).update({BulkCommandJob.status: "cancelling"}, synchronize_session=False)
+    db.commit()
+    return changed == 1
+
+
+def interrupt_stale_jobs(db, now: Optional[datetime] = None) -> int:
+    """Mark jobs whose runner stopped heartbeating as interrupted."""
+    now = now or _utcnow()
+    cutoff = now - STALE_HEARTBEAT
+    stale = [row.id for row in db.query(BulkCommandJob.id).filter(
+        BulkCommandJob.status.in_(ACTIVE_STATUSES),
+        func.coalesce(BulkCommandJob.heartbeat_at, BulkCommandJob.created_at) < cutoff,
+    )]
+    for job_id in stale:
+        _finish(db, job_id, "interrupted", now)
+    return len(stale)
+
+
+def serialize_job(job: BulkCommandJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "command": job.command,
+        "params": json.loads(job.params or "{}"),
+        "target": json.loads(job.target or "{}"),
+        "status": job.status,
+        "concurrency": job.concurrency,
+        "timeout_seconds": job.timeout_seconds,
+        "wave_size": job.wave_size,
+        "wave_delay_seconds": job.wave_delay_seconds,
+        "max_failure_ratio": job.max_failure_ratio,
+        "total": job.total,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "skipped": job.skipped,
+        "pending": job.total - job.succeeded - job.failed - job.skipped,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def serialize_result(row: BulkCommandResult) -> Dict[str, Any]:
+    return {
+        "charge_point_id": row.charge_point_id,
+        "wave": row.wave,
+        "status": row.status,
+        "success": row.status == "success",
+        "response": json.loads(row.response) if row.response else None,
+        "error": row.error,
+        "duration_ms": row.duration_ms,
+        "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+    }
+
+
+def finished_results(db, job_id: int, since: Optional[datetime] = None) -> List[BulkCommandResult]:
+    """Results that are no longer pending, finished at or after `since`."""
+    q = db.query(BulkCommandResult).filter(
+        BulkCommandResult.job_id == job_id, BulkCommandResult.status != "pending",
+    )
+    if since is not None:
+        q = q.filter(BulkCommandResult.finished_at >= since)
+    return q.order_by(BulkCommandResult.finished_at, BulkCommandResult.id).all()
+
+
+async def wait_for_progress(job_id: int, timeout: float) -> bool:
+    """Wait until the job's runner (in this process) flushes again."""
+    event = _progress.setdefault(job_id, asyncio.Event())
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def _notify_progress(job_id: int) -> None:
+    event = _progress.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+def _start(db, job_id: int, now: datetime):
+    """queued → running; returns (job snapshot, pending [(result id, cp, wave)])
+    or (None, []) if the job was cancelled before it started."""
+    started = db.query(BulkCommandJob).filter(
+        BulkCommandJob.id == job_id, BulkCommandJob.status == "queued",
+    ).update({BulkCommandJob.status: "running", BulkCommandJob.started_at: now,
+              BulkCommandJob.heartbeat_at: now}, synchronize_session=False)
+    db.commit()
+    job = db.get(BulkCommandJob, job_id)
+    if not started:
+        return None, []
+    pending = [
+        (row.id, row.charge_point_id, row.wave)
+        for row in db.query(BulkCommandResult.id, BulkCommandResult.charge_point_id, BulkCommandResult.wave)
+        .filter(BulkCommandResult.job_id == job_id, BulkCommandResult.status == "pending")
+        .order_by(BulkCommandResult.wave, BulkCommandResult.id)
+    ]
+    db.expunge(job)
+    return job, pending
+
+
+def _flush(db, job_id: int, results: List[Dict[str, Any]], counters: Dict[str, int], now: datetime) -> str:
+    """Write buffered results + counters + heartbeat; return the job's status
+    as stored (so a cancel from any process is seen)."""
+    if results:
+        db.execute(update(BulkCommandResult), results)
+    db.query(BulkCommandJob).filter(BulkCommandJob.id == job_id).update(
+        {BulkCommandJob.succeeded: counters["succeeded"], BulkCommandJob.failed: counters["failed"],
+         BulkCommandJob.heartbeat_at: now},
+        synchronize_session=False,
+    )
+    status = db.query(BulkCommandJob.status).filter(BulkCommandJob.id == job_id).scalar()
+    db.commit()
+    return status
+
+
+def _finish(db, job_id: int, status: str, now: datetime) -> None:
+    """Mark still-pending results skipped and close the job."""
+    db.query(BulkCommandResult).filter(
+        BulkCommandResult.job_id == job_id, BulkCommandResult.status == "pending",
+    ).update({BulkCommandResult.status: "skipped", BulkCommandResult.finished_at: now},
+             synchronize_session=False)
+    skipped = db.query(func.count(BulkCommandResult.id)).filter(
+        BulkCommandResult.job_id == job_id, BulkCommandResult.status.in_(("skipped", "offline")),
+    ).scalar()
+    db.query(BulkCommandJob).filter(BulkCommandJob.id == job_id).update(
+        {BulkCommandJob.status: status, BulkCommandJob.skipped: skipped,
+         BulkCommandJob.finished_at: now, BulkCommandJob.heartbeat_at: now},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+async def send_command(command: str, params: Dict[str, Any], charge_point_id: str,
+                       timeout: float) -> Tuple[str, Any, Optional[str]]:
+    """Run one command on one charger → (status, JSON-safe response, error)."""
+    cp = get_active_charge_point(charge_point_id)
+    if cp is None:
+        return "offline", None, "Not connected"
+    try:
+        resp = await asyncio.wait_for(getattr(cp, command)(**params), timeout=timeout)
+    except asyncio.TimeoutError:
+        return "timeout", None, f"No response within {timeout:g}s"
+    except Exception as e:
+        return "failed", None, str(e)[:500]
+    if resp is None:
+        return "failed", None, "No response from charger"
+    accepted = BULK_COMMANDS[command]
+    status = getattr(resp, "status", None)
+    if accepted is not None and status not in accepted:
+        return "failed", serialize_ocpp_result(resp), f"Status: {status}"
+    return "success", serialize_ocpp_result(resp), None
+
+
+async def run_job(job_id: int) -> str:
+    """Execute a created job to the end. Returns its final status."""
+    job, pending = await run_db(_start, job_id, _utcnow())
+    if job is None:
+        await run_db(_finish, job_id, "cancelled", _utcnow())
+        _notify_progress(job_id)
+        return "cancelled"
+
+    params = json.loads(job.params or "{}")
+    counters = {"succeeded": 0, "failed": 0}
+    buffer: List[Dict[str, Any]] = []
+    cancelled = asyncio.Event()
+    done = asyncio.Event()
+
+    async def flush_once():
+        batch = buffer[:]
+        del buffer[:len(batch)]
+        status = await run_db(_flush, job_id, batch, dict(counters), _utcnow())
+        if status == "cancelling":
+            cancelled.set()
+        _notify_progress(job_id)
+
+    async def flusher():
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), timeout=BULK_COMMAND_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await flush_once()
+            except Exception as e:
+                logger.error(f"[bulk-command] job #{job_id} progress flush failed: {e}", exc_info=True)
+
+    semaphore = asyncio.Semaphore(job.concurrency)
+
+    async def one(result_id: int, charge_point_id: str) -> Optional[bool]:
+        async with semaphore:
+            if cancelled.is_set():
+                return None  # left pending → skipped
+            started = time.monotonic()
+            status, response, error = await send_command(job.command, params, charge_point_id, job.timeout_seconds)
+        ok = status == "success"
+        counters["succeeded" if ok else "failed"] += 1
+        buffer.append({
+            "id": result_id, "status": status, "error": error,
+            "response": json.dumps(response, default=str) if response is not None else None,
+            "duration_ms": int((time.monotonic() - started) * 1000), "finished_at": _utcnow(),
+        })
+        return ok
+
+    waves: Dict[int, List[Tuple[int, str]]] = {}
+    for result_id, charge_point_id, wave in pending:
+        waves.setdefault(wave, []).append((result_id, charge_point_id))
+
+    final = "completed"
+    flush_task = asyncio.create_task(flusher())
+    try:
+        for index, wave in enumerate(sorted(waves)):
+            if index and job.wave_delay_seconds:
+                try:
+                    await asyncio.wait_for(cancelled.wait(), timeout=job.wave_delay_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            if cancelled.is_set():
+                break
+            members = waves[wave]
+            outcomes = await asyncio.gather(*(one(rid, cp_id) for rid, cp_id in members))
+            if cancelled.is_set():
+                break
+            failures = outcomes.count(False)
+            if (job.max_failure_ratio is not None and index < len(waves) - 1
+                    and failures / len(members) > job.max_failure_ratio):
+                logger.warning(f"[bulk-command] job #{job_id} halted after wave {wave}: "
+                               f"{failures}/{len(members)} failed")
+                final = "halted"
+                break
+        if cancelled.is_set():
+            final = "cancelled"
+    except Exception as e:
+        logger.error(f"[bulk-command] job #{job_id} failed: {e}", exc_info=True)
+        final = "interrupted"
+    finally:
+        done.set()
+        await flush_task  # its last pass runs after done is set
+        if buffer:
+            await flush_once()
+        await run_db(_finish, job_id, final, _utcnow())
+        _notify_progress(job_id)
+
+    logger.info(f"[bulk-command] job #{job_id} {job.command} {final}: "
+                f"{counters['succeeded']} ok / {counters['failed']} failed of {job.total}")
+    return final
+
+
+def start_job(job_id: int) -> asyncio.Task:
+    """Run the job in the background on the current loop."""
+    task = asyncio.create_task(run_job(job_id))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
@@ -0,0 +1,115 @@
+"""
+PlagSini EV — Partner Sync Change Feed
+
+Partners mirrored our data by polling /api/sync/transactions?since=… and
+re-fetching single refs to see whether a charging session had completed.
+Every poll rescanned the same time window, and a session finishing hours
+after its payment was only noticed by re-reading it.
+
+Every insert / update / delete of a PaymentTransaction or ChargingSession
+now appends a row to sync_changes (listeners in database.py) with a
+monotonically increasing `seq`. Partners keep the last seq they processed
+and call
+
+    GET /api/sync/changes?after_seq=<last_seq>
+
+to get only what changed since, oldest first — cost proportional to the
+delta, no rescans. Running-energy ticks from MeterValues (updates touching
+only energy_consumed) are not logged; the final figure arrives with the
+session's stop update.
+
+Ordering: feed rows are written at the very end of the mutating
+transaction, just before COMMIT. Two transactions committing at the same
+moment can still become visible out of seq order, so a row is only served
+once it is SYNC_CHANGES_SETTLE_SECONDS old, and a page stops at the first
+row that is not — a client never advances past a seq that might still be
+followed by a smaller one.
+
+Retention: rows older than SYNC_CHANGES_RETENTION_DAYS are pruned hourly.
+A client whose after_seq is below `oldest_seq` − 1 has fallen behind the
+retained range and should re-sync through /api/sync/transactions.
+
+Env:
+    SYNC_CHANGES_SETTLE_SECONDS    visibility delay for new rows (2)
+    SYNC_CHANGES_RETENTION_DAYS    0 = keep forever (30)
+
+Usage:
+    from change_feed import changes_after
+    changes, has_more = changes_after(db, after_seq=1200, limit=500)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+
+from database import SyncChange, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+SYNC_CHANGES_SETTLE_SECONDS = float(os.getenv("SYNC_CHANGES_SETTLE_SECONDS", "2"))
+SYNC_CHANGES_RETENTION_DAYS = int(os.getenv("SYNC_CHANGES_RETENTION_DAYS", "30"))
+_PRUNE_INTERVAL_SECONDS = 3600
+_PRUNE_BATCH = 5000
+
+ENTITIES = ("payment_transaction", "charging_session")
+
+
+def changes_after(db, after_seq: int, limit: int = 500, entities: Optional[Sequence[str]] = None,
+                  now: Optional[datetime] = None) -> Tuple[List[SyncChange], bool]:
+    """Settled changes with seq > after_seq, oldest first.
+
+    Returns (changes, has_more). has_more is also True when the page was cut
+    short at a row still inside the settle window — poll again shortly."""
+    q = db.query(SyncChange).filter(SyncChange.seq > after_seq)
+    if entities:
+        q = q.filter(SyncChange.entity.in_(list(entities)))
+    rows = q.order_by(SyncChange.seq).limit(limit + 1).all()
+    cutoff = (now or _utcnow()) - timedelta(seconds=SYNC_CHANGES_SETTLE_SECONDS)
+    settled = []
+    for row in rows[:limit]:
+        if row.created_at > cutoff:
+            return settled, True
+        settled.append(row)
+    return settled, len(rows) > limit
+
+
+def oldest_seq(db) -> Optional[int]:
+    return db.query(func.min(SyncChange.seq)).scalar()
+
+
+def prune_changes(db, now: Optional[datetime] = None) -> int:
+    """Delete rows past retention, in batches. Returns rows deleted."""
+    if SYNC_CHANGES_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = (now or _utcnow()) - timedelta(days=SYNC_CHANGES_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        upto = (
+            db.query(SyncChange.seq).filter(SyncChange.created_at < cutoff)
+            .order_by(SyncChange.seq).offset(_PRUNE_BATCH - 1).limit(1).scalar()
+        )
+        q = db.query(SyncChange).filter(SyncChange.created_at < cutoff)
+        if upto is not None:
+            q = q.filter(SyncChange.seq <= upto)
+        n = q.delete(synchronize_session=False)
+        db.commit()
+        deleted += n
+        if upto is None or n == 0:
+            return deleted
+
+
+async def change_feed_worker(interval_seconds: float = _PRUNE_INTERVAL_SECONDS):
+    """Background loop (API process): prune expired feed rows."""
+    logger.info("Sync change feed pruning started (retention %sd)", SYNC_CHANGES_RETENTION_DAYS)
+    while True:
+        try:
+            deleted = await run_db(prune_changes)
+            if deleted:
+                logger.info(f"[change-feed] pruned {deleted} rows")
+        except Exception as e:
+            logger.error(f"[change-feed] prune failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
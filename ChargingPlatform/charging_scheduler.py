@@ -0,0 +1,333 @@
+"""
+PlagSini EV — Charging Schedule Scheduler
+
+Two loops used to drive charging_schedules: scheduled_charging_worker on the
+OCPP side loaded every enabled schedule each minute and string-matched
+HH:MM, and _schedule_worker_loop in the API ran two queries every 30s. Both
+cost the same whether a schedule was due or idle for the next week, and
+they dedup'd differently (a 2-minute debounce column vs. an in-memory
+minute bucket), so the same start could go out twice.
+
+ChargingScheduler is the single replacement (API process):
+
+  * a min-heap of (fire_at, schedule_id, action, version) holding the next
+    start and stop of every enabled schedule, built with one query at
+    startup. Create / toggle / delete call upsert() / remove(), which bump
+    the schedule's version (stale heap entries are dropped when popped) and
+    push its new fire times.
+  * the loop sleeps until the earliest fire time (or until an upsert
+    brings an earlier one), fires it, and pushes that schedule's next
+    occurrence. Cost is per fire, not per schedule.
+  * dedup is persisted: before firing, a conditional UPDATE moves
+    last_triggered_start / last_triggered_stop to the occurrence's fire
+    time only if it is still older. Only the caller whose UPDATE matched
+    fires, so an occurrence goes out at most once — across restarts and
+    across API processes. The same UPDATE checks `enabled`, so a schedule
+    disabled or deleted elsewhere does not fire.
+  * every SCHEDULE_RESYNC_SECONDS, rows with updated_at past the last sync
+    are reloaded, so edits served by another API process reach this heap.
+    A row deleted elsewhere is dropped the first time its claim misses.
+
+Times are HH:MM Asia/Kuala_Lumpur (UTC+8, no DST); fire times are kept as
+naive UTC. An occurrence more than SCHEDULE_GRACE_SECONDS late (process was
+busy or down) is skipped, not fired late.
+
+Env:
+    SCHEDULE_RESYNC_SECONDS   reload of changed rows (300)
+    SCHEDULE_GRACE_SECONDS    latest a due occurrence still fires (120)
+
+Usage:
+    from charging_scheduler import charging_scheduler
+    asyncio.create_task(charging_scheduler.run())      # startup
+    charging_scheduler.upsert(row)                     # after commit
+    charging_scheduler.remove(schedule_id)
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, time as dt_time, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from database import ChargingSchedule, ChargingSession, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_RESYNC_SECONDS = float(os.getenv("SCHEDULE_RESYNC_SECONDS", "300"))
+SCHEDULE_GRACE_SECONDS = float(os.getenv("SCHEDULE_GRACE_SECONDS", "120"))
+
+MYT = timezone(timedelta(hours=8))
+ACTIONS = ("start", "stop")
+
+
+def schedule_matches_day(days_of_week: str, dow: int) -> bool:
+    """days_of_week format:
+       - "" or "daily"    → every day
+       - "weekdays"       → 1..5 (Mon..Fri)
+       - "weekends"       → 0, 6  (Sun, Sat)
+       - "0,1,3"          → comma list of ints 0..6 (0=Sun … 6=Sat)
+    """
+    days = (days_of_week or "").strip().lower()
+    if days in ("", "daily", "everyday", "all"):
+        return True
+    if days == "weekdays":
+        return 1 <= dow <= 5
+    if days == "weekends":
+        return dow in (0, 6)
+    try:
+        wanted = {int(x.strip()) for x in days.split(",") if x.strip()}
+    except ValueError:
+        return False
+    return dow in wanted
+
+
+def next_fire_time(hhmm: str, days_of_week: str, after: datetime) -> Optional[datetime]:
+    """First occurrence of local HH:MM on a matching day strictly after
+    `after` (naive UTC), as naive UTC. None if the schedule never matches."""
+    try:
+        hour, minute = (int(x) for x in hhmm.split(":"))
+        at = dt_time(hour, minute)
+    except (ValueError, AttributeError):
+        return None
+    local_after = after.replace(tzinfo=timezone.utc).astimezone(MYT)
+    for offset in range(8):
+        day = local_after.date() + timedelta(days=offset)
+        candidate = datetime.combine(day, at, tzinfo=MYT)
+        # Python weekday(): Mon=0..Sun=6; schedules use Sun=0..Sat=6.
+        if candidate > local_after and schedule_matches_day(days_of_week, (day.weekday() + 1) % 7):
+            return candidate.astimezone(timezone.utc).replace(tzinfo=None)
+    return None
+
+
+def _snapshot(row) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=row.id, charger_id=row.charger_id, charge_point_id=row.charge_point_id,
+        connector_id=row.connector_id, id_tag=row.id_tag, start_time=row.start_time,
+        stop_time=row.stop_time, days_of_week=row.days_of_week, enabled=bool(row.enabled),
+    )
+
+
+def _load_schedules(db, changed_since: Optional[datetime] = None) -> List[SimpleNamespace]:
+    """Enabled schedules (startup), or every row touched since `changed_since`
+    (resync — disabled ones included so they get dropped)."""
+    q = db.query(ChargingSchedule)
+    if changed_since is None:
+        q = q.filter(ChargingSchedule.enabled.is_(True))
+    else:
+        q = q.filter(ChargingSchedule.updated_at >= changed_since)
+    return [_snapshot(r) for r in q]
+
+
+def _claim_fire(db, schedule_id: int, action: str, fire_at: datetime) -> bool:
+    """Persisted dedup: record `fire_at` as the last trigger unless this (or
+    a later) occurrence is already recorded. True if this caller fires."""
+    column = ChargingSchedule.last_triggered_start if action == "start" else ChargingSchedule.last_triggered_stop
+    claimed = db.query(ChargingSchedule).filter(
+        ChargingSchedule.id == schedule_id,
+        ChargingSchedule.enabled.is_(True),
+        or_(column.is_(None), column < fire_at),
+    ).update(
+        # updated_at pinned: a claim is not an edit, keep it out of resync.
+        {column: fire_at, ChargingSchedule.updated_at: ChargingSchedule.updated_at},
+        synchronize_session=False,
+    )
+    db.commit()
+    return claimed == 1
+
+
+def _still_enabled(db, schedule_id: int) -> bool:
+    return db.query(ChargingSchedule.id).filter(
+        ChargingSchedule.id == schedule_id, ChargingSchedule.enabled.is_(True),
+    ).first() is not None
+
+
+def _open_transaction_id(db, charger_id: int) -> Optional[int]:
+    """transaction_id of the charger's unfinished session. stop_time is the
+    authoritative signal — NULL means the session is not closed yet."""
+    row = (
+        db.query(ChargingSession.transaction_id)
+        .filter(
+            ChargingSession.charger_id == charger_id,
+            ChargingSession.transaction_id > 0,
+            ChargingSession.stop_time.is_(None),
+        )
+        .order_by(ChargingSession.start_time.desc())
+        .first()
+    )
+    return row.transaction_id if row else None
+
+
+class ChargingScheduler:
+    """Priority queue of the next start / stop of every enabled schedule."""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str, int]] = []
+        self._specs: Dict[int, Tuple[int, SimpleNamespace]] = {}  # id → (version, snapshot)
+        self._version = 0
+        self._wake: Optional[asyncio.Event] = None
+        self.stats: Dict[str, int] = {"fired": 0, "skipped_late": 0, "dedup_skipped": 0, "resyncs": 0}
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def next_due(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def upsert(self, row, now: Optional[datetime] = None) -> None:
+        """Schedule (or reschedule) a row after it was created or edited.
+        Disabled rows are removed."""
+        spec = row if isinstance(row, SimpleNamespace) else _snapshot(row)
+        if not spec.enabled:
+            self.remove(spec.id)
+            return
+        now = now or _utcnow()
+        self._version += 1
+        self._specs[spec.id] = (self._version, spec)
+        for action in ACTIONS:
+            self._push(spec, action, now)
+        self._notify()
+
+    def remove(self, schedule_id: int) -> None:
+        """Forget a schedule; its heap entries are dropped lazily."""
+        if self._specs.pop(schedule_id, None) is not None:
+            self._notify()
+
+    def pop_due(self, now: datetime) -> List[Tuple[datetime, SimpleNamespace, str]]:
+        """Pop every occurrence due at `now` and queue each schedule's next
+        one. Returns [(fire_at, snapshot, action)]."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, schedule_id, action, version = heapq.heappop(self._heap)
+            current = self._specs.get(schedule_id)
+            if current is None or current[0] != version:
+                continue
+            spec = current[1]
+            self._push(spec, action, fire_at)
+            due.append((fire_at, spec, action))
+        return due
+
+    def _push(self, spec: SimpleNamespace, action: str, after: datetime) -> None:
+        hhmm = spec.start_time if action == "start" else spec.stop_time
+        fire_at = next_fire_time(hhmm, spec.days_of_week, after)
+        if fire_at is not None:
+            heapq.heappush(self._heap, (fire_at, spec.id, action, self._specs[spec.id][0]))
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            _, schedule_id, _, version = self._heap[0]
+            current = self._specs.get(schedule_id)
+            if current is not None and current[0] == version:
+                return
+            heapq.heappop(self._heap)
+
+    def _notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def fire(self, fire_at: datetime, spec: SimpleNamespace, action: str) -> bool:
+        """Claim the occurrence, then send RemoteStart / RemoteStop. False if
+        another process (or an earlier run) already fired it."""
+        if not await run_db(_claim_fire, spec.id, action, fire_at):
+            self.stats["dedup_skipped"] += 1
+            # Deleted or disabled by another process: stop queueing it.
+            if not await run_db(_still_enabled, spec.id):
+                self.remove(spec.id)
+            return False
+        self.stats["fired"] += 1
+        # Local import: ocpp_server pulls in the whole OCPP stack.
+        from ocpp_server import get_active_charge_point
+        cp = get_active_charge_point(spec.charge_point_id)
+        if cp is None:
+            logger.warning(f"[schedule-worker] schedule #{spec.id} {action} due on "
+                           f"{spec.charge_point_id} but charger offline — skipped")
+            return True
+        try:
+            if action == "start":
+                resp = await cp.remote_start_transaction(
+                    connector_id=int(spec.connector_id or 1),
+                    id_tag=spec.id_tag or "APP_USER",
+                )
+                detail = f"c{spec.connector_id}"
+            else:
+                transaction_id = await run_db(_open_transaction_id, spec.charger_id)
+                if transaction_id is None:
+                    logger.info(f"[schedule-worker] schedule #{spec.id} stop due on "
+                                f"{spec.charge_point_id} but no active session")
+                    return True
+                resp = await cp.remote_stop_transaction(transaction_id=transaction_id)
+                detail = f"txn={transaction_id}"
+            status = getattr(resp, "status", None) if resp else None
+            logger.info(f"[schedule-worker] schedule #{spec.id} {action.upper()} → "
+                        f"{spec.charge_point_id} {detail} status={status}")
+        except Exception as e:
+            logger.error(f"[schedule-worker] schedule #{spec.id} {action} on "
+                         f"{spec.charge_point_id} failed: {e}", exc_info=True)
+        return True
+
+    async def run_due(self, now: Optional[datetime] = None) -> int:
+        """Fire everything due at `now`. Returns occurrences fired."""
+        now = now or _utcnow()
+        fired = 0
+        for fire_at, spec, action in self.pop_due(now):
+            if (now - fire_at).total_seconds() > SCHEDULE_GRACE_SECONDS:
+                self.stats["skipped_late"] += 1
+                logger.warning(f"[schedule-worker] schedule #{spec.id} {action} at {fire_at} "
+                               f"missed by {(now - fire_at).total_seconds():.0f}s — skipped")
+                continue
+            if await self.fire(fire_at, spec, action):
+                fired += 1
+        return fired
+
+    async def resync(self, since: Optional[datetime]) -> None:
+        """Apply rows changed since `since` (None = full load). Fire times
+        are recomputed from one grace period back, so an occurrence due
+        while the process was restarting still fires — the claim keeps an
+        already fired one from going out again."""
+        after = _utcnow() - timedelta(seconds=SCHEDULE_GRACE_SECONDS)
+        specs = await run_db(_load_schedules, since)
+        if since is None:
+            self._specs.clear()
+            self._heap.clear()
+        for spec in specs:
+            self.upsert(spec, after)
+        self.stats["resyncs"] += 1
+
+    async def run(self) -> None:
+        """Background loop: sleep until the next occurrence, fire it."""
+        self._wake = asyncio.Event()
+        synced_at = None
+        next_resync = asyncio.get_running_loop().time()
+        logger.info("Charging schedule scheduler started")
+        while True:
+            loop_now = asyncio.get_running_loop().time()
+            if loop_now >= next_resync:
+                started = _utcnow()
+                try:
+                    # Small overlap so a row committed mid-query is not missed.
+                    await self.resync(synced_at - timedelta(seconds=5) if synced_at else None)
+                    synced_at = started
+                except Exception as e:
+                    logger.error(f"[schedule-worker] resync failed: {e}", exc_info=True)
+                next_resync = loop_now + SCHEDULE_RESYNC_SECONDS
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"[schedule-worker] tick failed: {e}", exc_info=True)
+
+            due = self.next_due()
+            timeout = next_resync - asyncio.get_running_loop().time()
+            if due is not None:
+                timeout = min(timeout, (due - _utcnow()).total_seconds())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+
+charging_scheduler = ChargingScheduler()
@@ -21,6 +21,7 @@ from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
 from database import SessionLocal, Charger, ChargingSession, MeterValue
+from meter_latest import record_latest_sample
 
 logger = logging.getLogger(__name__)
 
@@ -231,6 +232,10 @@ def sync_meter_value(
             total_kwh=payload.total_kwh,
         )
         db.add(mv)
+        record_latest_sample(db, charger.id, payload.transaction_id, {
+            "timestamp": mv.timestamp, "voltage": mv.voltage, "current": mv.current,
+            "power": mv.power, "total_kwh": mv.total_kwh,
+        })
 
         # Keep session energy_consumed in sync
         if payload.transaction_id and payload.total_kwh is not None:
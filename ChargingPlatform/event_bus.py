@@ -0,0 +1,178 @@
+"""
+PlagSini EV — In-process Event Bus
+
+The OCPP server (its own thread + loop) and the FastAPI app (main loop)
+used to share state through module globals and ad-hoc bridges: the API
+re-queried the DB to learn what a handler had just written, and firmware
+toasts came from a list the dashboard scanned on every poll.
+
+Handlers now publish typed events here; anything that cares subscribes:
+
+    ChargerStatusChanged  — availability / connector / online / ws changes
+    SessionStarted        — StartTransaction accepted
+    SessionStopped        — StopTransaction closed a session
+    MeterSample           — newest reading of a live transaction
+    FaultChanged          — a connector fault was raised or cleared
+    FirmwareStatus        — FirmwareStatusNotification
+
+Fan-out is thread-safe. A subscriber registered with `loop=` gets each
+event via that loop's call_soon_threadsafe (coroutine handlers become a
+task there), so its state is only ever touched from its own loop. Without
+a loop the handler runs inline on the publisher's thread — only for cheap,
+thread-safe work (appending to a deque, handing off to another queue).
+A failing subscriber is logged and never breaks the publisher.
+
+Usage:
+    from event_bus import event_bus, SessionStarted
+
+    event_bus.publish(SessionStarted("CP001", transaction_id=42, connector_id=1))
+
+    token = event_bus.subscribe(on_event, SessionStarted, loop=asyncio.get_running_loop())
+    event_bus.unsubscribe(token)
+"""
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from database import _utcnow
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Events ────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class ChargerEvent:
+    """Base class — every event is about one charger."""
+    charge_point_id: str
+
+
+@dataclass(frozen=True)
+class ChargerStatusChanged(ChargerEvent):
+    # Only the fields that changed, using /api/chargers (ChargerStatus) names:
+    # status, availability, connector_status, firmware_version, ws_connected …
+    changes: Dict[str, Any] = field(default_factory=dict)
+    at: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(frozen=True)
+class SessionStarted(ChargerEvent):
+    transaction_id: int = 0
+    connector_id: Optional[int] = None
+    at: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(frozen=True)
+class SessionStopped(ChargerEvent):
+    transaction_id: int = 0
+    energy_consumed: Optional[float] = None
+    at: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(frozen=True)
+class MeterSample(ChargerEvent):
+    transaction_id: Optional[int] = None
+    connector_id: Optional[int] = None
+    energy_kwh: Optional[float] = None
+    power: Optional[float] = None
+    voltage: Optional[float] = None
+    current: Optional[float] = None
+    at: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(frozen=True)
+class FaultChanged(ChargerEvent):
+    event: str = "raised"          # "raised" | "cleared"
+    error_code: Optional[str] = None
+    status: Optional[str] = None
+    at: datetime = field(default_factory=_utcnow)
+
+
+@dataclass(frozen=True)
+class FirmwareStatus(ChargerEvent):
+    status: str = ""
+    firmware_version: str = ""
+    timestamp: str = ""            # ISO, MYT — what the dashboard toast shows
+    at: datetime = field(default_factory=_utcnow)
+
+
+# ─── Bus ───────────────────────────────────────────────────────────────────
+
+Handler = Callable[[ChargerEvent], Any]
+
+
+class _Subscription:
+    __slots__ = ("handler", "types", "loop")
+
+    def __init__(self, handler: Handler, types: Tuple[Type[ChargerEvent], ...],
+                 loop: Optional[asyncio.AbstractEventLoop]):
+        self.handler = handler
+        self.types = types
+        self.loop = loop
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: List[_Subscription] = []
+        self.stats: Dict[str, int] = {"published": 0, "delivered": 0, "errors": 0}
+
+    def subscribe(self, handler: Handler, *event_types: Type[ChargerEvent],
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> _Subscription:
+        """Register `handler` for `event_types` (all events if none given).
+        Coroutine handlers need a `loop`. Returns a token for unsubscribe()."""
+        if asyncio.iscoroutinefunction(handler) and loop is None:
+            raise ValueError("coroutine subscribers need a loop")
+        sub = _Subscription(handler, tuple(event_types) or (ChargerEvent,), loop)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def publish(self, event: ChargerEvent) -> None:
+        """Deliver `event` to every matching subscriber. Safe from any
+        thread or loop; never blocks on a subscriber's loop."""
+        with self._lock:
+            subs = [s for s in self._subs if isinstance(event, s.types)]
+            self.stats["published"] += 1
+        for sub in subs:
+            if sub.loop is None:
+                self._call(sub.handler, event)
+                continue
+            if sub.loop.is_closed():
+                self.unsubscribe(sub)
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(self._call, sub.handler, event)
+            except RuntimeError:
+                # Subscriber loop shut down between the check and the call.
+                self.unsubscribe(sub)
+
+    def _call(self, handler: Handler, event: ChargerEvent) -> None:
+        try:
+            result = handler(event)
+            if asyncio.iscoroutine(result):
+                asyncio.get_running_loop().create_task(result)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            logger.error(f"[event_bus] {type(event).__name__} subscriber "
+                         f"{getattr(handler, '__qualname__', handler)} failed: {e}", exc_info=True)
+            return
+        with self._lock:
+            self.stats["delivered"] += 1
+
+
+event_bus = EventBus()
@@ -25,6 +25,7 @@ from database import (
     Charger, ChargerReview, ChargerBooking, ChargingSession,
     Fault, MeterValue, Pricing, PushSubscription, User,
 )
+from meter_latest import latest_for_transaction
 from security import verify_access_token as decode_access_token
 
 logger = logging.getLogger(__name__)
@@ -217,6 +218,11 @@ def get_session_meter_values(
         .all()
     )
     values = list(reversed(values))
+    # Raw rows land via the write-behind buffer; the cached latest sample
+    # is the graph's freshest head.
+    head = latest_for_transaction(db, transaction_id)
+    if head is not None and (not values or head.timestamp > values[-1].timestamp):
+        values = (values + [head])[-max(limit, 1):]
     return [
         {
             "timestamp": v.timestamp.isoformat() if v.timestamp else None,
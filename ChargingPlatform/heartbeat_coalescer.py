@@ -0,0 +1,184 @@
+"""
+PlagSini EV — Coalesced Heartbeat / last_seen Writer
+
+Heartbeat, connector-0 StatusNotification and WS connect used to each
+commit `chargers.last_heartbeat` + `status='online'` on their own. With a
+30s heartbeat interval that was the bulk of the OCPP server's write
+traffic, and none of it carried information beyond "still alive".
+
+Those paths now call `heartbeat_coalescer.touch(cp_id)`, which only records
+the timestamp in memory. A background task writes every dirty charger in
+ONE multi-row UPDATE (CASE on charge_point_id) every
+OCPP_HEARTBEAT_FLUSH_SECONDS (default 10s).
+
+Readers that decide liveness (/api/chargers, the OCPP state healer) call
+`heartbeat_coalescer.effective(cp_id, db_value)`, which returns the newer
+of the in-memory and DB timestamps — so online/offline precision is the
+same as before even though the DB lags by up to one flush interval.
+
+The map is guarded by a threading.Lock: touch() runs on the OCPP loop,
+effective() on the FastAPI loop, and the flush on the DB executor.
+
+Usage:
+    from heartbeat_coalescer import heartbeat_coalescer
+    heartbeat_coalescer.touch("CP001")
+    hb = heartbeat_coalescer.effective("CP001", charger.last_heartbeat)
+
+    # on shutdown (FastAPI shutdown hook):
+    await drain_heartbeats()
+"""
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import case, update
+
+from database import Charger, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+OCPP_HEARTBEAT_FLUSH_SECONDS = float(os.getenv("OCPP_HEARTBEAT_FLUSH_SECONDS", "10"))
+# Cap on rows per UPDATE so the CASE expression / IN list stays reasonable.
+_FLUSH_CHUNK = 500
+
+
+def _bulk_touch_chargers(db, seen: Dict[str, datetime]) -> int:
+    """Executor body: one UPDATE per chunk setting each charger's own
+    last_heartbeat and status='online'. Returns rows matched."""
+    matched = 0
+    items = list(seen.items())
+    for i in range(0, len(items), _FLUSH_CHUNK):
+        chunk = dict(items[i:i + _FLUSH_CHUNK])
+        stmt = (
+            update(Charger)
+            .where(Charger.charge_point_id.in_(list(chunk)))
+            .values(
+                last_heartbeat=case(chunk, value=Charger.charge_point_id),
+                status="online",
+            )
+            .execution_options(synchronize_session=False)
+        )
+        matched += db.execute(stmt).rowcount or 0
+    db.commit()
+    return matched
+
+
+class HeartbeatCoalescer:
+    """In-memory charge_point_id → last_seen map, flushed in bulk.
+
+    The flush task starts lazily on the first touch() from a running loop
+    (the OCPP loop), same as meter_ingest.MeterIngestBuffer.
+    """
+
+    def __init__(self, flush_seconds: float = OCPP_HEARTBEAT_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._last_seen: Dict[str, datetime] = {}
+        self._dirty: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closed = False
+        self.stats: Dict[str, int] = {"touches": 0, "flushes": 0, "rows_written": 0, "failed_flushes": 0}
+
+    def touch(self, charge_point_id: str, seen_at: Optional[datetime] = None) -> None:
+        """Record that the charger is alive. Never touches the DB."""
+        seen_at = seen_at or _utcnow()
+        with self._lock:
+            self._last_seen[charge_point_id] = seen_at
+            self._dirty[charge_point_id] = seen_at
+            self.stats["touches"] += 1
+        self._ensure_started()
+
+    def last_seen(self, charge_point_id: str) -> Optional[datetime]:
+        with self._lock:
+            return self._last_seen.get(charge_point_id)
+
+    def effective(self, charge_point_id: str, db_value: Optional[datetime]) -> Optional[datetime]:
+        """The fresher of the in-memory and DB last_heartbeat."""
+        mem = self.last_seen(charge_point_id)
+        if mem is None:
+            return db_value
+        if db_value is None:
+            return mem
+        return max(mem, db_value.replace(tzinfo=None))
+
+    def forget(self, charge_point_id: str) -> None:
+        """Drop a charger from the map (e.g. after the row is deleted)."""
+        with self._lock:
+            self._last_seen.pop(charge_point_id, None)
+            self._dirty.pop(charge_point_id, None)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def _ensure_started(self) -> None:
+        if self._closed or (self._task is not None and not self._task.done()):
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (scripts/tests) — flush() can still be awaited manually
+        self._task = self._loop.create_task(self._run())
+
+    async def flush(self) -> int:
+        """Write every dirty charger in one UPDATE. Returns rows matched."""
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if not batch:
+            return 0
+        try:
+            written = await run_db(_bulk_touch_chargers, batch)
+        except Exception as e:
+            # Put back anything not re-touched meanwhile; next tick retries.
+            with self._lock:
+                for cp_id, ts in batch.items():
+                    if cp_id not in self._dirty:
+                        self._dirty[cp_id] = ts
+                self.stats["failed_flushes"] += 1
+            logger.warning(f"[heartbeat] flush of {len(batch)} charger(s) failed: {e}")
+            return 0
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += written
+        return written
+
+    async def _run(self) -> None:
+        logger.info("Heartbeat coalescer started (interval=%.1fs)", self.flush_seconds)
+        while not self._closed:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[heartbeat] flush loop error: {e}", exc_info=True)
+
+    async def close(self) -> None:
+        """Stop the flush task and write whatever is pending."""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
+heartbeat_coalescer = HeartbeatCoalescer()
+
+
+async def drain_heartbeats(timeout: float = 10.0) -> None:
+    """Flush heartbeat_coalescer on shutdown from whichever loop is shutting
+    down (it lives on the OCPP thread's loop)."""
+    loop = heartbeat_coalescer._loop
+    if loop is None or loop.is_closed():
+        return
+    try:
+        if loop is asyncio.get_running_loop():
+            await asyncio.wait_for(heartbeat_coalescer.close(), timeout=timeout)
+        elif loop.is_running():
+            fut = asyncio.run_coroutine_threadsafe(heartbeat_coalescer.close(), loop)
+            await asyncio.wait_for(asyncio.wrap_future(fut), timeout=timeout)
+    except Exception as e:
+        logger.error(f"[heartbeat] shutdown drain failed: {e}", exc_info=True)
@@ -0,0 +1,297 @@
+"""
+PlagSini EV — Invoice Aggregates and Streaming Exports
+
+/api/invoice/sessions loaded every matching ChargingSession with .all(),
+looked up its Charger one row at a time and built the whole JSON list before
+answering. A month-end export over a few hundred thousand sessions held all
+of it in memory and sat silent long enough for nginx to give up on the
+upstream. /api/invoice/summary did the same to add the numbers up in Python,
+and priced every session with whichever Pricing row came first.
+
+  charger_totals() — the invoice summary: sessions, energy, duration and
+                     revenue per charger in one GROUP BY, priced with each
+                     charger's own Pricing row (default row as fallback).
+  session_rows()   — one SELECT with the charger joined in SQL, read through a
+                     server-side cursor (stream_results + yield_per), so only
+                     one chunk of rows is in Python at a time.
+  stream_csv()     — CSV, flushed every EXPORT_CHUNK_ROWS rows.
+  stream_parquet() — columnar Parquet (one row group per chunk) or an Arrow
+                     IPC stream. Needs pyarrow, which is optional: without it
+                     these formats are reported as unavailable and CSV still
+                     works (pip install pyarrow).
+
+The header goes out immediately and bytes keep flowing, so the proxy read
+timeout never trips; responses also send X-Accel-Buffering: no so nginx
+passes chunks through instead of spooling the whole file.
+
+Env:
+    INVOICE_EXPORT_CHUNK_ROWS   rows per cursor fetch / flushed chunk (5000)
+
+Usage:
+    from invoice_export import parse_invoice_range, stream_csv
+    start_dt, end_dt = parse_invoice_range("2026-07-01", "2026-07-31")
+    StreamingResponse(stream_csv(Session(bind=engine), start_dt, end_dt), media_type="text/csv")
+"""
+import csv
+import io
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import case, desc, func
+
+from database import Charger, ChargingSession, Pricing
+from time_buckets import duration_seconds
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = max(100, int(os.getenv("INVOICE_EXPORT_CHUNK_ROWS", "5000")))
+
+EXPORT_FORMATS = {
+    # format → (media type, file extension)
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+COLUMNS = (
+    "id", "transaction_id", "charge_point_id", "start_time", "stop_time", "duration_minutes",
+    "energy_kwh", "price_per_kwh", "amount", "status", "user_id",
+)
+
+DEFAULT_PRICE_PER_KWH = 0.50
+
+
+def columnar_available() -> bool:
+    """True when pyarrow is installed (Parquet / Arrow exports)."""
+    return pa is not None
+
+
+def parse_invoice_range(start_date: Optional[str],
+                        end_date: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Invoice period from query strings: ISO timestamps, or plain dates
+    (an end date then covers the whole day)."""
+    start_dt = None
+    end_dt = None
+    if start_date:
+        try:
+            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        except ValueError:
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    if end_date:
+        try:
+            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        except ValueError:
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+            end_dt = end_dt.replace(hour=23, minute=59, second=59)
+    return start_dt, end_dt
+
+
+def invoice_prices(db) -> Tuple[Dict[int, float], float]:
+    """({charger_id: price_per_kwh}, default price) from the active Pricing
+    rows — a charger without its own row bills at the default (charger_id
+    NULL) price, or DEFAULT_PRICE_PER_KWH if there is none."""
+    by_charger: Dict[Optional[int], float] = {}
+    for charger_id, price in db.query(Pricing.charger_id, Pricing.price_per_kwh).filter(
+        Pricing.is_active == True
+    ).order_by(Pricing.id):
+        by_charger.setdefault(charger_id, float(price))
+    return by_charger, by_charger.pop(None, DEFAULT_PRICE_PER_KWH)
+
+
+def invoice_session_query(db, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None,
+                          charge_point_id: Optional[str] = None):
+    """Session columns with the charge point id joined in, newest first."""
+    query = (
+        db.query(ChargingSession.id, ChargingSession.transaction_id, Charger.charge_point_id,
+                 ChargingSession.start_time, ChargingSession.stop_time, ChargingSession.energy_consumed,
+                 ChargingSession.status, ChargingSession.user_id, ChargingSession.charger_id)
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+    )
+    if charge_point_id:
+        query = query.filter(Charger.charge_point_id == charge_point_id)
+    if start_dt:
+        query = query.filter(ChargingSession.start_time >= start_dt)
+    if end_dt:
+        query = query.filter(ChargingSession.start_time <= end_dt)
+    return query.order_by(desc(ChargingSession.start_time), desc(ChargingSession.id))
+
+
+def charger_totals(db, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None,
+                   charge_point_id: Optional[str] = None,
+                   prices: Optional[Tuple[Dict[int, float], float]] = None) -> List[dict]:
+    """Per-charger session totals for the invoice summary — one GROUP BY,
+    so the result (and the cost) scales with chargers, not sessions.
+    Revenue uses each charger's own price (`prices` as from invoice_prices)."""
+    prices, default_price = prices or invoice_prices(db)
+    seconds = duration_seconds(db, ChargingSession.start_time, ChargingSession.stop_time)
+    query = (
+        db.query(
+            ChargingSession.charger_id,
+            Charger.charge_point_id,
+            func.count(ChargingSession.id),
+            func.sum(case((ChargingSession.status == "completed", 1), else_=0)),
+            func.sum(case((ChargingSession.status == "active", 1), else_=0)),
+            func.coalesce(func.sum(ChargingSession.energy_consumed), 0),
+            func.coalesce(func.sum(seconds), 0),
+        )
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+    )
+    if charge_point_id:
+        query = query.filter(Charger.charge_point_id == charge_point_id)
+    if start_dt:
+        query = query.filter(ChargingSession.start_time >= start_dt)
+    if end_dt:
+        query = query.filter(ChargingSession.start_time <= end_dt)
+    totals = []
+    for charger_id, cp_id, sessions, completed, active, energy, secs in query.group_by(
+        ChargingSession.charger_id, Charger.charge_point_id
+    ):
+        price_per_kwh = prices.get(charger_id, default_price)
+        totals.append({
+            "charger_id": charger_id,
+            "charge_point_id": cp_id,
+            "sessions": int(sessions),
+            "completed": int(completed or 0),
+            "active": int(active or 0),
+            "energy_kwh": float(energy),
+            "duration_minutes": float(secs) / 60,
+            "price_per_kwh": price_per_kwh,
+            "revenue": float(energy) * price_per_kwh,
+        })
+    return totals
+
+
+def session_rows(db, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None,
+                 charge_point_id: Optional[str] = None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[tuple]:
+    """Invoice rows in COLUMNS order, read through a server-side cursor."""
+    prices, default_price = invoice_prices(db)
+    query = (
+        invoice_session_query(db, start_dt, end_dt, charge_point_id)
+        .execution_options(stream_results=True)
+        .yield_per(chunk_rows)
+    )
+    for sid, txn, cp_id, start_time, stop_time, energy, status, user_id, charger_id in query:
+        price_per_kwh = prices.get(charger_id, default_price)
+        duration_minutes = 0.0
+        if start_time and stop_time:
+            duration_minutes = (stop_time - start_time).total_seconds() / 60
+        energy = float(energy or 0)
+        yield (
+            sid, txn, cp_id or "Unknown", start_time, stop_time, round(duration_minutes, 1),
+            round(energy, 2), price_per_kwh, round(energy * price_per_kwh, 2), status, user_id,
+        )
+
+
+def stream_csv(db, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None,
+               charge_point_id: Optional[str] = None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """CSV bytes, header first, then one chunk per `chunk_rows` rows.
+    Owns `db` and closes it when the stream ends."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    try:
+        writer.writerow(COLUMNS)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        pending = 0
+        for row in session_rows(db, start_dt, end_dt, charge_point_id, chunk_rows):
+            writer.writerow(
+                [v.isoformat() if isinstance(v, datetime) else v for v in row]
+            )
+            pending += 1
+            if pending >= chunk_rows:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+                pending = 0
+        if pending:
+            yield buf.getvalue().encode("utf-8")
+    finally:
+        db.close()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last
+    drain — lets pyarrow writers feed a streaming response."""
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("transaction_id", pa.int64()),
+        ("charge_point_id", pa.string()),
+        ("start_time", pa.timestamp("us")),
+        ("stop_time", pa.timestamp("us")),
+        ("duration_minutes", pa.float64()),
+        ("energy_kwh", pa.float64()),
+        ("price_per_kwh", pa.float64()),
+        ("amount", pa.float64()),
+        ("status", pa.string()),
+        ("user_id", pa.int64()),
+    ])
+
+
+def stream_parquet(db, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None,
+                   charge_point_id: Optional[str] = None, chunk_rows: int = EXPORT_CHUNK_ROWS,
+                   fmt: str = "parquet") -> Iterator[bytes]:
+    """Parquet (fmt="parquet", one row group per chunk) or Arrow IPC stream
+    (fmt="arrow", one record batch per chunk) bytes. Requires pyarrow.
+    Owns `db` and closes it when the stream ends."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    columns = [[] for _ in COLUMNS]
+
+    def flush():
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema,
+        )
+        writer.write_batch(batch)
+        for col in columns:
+            col.clear()
+        return sink.drain()
+
+    try:
+        for row in session_rows(db, start_dt, end_dt, charge_point_id, chunk_rows):
+            for col, value in zip(columns, row):
+                col.append(value)
+            if len(columns[0]) >= chunk_rows:
+                yield flush()
+        if columns[0]:
+            yield flush()
+        writer.close()
+        yield sink.drain()
+    finally:
+        db.close()
@@ -0,0 +1,126 @@
+"""
+PlagSini EV — Keyset (Cursor) Pagination
+
+List APIs paged with OFFSET/LIMIT: page N makes the database walk and throw
+away N × limit rows first, so a partner syncing a large window got slower
+with every page, and /api/sync/transactions also ran a COUNT(*) over the
+whole filter on each request.
+
+Keyset paging instead remembers where the last page ended — the (timestamp,
+id) of its last row — and asks for rows strictly after that position:
+
+    WHERE ts < :ts OR (ts = :ts AND id < :id) ORDER BY ts DESC, id DESC
+
+which an index on the sort columns answers directly, at the same cost for
+page 1 and page 10,000. The position goes back to the client as an opaque
+cursor token (base64 JSON); clients just echo `next_cursor` (or follow the
+`Link: rel="next"` header). Key columns must be NOT NULL and end with a
+unique column (the id) so the order is total.
+
+Totals are optional: estimated_count() reads the optimizer's row estimate on
+MySQL (EXPLAIN) and falls back to an exact COUNT elsewhere.
+
+Usage:
+    from keyset import InvalidCursor, keyset_page
+    rows, next_cursor = keyset_page(q, (PaymentTransaction.created_at, PaymentTransaction.id),
+                                    cursor=cursor, limit=100)
+"""
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(ValueError):
+    """Cursor token that is malformed or does not match the endpoint."""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Opaque token for a key position."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, columns: Sequence[Any]) -> Tuple[Any, ...]:
+    """Key position from a token, typed after `columns`."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor("Invalid cursor")
+    typed = []
+    for value, column in zip(values, columns):
+        try:
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif column.type.python_type is int:
+                value = int(value)
+        except (TypeError, ValueError, NotImplementedError) as e:
+            raise InvalidCursor("Invalid cursor") from e
+        typed.append(value)
+    return tuple(typed)
+
+
+def _after(columns: Sequence[Any], values: Sequence[Any], descending: bool):
+    """Rows strictly past `values` in (columns…) order, expanded to
+    OR/AND so every dialect can use the index."""
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        step = column < value if descending else column > value
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], step))
+    return or_(*clauses)
+
+
+def keyset_page(query, columns: Sequence[Any], cursor: Optional[str] = None, limit: int = 100,
+                descending: bool = True, key: Optional[Callable[[Any], Any]] = None) -> Tuple[List[Any], Optional[str]]:
+    """One page of `query` ordered by `columns`, starting after `cursor`.
+
+    Returns (rows, next_cursor) — next_cursor is None on the last page.
+    `key` maps a result row to the object carrying the column attributes
+    (for tuple rows such as `(Ticket, count)`); default is the row itself.
+    """
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = key(rows[-1]) if key else rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
+
+
+def offset_page(query, columns: Sequence[Any], offset: int = 0, limit: int = 100, descending: bool = True,
+                key: Optional[Callable[[Any], Any]] = None) -> Tuple[List[Any], Optional[str]]:
+    """Legacy OFFSET page in the same order as keyset_page, plus the cursor
+    that continues after it — lets offset clients switch over mid-walk."""
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).offset(offset).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = key(rows[-1]) if key else rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
+
+
+def estimated_count(db, query) -> int:
+    """Approximate row count of `query`: the optimizer estimate on MySQL,
+    an exact COUNT elsewhere (or if EXPLAIN is unavailable)."""
+    if db.get_bind().dialect.name == "mysql":
+        try:
+            compiled = query.order_by(None).statement.compile(
+                dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True},
+            )
+            plan = db.connection().exec_driver_sql("EXPLAIN " + str(compiled), compiled.params).mappings().first()
+            if plan and plan.get("rows") is not None:
+                return int(plan["rows"])
+        except Exception as e:
+            logger.debug(f"[keyset] EXPLAIN estimate failed, counting: {e}")
+    return query.order_by(None).count()
@@ -0,0 +1,149 @@
+"""
+PlagSini EV — Live Charger Status Hub
+
+Fan-out point for push updates to dashboards and AppEV. The hub subscribes
+to the event bus (event_bus.py) and turns what the OCPP handlers publish
+(availability, connector status, session start/stop, meter ticks, faults)
+into plain dicts; every open `/api/live/chargers` stream receives them and
+forwards a diff to its client, instead of each browser tab and app
+instance polling /api/chargers, /api/sessions and /api/faults every 3-5
+seconds.
+
+Events arrive on the OCPP thread's loop, subscribers live on the FastAPI
+loop, so publish() is thread-safe: it hands each event to the subscriber's
+own loop with call_soon_threadsafe. Subscriber queues are bounded — a
+client that can't keep up is flagged `overflowed` and gets a fresh
+snapshot rather than an unbounded backlog.
+
+Event shape (plain dict, JSON-serialisable):
+    {"type": "charger", "charge_point_id": "CP001", "changes": {"availability": "charging", ...}}
+    {"type": "session", "charge_point_id": "CP001", "event": "started"|"stopped"|"meter", ...}
+    {"type": "fault",   "charge_point_id": "CP001", "event": "raised"|"cleared", ...}
+
+Usage:
+    from live_status import live_status
+
+    sub = live_status.subscribe()      # on the consumer's loop
+    event = await sub.get(timeout=15)
+    live_status.unsubscribe(sub)
+"""
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from event_bus import (
+    ChargerEvent, ChargerStatusChanged, FaultChanged, MeterSample,
+    SessionStarted, SessionStopped, event_bus,
+)
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATUS_QUEUE_SIZE = int(os.getenv("LIVE_STATUS_QUEUE_SIZE", "1000"))
+
+
+class LiveSubscription:
+    """One consumer's bounded event queue, bound to the loop that created it."""
+
+    def __init__(self, maxsize: int):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _offer(self, event: Dict[str, Any]) -> None:
+        # Runs on self.loop.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Everything already queued, without waiting."""
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+
+class LiveStatusHub:
+    def __init__(self, queue_size: int = LIVE_STATUS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs: List[LiveSubscription] = []
+        self.stats: Dict[str, int] = {"published": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def subscribe(self) -> LiveSubscription:
+        sub = LiveSubscription(self.queue_size)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: LiveSubscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Deliver `event` to every subscriber. Safe from any thread/loop;
+        never blocks the publisher."""
+        with self._lock:
+            subs = list(self._subs)
+            self.stats["published"] += 1
+        for sub in subs:
+            if sub.loop.is_closed():
+                self.unsubscribe(sub)
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, event)
+            except RuntimeError:
+                # Subscriber loop shut down between the check and the call.
+                self.unsubscribe(sub)
+
+    def on_event(self, event: ChargerEvent) -> None:
+        """event_bus subscriber (runs inline on the publisher's thread)."""
+        cp_id = event.charge_point_id
+        if isinstance(event, ChargerStatusChanged):
+            self._charger(cp_id, **event.changes)
+        elif isinstance(event, SessionStarted):
+            self._charger(cp_id, availability="charging", active_transaction_id=event.transaction_id)
+            self._session(cp_id, "started", transaction_id=event.transaction_id,
+                          connector_id=event.connector_id)
+        elif isinstance(event, SessionStopped):
+            self._charger(cp_id, availability="available", active_transaction_id=None)
+            self._session(cp_id, "stopped", transaction_id=event.transaction_id,
+                          energy_consumed=event.energy_consumed)
+        elif isinstance(event, MeterSample):
+            if event.transaction_id:
+                self._session(cp_id, "meter", transaction_id=event.transaction_id,
+                              energy_kwh=event.energy_kwh, power=event.power,
+                              voltage=event.voltage, current=event.current)
+        elif isinstance(event, FaultChanged):
+            fields = {k: v for k, v in asdict(event).items() if k not in ("charge_point_id", "event", "at")}
+            self.publish({"type": "fault", "charge_point_id": cp_id, "event": event.event, **fields})
+
+    def _charger(self, charge_point_id: str, **changes: Any) -> None:
+        self.publish({"type": "charger", "charge_point_id": charge_point_id, "changes": changes})
+
+    def _session(self, charge_point_id: str, event: str, **fields: Any) -> None:
+        self.publish({"type": "session", "charge_point_id": charge_point_id, "event": event, **fields})
+
+
+live_status = LiveStatusHub()
+event_bus.subscribe(
+    live_status.on_event,
+    ChargerStatusChanged, SessionStarted, SessionStopped, MeterSample, FaultChanged,
+)
@@ -3,7 +3,8 @@ PlagSini EV — Application Entry Point
 
 Starts:
   1. FastAPI server (port 8000) — dashboard, API, static files
-  2. OCPP WebSocket server (port 9000) — charger connections
+  2. OCPP WebSocket server (port 9000) — charger connections; one background
+     thread, or OCPP_WORKERS processes sharing the port (ocpp_workers.py)
   3. Orphan session watchdog — background task to close stale sessions
 
 Bootstrap: creates default admin & staff if env vars set and DB empty.
@@ -15,6 +16,7 @@ Usage:
 import asyncio
 import logging
 import os
+import socket
 import threading
 
 import uvicorn
@@ -32,7 +34,10 @@ except ImportError:
 
 from api import app
 from database import init_db, SessionLocal, User, Wallet, SupportStaff
-from ocpp_server import on_connect, orphan_session_watchdog, scheduled_charging_worker
+from meter_timeseries import meter_timeseries_worker
+from ocpp_registry import connection_registry
+from ocpp_server import on_connect, orphan_session_watchdog
+from ocpp_workers import ocpp_worker_count, start_ocpp_workers, stop_ocpp_workers
 
 logger = logging.getLogger(__name__)
 
@@ -146,7 +151,10 @@ def create_default_staff() -> None:
 async def ocpp_server() -> None:
     """
     Start OCPP WebSocket server on ws://0.0.0.0:9000.
-    Runs orphan_session_watchdog every 600s to close stale charging sessions.
+    Runs orphan_session_watchdog every 600s to close stale charging sessions
+    and meter_timeseries_worker to downsample / expire meter_values.
+    With OCPP_REGISTRY=db, several of these nodes can sit behind one load
+    balancer; API calls reach each charger through ocpp_registry's relay.
     """
     logger.info("Starting OCPP WebSocket server on ws://0.0.0.0:9000")
     async with serve(
@@ -160,7 +168,10 @@ async def ocpp_server() -> None:
         compression=None,
     ):
         asyncio.create_task(orphan_session_watchdog(interval_seconds=600))
-        asyncio.create_task(scheduled_charging_worker(interval_seconds=60))
+        asyncio.create_task(meter_timeseries_worker())
+        # Keeps this node's rows in the shared connection registry fresh
+        # (no-op for the default single-node OCPP_REGISTRY=local).
+        asyncio.create_task(connection_registry.run())
         await asyncio.Future()  # run forever
 
 
@@ -170,7 +181,7 @@ def start_servers() -> None:
     """
     Bootstrap and start both servers:
     1. Init DB, create default admin/staff
-    2. Start OCPP WebSocket in background thread
+    2. Start OCPP WebSocket in background thread (or OCPP_WORKERS processes)
     3. Run FastAPI on port 8000
     """
     logging.basicConfig(level=logging.INFO)
@@ -181,17 +192,32 @@ def start_servers() -> None:
     create_default_admin()
     create_default_staff()
 
-    # 2. OCPP server in background (daemon thread)
-    # Daemon=True so it exits when main process exits
-    ocpp_thread = threading.Thread(
-        target=lambda: asyncio.run(ocpp_server()), daemon=True
-    )
-    ocpp_thread.start()
-    logger.info("OCPP server started in background thread")
+    # 2. OCPP server: N worker processes sharing :9000, or one background thread
+    workers = ocpp_worker_count()
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logger.error("OCPP_WORKERS=%d needs SO_REUSEPORT (Linux) — falling back to one in-thread server", workers)
+        workers = 1
+    if workers > 1 and connection_registry.kind != "db":
+        # The API process holds no sockets; it finds chargers via the shared registry.
+        logger.error("OCPP_WORKERS=%d needs OCPP_REGISTRY=db — falling back to one in-thread server", workers)
+        workers = 1
+
+    if workers > 1:
+        start_ocpp_workers(workers)
+    else:
+        # Daemon=True so it exits when main process exits
+        ocpp_thread = threading.Thread(
+            target=lambda: asyncio.run(ocpp_server()), daemon=True
+        )
+        ocpp_thread.start()
+        logger.info("OCPP server started in background thread")
 
     # 3. FastAPI (blocks until shutdown)
     logger.info("Starting FastAPI server on http://0.0.0.0:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    try:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
+    finally:
+        stop_ocpp_workers()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+"""
+PlagSini EV — MeterValues Write-Behind Buffer
+
+MeterValues is the highest-volume OCPP message. Inserting (and committing)
+one `meter_values` row per sample made per-row commits the biggest consumer
+of MySQL write IOPS. Handlers now hand parsed rows to `meter_buffer`, which
+flushes them in one bulk INSERT when either:
+
+  - OCPP_METER_BATCH_SIZE rows are pending (default 500), or
+  - OCPP_METER_FLUSH_SECONDS have passed since the last flush (default 2s).
+
+Memory is bounded by OCPP_METER_MAX_PENDING (default 20000 rows). When the
+buffer is full, put() waits up to OCPP_METER_PUT_TIMEOUT seconds for a
+flush to make room (backpressure on the charger's MeterValues.conf); if the
+DB is still not draining, the new rows are dropped and counted.
+
+Session energy / kWh-quota updates are NOT buffered — they stay synchronous
+in the handler so auto-stop fires on time. Only the raw sample history is
+write-behind, so /latest readers may lag by up to one flush interval.
+
+Usage (from ocpp_server.py):
+    from meter_ingest import meter_buffer
+    await meter_buffer.put([{"charger_id": 1, "transaction_id": 7, "timestamp": ts, ...}])
+
+    # on shutdown, from any loop/thread (FastAPI shutdown hook):
+    await drain_meter_buffer()
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from database import MeterValue
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+OCPP_METER_BATCH_SIZE = int(os.getenv("OCPP_METER_BATCH_SIZE", "500"))
+OCPP_METER_FLUSH_SECONDS = float(os.getenv("OCPP_METER_FLUSH_SECONDS", "2"))
+OCPP_METER_MAX_PENDING = int(os.getenv("OCPP_METER_MAX_PENDING", "20000"))
+OCPP_METER_PUT_TIMEOUT = float(os.getenv("OCPP_METER_PUT_TIMEOUT", "5"))
+# A batch that fails this many flushes in a row is dropped so one bad row
+# can't wedge the pipeline forever.
+_MAX_FLUSH_ATTEMPTS = 3
+
+
+def _bulk_insert_meter_values(db, rows: List[Dict[str, Any]]) -> int:
+    """Executor body: one executemany INSERT + one commit for the batch."""
+    db.execute(insert(MeterValue), rows)
+    db.commit()
+    return len(rows)
+
+
+class MeterIngestBuffer:
+    """Bounded in-memory queue of meter_values rows, flushed in bulk.
+
+    Bound to the event loop that first calls put() (the OCPP loop). The
+    flush task starts lazily on that first put, so every OCPP entrypoint
+    (main.py, DEV_AUTO_INIT) gets batching without extra wiring.
+    """
+
+    def __init__(self, batch_size: int = OCPP_METER_BATCH_SIZE,
+                 flush_seconds: float = OCPP_METER_FLUSH_SECONDS,
+                 max_pending: int = OCPP_METER_MAX_PENDING,
+                 put_timeout: float = OCPP_METER_PUT_TIMEOUT):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_pending = max(self.batch_size, max_pending)
+        self.put_timeout = put_timeout
+        self._rows: Deque[Dict[str, Any]] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closed = False
+        self._failures = 0
+        self.stats: Dict[str, int] = {"flushed": 0, "batches": 0, "dropped": 0, "failed_flushes": 0, "waits": 0}
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = self._wake or asyncio.Event()
+            self._space = self._space or asyncio.Condition()
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, rows: List[Dict[str, Any]]) -> bool:
+        """Queue rows for the next bulk flush. Returns False if they were
+        dropped because the buffer stayed full for `put_timeout` seconds."""
+        if not rows:
+            return True
+        if self._closed:
+            # Shutting down — write straight through rather than lose data.
+            await run_db(_bulk_insert_meter_values, rows)
+            return True
+        self._ensure_started()
+
+        if len(self._rows) + len(rows) > self.max_pending:
+            self.stats["waits"] += 1
+            self._wake.set()
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: len(self._rows) + len(rows) <= self.max_pending),
+                        timeout=self.put_timeout,
+                    )
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += len(rows)
+                logger.error(
+                    "[meter-ingest] buffer full (%d pending) — dropped %d sample(s)",
+                    len(self._rows), len(rows),
+                )
+                return False
+
+        self._rows.extend(rows)
+        if len(self._rows) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    async def flush(self) -> int:
+        """Write everything currently pending. Returns rows written."""
+        if not self._rows:
+            return 0
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = 0
+            while self._rows:
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                try:
+                    written += await run_db(_bulk_insert_meter_values, batch)
+                    self._failures = 0
+                    self.stats["batches"] += 1
+                    self.stats["flushed"] += len(batch)
+                except Exception as e:
+                    self._failures += 1
+                    self.stats["failed_flushes"] += 1
+                    if self._failures >= _MAX_FLUSH_ATTEMPTS:
+                        self.stats["dropped"] += len(batch)
+                        logger.error(
+                            "[meter-ingest] dropping batch of %d after %d failed flushes: %s",
+                            len(batch), self._failures, e, exc_info=True,
+                        )
+                        self._failures = 0
+                    else:
+                        # Put the batch back at the head and retry next tick.
+                        self._rows.extendleft(reversed(batch))
+                        logger.warning(
+                            "[meter-ingest] flush of %d row(s) failed (attempt %d): %s",
+                            len(batch), self._failures, e,
+                        )
+                        break
+            if self._space is not None:
+                async with self._space:
+                    self._space.notify_all()
+            return written
+
+    async def _run(self) -> None:
+        logger.info(
+            "MeterValues write-behind started (batch=%d, interval=%.1fs, max_pending=%d)",
+            self.batch_size, self.flush_seconds, self.max_pending,
+        )
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[meter-ingest] flush loop error: {e}", exc_info=True)
+
+    async def close(self) -> None:
+        """Stop the flush task and drain the buffer (call on shutdown)."""
+        self._closed = True
+        if self._wake is not None:
+            self._wake.set()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, timeout=self.flush_seconds + 5)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+        remaining = len(self._rows)
+        await self.flush()
+        if remaining:
+            logger.info("[meter-ingest] flushed %d pending sample(s) on shutdown", remaining)
+
+
+meter_buffer = MeterIngestBuffer()
+
+
+async def drain_meter_buffer(timeout: float = 15.0) -> None:
+    """Flush meter_buffer on shutdown from whichever loop is shutting down.
+
+    The buffer lives on the OCPP thread's loop, while shutdown hooks run on
+    the FastAPI loop — hop over with run_coroutine_threadsafe when needed.
+    """
+    loop = meter_buffer._loop
+    if loop is None or loop.is_closed():
+        return
+    try:
+        if loop is asyncio.get_running_loop():
+            await asyncio.wait_for(meter_buffer.close(), timeout=timeout)
+        elif loop.is_running():
+            fut = asyncio.run_coroutine_threadsafe(meter_buffer.close(), loop)
+            await asyncio.wait_for(asyncio.wrap_future(fut), timeout=timeout)
+    except Exception as e:
+        logger.error(f"[meter-ingest] shutdown drain failed: {e}", exc_info=True)
@@ -0,0 +1,116 @@
+"""
+PlagSini EV — Latest Meter Sample Cache
+
+The metering page, the ops panel and the dashboard tiles poll
+/api/metering/{cp}/latest, and the app's kW graph asks for the newest
+points of a transaction. Each of those was `ORDER BY timestamp DESC LIMIT 1`
+against meter_values, so the cost of a "current reading" grew with the
+history we keep.
+
+charger_meter_latest / transaction_meter_latest hold the newest sample per
+charger and per transaction. The writers update them in place, in the same
+commit as the session energy: on_meter_values (via _persist_meter_values)
+and the edge POST /api/edge/sync/meter-value. A sample older than the
+stored one (edge catch-up, out-of-order MeterValues) never overwrites it.
+Reads are a primary-key lookup. A charger or transaction with no row yet
+(history from before the tables existed) falls back to meter_values.
+
+The raw rows still go through meter_buffer (write-behind), so the cached
+sample can be up to OCPP_METER_FLUSH_SECONDS newer than meter_values.
+
+Usage:
+    from meter_latest import record_latest_sample, latest_for_charger
+    record_latest_sample(db, charger_id, transaction_id, sample)  # caller commits
+    latest = latest_for_charger(db, charger_id)
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import desc
+
+from database import ChargerMeterLatest, MeterValue, TransactionMeterLatest
+
+_SAMPLE_FIELDS = ("voltage", "current", "power", "total_kwh")
+
+
+def _naive(ts: datetime) -> datetime:
+    # meter_values stores the charger's wall time without offset.
+    return ts.replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+
+def _apply(row, timestamp: datetime, sample: Dict) -> None:
+    row.timestamp = timestamp
+    for name in _SAMPLE_FIELDS:
+        setattr(row, name, sample.get(name))
+
+
+def record_latest_sample(db, charger_id: int, transaction_id: Optional[int], sample: Dict) -> None:
+    """Overwrite the charger's (and transaction's) latest sample with
+    `sample` (keys: timestamp, voltage, current, power, total_kwh) unless the
+    stored one is newer. Runs in the caller's transaction."""
+    timestamp = _naive(sample["timestamp"])
+
+    row = db.get(ChargerMeterLatest, charger_id)
+    if row is None:
+        row = ChargerMeterLatest(charger_id=charger_id)
+        db.add(row)
+    if row.timestamp is None or timestamp >= row.timestamp:
+        _apply(row, timestamp, sample)
+        row.transaction_id = transaction_id
+
+    if transaction_id:
+        txn = db.get(TransactionMeterLatest, transaction_id)
+        if txn is None:
+            txn = TransactionMeterLatest(transaction_id=transaction_id, charger_id=charger_id)
+            db.add(txn)
+        if txn.timestamp is None or timestamp >= txn.timestamp:
+            _apply(txn, timestamp, sample)
+
+
+def _snapshot(row, transaction_id: Optional[int]) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=getattr(row, "id", None), timestamp=row.timestamp, transaction_id=transaction_id,
+        **{name: getattr(row, name) for name in _SAMPLE_FIELDS},
+    )
+
+
+def latest_for_charger(db, charger_id: int) -> Optional[SimpleNamespace]:
+    """Newest sample of a charger, shaped like a MeterValue (id is None when
+    served from the cache), or None if it never sent one."""
+    row = db.get(ChargerMeterLatest, charger_id)
+    if row is not None:
+        return _snapshot(row, row.transaction_id)
+    raw = (
+        db.query(MeterValue)
+        .filter(MeterValue.charger_id == charger_id)
+        .order_by(desc(MeterValue.timestamp))
+        .first()
+    )
+    return _snapshot(raw, raw.transaction_id) if raw is not None else None
+
+
+def latest_for_transactions(db, transaction_ids: Iterable[int]) -> Dict[int, SimpleNamespace]:
+    """{transaction_id: newest sample} for the given transactions; ones that
+    never sent a sample are absent."""
+    wanted = {t for t in transaction_ids if t}
+    if not wanted:
+        return {}
+    out = {
+        row.transaction_id: _snapshot(row, row.transaction_id)
+        for row in db.query(TransactionMeterLatest).filter(TransactionMeterLatest.transaction_id.in_(wanted))
+    }
+    for transaction_id in wanted - out.keys():
+        raw = (
+            db.query(MeterValue)
+            .filter(MeterValue.transaction_id == transaction_id)
+            .order_by(desc(MeterValue.timestamp))
+            .first()
+        )
+        if raw is not None:
+            out[transaction_id] = _snapshot(raw, transaction_id)
+    return out
+
+
+def latest_for_transaction(db, transaction_id: int) -> Optional[SimpleNamespace]:
+    return latest_for_transactions(db, [transaction_id]).get(transaction_id)
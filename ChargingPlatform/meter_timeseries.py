@@ -0,0 +1,369 @@
+"""
+PlagSini EV — Meter Time-series Storage
+
+meter_values grows by one row per charger every ~10s and was one plain
+table: charts over a day or a month scanned (and shipped) every raw sample,
+and nothing ever deleted old ones. This module turns it into a small
+time-series store:
+
+  raw        meter_values           kept OCPP_METER_RAW_RETENTION_DAYS (90)
+  1 minute   meter_rollup_1m        kept OCPP_METER_1M_RETENTION_DAYS (400)
+  15 minute  meter_rollup_15m       kept forever (OCPP_METER_15M_RETENTION_DAYS=0)
+
+A background loop (meter_timeseries_worker) downsamples raw → 1m → 15m
+every OCPP_METER_ROLLUP_SECONDS. Each pass re-aggregates the trailing
+OCPP_METER_ROLLUP_REWIND_SECONDS as well, so samples that land late
+(write-behind buffer, edge sync catch-up) still make it into their
+bucket. Buckets are rebuilt idempotently (delete range + insert).
+
+Once a day it applies retention. On MySQL, where meter_values is
+RANGE-partitioned by month (migration 20260712_000001), expired months are
+dropped as whole partitions and empty future ones are added. Elsewhere
+(SQLite dev/CI) it deletes in chunks.
+
+Readers call meter_series(), which picks the finest resolution that still
+covers the requested range and fits in `max_points` — raw for the last
+hour, 1m for a day, 15m for months.
+
+Usage:
+    from meter_timeseries import meter_series
+    resolution, points = meter_series(db, charger_id=3, start=t0, end=t1, max_points=500)
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import func, insert, text
+
+from database import MeterRollup15m, MeterRollup1m, MeterValue, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+OCPP_METER_ROLLUP_SECONDS = float(os.getenv("OCPP_METER_ROLLUP_SECONDS", "60"))
+OCPP_METER_ROLLUP_REWIND_SECONDS = int(os.getenv("OCPP_METER_ROLLUP_REWIND_SECONDS", "600"))
+OCPP_METER_RAW_RETENTION_DAYS = int(os.getenv("OCPP_METER_RAW_RETENTION_DAYS", "90"))
+OCPP_METER_1M_RETENTION_DAYS = int(os.getenv("OCPP_METER_1M_RETENTION_DAYS", "400"))
+OCPP_METER_15M_RETENTION_DAYS = int(os.getenv("OCPP_METER_15M_RETENTION_DAYS", "0"))  # 0 = keep
+# Raw samples arrive every ~10s; used to estimate point counts per resolution.
+_RAW_SAMPLE_SECONDS = 10
+# Largest slice one executor call aggregates, so a long catch-up after
+# downtime never holds a DB session for minutes.
+_CHUNK = timedelta(hours=6)
+_MAX_CHUNKS_PER_PASS = 24
+_DELETE_BATCH = 5000
+_RETENTION_EVERY = timedelta(hours=24)
+_FUTURE_PARTITIONS = 3
+
+RESOLUTION_SECONDS = {"raw": _RAW_SAMPLE_SECONDS, "1m": 60, "15m": 900}
+
+
+def _floor(ts: datetime, seconds: int) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=int((ts - epoch).total_seconds()) // seconds * seconds)
+
+
+def _retention_cutoff(days: int, now: datetime) -> Optional[datetime]:
+    return now - timedelta(days=days) if days > 0 else None
+
+
+# ─── Downsampling ──────────────────────────────────────────────────────────
+
+class _Bucket:
+    __slots__ = ("samples", "power_sum", "power_n", "power_max", "voltage_sum", "voltage_n",
+                 "current_sum", "current_n", "kwh_first", "kwh_last")
+
+    def __init__(self):
+        self.samples = 0
+        self.power_sum = self.voltage_sum = self.current_sum = 0.0
+        self.power_n = self.voltage_n = self.current_n = 0
+        self.power_max: Optional[float] = None
+        self.kwh_first: Optional[float] = None
+        self.kwh_last: Optional[float] = None
+
+    def add(self, weight: int, power: Optional[float], power_max: Optional[float],
+            voltage: Optional[float], current: Optional[float],
+            kwh_first: Optional[float], kwh_last: Optional[float]) -> None:
+        """Fold in one raw sample (weight 1) or one finer rollup row. Rows
+        must arrive in time order for kwh_first / kwh_last."""
+        self.samples += weight
+        if power is not None:
+            self.power_sum += power * weight
+            self.power_n += weight
+        if power_max is not None:
+            self.power_max = power_max if self.power_max is None else max(self.power_max, power_max)
+        if voltage is not None:
+            self.voltage_sum += voltage * weight
+            self.voltage_n += weight
+        if current is not None:
+            self.current_sum += current * weight
+            self.current_n += weight
+        if kwh_first is not None and self.kwh_first is None:
+            self.kwh_first = kwh_first
+        if kwh_last is not None:
+            self.kwh_last = kwh_last
+
+    def row(self, charger_id: int, transaction_id: int, bucket_start: datetime) -> Dict[str, Any]:
+        return {
+            "charger_id": charger_id,
+            "transaction_id": transaction_id,
+            "bucket_start": bucket_start,
+            "samples": self.samples,
+            "power_avg": self.power_sum / self.power_n if self.power_n else None,
+            "power_max": self.power_max,
+            "voltage_avg": self.voltage_sum / self.voltage_n if self.voltage_n else None,
+            "current_avg": self.current_sum / self.current_n if self.current_n else None,
+            "total_kwh_first": self.kwh_first,
+            "total_kwh_last": self.kwh_last,
+        }
+
+
+def _replace_buckets(db, model: Type, start: datetime, end: datetime,
+                     buckets: Dict[Tuple[int, int, datetime], _Bucket]) -> int:
+    db.query(model).filter(model.bucket_start >= start, model.bucket_start < end).delete(
+        synchronize_session=False
+    )
+    rows = [b.row(*key) for key, b in buckets.items()]
+    if rows:
+        db.execute(insert(model), rows)
+    return len(rows)
+
+
+def _rollup_raw_to_1m(db, start: datetime, end: datetime) -> int:
+    """Rebuild 1m buckets in [start, end) from meter_values."""
+    buckets: Dict[Tuple[int, int, datetime], _Bucket] = {}
+    rows = (
+        db.query(MeterValue.charger_id, MeterValue.transaction_id, MeterValue.timestamp,
+                 MeterValue.power, MeterValue.voltage, MeterValue.current, MeterValue.total_kwh)
+        .filter(MeterValue.timestamp >= start, MeterValue.timestamp < end,
+                MeterValue.charger_id.isnot(None))
+        .order_by(MeterValue.timestamp)
+        .yield_per(5000)
+    )
+    for r in rows:
+        key = (r.charger_id, r.transaction_id or 0, _floor(r.timestamp, 60))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        bucket.add(1, r.power, r.power, r.voltage, r.current, r.total_kwh, r.total_kwh)
+    written = _replace_buckets(db, MeterRollup1m, start, end, buckets)
+    db.commit()
+    return written
+
+
+def _rollup_1m_to_15m(db, start: datetime, end: datetime) -> int:
+    """Rebuild 15m buckets in [start, end) from meter_rollup_1m."""
+    buckets: Dict[Tuple[int, int, datetime], _Bucket] = {}
+    rows = (
+        db.query(MeterRollup1m)
+        .filter(MeterRollup1m.bucket_start >= start, MeterRollup1m.bucket_start < end)
+        .order_by(MeterRollup1m.bucket_start)
+        .yield_per(5000)
+    )
+    for r in rows:
+        key = (r.charger_id, r.transaction_id, _floor(r.bucket_start, 900))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        bucket.add(r.samples, r.power_avg, r.power_max, r.voltage_avg, r.current_avg,
+                   r.total_kwh_first, r.total_kwh_last)
+    written = _replace_buckets(db, MeterRollup15m, start, end, buckets)
+    db.commit()
+    return written
+
+
+def _rollup_start(db, rewind_from: datetime) -> datetime:
+    """Where the next pass starts: the first raw sample after the newest 1m
+    bucket (the oldest one on first run), pulled back to cover the rewind
+    window. Skipping straight to the next sample keeps a long outage gap
+    from being rescanned every pass."""
+    q = db.query(func.min(MeterValue.timestamp))
+    newest = db.query(func.max(MeterRollup1m.bucket_start)).scalar()
+    if newest is not None:
+        q = q.filter(MeterValue.timestamp >= newest + timedelta(minutes=1))
+    following = q.scalar()
+    return min(_floor(following, 900), rewind_from) if following is not None else rewind_from
+
+
+def rollup_pass(db, now: Optional[datetime] = None) -> Dict[str, int]:
+    """One downsampling pass up to the last complete minute. Runs on the DB
+    executor; split into _CHUNK slices, at most _MAX_CHUNKS_PER_PASS."""
+    now = now or _utcnow()
+    end = _floor(now - timedelta(seconds=5), 60)  # let the write-behind buffer land
+    rewind_from = _floor(end - timedelta(seconds=OCPP_METER_ROLLUP_REWIND_SECONDS), 900)
+    start = _floor(_rollup_start(db, rewind_from), 900)
+    stats = {"1m": 0, "15m": 0, "chunks": 0}
+    cursor = start
+    while cursor < end and stats["chunks"] < _MAX_CHUNKS_PER_PASS:
+        chunk_end = min(cursor + _CHUNK, end)
+        stats["1m"] += _rollup_raw_to_1m(db, cursor, chunk_end)
+        # Only complete 15m buckets; the open one is rebuilt next pass.
+        q_end = _floor(chunk_end, 900)
+        if q_end > cursor:
+            stats["15m"] += _rollup_1m_to_15m(db, cursor, q_end)
+        stats["chunks"] += 1
+        cursor = chunk_end
+    return stats
+
+
+# ─── Retention & partitions ────────────────────────────────────────────────
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def _mysql_partitions(db) -> List[Tuple[str, Optional[int]]]:
+    """[(name, upper bound as TO_DAYS value or None for MAXVALUE)] in order;
+    empty if meter_values is not partitioned."""
+    rows = db.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'meter_values' "
+        "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+    )).all()
+    return [(name, None if desc == "MAXVALUE" else int(desc)) for name, desc in rows]
+
+
+def _to_days(db, d: date) -> int:
+    return int(db.execute(text("SELECT TO_DAYS(:d)"), {"d": d.isoformat()}).scalar())
+
+
+def _maintain_mysql_partitions(db, raw_cutoff: Optional[datetime], today: date) -> Dict[str, int]:
+    partitions = _mysql_partitions(db)
+    if not partitions:
+        return {}
+    dropped = 0
+    if raw_cutoff is not None:
+        cutoff_days = _to_days(db, raw_cutoff.date())
+        expired = [name for name, upper in partitions if upper is not None and upper <= cutoff_days]
+        if expired:
+            db.execute(text(f"ALTER TABLE meter_values DROP PARTITION {', '.join(expired)}"))
+            dropped = len(expired)
+
+    # Split pmax so the next _FUTURE_PARTITIONS months each have their own partition.
+    bounded = [upper for _, upper in partitions if upper is not None]
+    have_until = max(bounded) if bounded else _to_days(db, today)
+    month = date(today.year, today.month, 1)
+    target = month
+    for _ in range(_FUTURE_PARTITIONS + 1):
+        target = _next_month(target)
+    new_parts = []
+    while month < target:
+        upper = _next_month(month)
+        upper_days = _to_days(db, upper)
+        if upper_days > have_until:
+            new_parts.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ({upper_days})")
+        month = upper
+    if new_parts and any(name == "pmax" for name, _ in partitions):
+        db.execute(text(
+            "ALTER TABLE meter_values REORGANIZE PARTITION pmax INTO ("
+            + ", ".join(new_parts) + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+    return {"partitions_dropped": dropped, "partitions_added": len(new_parts)}
+
+
+def _delete_before(db, model: Type, column, cutoff: datetime) -> int:
+    """Chunked DELETE so retention never holds one huge transaction."""
+    deleted = 0
+    while True:
+        ids = [r[0] for r in db.query(model.id).filter(column < cutoff).limit(_DELETE_BATCH).all()]
+        if not ids:
+            return deleted
+        db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+
+
+def apply_retention(db, now: Optional[datetime] = None) -> Dict[str, int]:
+    now = now or _utcnow()
+    stats: Dict[str, int] = {}
+    raw_cutoff = _retention_cutoff(OCPP_METER_RAW_RETENTION_DAYS, now)
+    if db.bind.dialect.name == "mysql":
+        stats.update(_maintain_mysql_partitions(db, raw_cutoff, now.date()))
+    if raw_cutoff is not None and "partitions_dropped" not in stats:
+        stats["raw_deleted"] = _delete_before(db, MeterValue, MeterValue.timestamp, raw_cutoff)
+    for label, model, days in (("1m", MeterRollup1m, OCPP_METER_1M_RETENTION_DAYS),
+                               ("15m", MeterRollup15m, OCPP_METER_15M_RETENTION_DAYS)):
+        cutoff = _retention_cutoff(days, now)
+        if cutoff is not None:
+            stats[f"{label}_deleted"] = _delete_before(db, model, model.bucket_start, cutoff)
+    db.commit()
+    return stats
+
+
+async def meter_timeseries_worker(interval_seconds: float = OCPP_METER_ROLLUP_SECONDS):
+    """Background loop on the OCPP loop: rollups every interval, retention daily.
+    Run it on ONE process (main OCPP thread, or OCPP worker 0)."""
+    logger.info("Meter time-series worker started (rollup every %.0fs)", interval_seconds)
+    last_retention: Optional[datetime] = None
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            stats = await run_db(rollup_pass)
+            if stats["chunks"] > 1:
+                logger.info(f"[meter-ts] rollup catch-up: {stats}")
+            now = _utcnow()
+            if last_retention is None or now - last_retention >= _RETENTION_EVERY:
+                last_retention = now
+                logger.info(f"[meter-ts] retention: {await run_db(apply_retention)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[meter-ts] pass failed: {e}", exc_info=True)
+
+
+# ─── Reads ─────────────────────────────────────────────────────────────────
+
+def pick_resolution(start: datetime, end: datetime, max_points: int,
+                    now: Optional[datetime] = None) -> str:
+    """Finest resolution that still has data for `start` (retention) and
+    returns at most `max_points` points; 15m otherwise."""
+    now = now or _utcnow()
+    span = max(0.0, (end - start).total_seconds())
+    for resolution, days in (("raw", OCPP_METER_RAW_RETENTION_DAYS), ("1m", OCPP_METER_1M_RETENTION_DAYS)):
+        cutoff = _retention_cutoff(days, now)
+        if cutoff is not None and start < cutoff:
+            continue
+        if span / RESOLUTION_SECONDS[resolution] <= max_points:
+            return resolution
+    return "15m"
+
+
+def meter_series(db, *, charger_id: Optional[int] = None, transaction_id: Optional[int] = None,
+                 start: datetime, end: datetime, max_points: int = 500,
+                 resolution: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """Meter points in [start, end) for a charger and/or transaction, oldest
+    first. Raw points and rollup buckets share one shape; rollups add
+    `samples` and `power_max`. At most `max_points` (the newest ones)."""
+    if charger_id is None and transaction_id is None:
+        raise ValueError("meter_series needs charger_id or transaction_id")
+    resolution = resolution or pick_resolution(start, end, max_points)
+    if resolution == "raw":
+        q = db.query(MeterValue).filter(MeterValue.timestamp >= start, MeterValue.timestamp < end)
+        if charger_id is not None:
+            q = q.filter(MeterValue.charger_id == charger_id)
+        if transaction_id is not None:
+            q = q.filter(MeterValue.transaction_id == transaction_id)
+        rows = list(reversed(q.order_by(MeterValue.timestamp.desc()).limit(max_points).all()))
+        return resolution, [
+            {"timestamp": r.timestamp, "power": r.power, "voltage": r.voltage,
+             "current": r.current, "total_kwh": r.total_kwh, "transaction_id": r.transaction_id}
+            for r in rows
+        ]
+
+    model = MeterRollup1m if resolution == "1m" else MeterRollup15m
+    q = db.query(model).filter(model.bucket_start >= _floor(start, RESOLUTION_SECONDS[resolution]),
+                               model.bucket_start < end)
+    if charger_id is not None:
+        q = q.filter(model.charger_id == charger_id)
+    if transaction_id is not None:
+        q = q.filter(model.transaction_id == transaction_id)
+    rows = list(reversed(q.order_by(model.bucket_start.desc()).limit(max_points).all()))
+    return resolution, [
+        {"timestamp": r.bucket_start, "power": r.power_avg, "voltage": r.voltage_avg,
+         "current": r.current_avg, "total_kwh": r.total_kwh_last,
+         "transaction_id": r.transaction_id or None,
+         "samples": r.samples, "power_max": r.power_max}
+        for r in rows
+    ]
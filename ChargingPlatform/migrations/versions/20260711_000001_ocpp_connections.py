@@ -0,0 +1,41 @@
+"""OCPP connection registry — charger → node routing table
+
+Lets several OCPP nodes run behind the load balancer: the node holding a
+charger's WebSocket records itself here, and API nodes relay commands to
+it. Only used when OCPP_REGISTRY=db.
+
+Revision ID: 20260711_000001
+Revises: 20260710_000003
+Create Date: 2026-07-11 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260711_000001"
+down_revision: Union[str, None] = "20260710_000003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ocpp_connections",
+        sa.Column("charge_point_id", sa.String(length=255), primary_key=True),
+        sa.Column("node_id", sa.String(length=100), nullable=False),
+        sa.Column("node_url", sa.String(length=255), nullable=False),
+        sa.Column("connected_at", sa.DateTime(), nullable=False,
+                  server_default=sa.func.current_timestamp()),
+        sa.Column("last_seen", sa.DateTime(), nullable=False,
+                  server_default=sa.func.current_timestamp()),
+    )
+    op.create_index("ix_ocpp_connections_node_id", "ocpp_connections", ["node_id"])
+    op.create_index("ix_ocpp_connections_last_seen", "ocpp_connections", ["last_seen"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ocpp_connections_last_seen", table_name="ocpp_connections")
+    op.drop_index("ix_ocpp_connections_node_id", table_name="ocpp_connections")
+    op.drop_table("ocpp_connections")
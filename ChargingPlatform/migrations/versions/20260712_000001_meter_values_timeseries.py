@@ -0,0 +1,119 @@
+"""meter_values time-series layout — indexes, monthly partitions, rollup tables
+
+meter_values had no index on charger_id, transaction_id or timestamp, yet
+/api/metering, the session kW graph, the orphan watchdog and boot-time
+orphan close all filter and sort on them.
+
+- Composite indexes (charger_id, timestamp), (transaction_id, timestamp)
+  and (timestamp) on every dialect.
+- meter_rollup_1m / meter_rollup_15m tables filled by meter_timeseries.py.
+- MySQL only: RANGE partitioning by month on TO_DAYS(timestamp). MySQL
+  requires the partition column in the primary key and forbids foreign keys
+  on partitioned tables, so the PK becomes (id, timestamp) and the
+  charger_id FK constraint is dropped (the ORM relationship is unaffected).
+  meter_timeseries.py adds future partitions and drops expired ones.
+
+NOTE: partitioning rebuilds meter_values. On a large table run this in a
+maintenance window (see DB_MIGRATION_RUNBOOK.md).
+
+Revision ID: 20260712_000001
+Revises: 20260711_000001
+Create Date: 2026-07-12 00:00:00
+"""
+from datetime import date
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260712_000001"
+down_revision: Union[str, None] = "20260711_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_ROLLUP_TABLES = ("meter_rollup_1m", "meter_rollup_15m")
+# Months of empty partitions created ahead of today.
+_FUTURE_MONTHS = 3
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def _monthly_partitions(first: date, last: date) -> List[str]:
+    """`PARTITION pYYYYMM VALUES LESS THAN (TO_DAYS('<next month>'))` for
+    every month from `first` to `last`, then the catch-all pmax."""
+    parts = []
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        upper = _next_month(month)
+        parts.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))")
+        month = upper
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return parts
+
+
+def _create_rollup_table(name: str) -> None:
+    op.create_table(
+        name,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("charger_id", sa.Integer(), nullable=False),
+        sa.Column("transaction_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("samples", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("power_avg", sa.Float(), nullable=True),
+        sa.Column("power_max", sa.Float(), nullable=True),
+        sa.Column("voltage_avg", sa.Float(), nullable=True),
+        sa.Column("current_avg", sa.Float(), nullable=True),
+        sa.Column("total_kwh_first", sa.Float(), nullable=True),
+        sa.Column("total_kwh_last", sa.Float(), nullable=True),
+        sa.UniqueConstraint("charger_id", "transaction_id", "bucket_start", name=f"uq_{name}_bucket"),
+    )
+    op.create_index(f"ix_{name}_txn_bucket", name, ["transaction_id", "bucket_start"])
+    op.create_index(f"ix_{name}_bucket", name, ["bucket_start"])
+
+
+def upgrade() -> None:
+    op.create_index("ix_meter_values_charger_ts", "meter_values", ["charger_id", "timestamp"])
+    op.create_index("ix_meter_values_txn_ts", "meter_values", ["transaction_id", "timestamp"])
+    op.create_index("ix_meter_values_timestamp", "meter_values", ["timestamp"])
+    for name in _ROLLUP_TABLES:
+        _create_rollup_table(name)
+
+    bind = op.get_bind()
+    if bind.dialect.name != "mysql":
+        return
+
+    for fk in sa.inspect(bind).get_foreign_keys("meter_values"):
+        if fk.get("constrained_columns") == ["charger_id"] and fk.get("name"):
+            op.execute(f"ALTER TABLE meter_values DROP FOREIGN KEY `{fk['name']}`")
+    op.execute("ALTER TABLE meter_values DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+
+    oldest = bind.execute(sa.text("SELECT MIN(timestamp) FROM meter_values")).scalar()
+    today = date.today()
+    first = oldest.date() if oldest else today
+    last = today
+    for _ in range(_FUTURE_MONTHS):
+        last = _next_month(last)
+    op.execute(
+        "ALTER TABLE meter_values PARTITION BY RANGE (TO_DAYS(timestamp)) (\n    "
+        + ",\n    ".join(_monthly_partitions(first, last))
+        + "\n)"
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "mysql":
+        op.execute("ALTER TABLE meter_values REMOVE PARTITIONING")
+        op.execute("ALTER TABLE meter_values DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+        op.create_foreign_key(None, "meter_values", "chargers", ["charger_id"], ["id"])
+
+    for name in reversed(_ROLLUP_TABLES):
+        op.drop_index(f"ix_{name}_bucket", table_name=name)
+        op.drop_index(f"ix_{name}_txn_bucket", table_name=name)
+        op.drop_table(name)
+    op.drop_index("ix_meter_values_timestamp", table_name="meter_values")
+    op.drop_index("ix_meter_values_txn_ts", table_name="meter_values")
+    op.drop_index("ix_meter_values_charger_ts", table_name="meter_values")
@@ -0,0 +1,103 @@
+"""meter latest-sample tables — charger_meter_latest, transaction_meter_latest
+
+/api/metering/{cp}/latest, the kW graph head and the dashboard tiles asked
+meter_values for `ORDER BY timestamp DESC LIMIT 1` on every poll. These two
+tables hold the newest sample per charger and per transaction, overwritten
+in place by on_meter_values and the edge meter-value sync.
+
+Backfill: every charger's newest sample, and the newest sample of each
+still-active/pending session. Older transactions have no row and are
+answered from meter_values (indexed since 20260712_000001).
+
+Revision ID: 20260713_000001
+Revises: 20260712_000001
+Create Date: 2026-07-13 00:00:00
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260713_000001"
+down_revision: Union[str, None] = "20260712_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_SAMPLE_COLUMNS = ("timestamp", "voltage", "current", "power", "total_kwh")
+
+
+def _sample_columns():
+    return [
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("voltage", sa.Float(), nullable=True),
+        sa.Column("current", sa.Float(), nullable=True),
+        sa.Column("power", sa.Float(), nullable=True),
+        sa.Column("total_kwh", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    ]
+
+
+def _backfill(bind) -> None:
+    meter_values = sa.table(
+        "meter_values", sa.column("id"), sa.column("charger_id"), sa.column("transaction_id"),
+        *(sa.column(c) for c in _SAMPLE_COLUMNS),
+    )
+    sessions = sa.table("charging_sessions", sa.column("transaction_id"), sa.column("status"))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def newest(condition):
+        return bind.execute(
+            sa.select(meter_values).where(condition)
+            .order_by(meter_values.c.timestamp.desc(), meter_values.c.id.desc()).limit(1)
+        ).mappings().first()
+
+    charger_rows = []
+    charger_ids = bind.execute(
+        sa.select(meter_values.c.charger_id).where(meter_values.c.charger_id.isnot(None)).distinct()
+    ).scalars().all()
+    for charger_id in charger_ids:
+        row = newest(meter_values.c.charger_id == charger_id)
+        charger_rows.append({"charger_id": charger_id, "transaction_id": row["transaction_id"],
+                             "updated_at": now, **{c: row[c] for c in _SAMPLE_COLUMNS}})
+
+    txn_rows = []
+    active_txns = bind.execute(
+        sa.select(sessions.c.transaction_id).where(
+            sessions.c.status.in_(["active", "pending"]), sessions.c.transaction_id.isnot(None),
+        )
+    ).scalars().all()
+    for transaction_id in set(active_txns):
+        row = newest(meter_values.c.transaction_id == transaction_id)
+        if row is not None and row["charger_id"] is not None:
+            txn_rows.append({"transaction_id": transaction_id, "charger_id": row["charger_id"],
+                             "updated_at": now, **{c: row[c] for c in _SAMPLE_COLUMNS}})
+
+    if charger_rows:
+        op.bulk_insert(sa.table("charger_meter_latest", *(sa.column(k) for k in charger_rows[0])), charger_rows)
+    if txn_rows:
+        op.bulk_insert(sa.table("transaction_meter_latest", *(sa.column(k) for k in txn_rows[0])), txn_rows)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "charger_meter_latest",
+        sa.Column("charger_id", sa.Integer(), sa.ForeignKey("chargers.id"), primary_key=True, autoincrement=False),
+        sa.Column("transaction_id", sa.Integer(), nullable=True),
+        *_sample_columns(),
+    )
+    op.create_table(
+        "transaction_meter_latest",
+        sa.Column("transaction_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("charger_id", sa.Integer(), nullable=False),
+        *_sample_columns(),
+    )
+    op.create_index("ix_transaction_meter_latest_charger_id", "transaction_meter_latest", ["charger_id"])
+    _backfill(op.get_bind())
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transaction_meter_latest_charger_id", table_name="transaction_meter_latest")
+    op.drop_table("transaction_meter_latest")
+    op.drop_table("charger_meter_latest")
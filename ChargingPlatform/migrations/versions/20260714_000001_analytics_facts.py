@@ -0,0 +1,43 @@
+"""analytics_facts — pre-aggregated metrics for /api/analytics
+
+Daily/hourly revenue, sessions, energy and sign-ups per charger, tenant and
+dimension. Filled by analytics_facts.py's background job; the first run
+after this migration backfills all history, so no data step here.
+
+Revision ID: 20260714_000001
+Revises: 20260713_000001
+Create Date: 2026-07-14 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260714_000001"
+down_revision: Union[str, None] = "20260713_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "analytics_facts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("hour", sa.SmallInteger(), nullable=False, server_default="0"),
+        sa.Column("metric", sa.String(32), nullable=False),
+        sa.Column("charger_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("tenant", sa.String(50), nullable=False, server_default=""),
+        sa.Column("dimension", sa.String(64), nullable=False, server_default=""),
+        sa.Column("value", sa.Numeric(16, 3), nullable=False, server_default="0"),
+        sa.Column("events", sa.Integer(), nullable=False, server_default="0"),
+        sa.UniqueConstraint("day", "hour", "metric", "charger_id", "tenant", "dimension",
+                            name="uq_analytics_facts_key"),
+    )
+    op.create_index("ix_analytics_facts_metric_day", "analytics_facts", ["metric", "day"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_analytics_facts_metric_day", table_name="analytics_facts")
+    op.drop_table("analytics_facts")
@@ -0,0 +1,36 @@
+"""keyset pagination indexes
+
+Composite (timestamp, id) indexes matching the ORDER BY of the cursor-paged
+list endpoints (keyset.py), so each page is an index range scan.
+
+Revision ID: 20260715_000001
+Revises: 20260714_000001
+Create Date: 2026-07-15 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "20260715_000001"
+down_revision: Union[str, None] = "20260714_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_INDEXES = (
+    ("ix_payment_transactions_created_id", "payment_transactions", ["created_at", "id"]),
+    ("ix_support_tickets_created_id", "support_tickets", ["created_at", "id"]),
+    ("ix_charging_sessions_start_id", "charging_sessions", ["start_time", "id"]),
+    ("ix_charging_sessions_stop_id", "charging_sessions", ["stop_time", "id"]),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in _INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
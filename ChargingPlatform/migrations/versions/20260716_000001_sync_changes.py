@@ -0,0 +1,40 @@
+"""sync_changes — change feed for partner sync
+
+Append-only log of payment_transactions / charging_sessions mutations,
+written by the ORM listeners in database.py and served by
+/api/sync/changes. Starts empty: partners bootstrap from
+/api/sync/transactions, then follow the feed.
+
+Revision ID: 20260716_000001
+Revises: 20260715_000001
+Create Date: 2026-07-16 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260716_000001"
+down_revision: Union[str, None] = "20260715_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sync_changes",
+        sa.Column("seq", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), primary_key=True, autoincrement=True),
+        sa.Column("entity", sa.String(32), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("entity_ref", sa.String(64), nullable=True),
+        sa.Column("op", sa.String(8), nullable=False),
+        sa.Column("fields", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_sync_changes_created_at", "sync_changes", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sync_changes_created_at", table_name="sync_changes")
+    op.drop_table("sync_changes")
@@ -0,0 +1,53 @@
+"""partner webhooks — endpoint registration + delivery outbox
+
+Adds webhook_url / webhook_secret / webhook_events to partner_api_keys and
+the webhook_outbox table drained by webhook_delivery.py. Existing partners
+start with no webhook (url NULL) and keep polling until they register one.
+
+Revision ID: 20260717_000001
+Revises: 20260716_000001
+Create Date: 2026-07-17 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260717_000001"
+down_revision: Union[str, None] = "20260716_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("partner_api_keys", sa.Column("webhook_url", sa.String(500), nullable=True))
+    op.add_column("partner_api_keys", sa.Column("webhook_secret", sa.String(64), nullable=True))
+    op.add_column("partner_api_keys", sa.Column("webhook_events", sa.String(255), nullable=True))
+
+    op.create_table(
+        "webhook_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("partner_id", sa.Integer(), sa.ForeignKey("partner_api_keys.id"), nullable=False),
+        sa.Column("event_id", sa.String(36), nullable=False, unique=True),
+        sa.Column("event_type", sa.String(50), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(16), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("claim_token", sa.String(32), nullable=True),
+        sa.Column("last_error", sa.String(500), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("delivered_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_webhook_outbox_partner_id", "webhook_outbox", ["partner_id"])
+    op.create_index("ix_webhook_outbox_due", "webhook_outbox", ["status", "next_attempt_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_webhook_outbox_due", table_name="webhook_outbox")
+    op.drop_index("ix_webhook_outbox_partner_id", table_name="webhook_outbox")
+    op.drop_table("webhook_outbox")
+    op.drop_column("partner_api_keys", "webhook_events")
+    op.drop_column("partner_api_keys", "webhook_secret")
+    op.drop_column("partner_api_keys", "webhook_url")
@@ -0,0 +1,27 @@
+"""charging_sessions (status, id) index
+
+The orphan session watchdog walks open (active / pending) sessions in id
+order, batch by batch; this index makes each batch a range scan instead of
+a pass over every session ever recorded.
+
+Revision ID: 20260718_000001
+Revises: 20260717_000001
+Create Date: 2026-07-18 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "20260718_000001"
+down_revision: Union[str, None] = "20260717_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_charging_sessions_status_id", "charging_sessions", ["status", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_charging_sessions_status_id", table_name="charging_sessions")
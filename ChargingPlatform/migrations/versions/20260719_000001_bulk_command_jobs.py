@@ -0,0 +1,66 @@
+"""bulk OCPP command jobs — job record + per-charger results
+
+Adds bulk_command_jobs and bulk_command_results, written by
+bulk_commands.py for fleet-wide Reset / ChangeConfiguration /
+GetConfiguration / TriggerMessage / SendLocalList / UpdateFirmware runs.
+
+Revision ID: 20260719_000001
+Revises: 20260718_000001
+Create Date: 2026-07-19 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20260719_000001"
+down_revision: Union[str, None] = "20260718_000001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bulk_command_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("command", sa.String(50), nullable=False),
+        sa.Column("params", sa.Text(), nullable=False),
+        sa.Column("target", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("concurrency", sa.Integer(), nullable=False, server_default="20"),
+        sa.Column("timeout_seconds", sa.Float(), nullable=False, server_default="30"),
+        sa.Column("wave_size", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("wave_delay_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("max_failure_ratio", sa.Float(), nullable=True),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("succeeded", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("skipped", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_by", sa.String(255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_bulk_command_jobs_status", "bulk_command_jobs", ["status"])
+
+    op.create_table(
+        "bulk_command_results",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("job_id", sa.Integer(), sa.ForeignKey("bulk_command_jobs.id"), nullable=False),
+        sa.Column("charge_point_id", sa.String(255), nullable=False),
+        sa.Column("wave", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("status", sa.String(16), nullable=False, server_default="pending"),
+        sa.Column("response", sa.Text(), nullable=True),
+        sa.Column("error", sa.String(500), nullable=True),
+        sa.Column("duration_ms", sa.Integer(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("job_id", "charge_point_id", name="uq_bulk_command_results_job_cp"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("bulk_command_results")
+    op.drop_index("ix_bulk_command_jobs_status", table_name="bulk_command_jobs")
+    op.drop_table("bulk_command_jobs")
@@ -8,10 +8,12 @@ import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from sqlalchemy.orm import Session, joinedload
 
 from database import Charger, ChargingSession, MeterValue, Pricing, SessionLocal, get_db
+from invoice_export import invoice_prices
+from keyset import InvalidCursor, estimated_count, keyset_page, offset_page
 from .models import (
     Connector,
     EVSE,
@@ -128,16 +130,41 @@ async def get_version_details(request: Request):
     }
 
 
+def _paginate(request: Request, response: Response, db: Session, q, keys, offset: int,
+              limit: Optional[int], cursor: Optional[str], descending: bool = True, key=None):
+    """OCPI 2.2.1 pagination: one page of `q` plus the X-Total-Count,
+    X-Limit and `Link: <…>; rel="next"` headers. The next link carries a
+    keyset cursor (keyset.py), so walking every page costs the same per page;
+    a plain `offset` from the client still works for the first hop."""
+    limit = limit or 100
+    try:
+        if cursor:
+            rows, next_cursor = keyset_page(q, keys, cursor=cursor, limit=limit, descending=descending, key=key)
+        else:
+            rows, next_cursor = offset_page(q, keys, offset=offset, limit=limit, descending=descending, key=key)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(estimated_count(db, q))
+    response.headers["X-Limit"] = str(limit)
+    if next_cursor:
+        query = request.url.remove_query_params("offset").include_query_params(cursor=next_cursor).query
+        response.headers["Link"] = f'<{_get_base_url(request)}{request.url.path}?{query}>; rel="next"'
+    return rows
+
+
 # ============ Locations ============
 @router.get("/2.2.1/locations", response_model=dict, dependencies=[Depends(_ocpi_auth)])
 async def get_locations(
     request: Request,
+    response: Response,
     offset: int = 0,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
     """Get list of charging locations (from chargers)."""
-    chargers = db.query(Charger).offset(offset).limit(limit or 100).all()
+    chargers = _paginate(request, response, db, db.query(Charger), (Charger.id,), offset, limit, cursor,
+                         descending=False)
     country = os.getenv("OCPI_COUNTRY_CODE", "MY")
     party_id = os.getenv("OCPI_PARTY_ID", "PLG")
 
@@ -269,14 +296,17 @@ async def get_location(
 # ============ Sessions ============
 @router.get("/2.2.1/sessions", response_model=dict, dependencies=[Depends(_ocpi_auth)])
 async def get_sessions(
+    request: Request,
+    response: Response,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     offset: int = 0,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
     """Get charging sessions (OCPI pull model)."""
-    q = db.query(ChargingSession).filter(
+    q = db.query(ChargingSession).options(joinedload(ChargingSession.charger)).filter(
         ChargingSession.status.in_(["active", "completed", "stopped"])
     )
     if date_from:
@@ -291,7 +321,8 @@ async def get_sessions(
             q = q.filter(ChargingSession.start_time < dt)
         except Exception:
             pass
-    sessions = q.order_by(ChargingSession.start_time.desc()).offset(offset).limit(limit or 100).all()
+    sessions = _paginate(request, response, db, q, (ChargingSession.start_time, ChargingSession.id),
+                         offset, limit, cursor)
 
     country = os.getenv("OCPI_COUNTRY_CODE", "MY")
     party_id = os.getenv("OCPI_PARTY_ID", "PLG")
@@ -329,14 +360,17 @@ async def get_sessions(
 # ============ CDRs ============
 @router.get("/2.2.1/cdrs", response_model=dict, dependencies=[Depends(_ocpi_auth)])
 async def get_cdrs(
+    request: Request,
+    response: Response,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     offset: int = 0,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
     """Get Charge Detail Records (CDRs) for billing."""
-    q = db.query(ChargingSession).filter(
+    q = db.query(ChargingSession).options(joinedload(ChargingSession.charger)).filter(
         ChargingSession.status.in_(["completed", "stopped"]),
         ChargingSession.stop_time.isnot(None),
     )
@@ -352,7 +386,10 @@ async def get_cdrs(
             q = q.filter(ChargingSession.stop_time < dt)
         except Exception:
             pass
-    sessions = q.order_by(ChargingSession.stop_time.desc()).offset(offset).limit(limit or 100).all()
+    sessions = _paginate(request, response, db, q, (ChargingSession.stop_time, ChargingSession.id),
+                         offset, limit, cursor)
+    # Pricing for total_cost, loaded once: charger-specific first, then default
+    prices, default_price = invoice_prices(db)
 
     country = os.getenv("OCPI_COUNTRY_CODE", "MY")
     party_id = os.getenv("OCPI_PARTY_ID", "PLG")
@@ -368,17 +405,7 @@ async def get_cdrs(
         stop_time = s.stop_time or datetime.utcnow()
         duration_h = (stop_time - start_time).total_seconds() / 3600 if stop_time and start_time else 0
 
-        # Get pricing for total_cost (charger-specific first, then default)
-        pricing = db.query(Pricing).filter(
-            Pricing.charger_id == charger.id,
-            Pricing.is_active == True
-        ).first()
-        if not pricing:
-            pricing = db.query(Pricing).filter(
-                Pricing.charger_id.is_(None),
-                Pricing.is_active == True
-            ).first()
-        price_per_kwh = float(pricing.price_per_kwh) if pricing else 0.5
+        price_per_kwh = prices.get(charger.id, default_price)
         total_cost = round(energy * price_per_kwh, 2)
 
         result.append({
@@ -0,0 +1,273 @@
+"""
+PlagSini EV — OCPP Connection Admission Control
+
+After a site power blip every charger reconnects at once. Each handshake
+used to re-parse OCPP_CHARGER_TOKENS from env, load the charger row, and
+then BootNotification wrote to MySQL again — hundreds at the same instant,
+so recovery turned into a thundering herd that timed out half the boots
+and made those chargers retry too.
+
+on_connect / BootNotification now go through three gates:
+
+  1. Token bucket on new handshakes — OCPP_CONNECT_RATE per second with
+     OCPP_CONNECT_BURST headroom. A handshake over the rate waits for its
+     slot; if that wait would exceed OCPP_CONNECT_MAX_WAIT_SECONDS it is
+     closed with 1013 (Try Again Later) and the charger's own retry
+     spreads the herd out.
+  2. Boot semaphore — at most OCPP_BOOT_CONCURRENCY chargers in the
+     connect-load / BootNotification DB path at once. A boot that can't get
+     a slot within OCPP_BOOT_MAX_WAIT_SECONDS is answered
+     RegistrationStatus.Pending with interval=OCPP_BOOT_RETRY_SECONDS —
+     OCPP's own "come back later".
+  3. Pre-parsed auth config — OCPP_REQUIRE_AUTH / OCPP_SHARED_TOKEN /
+     OCPP_CHARGER_TOKENS are parsed once. Per-charger tokens may also live
+     in OCPP_CHARGER_TOKENS_FILE (one `CP001:token` per line), re-read when
+     its mtime changes, so tokens rotate without a restart.
+
+Counters (accepted / queued / rejected / boot waits …) are logged every
+OCPP_ADMISSION_LOG_SECONDS when anything changed, and returned by
+admission.snapshot() for the admin API.
+
+Usage:
+    from ocpp_admission import admission
+    if not await admission.admit(cp_id):
+        await websocket.close(code=1013, reason="Server busy")
+    auth = admission.auth_config()
+    async with admission.boot_slot() as got_slot: ...
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OCPP_CONNECT_RATE = float(os.getenv("OCPP_CONNECT_RATE", "20"))
+OCPP_CONNECT_BURST = float(os.getenv("OCPP_CONNECT_BURST", "50"))
+OCPP_CONNECT_MAX_WAIT_SECONDS = float(os.getenv("OCPP_CONNECT_MAX_WAIT_SECONDS", "15"))
+OCPP_BOOT_CONCURRENCY = max(1, int(os.getenv("OCPP_BOOT_CONCURRENCY", "10")))
+OCPP_BOOT_MAX_WAIT_SECONDS = float(os.getenv("OCPP_BOOT_MAX_WAIT_SECONDS", "20"))
+OCPP_BOOT_RETRY_SECONDS = int(os.getenv("OCPP_BOOT_RETRY_SECONDS", "30"))
+OCPP_ADMISSION_LOG_SECONDS = float(os.getenv("OCPP_ADMISSION_LOG_SECONDS", "60"))
+# How often the token file's mtime is checked (a stat per handshake is wasteful in a storm).
+_TOKEN_FILE_CHECK_SECONDS = 5.0
+
+
+def _parse_token_map(raw_tokens: str, sep: str = ",") -> Dict[str, str]:
+    """
+    Parse OCPP charger token map from env:
+    OCPP_CHARGER_TOKENS="CP001:tokenA,CP002:tokenB"
+    """
+    token_map: Dict[str, str] = {}
+    if not raw_tokens:
+        return token_map
+    for pair in raw_tokens.split(sep):
+        item = pair.strip()
+        if not item or item.startswith("#") or ":" not in item:
+            continue
+        cp_id, token = item.split(":", 1)
+        cp_id = cp_id.strip()
+        token = token.strip()
+        if cp_id and token:
+            token_map[cp_id] = token
+    return token_map
+
+
+@dataclass(frozen=True)
+class OcppAuthConfig:
+    require_auth: bool
+    shared_token: str
+    charger_tokens: Dict[str, str] = field(default_factory=dict)
+
+    def expected_token(self, charge_point_id: str) -> str:
+        return self.charger_tokens.get(charge_point_id) or self.shared_token
+
+
+def _load_auth_config(tokens_file: str) -> OcppAuthConfig:
+    charger_tokens = _parse_token_map(os.getenv("OCPP_CHARGER_TOKENS", ""))
+    if tokens_file:
+        try:
+            with open(tokens_file, encoding="utf-8") as fh:
+                # File entries override env entries for the same charger.
+                charger_tokens.update(_parse_token_map(fh.read(), sep="\n"))
+        except OSError as e:
+            logger.error(f"[ocpp-admission] cannot read OCPP_CHARGER_TOKENS_FILE {tokens_file}: {e}")
+    return OcppAuthConfig(
+        require_auth=os.getenv("OCPP_REQUIRE_AUTH", "1").strip().lower() not in ("0", "false", "no"),
+        shared_token=os.getenv("OCPP_SHARED_TOKEN", "").strip(),
+        charger_tokens=charger_tokens,
+    )
+
+
+class OcppAdmission:
+    """Per-process gate state. The bucket and semaphore belong to the OCPP
+    loop; stats are read from the API thread, hence the lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = OCPP_CONNECT_BURST
+        self._refilled_at = time.monotonic()
+        self._boot_sem: Optional[asyncio.Semaphore] = None
+        self._log_task: Optional[asyncio.Task] = None
+        self._tokens_file = os.getenv("OCPP_CHARGER_TOKENS_FILE", "").strip()
+        self._tokens_file_mtime: Optional[float] = None
+        self._tokens_file_checked_at = 0.0
+        self._auth = _load_auth_config(self._tokens_file)
+        self._tokens_file_mtime = self._file_mtime()
+        self.stats: Dict[str, int] = {
+            "accepted": 0, "queued": 0, "queued_now": 0, "rejected_rate": 0,
+            "rejected_auth": 0, "boot_waited": 0, "boot_waiting_now": 0,
+            "boot_active_now": 0, "boot_pending": 0, "token_reloads": 0,
+        }
+
+    # ── Auth config ────────────────────────────────────────────────────────
+
+    def _file_mtime(self) -> Optional[float]:
+        if not self._tokens_file:
+            return None
+        try:
+            return os.stat(self._tokens_file).st_mtime
+        except OSError:
+            return None
+
+    def auth_config(self) -> OcppAuthConfig:
+        """Current auth config; re-reads the token file if it changed."""
+        now = time.monotonic()
+        if self._tokens_file and now - self._tokens_file_checked_at >= _TOKEN_FILE_CHECK_SECONDS:
+            self._tokens_file_checked_at = now
+            mtime = self._file_mtime()
+            if mtime != self._tokens_file_mtime:
+                self.reload_auth(mtime)
+        return self._auth
+
+    def reload_auth(self, mtime: Optional[float] = None) -> OcppAuthConfig:
+        self._auth = _load_auth_config(self._tokens_file)
+        self._tokens_file_mtime = mtime if mtime is not None else self._file_mtime()
+        with self._lock:
+            self.stats["token_reloads"] += 1
+        logger.info(f"[ocpp-admission] auth config reloaded ({len(self._auth.charger_tokens)} per-charger tokens)")
+        return self._auth
+
+    def note_auth_rejected(self) -> None:
+        with self._lock:
+            self.stats["rejected_auth"] += 1
+
+    # ── Connection-rate token bucket ───────────────────────────────────────
+
+    def _reserve(self) -> Optional[float]:
+        """Take one token; return how long the caller must wait for it, or
+        None if that wait exceeds the limit (nothing is taken)."""
+        now = time.monotonic()
+        self._tokens = min(OCPP_CONNECT_BURST, self._tokens + (now - self._refilled_at) * OCPP_CONNECT_RATE)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        wait = (1 - self._tokens) / OCPP_CONNECT_RATE
+        if wait > OCPP_CONNECT_MAX_WAIT_SECONDS:
+            return None
+        self._tokens -= 1  # may go negative: later arrivals queue behind us
+        return wait
+
+    async def admit(self, charge_point_id: str) -> bool:
+        """Wait for this handshake's slot in the connection rate.
+        False = over the limit, caller should close with 1013."""
+        self._ensure_logger()
+        if OCPP_CONNECT_RATE <= 0:
+            with self._lock:
+                self.stats["accepted"] += 1
+            return True
+        wait = self._reserve()
+        if wait is None:
+            with self._lock:
+                self.stats["rejected_rate"] += 1
+            logger.debug(f"[ocpp-admission] {charge_point_id}: rejected, connect rate exceeded")
+            return False
+        if wait > 0:
+            with self._lock:
+                self.stats["queued"] += 1
+                self.stats["queued_now"] += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self.stats["queued_now"] -= 1
+        with self._lock:
+            self.stats["accepted"] += 1
+        return True
+
+    # ── Boot-path semaphore ────────────────────────────────────────────────
+
+    @contextlib.asynccontextmanager
+    async def boot_slot(self, timeout: Optional[float] = None):
+        """Hold one of OCPP_BOOT_CONCURRENCY slots for the DB-heavy boot path.
+        Yields True with a slot, False if none freed up within `timeout`
+        (default OCPP_BOOT_MAX_WAIT_SECONDS) — the caller degrades."""
+        if self._boot_sem is None:
+            self._boot_sem = asyncio.Semaphore(OCPP_BOOT_CONCURRENCY)
+        sem = self._boot_sem
+        acquired = False
+        if sem.locked():
+            with self._lock:
+                self.stats["boot_waited"] += 1
+                self.stats["boot_waiting_now"] += 1
+            try:
+                await asyncio.wait_for(sem.acquire(), timeout=OCPP_BOOT_MAX_WAIT_SECONDS if timeout is None else timeout)
+                acquired = True
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    self.stats["boot_waiting_now"] -= 1
+        else:
+            await sem.acquire()
+            acquired = True
+        if not acquired:
+            yield False
+            return
+        with self._lock:
+            self.stats["boot_active_now"] += 1
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self.stats["boot_active_now"] -= 1
+            sem.release()
+
+    def note_boot_pending(self) -> None:
+        with self._lock:
+            self.stats["boot_pending"] += 1
+
+    # ── Metrics ────────────────────────────────────────────────────────────
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "connect_rate": OCPP_CONNECT_RATE,
+            "connect_burst": OCPP_CONNECT_BURST,
+            "boot_concurrency": OCPP_BOOT_CONCURRENCY,
+            "per_charger_tokens": len(self._auth.charger_tokens),
+        }
+
+    def _ensure_logger(self) -> None:
+        if self._log_task is None and OCPP_ADMISSION_LOG_SECONDS > 0:
+            self._log_task = asyncio.get_running_loop().create_task(self._log_loop())
+
+    async def _log_loop(self) -> None:
+        last: Dict[str, int] = {}
+        while True:
+            await asyncio.sleep(OCPP_ADMISSION_LOG_SECONDS)
+            with self._lock:
+                stats = dict(self.stats)
+            if stats != last:
+                logger.info("[ocpp-admission] " + " ".join(f"{k}={v}" for k, v in stats.items()))
+                last = stats
+
+
+admission = OcppAdmission()
@@ -0,0 +1,266 @@
+"""
+PlagSini EV — Per-Charger Outbound Command Queue
+
+OCPP 1.6 allows one outstanding CALL per connection; python-ocpp enforces
+it with a lock inside ChargePoint.call(). Every outbound command —
+RemoteStart from the app, RemoteStop from a user or the kWh quota,
+GetConfiguration from an admin page, a bulk TriggerMessage — queued on that
+lock in arrival order. A RemoteStop could wait behind a firmware download
+request and three identical GetConfiguration reads, and nothing bounded how
+many callers piled up on a silent charger.
+
+ChargePoint.call() now goes through a CommandQueue per connection:
+
+  * priority  — COMMAND_PRIORITIES by OCPP action: RemoteStop first, then
+                RemoteStart / UnlockConnector, control commands,
+                configuration writes, reads, and diagnostics / firmware
+                last. FIFO within a priority. The CALL already on the wire
+                is never interrupted.
+  * coalesce  — an identical read (same action and payload) that is still
+                queued is shared: later callers await the first one's
+                response instead of sending again. A write queued in
+                between stops the sharing, so a read never returns a value
+                from before a change its caller queued after.
+  * bound     — at most OCPP_COMMAND_QUEUE_DEPTH commands wait per charger.
+                When full, a newcomer displaces the lowest-priority waiter
+                if it outranks it, otherwise it is refused (CommandQueueFull)
+                — a backlog of reads can never lock out a RemoteStop.
+  * deadline  — a command not dispatched within OCPP_COMMAND_QUEUE_WAIT_SECONDS
+                is dropped (asyncio.TimeoutError) instead of reaching the
+                charger long after its caller gave up.
+
+Callers run on the API loop or the OCPP loop, so the queue holds a
+threading.Lock and the command whose turn it is is woken on its own loop;
+each caller sends its own CALL, the queue only decides the order.
+
+Env:
+    OCPP_COMMAND_QUEUE_DEPTH          waiting commands per charger (16)
+    OCPP_COMMAND_QUEUE_WAIT_SECONDS   max wait before dispatch (60)
+
+Usage:
+    queue = CommandQueue("CP001")
+    resp = await queue.run("GetConfiguration", send, coalesce_key=key)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OCPP_COMMAND_QUEUE_DEPTH = max(1, int(os.getenv("OCPP_COMMAND_QUEUE_DEPTH", "16")))
+OCPP_COMMAND_QUEUE_WAIT_SECONDS = float(os.getenv("OCPP_COMMAND_QUEUE_WAIT_SECONDS", "60"))
+
+# Lower runs first.
+COMMAND_PRIORITIES: Dict[str, int] = {
+    "RemoteStopTransaction": 0,
+    "RemoteStartTransaction": 1,
+    "UnlockConnector": 1,
+    "ChangeAvailability": 2,
+    "Reset": 2,
+    "ReserveNow": 2,
+    "CancelReservation": 2,
+    "SetChargingProfile": 2,
+    "ClearChargingProfile": 2,
+    "ChangeConfiguration": 3,
+    "ClearCache": 3,
+    "SendLocalList": 3,
+    "DataTransfer": 3,
+    "GetConfiguration": 4,
+    "GetLocalListVersion": 4,
+    "GetCompositeSchedule": 4,
+    "TriggerMessage": 4,
+    "GetDiagnostics": 5,
+    "UpdateFirmware": 5,
+}
+DEFAULT_PRIORITY = 3
+# Side-effect-free actions whose identical pending requests may share one CALL.
+COALESCABLE_ACTIONS = frozenset({"GetConfiguration", "GetLocalListVersion", "GetCompositeSchedule"})
+
+# Process-wide counters across every charger's queue (admin metrics).
+command_queue_stats: Dict[str, int] = {
+    "submitted": 0, "dispatched": 0, "coalesced": 0, "rejected": 0, "displaced": 0, "expired": 0,
+    "max_depth_seen": 0,
+}
+
+
+class CommandQueueFull(Exception):
+    """The charger's command queue is at OCPP_COMMAND_QUEUE_DEPTH."""
+
+
+def _settle(loop: asyncio.AbstractEventLoop, fut: asyncio.Future, result: Any = None,
+            exc: Optional[BaseException] = None) -> None:
+    """Resolve `fut` on its own loop (callers may live on another thread)."""
+    def _apply():
+        if fut.done():
+            return
+        if isinstance(exc, asyncio.CancelledError):
+            fut.cancel()
+        elif exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+    try:
+        loop.call_soon_threadsafe(_apply)
+    except RuntimeError:
+        pass  # caller's loop already closed — nobody left to wake
+
+
+class _Entry:
+    __slots__ = ("priority", "seq", "action", "key", "state", "loop", "wake", "followers")
+
+    def __init__(self, priority: int, seq: int, action: str, key: Optional[str]):
+        self.priority = priority
+        self.seq = seq
+        self.action = action
+        self.key = key
+        self.state = "queued"  # queued | dispatched | dropped
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wake: Optional[asyncio.Future] = None
+        self.followers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class CommandQueue:
+    """Orders outbound CALLs of one charger connection."""
+
+    def __init__(self, charge_point_id: str, max_depth: int = OCPP_COMMAND_QUEUE_DEPTH,
+                 wait_seconds: float = OCPP_COMMAND_QUEUE_WAIT_SECONDS):
+        self.charge_point_id = charge_point_id
+        self.max_depth = max_depth
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._heap: List[_Entry] = []
+        self._busy: Optional[_Entry] = None
+        self._depth = 0
+        self._seq = itertools.count()
+        self._last_write_seq = -1
+        self._pending_reads: Dict[str, _Entry] = {}
+
+    @property
+    def depth(self) -> int:
+        """Commands waiting (not counting the one on the wire)."""
+        return self._depth
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"depth": self._depth, "in_flight": self._busy.action if self._busy else None}
+
+    async def run(self, action: str, send: Callable[[], Awaitable[Any]], *,
+                  priority: Optional[int] = None, coalesce_key: Optional[str] = None,
+                  wait_seconds: Optional[float] = None) -> Any:
+        """Wait for this charger's turn, then `await send()` and return its
+        result. A queued identical read (same coalesce_key) is shared."""
+        loop = asyncio.get_running_loop()
+        priority = COMMAND_PRIORITIES.get(action, DEFAULT_PRIORITY) if priority is None else priority
+        wait = self.wait_seconds if wait_seconds is None else wait_seconds
+        displaced = None
+        with self._lock:
+            command_queue_stats["submitted"] += 1
+            leader = self._pending_reads.get(coalesce_key) if coalesce_key is not None else None
+            if leader is not None and leader.state == "queued" and leader.seq > self._last_write_seq:
+                follower = loop.create_future()
+                leader.followers.append((loop, follower))
+                command_queue_stats["coalesced"] += 1
+                entry = None
+            else:
+                follower = None
+                entry = _Entry(priority, next(self._seq), action, coalesce_key)
+                if coalesce_key is None:
+                    self._last_write_seq = entry.seq
+                if self._busy is None:
+                    entry.state = "dispatched"
+                    self._busy = entry
+                else:
+                    if self._depth >= self.max_depth:
+                        worst = max((e for e in self._heap if e.state == "queued"), default=None)
+                        if worst is None or not entry < worst:
+                            command_queue_stats["rejected"] += 1
+                            raise CommandQueueFull(
+                                f"{self.charge_point_id}: {self._depth} commands already queued, {action} refused")
+                        displaced = self._drop(worst)
+                        command_queue_stats["displaced"] += 1
+                    entry.loop, entry.wake = loop, loop.create_future()
+                    heapq.heappush(self._heap, entry)
+                    self._depth += 1
+                    command_queue_stats["max_depth_seen"] = max(command_queue_stats["max_depth_seen"], self._depth)
+                    if coalesce_key is not None:
+                        self._pending_reads[coalesce_key] = entry
+        if displaced is not None:
+            self._fail(displaced, CommandQueueFull(
+                f"{self.charge_point_id}: {displaced.action} displaced by {action} (queue full)"))
+
+        if follower is not None:
+            return await follower
+
+        if entry.state != "dispatched":
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.wake), timeout=wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                with self._lock:
+                    expired = entry.state == "queued"
+                    if expired:
+                        self._drop(entry)
+                        command_queue_stats["expired"] += 1
+                if expired:
+                    timeout = asyncio.TimeoutError(f"{self.charge_point_id}: {action} not dispatched within {wait:g}s")
+                    self._fail(entry, timeout, wake=False)
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    logger.warning(str(timeout))
+                    raise timeout
+                if entry.state == "dropped":
+                    raise  # displaced just now; its CommandQueueFull is on the way
+                if isinstance(e, asyncio.CancelledError):
+                    # Our turn arrived as the caller went away — pass it on.
+                    self._release(entry, exc=e)
+                    raise
+                # Turn arrived right at the deadline: send after all.
+
+        command_queue_stats["dispatched"] += 1
+        try:
+            result = await send()
+        except BaseException as e:
+            self._release(entry, exc=e)
+            raise
+        self._release(entry, result=result)
+        return result
+
+    def _drop(self, entry: _Entry) -> _Entry:
+        """Under the lock: take a queued entry out (heap entry removed lazily)."""
+        entry.state = "dropped"
+        self._depth -= 1
+        if entry.key is not None and self._pending_reads.get(entry.key) is entry:
+            del self._pending_reads[entry.key]
+        return entry
+
+    def _fail(self, entry: _Entry, exc: BaseException, wake: bool = True) -> None:
+        if wake and entry.wake is not None:
+            _settle(entry.loop, entry.wake, exc=exc)
+        for loop, fut in entry.followers:
+            _settle(loop, fut, exc=exc)
+
+    def _release(self, entry: _Entry, result: Any = None, exc: Optional[BaseException] = None) -> None:
+        """The dispatched entry is done: answer its followers and hand the
+        connection to the next live entry."""
+        for loop, fut in entry.followers:
+            _settle(loop, fut, result=result, exc=exc)
+        with self._lock:
+            self._busy = None
+            while self._heap:
+                nxt = heapq.heappop(self._heap)
+                if nxt.state != "queued":
+                    continue
+                self._drop(nxt)
+                nxt.state = "dispatched"
+                self._busy = nxt
+                break
+            else:
+                nxt = None
+        if nxt is not None:
+            _settle(nxt.loop, nxt.wake)
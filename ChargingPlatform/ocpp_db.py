@@ -0,0 +1,123 @@
+"""
+PlagSini EV — OCPP Persistence Executor
+
+Runs the OCPP server's blocking SQLAlchemy work on a small dedicated thread
+pool so a slow MySQL round-trip never stalls the asyncio loop that owns every
+charger's WebSocket. Before this, each @on(...) handler queried and committed
+inline — one slow statement froze Heartbeats for the whole fleet and chargers
+hit WS ping timeouts.
+
+Each call gets its own short-lived Session (opened and closed on the worker
+thread), so nothing ORM-bound ever crosses back to the event loop. Return
+plain values / SimpleNamespace snapshots from the worker function.
+
+Concurrency is bounded by OCPP_DB_WORKERS (default 8): excess calls queue in
+the executor instead of piling more connections onto MySQL. Keep it at or
+below the engine's pool_size + max_overflow (5 + 10 by default).
+
+Usage:
+    from ocpp_db import run_db
+
+    def _mark_online(db, cp_id):
+        db.query(Charger).filter(Charger.charge_point_id == cp_id).update({"status": "online"})
+        db.commit()
+
+    await run_db(_mark_online, "CP001")
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+OCPP_DB_WORKERS = max(1, int(os.getenv("OCPP_DB_WORKERS", "8")))
+# Log any single DB call slower than this — the stall that used to freeze
+# the whole loop is now just a log line.
+OCPP_DB_SLOW_MS = int(os.getenv("OCPP_DB_SLOW_MS", "500"))
+
+_executor = ThreadPoolExecutor(max_workers=OCPP_DB_WORKERS, thread_name_prefix="ocpp-db")
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "slow": 0}
+
+
+def _run_in_session(fn: Callable[..., Any], args: tuple, kwargs: dict, enqueued_at: float) -> Any:
+    """Worker-thread body: open a Session, run `fn(db, ...)`, always close."""
+    with _stats_lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        result = fn(db, *args, **kwargs)
+        with _stats_lock:
+            _stats["completed"] += 1
+        return result
+    except Exception:
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        db.close()
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with _stats_lock:
+            _stats["running"] -= 1
+            if elapsed_ms >= OCPP_DB_SLOW_MS:
+                _stats["slow"] += 1
+        if elapsed_ms >= OCPP_DB_SLOW_MS:
+            logger.warning(
+                "[ocpp-db] slow call %s: %.0f ms (waited %.0f ms in queue)",
+                getattr(fn, "__name__", fn), elapsed_ms, (started - enqueued_at) * 1000,
+            )
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run `fn(db, *args, **kwargs)` on the OCPP DB executor and await it.
+
+    `fn` owns its commits; on exception the session is rolled back and the
+    exception re-raised to the awaiting handler. Safe to call from any
+    event loop (OCPP thread or FastAPI loop).
+    """
+    loop = asyncio.get_running_loop()
+    with _stats_lock:
+        _stats["queued"] += 1
+    call = functools.partial(_run_in_session, fn, args, kwargs, time.monotonic())
+    try:
+        cfut = _executor.submit(call)
+    except RuntimeError:
+        # Executor already shut down (process exiting) — undo the queued count.
+        with _stats_lock:
+            _stats["queued"] -= 1
+        raise
+    # A call cancelled while still queued (awaiting task cancelled) never
+    # reaches _run_in_session, so undo its queued count here.
+    cfut.add_done_callback(_uncount_cancelled)
+    return await asyncio.wrap_future(cfut, loop=loop)
+
+
+def _uncount_cancelled(cfut) -> None:
+    if cfut.cancelled():
+        with _stats_lock:
+            _stats["queued"] -= 1
+
+
+def db_executor_stats() -> Dict[str, int]:
+    """Snapshot of executor counters for /health-style reporting."""
+    with _stats_lock:
+        return {"workers": OCPP_DB_WORKERS, **_stats}
+
+
+def shutdown_db_executor(wait: bool = True) -> None:
+    """Stop accepting new DB work; optionally wait for in-flight calls."""
+    _executor.shutdown(wait=wait)
@@ -0,0 +1,146 @@
+"""
+PlagSini EV — OCPP Connection Liveness Tracker
+
+The OCPP state healer (ocpp_state_healer_loop) loaded the whole chargers
+table every 60s and compared each row with active_charge_points — a cost
+proportional to the fleet, paid every minute, to find the one or two
+chargers whose socket and DB heartbeat disagree.
+
+This tracker keeps the socket side in memory, so the healer only looks at
+chargers whose state actually changed:
+
+  * per connection — the time of the last inbound OCPP message, updated by
+    ChargePoint.route_message (any message proves the socket is alive, not
+    just Heartbeat).
+  * zombie deadlines — a min-heap of (last message + stale_after) per
+    connection. Messages only move the timestamp; an expired heap entry is
+    re-checked against it and pushed back if the connection has spoken
+    since, so a message costs O(1) and a healer cycle O(expired · log n).
+    Whatever is still silent at its deadline is a Case B zombie.
+  * suspects — chargers whose DB heartbeat may be newer than their socket
+    state: sockets that closed within the fresh window, and messages
+    arriving on a connection that is no longer the registered one (a task
+    that outlived its pool entry and keeps the DB heartbeat fresh). Only
+    these are looked up in the DB for Case A.
+
+Guarded by a threading.Lock: messages arrive on the OCPP loop, and the
+healer runs wherever the sockets live — the FastAPI loop with the in-process
+OCPP server, or each OCPP worker's own loop when OCPP_WORKERS > 1 (the API
+process then skips it).
+
+Usage:
+    from ocpp_liveness import liveness
+    liveness.connected("CP001", charge_point)
+    liveness.message("CP001", charge_point)
+    zombies = liveness.due_zombies(now)
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import _utcnow
+
+# Case B: connected but silent this long → zombie socket.
+STALE_AFTER = timedelta(minutes=10)
+# Case A: a DB heartbeat younger than this means "online".
+FRESH_WINDOW = timedelta(minutes=5)
+
+
+class ConnectionLiveness:
+    """charge_point_id → (connection token, last message) plus the zombie
+    deadline heap and the Case A suspect set."""
+
+    def __init__(self, stale_after: timedelta = STALE_AFTER, fresh_window: timedelta = FRESH_WINDOW):
+        self.stale_after = stale_after
+        self.fresh_window = fresh_window
+        self._lock = threading.Lock()
+        self._conns: Dict[str, Tuple[int, datetime]] = {}
+        self._deadlines: List[Tuple[datetime, str, int]] = []
+        # charge_point_id → socket state time (None = unknown, e.g. startup seed)
+        self._suspects: Dict[str, Optional[datetime]] = {}
+        self.stats: Dict[str, int] = {"messages": 0, "off_pool_messages": 0, "deadlines_expired": 0}
+
+    def connected(self, charge_point_id: str, conn: Any, at: Optional[datetime] = None) -> None:
+        at = at or _utcnow()
+        token = id(conn)
+        with self._lock:
+            self._conns[charge_point_id] = (token, at)
+            self._suspects.pop(charge_point_id, None)
+            heapq.heappush(self._deadlines, (at + self.stale_after, charge_point_id, token))
+
+    def message(self, charge_point_id: str, conn: Any, at: Optional[datetime] = None) -> None:
+        """Inbound OCPP message on `conn`. O(1) — the heap is not touched."""
+        at = at or _utcnow()
+        token = id(conn)
+        with self._lock:
+            self.stats["messages"] += 1
+            current = self._conns.get(charge_point_id)
+            if current is not None and current[0] == token:
+                self._conns[charge_point_id] = (token, at)
+            else:
+                # Connection no longer registered for this charger but still
+                # talking — the DB heartbeat will outrun the socket state.
+                self.stats["off_pool_messages"] += 1
+                self._suspects.setdefault(charge_point_id, at)
+
+    def disconnected(self, charge_point_id: str, conn: Any = None, at: Optional[datetime] = None) -> None:
+        """Socket closed. `conn` guards against a stale close arriving after
+        a newer connection registered; None drops whatever is registered."""
+        at = at or _utcnow()
+        with self._lock:
+            current = self._conns.get(charge_point_id)
+            if current is None or (conn is not None and current[0] != id(conn)):
+                return
+            del self._conns[charge_point_id]
+            self._suspects[charge_point_id] = at
+
+    def due_zombies(self, now: Optional[datetime] = None) -> List[str]:
+        """Connections silent for stale_after as of `now`. Each is re-armed
+        one stale_after later, so a failed close is retried, not repeated
+        every cycle."""
+        now = now or _utcnow()
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, charge_point_id, token = heapq.heappop(self._deadlines)
+                current = self._conns.get(charge_point_id)
+                if current is None or current[0] != token:
+                    continue  # connection gone or replaced
+                self.stats["deadlines_expired"] += 1
+                last = current[1]
+                if last + self.stale_after > now:
+                    heapq.heappush(self._deadlines, (last + self.stale_after, charge_point_id, token))
+                    continue
+                due.append(charge_point_id)
+                heapq.heappush(self._deadlines, (now + self.stale_after, charge_point_id, token))
+        return due
+
+    def seed_suspects(self, charge_point_ids: Iterable[str]) -> None:
+        """Chargers to check once without a known socket state (startup)."""
+        with self._lock:
+            for charge_point_id in charge_point_ids:
+                if charge_point_id not in self._conns:
+                    self._suspects.setdefault(charge_point_id, None)
+
+    def suspects(self) -> Dict[str, Optional[datetime]]:
+        with self._lock:
+            return dict(self._suspects)
+
+    def resolve(self, charge_point_id: str) -> None:
+        """Socket and DB agree again — stop checking this charger."""
+        with self._lock:
+            self._suspects.pop(charge_point_id, None)
+
+    def last_message(self, charge_point_id: str) -> Optional[datetime]:
+        with self._lock:
+            current = self._conns.get(charge_point_id)
+            return current[1] if current else None
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "connections": len(self._conns), "deadlines": len(self._deadlines),
+                    "suspects": len(self._suspects)}
+
+
+liveness = ConnectionLiveness()
@@ -0,0 +1,320 @@
+"""
+PlagSini EV — OCPP Connection Registry & Command Relay
+
+`active_charge_points` only knows the sockets held by THIS process, so an
+API call (RemoteStart, Reset, …) used to fail with "not connected" unless
+the API happened to run next to the charger's WebSocket. That pinned the
+whole platform to one container.
+
+The registry maps charge_point_id → the node holding its socket:
+
+    OCPP_REGISTRY=local (default)  in-memory; single-node deployments
+    OCPP_REGISTRY=db               `ocpp_connections` table shared by all nodes
+
+The owning node claims a charger on connect and releases it on disconnect;
+a background task refreshes `last_seen` for all of the node's rows in one
+UPDATE every OCPP_REGISTRY_TTL_SECONDS / 3. Rows older than the TTL belong
+to a node that died without cleaning up and are treated as disconnected.
+
+When get_active_charge_point() finds the charger on another node it returns
+a RemoteChargePoint: the same async command methods as ChargePoint, relayed
+as POST {node_url}/api/internal/ocpp/relay (X-Relay-Secret = OCPP_RELAY_SECRET)
+to the owner, which runs the command on its local socket. Call sites don't
+change — `cp = get_active_charge_point(id); await cp.reset("Soft")` works
+wherever the charger is connected.
+
+Env:
+    OCPP_NODE_ID      stable node name (default: hostname)
+    OCPP_NODE_URL     base URL peers use to reach this node's API
+    OCPP_RELAY_SECRET shared secret for the relay endpoint (required for db mode)
+
+Usage:
+    from ocpp_registry import connection_registry
+    await connection_registry.claim("CP001")          # OCPP loop, on connect
+    owner = connection_registry.owner("CP001")        # any thread
+"""
+import asyncio
+import dataclasses
+import logging
+import os
+import secrets
+import socket
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import httpx
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from database import OcppConnection, SessionLocal, _utcnow
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+OCPP_REGISTRY = os.getenv("OCPP_REGISTRY", "local").strip().lower()
+OCPP_NODE_ID = os.getenv("OCPP_NODE_ID", "").strip() or socket.gethostname()
+OCPP_NODE_URL = os.getenv("OCPP_NODE_URL", "http://localhost:8000").strip().rstrip("/")
+OCPP_RELAY_SECRET = os.getenv("OCPP_RELAY_SECRET", "").strip()
+OCPP_REGISTRY_TTL_SECONDS = float(os.getenv("OCPP_REGISTRY_TTL_SECONDS", "90"))
+# DataTransfer to slow GAC firmware may legitimately take ~90s on the owner.
+OCPP_RELAY_TIMEOUT_SECONDS = float(os.getenv("OCPP_RELAY_TIMEOUT_SECONDS", "100"))
+
+# Outbound ChargePoint methods a peer node may invoke through the relay.
+RELAYABLE_COMMANDS = frozenset({
+    "remote_start_transaction", "remote_stop_transaction",
+    "get_configuration", "change_configuration", "change_availability",
+    "clear_cache", "reset", "unlock_connector", "get_diagnostics",
+    "update_firmware", "reserve_now", "cancel_reservation", "data_transfer",
+    "get_local_list_version", "send_local_list", "trigger_message",
+    "get_composite_schedule", "clear_charging_profile", "set_charging_profile",
+})
+# Node-side housekeeping the relay endpoint also accepts (ocpp_server helpers,
+# not ChargePoint methods): drop the cached chargers row, force a reconnect.
+RELAY_CONTROL_COMMANDS = frozenset({"drop_charger_cache", "force_close"})
+
+
+def set_node_identity(node_id: str, node_url: str) -> None:
+    """Override this process's node id / relay URL (OCPP worker processes
+    each register as their own node — see ocpp_workers.py)."""
+    global OCPP_NODE_ID, OCPP_NODE_URL
+    OCPP_NODE_ID = node_id
+    OCPP_NODE_URL = node_url.rstrip("/")
+
+
+@dataclasses.dataclass(frozen=True)
+class NodeRef:
+    node_id: str
+    node_url: str
+
+    @property
+    def is_local(self) -> bool:
+        return self.node_id == OCPP_NODE_ID
+
+
+# ─── Registries ────────────────────────────────────────────────────────────
+
+class LocalRegistry:
+    """Single-node registry: every connected charger is on this node."""
+
+    kind = "local"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owned: Set[str] = set()
+
+    async def claim(self, charge_point_id: str) -> None:
+        with self._lock:
+            self._owned.add(charge_point_id)
+
+    async def release(self, charge_point_id: str) -> None:
+        with self._lock:
+            self._owned.discard(charge_point_id)
+
+    def owner(self, charge_point_id: str) -> Optional[NodeRef]:
+        with self._lock:
+            if charge_point_id in self._owned:
+                return NodeRef(OCPP_NODE_ID, OCPP_NODE_URL)
+        return None
+
+    def connected_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._owned)
+
+    async def run(self) -> None:
+        """Nothing to refresh in memory."""
+        return None
+
+
+def _claim_row(db, charge_point_id: str, node_id: str, node_url: str) -> None:
+    now = _utcnow()
+    values = {"node_id": node_id, "node_url": node_url, "connected_at": now, "last_seen": now}
+    updated = db.query(OcppConnection).filter(
+        OcppConnection.charge_point_id == charge_point_id
+    ).update(values, synchronize_session=False)
+    if not updated:
+        db.add(OcppConnection(charge_point_id=charge_point_id, **values))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another node inserted between our UPDATE and INSERT — newest connect wins.
+        db.rollback()
+        db.query(OcppConnection).filter(
+            OcppConnection.charge_point_id == charge_point_id
+        ).update(values, synchronize_session=False)
+        db.commit()
+
+
+def _release_row(db, charge_point_id: str, node_id: str) -> None:
+    # Only drop our own claim: the charger may already have reconnected elsewhere.
+    db.query(OcppConnection).filter(
+        OcppConnection.charge_point_id == charge_point_id,
+        OcppConnection.node_id == node_id,
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _refresh_rows(db, node_id: str, charge_point_ids: Iterable[str]) -> int:
+    ids = list(charge_point_ids)
+    now = _utcnow()
+    # Rows left behind by a previous run of this node (crash, kill -9) would
+    # otherwise route commands to a socket that no longer exists.
+    stale = db.query(OcppConnection).filter(OcppConnection.node_id == node_id)
+    if ids:
+        stale = stale.filter(OcppConnection.charge_point_id.notin_(ids))
+    stale.delete(synchronize_session=False)
+    refreshed = 0
+    if ids:
+        refreshed = db.execute(
+            update(OcppConnection)
+            .where(OcppConnection.node_id == node_id)
+            .values(last_seen=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount or 0
+    db.commit()
+    return refreshed
+
+
+class DbRegistry:
+    """Shared registry backed by the `ocpp_connections` table.
+
+    claim/release/refresh run on the OCPP DB executor (ocpp_db.run_db).
+    owner()/connected_ids() are plain blocking reads, used from API
+    handlers the same way they query the chargers table.
+    """
+
+    kind = "db"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owned: Set[str] = set()
+
+    async def claim(self, charge_point_id: str) -> None:
+        with self._lock:
+            self._owned.add(charge_point_id)
+        await run_db(_claim_row, charge_point_id, OCPP_NODE_ID, OCPP_NODE_URL)
+
+    async def release(self, charge_point_id: str) -> None:
+        with self._lock:
+            self._owned.discard(charge_point_id)
+        await run_db(_release_row, charge_point_id, OCPP_NODE_ID)
+
+    def owner(self, charge_point_id: str) -> Optional[NodeRef]:
+        with self._lock:
+            if charge_point_id in self._owned:
+                return NodeRef(OCPP_NODE_ID, OCPP_NODE_URL)
+        cutoff = _utcnow() - timedelta(seconds=OCPP_REGISTRY_TTL_SECONDS)
+        db = SessionLocal()
+        try:
+            row = db.query(OcppConnection.node_id, OcppConnection.node_url).filter(
+                OcppConnection.charge_point_id == charge_point_id,
+                OcppConnection.last_seen >= cutoff,
+            ).first()
+        finally:
+            db.close()
+        return NodeRef(row.node_id, row.node_url) if row else None
+
+    def connected_ids(self) -> Set[str]:
+        cutoff = _utcnow() - timedelta(seconds=OCPP_REGISTRY_TTL_SECONDS)
+        db = SessionLocal()
+        try:
+            rows = db.query(OcppConnection.charge_point_id).filter(
+                OcppConnection.last_seen >= cutoff,
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            return {r.charge_point_id for r in rows} | self._owned
+
+    async def run(self) -> None:
+        """Refresh this node's rows so peers keep routing to it. Runs on
+        the OCPP loop for the lifetime of the server."""
+        interval = max(5.0, OCPP_REGISTRY_TTL_SECONDS / 3)
+        logger.info(f"[ocpp-registry] node {OCPP_NODE_ID} ({OCPP_NODE_URL}) refreshing every {interval:.0f}s")
+        while True:
+            try:
+                with self._lock:
+                    owned = set(self._owned)
+                await run_db(_refresh_rows, OCPP_NODE_ID, owned)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[ocpp-registry] refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+
+# ─── Command relay ─────────────────────────────────────────────────────────
+
+def relay_secret_ok(provided: str) -> bool:
+    """Constant-time check of a relay request's X-Relay-Secret header."""
+    provided = (provided or "").strip()
+    return bool(OCPP_RELAY_SECRET and provided) and secrets.compare_digest(provided, OCPP_RELAY_SECRET)
+
+
+def serialize_ocpp_result(result: Any) -> Any:
+    """OCPP call_result dataclass / SimpleNamespace → JSON-safe dict."""
+    if result is None:
+        return None
+    if dataclasses.is_dataclass(result):
+        return dataclasses.asdict(result)
+    if isinstance(result, SimpleNamespace):
+        return dict(vars(result))
+    return result
+
+
+class RemoteChargePoint:
+    """Stand-in for a ChargePoint whose socket lives on another node.
+
+    Exposes the same outbound command coroutines; each one is relayed to
+    the owner and its response comes back as a SimpleNamespace, so
+    `getattr(resp, "status", None)` works exactly as with a local call.
+    Like the local methods, failures are logged and return None.
+    """
+
+    def __init__(self, charge_point_id: str, node: NodeRef):
+        self.id = charge_point_id
+        self.node = node
+
+    def __repr__(self) -> str:
+        return f"<RemoteChargePoint {self.id} @ {self.node.node_id}>"
+
+    def __getattr__(self, name: str):
+        if name not in RELAYABLE_COMMANDS:
+            raise AttributeError(name)
+
+        async def _relay(*args: Any, **kwargs: Any) -> Any:
+            return await self.relay(name, list(args), kwargs)
+
+        _relay.__name__ = name
+        return _relay
+
+    async def relay(self, command: str, args: List[Any], kwargs: Dict[str, Any]) -> Any:
+        url = f"{self.node.node_url}/api/internal/ocpp/relay"
+        payload = {"charge_point_id": self.id, "command": command, "args": args, "kwargs": kwargs}
+        try:
+            async with httpx.AsyncClient(timeout=OCPP_RELAY_TIMEOUT_SECONDS) as client:
+                resp = await client.post(url, json=payload, headers={"X-Relay-Secret": OCPP_RELAY_SECRET})
+            resp.raise_for_status()
+            body = resp.json()
+        except Exception as e:
+            logger.error(f"[ocpp-relay] {command} → {self.id} via {self.node.node_id} failed: {e}")
+            return None
+        if not body.get("connected", True):
+            logger.warning(f"[ocpp-relay] {self.id} no longer connected on {self.node.node_id}")
+            return None
+        result = body.get("result")
+        return SimpleNamespace(**result) if isinstance(result, dict) else result
+
+
+def _make_registry():
+    if OCPP_REGISTRY == "db":
+        if not OCPP_RELAY_SECRET:
+            logger.warning("[ocpp-registry] OCPP_REGISTRY=db but OCPP_RELAY_SECRET is empty — relayed commands will be rejected")
+        return DbRegistry()
+    if OCPP_REGISTRY != "local":
+        logger.warning(f"[ocpp-registry] unknown OCPP_REGISTRY={OCPP_REGISTRY!r} — using local")
+    return LocalRegistry()
+
+
+connection_registry = _make_registry()
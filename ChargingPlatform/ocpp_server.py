@@ -10,27 +10,49 @@ Inbound (charger → server): BootNotification, Authorize, StatusNotification,
 Outbound (server → charger): RemoteStart/Stop, ChangeAvailability, Reset,
   UpdateFirmware, GetConfiguration, SendLocalList, etc.
 
-Auth: OCPP_REQUIRE_AUTH, OCPP_SHARED_TOKEN, OCPP_CHARGER_TOKENS.
+Auth: OCPP_REQUIRE_AUTH, OCPP_SHARED_TOKEN, OCPP_CHARGER_TOKENS(_FILE) — see ocpp_admission.py.
 """
 import asyncio
+import json
 import logging
 import os
 import re
 import secrets
+import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 from types import SimpleNamespace
-from typing import Any, Dict, List, Optional
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
 from urllib.parse import parse_qs
 
 import websockets.exceptions
 from ocpp.exceptions import FormatViolationError
-from sqlalchemy import desc
+from sqlalchemy import desc, exists, func, or_, select
 from ocpp.routing import on
 from ocpp.v16 import ChargePoint as cp, call, call_result
 from ocpp.v16.enums import AuthorizationStatus, RegistrationStatus
 
-from database import SessionLocal, Charger, ChargingSchedule, ChargingSession, MeterValue, Fault, User, PaymentTransaction
+from database import (
+    SessionLocal, Charger, ChargingSession, Fault, MeterValue, User, PaymentTransaction,
+    TransactionMeterLatest, record_bulk_sync_changes,
+)
+from event_bus import (
+    ChargerStatusChanged, FaultChanged, FirmwareStatus, MeterSample,
+    SessionStarted, SessionStopped, event_bus,
+)
+from heartbeat_coalescer import heartbeat_coalescer
+from meter_ingest import meter_buffer
+from meter_latest import latest_for_transaction, record_latest_sample
+from ocpp_admission import OCPP_BOOT_RETRY_SECONDS, admission
+from ocpp_command_queue import COALESCABLE_ACTIONS, CommandQueue
+from ocpp_db import run_db
+from ocpp_liveness import liveness
+from webhook_delivery import enqueue_session_event
+from ocpp_registry import (
+    RELAY_CONTROL_COMMANDS, RELAYABLE_COMMANDS, RemoteChargePoint, connection_registry,
+    serialize_ocpp_result,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -68,55 +90,36 @@ connection_tasks: Dict[str, "asyncio.Task"] = {}
 # resets when state is consistent. Auto-recovery fires at threshold.
 _mismatch_strikes: Dict[str, int] = {}
 
-# Reference to the FastAPI (main) event loop.
-# Set by api.py startup handler. Used by the scheduled charging worker
-# — which runs inside the OCPP background-thread loop — to dispatch
-# ChargePoint.call() requests onto the same loop that API handlers use
-# (ChargePoint's internal Queue/Lock get bound to whichever loop first
-# touches them; the API binds them to its loop, so cross-loop calls
-# from the worker would otherwise raise "bound to a different event loop").
-API_LOOP: Optional[asyncio.AbstractEventLoop] = None
+# Recent firmware events (last 50, oldest first) — shared with API layer.
+# Filled by an event_bus subscriber; deque(maxlen) drops the oldest in O(1).
+firmware_events: Deque[Dict] = deque(maxlen=50)
+
+
+def _record_firmware_event(event: FirmwareStatus) -> None:
+    """event_bus subscriber: keep the event for /api/events/firmware toasts."""
+    firmware_events.append({
+        "charger_id": event.charge_point_id,
+        "status": event.status,
+        "firmware_version": event.firmware_version,
+        "timestamp": event.timestamp,
+    })
+
+
+event_bus.subscribe(_record_firmware_event, FirmwareStatus)
 
-# Recent firmware events (last 50) — shared with API layer
-firmware_events: List[Dict] = []
 
 def _add_firmware_event(charger_id: str, status: str, firmware_version: str = ""):
-    """Store a firmware event so the dashboard can poll and show toast."""
+    """Publish a firmware status so the dashboard can show a toast."""
     from datetime import datetime, timezone, timedelta
     myt = timezone(timedelta(hours=8))
-    firmware_events.append({
-        "charger_id": charger_id,
-        "status": status,
-        "firmware_version": firmware_version,
-        "timestamp": datetime.now(myt).isoformat(),
-    })
-    # Keep only last 50 events
-    if len(firmware_events) > 50:
-        firmware_events.pop(0)
+    event_bus.publish(FirmwareStatus(
+        charger_id, status=status, firmware_version=firmware_version,
+        timestamp=datetime.now(myt).isoformat(),
+    ))
 # Charge point ID format: alphanumeric, dots, underscores, colons, hyphens; 3–64 chars
 _CP_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{3,64}$")
 
 
-def _parse_token_map(raw_tokens: str) -> Dict[str, str]:
-    """
-    Parse OCPP charger token map from env:
-    OCPP_CHARGER_TOKENS="CP001:tokenA,CP002:tokenB"
-    """
-    token_map: Dict[str, str] = {}
-    if not raw_tokens:
-        return token_map
-    for pair in raw_tokens.split(","):
-        item = pair.strip()
-        if not item or ":" not in item:
-            continue
-        cp_id, token = item.split(":", 1)
-        cp_id = cp_id.strip()
-        token = token.strip()
-        if cp_id and token:
-            token_map[cp_id] = token
-    return token_map
-
-
 def _extract_ws_token(websocket: Any, raw_path: str) -> Optional[str]:
     """Extract charger token from query string or headers."""
     # 1) Query string: ws://host:9000/CP001?token=xxx
@@ -160,83 +163,759 @@ def utc_now_iso_z() -> str:
     return datetime.now(myt).isoformat()
 
 
+# ─── OCPP Persistence (runs on the DB executor, never on the event loop) ──
+# Each function takes a fresh Session as its first argument and is invoked
+# via `await run_db(fn, ...)` from the matching @on(...) handler below.
+# They return plain values / SimpleNamespace snapshots only — ORM objects
+# must not leak back to the loop thread once their session is closed.
+
+def _parse_sampled_values(sampled_value: list) -> Dict[str, Optional[float]]:
+    """Pull voltage/current/power/energy out of one OCPP sampledValue list.
+
+    OCPP 1.6: chargers may send power in 'W' or 'kW', energy in 'Wh' or
+    'kWh'. Respect the unit field so we always store in the canonical SI
+    prefix expected by the UI (power=kW, energy=kWh).
+    """
+    out: Dict[str, Optional[float]] = {"voltage": None, "current": None, "power": None, "total_kwh": None}
+    for sv in sampled_value:
+        try:
+            value = float(sv.get('value', 0) or 0)
+        except (ValueError, TypeError):
+            value = 0.0
+        measurand = sv.get('measurand', '')
+        unit = (sv.get('unit') or '').strip()
+
+        if measurand == 'Voltage':
+            out["voltage"] = value
+        elif measurand == 'Current.Import':
+            out["current"] = value
+        elif measurand == 'Power.Active.Import':
+            # Canonicalise to kW. If unit absent, infer from magnitude
+            # (anything >1000 is almost certainly watts).
+            if unit.lower() == 'w' or (not unit and value > 1000):
+                out["power"] = value / 1000.0
+            else:
+                out["power"] = value  # already kW
+        elif measurand == 'Energy.Active.Import.Register':
+            # Canonicalise to kWh.
+            if unit.lower() == 'kwh':
+                out["total_kwh"] = value
+            else:
+                out["total_kwh"] = value / 1000.0  # Wh → kWh
+    return out
+
+
+def _charger_row(charger: Charger) -> SimpleNamespace:
+    """Detached snapshot cached on ChargePoint for the connection's lifetime:
+    the primary key plus the fields handlers read but never write."""
+    return SimpleNamespace(
+        id=charger.id,
+        firmware_version=charger.firmware_version,
+        heartbeat_interval=charger.heartbeat_interval,
+    )
+
+
+def _connector_status_dict(raw: Optional[str]) -> Optional[Dict[str, str]]:
+    """chargers.connector_status JSON → dict (None if empty/invalid)."""
+    if not raw:
+        return None
+    try:
+        d = json.loads(raw)
+        return d if isinstance(d, dict) else None
+    except Exception:
+        return None
+
+
+def _load_charger_row(db, cp_id: str) -> Optional[SimpleNamespace]:
+    charger = db.query(Charger).filter(Charger.charge_point_id == cp_id).first()
+    return _charger_row(charger) if charger else None
+
+
+def _persist_boot_notification(db, cp_id: str, model: str, vendor: str,
+                               firmware_version: Optional[str]) -> SimpleNamespace:
+    """Get-or-create the charger row, close pre-reboot orphan sessions."""
+    charger = db.query(Charger).filter(Charger.charge_point_id == cp_id).first()
+
+    if not charger:
+        charger = Charger(
+            charge_point_id=cp_id,
+            vendor=vendor,
+            model=model,
+            firmware_version=firmware_version if firmware_version is not None else 'Unknown',
+            status="online",
+            last_heartbeat=_utcnow()
+        )
+        db.add(charger)
+    else:
+        charger.vendor = vendor
+        charger.model = model
+        if firmware_version is not None:
+            charger.firmware_version = firmware_version
+        charger.status = "online"
+        charger.last_heartbeat = _utcnow()
+
+        # BootNotification means charger just rebooted — any active/pending sessions
+        # from before the reboot are orphaned (StopTransaction was never received).
+        # Close them now using the last known meter value as final energy reading.
+        orphaned = db.query(ChargingSession).filter(
+            ChargingSession.charger_id == charger.id,
+            ChargingSession.status.in_(['active', 'pending'])
+        ).all()
+
+        if orphaned:
+            now = _utcnow()
+            for s in orphaned:
+                last_meter = latest_for_transaction(db, s.transaction_id)
+                final_energy = (last_meter.total_kwh or 0.0) if last_meter else (s.energy_consumed or 0.0)
+                s.status = "interrupted"
+                s.stop_time = now
+                s.energy_consumed = final_energy
+                logger.warning(
+                    f"Orphan session {s.id} (tx={s.transaction_id}) closed on charger reboot — "
+                    f"energy={final_energy:.3f} kWh"
+                )
+            charger.availability = "available"
+            logger.info(f"Charger {cp_id} rebooted — closed {len(orphaned)} orphan session(s)")
+
+    # Auto-populate max_power_kw from model name if not manually set (e.g. "30kW" → 30.0)
+    if charger.max_power_kw is None and model:
+        match = re.search(r'(\d+\.?\d*)\s*kw', model, re.IGNORECASE)
+        if match:
+            charger.max_power_kw = float(match.group(1))
+
+    # Auto-infer connector_type from power if not manually set (>22kW = DC CCS2, else AC Type 2)
+    if charger.connector_type is None and charger.max_power_kw is not None:
+        charger.connector_type = "CCS2" if charger.max_power_kw > 22 else "Type 2"
+
+    db.flush()
+    result = SimpleNamespace(
+        row=_charger_row(charger),
+        availability=charger.availability,
+        vendor=charger.vendor,
+        model=charger.model,
+        firmware_version=charger.firmware_version,
+        connector_type=charger.connector_type,
+        max_power_kw=charger.max_power_kw,
+        number_of_connectors=charger.number_of_connectors,
+        heartbeat_interval=charger.heartbeat_interval,
+    )
+    db.commit()
+    return result
+
+
+def _authorize_id_tag(db, cp_id: str, id_tag: str) -> bool:
+    """DB side of Authorize: PAY{txn.id} tags and numeric user ids."""
+    # quick-pay / terminal-kiosk id_tag format is "PAY{txn.id}".
+    # Accept it only if there's a matching successful PaymentTransaction
+    # for THIS charger — so a leaked tag from another site can't be reused.
+    if id_tag and id_tag.startswith("PAY") and id_tag[3:].isdigit():
+        pay_id = int(id_tag[3:])
+        txn = db.query(PaymentTransaction).filter(
+            PaymentTransaction.id == pay_id,
+            PaymentTransaction.status == "success",
+            PaymentTransaction.charger_id == cp_id,
+        ).first()
+        if txn:
+            return True
+        logger.warning(f"Authorize: id_tag={id_tag!r} has no matching paid txn for {cp_id}")
+
+    # Numeric id_tag may be user_id from app
+    if id_tag and id_tag.isdigit():
+        user = db.query(User).filter(User.id == int(id_tag), User.is_active == True).first()
+        if user:
+            return True
+    return False
+
+
+def _persist_status_notification(db, cp_id: str, charger_pk: int, connector_id: int,
+                                 error_code: str, status: str) -> Optional[SimpleNamespace]:
+    """Apply a StatusNotification. Returns `.availability`, `.connector_status`
+    (JSON string) and `.fault` ("raised" / "cleared" / None), or None if the
+    charger row has gone away."""
+    charger = db.get(Charger, charger_pk)
+    if not charger:
+        logger.warning(f"StatusNotification received for unknown charger {cp_id}")
+        return None
+
+    # Connector-0 "Available" never reaches here — the handler treats it
+    # as liveness only (see on_status_notification).
+
+    # Map OCPP status to our availability status
+    # If connector is "Charging", set availability to "charging" (charger might be charging locally)
+    status_map = {
+        'Available': 'available',
+        'Preparing': 'preparing',
+        'Charging': 'charging',   # Set to charging if connector status is Charging
+        'SuspendedEVSE': 'preparing',
+        'SuspendedEV': 'preparing',
+        'Finishing': 'preparing',
+        'Reserved': 'unavailable',
+        'Unavailable': 'unavailable',
+        'Faulted': 'faulted'
+    }
+
+    # ── Idle-fee detection ────────────────────────────────────────
+    # When the connector leaves "Charging" but the plug is still in
+    # (Suspended* / Finishing), the EV has finished drawing power —
+    # mark the active session's charge_complete_at + idle_started_at
+    # so settlement can later compute the post-grace idle penalty.
+    # When the plug is physically removed (Available), stamp it too
+    # in case we missed the in-between state.
+    if status in ('SuspendedEV', 'SuspendedEVSE', 'Finishing', 'Available'):
+        try:
+            open_session = (
+                db.query(ChargingSession)
+                .filter(
+                    ChargingSession.charger_id == charger.id,
+                    ChargingSession.status == 'active',
+                    ChargingSession.transaction_id > 0,
+                    ChargingSession.charge_complete_at.is_(None),
+                )
+                .first()
+            )
+            if open_session:
+                now = _utcnow()
+                open_session.charge_complete_at = now
+                open_session.idle_started_at = now
+                logger.info(
+                    f"[idle-fee] {cp_id}: charge complete "
+                    f"(status={status}) — session {open_session.transaction_id}, "
+                    f"idle timer started"
+                )
+        except Exception as e:
+            logger.error(f"[idle-fee] failed to mark charge_complete_at for {cp_id}: {e}")
+
+    # Update availability based on actual connector status
+    # Only set to "charging" if connector status is actually "Charging"
+    if status == 'Charging':
+        # Set availability to charging
+        charger.availability = 'charging'
+        # Check if we have an active session, if not, create one (charger might be charging locally)
+        try:
+            active_session = db.query(ChargingSession).filter(
+                ChargingSession.charger_id == charger.id,
+                ChargingSession.status == 'active'
+            ).first()
+
+            if not active_session:
+                # Charger is charging but no session exists - might be local charging
+                # Don't create session here - wait for StartTransaction
+                # Just update availability to charging
+                logger.info(f"Charger {cp_id} is charging but no active session found. Will wait for StartTransaction.")
+                # Don't create placeholder session - it causes database conflicts
+                # Session will be created when StartTransaction is received
+        except Exception as e:
+            logger.error(f"Error checking sessions for charger {cp_id}: {e}", exc_info=True)
+            # Don't fail the StatusNotification - just log the error
+    else:
+        # For other statuses (Available, Preparing, etc.), sync availability with actual charger state
+        # IMPORTANT: Trust the charger's actual status, not just database sessions
+        # If charger says "Available" or "Preparing", it's not charging - sync accordingly
+        try:
+            active_session = db.query(ChargingSession).filter(
+                ChargingSession.charger_id == charger.id,
+                ChargingSession.status == 'active',
+                ChargingSession.transaction_id > 0  # Only consider valid sessions
+            ).first()
+
+            # Sync availability with actual charger status
+            # If charger status is "Available" or "Preparing", charger is NOT charging
+            # Update availability to match actual state, even if we have an active session
+            # (The session might be stale from before disconnect)
+            new_availability = status_map.get(status, 'unknown')
+
+            if status in ['Available', 'Preparing']:
+                # Charger says it's NOT charging - trust the device (source of truth)
+                # Don't keep 'charging' based on stale session - user may have stopped locally
+                charger.availability = new_availability
+                if active_session:
+                    logger.info(
+                        f"Charger {cp_id} reports '{status}' - completing stale session "
+                        f"{active_session.transaction_id} (charger stopped charging)"
+                    )
+                    active_session.status = 'completed'
+                    active_session.stop_time = _utcnow()
+            else:
+                # Other statuses (Unavailable, Faulted, etc.) - update availability
+                charger.availability = new_availability
+
+            # Clear placeholder sessions (transaction_id = 0 or negative) if charger is not charging
+            try:
+                placeholder_sessions = db.query(ChargingSession).filter(
+                    ChargingSession.charger_id == charger.id,
+                    ChargingSession.status.in_(['active', 'pending']),
+                    ChargingSession.transaction_id <= 0  # Clear both 0 and negative transaction_ids
+                ).all()
+                for session in placeholder_sessions:
+                    session.status = 'completed'
+                    session.stop_time = _utcnow()
+                    logger.info(f"Cleared placeholder session (transaction_id={session.transaction_id}) for charger {cp_id}")
+            except Exception as e:
+                logger.error(f"Error clearing placeholder sessions for charger {cp_id}: {e}", exc_info=True)
+                db.rollback()
+        except Exception as e:
+            logger.error(f"Error checking sessions for charger {cp_id}: {e}", exc_info=True)
+            # Fallback: use simple status mapping when error occurs
+            charger.availability = status_map.get(status, 'unknown')
+
+    # ── Per-connector status tracking ──────────────────────────────
+    # connector >=1 = individual sockets. Track each socket separately
+    # so a multi-connector charger (e.g. a DC unit with 2 guns) is
+    # represented correctly, then derive charger.availability as the
+    # best (most usable) socket — a free socket keeps the charger
+    # usable even if another socket is faulted.
+    try:
+        import json as _json
+        conn_map = {}
+        if charger.connector_status:
+            try:
+                conn_map = _json.loads(charger.connector_status) or {}
+            except Exception:
+                conn_map = {}
+        if connector_id and connector_id >= 1:
+            conn_map[str(connector_id)] = status_map.get(status, 'unknown')
+            charger.connector_status = _json.dumps(conn_map)
+            _rank = {'available': 0, 'preparing': 1, 'charging': 2,
+                     'finishing': 3, 'reserved': 4, 'unavailable': 5,
+                     'faulted': 6, 'unknown': 7}
+            best = min(conn_map.values(),
+                       key=lambda s: _rank.get(s, 7), default=None)
+            if best:
+                charger.availability = best
+    except Exception as e:
+        logger.error(f"Error updating per-connector status for {cp_id}: {e}")
+
+    charger.last_heartbeat = _utcnow()
+    charger.status = 'online'  # Update status to online when we receive StatusNotification
+
+    # Handle faults
+    fault_event = None
+    if error_code and error_code != 'NoError':
+        fault_type_map = {
+            'OverCurrentFailure': 'overcurrent',
+            'GroundFailure': 'ground_fault',
+            'OtherError': 'cp_error'
+        }
+        fault_type = fault_type_map.get(error_code, 'cp_error')
+
+        # Check if fault already exists and is not cleared
+        existing_fault = db.query(Fault).filter(
+            Fault.charger_id == charger.id,
+            Fault.fault_type == fault_type,
+            Fault.cleared == False
+        ).first()
+
+        if not existing_fault:
+            fault = Fault(
+                charger_id=charger.id,
+                fault_type=fault_type,
+                message=f"Error code: {error_code}, Status: {status}",
+                timestamp=_utcnow()
+            )
+            db.add(fault)
+            fault_event = "raised"
+
+    # Clear faults if status is not faulted
+    if status != 'Faulted' and error_code == 'NoError':
+        cleared = db.query(Fault).filter(
+            Fault.charger_id == charger.id,
+            Fault.cleared == False
+        ).update({'cleared': True, 'cleared_at': _utcnow()})
+        if cleared:
+            fault_event = "cleared"
+
+    result = SimpleNamespace(
+        availability=charger.availability,
+        connector_status=charger.connector_status,
+        fault=fault_event,
+    )
+    try:
+        db.commit()
+    except Exception as e:
+        logger.error(f"Error committing StatusNotification for charger {cp_id}: {e}", exc_info=True)
+        db.rollback()
+        # Don't fail the StatusNotification - just log the error
+        # Return success response to prevent charger from disconnecting
+    return result
+
+
+def _enqueue_webhook(db, event_type: str, session) -> None:
+    """Queue partner webhooks in the caller's transaction (webhook_delivery.py).
+    Never lets a webhook problem fail the OCPP message."""
+    try:
+        with db.begin_nested():
+            enqueue_session_event(db, event_type, session)
+    except Exception as e:
+        logger.error(f"[webhooks] enqueue {event_type} failed for txn {session.transaction_id}: {e}",
+                     exc_info=True)
+
+
+def _persist_start_transaction(db, charger_pk: int, connector_id: int, id_tag: str,
+                               meter_start: int, start_dt: datetime) -> int:
+    """Activate the RemoteStart placeholder or open a new session. Returns the
+    assigned transaction_id."""
+    # Check if a pending/active session already exists (created by RemoteStart)
+    existing_session = db.query(ChargingSession).filter(
+        ChargingSession.charger_id == charger_pk,
+        ChargingSession.status.in_(["pending", "active"])
+    ).order_by(desc(ChargingSession.start_time)).first()
+
+    if existing_session:
+        existing_session.status = "active"
+        existing_session.start_time = start_dt
+        existing_session.connector_id = connector_id
+        existing_session.meter_start = meter_start if meter_start is not None else existing_session.meter_start
+        if not existing_session.user_id or existing_session.user_id in ("LOCAL_CHARGING", "DASHBOARD_USER"):
+            existing_session.user_id = id_tag
+        # Assign transaction_id from DB id if not already a valid one
+        if not existing_session.transaction_id or existing_session.transaction_id <= 0:
+            db.flush()
+            existing_session.transaction_id = existing_session.id
+        transaction_id = existing_session.transaction_id
+    else:
+        # New session — flush to get auto-increment id, use it as transaction_id
+        session = ChargingSession(
+            charger_id=charger_pk,
+            transaction_id=0,  # placeholder; will be replaced with DB id below
+            connector_id=connector_id,
+            start_time=start_dt,
+            status="active",
+            user_id=id_tag,
+            meter_start=meter_start,
+        )
+        db.add(session)
+        db.flush()  # populate session.id
+        session.transaction_id = session.id
+        transaction_id = session.transaction_id
+
+    db.query(Charger).filter(Charger.id == charger_pk).update(
+        {"availability": "charging", "status": "online"}, synchronize_session=False,
+    )
+    _enqueue_webhook(db, "session.started", existing_session or session)
+    db.commit()
+    return transaction_id
+
+
+def _persist_stop_transaction(db, cp_id: str, transaction_id: int, id_tag: str, meter_stop: int,
+                              stop_dt: datetime, reason: Optional[str]) -> Optional[SimpleNamespace]:
+    """Close the session, free the charger, settle idle-fee/refund and look up
+    the originating payment for the invoice email. Returns None if the
+    transaction is unknown."""
+    session = db.query(ChargingSession).filter(
+        ChargingSession.transaction_id == transaction_id
+    ).first()
+    if not session:
+        return None
+
+    session.stop_time = stop_dt
+    session.status = "completed"
+    session.meter_stop = meter_stop
+    session.stop_reason = reason
+
+    # Use meter_stop for billing accuracy — OCPP spec: meter_stop is authoritative Wh at session end
+    if meter_stop is not None:
+        if session.meter_start is not None:
+            session.energy_consumed = (meter_stop - session.meter_start) / 1000.0  # Wh → kWh
+        else:
+            session.energy_consumed = meter_stop / 1000.0  # Fallback: treat as session delta
+        logger.info(f"Session {transaction_id}: energy={session.energy_consumed:.3f} kWh (meter_stop={meter_stop} Wh)")
+    # Else keep energy_consumed from MeterValues stream
+
+    _enqueue_webhook(db, "session.stopped", session)
+    db.commit()
+
+    # Update charger availability
+    charger = db.query(Charger).filter(Charger.id == session.charger_id).first()
+    if charger:
+        charger.availability = "available"
+        db.commit()
+
+    # ── Idle-fee + refund settlement ──────────────────────────
+    # If charger has idle_fee enabled and we have a hold_amount on
+    # this session, compute energy cost + idle fee, then mark the
+    # refund as pending. Actual TNG refund call happens in Phase 5.
+    try:
+        if charger and charger.idle_fee_enabled and session.hold_amount_rm:
+            tariff = float(charger.tariff_per_kwh or 0.10)
+            kwh = float(session.energy_consumed or 0)
+            energy_cost = round(kwh * tariff, 2)
+
+            # Idle minutes accrued past grace
+            idle_min = 0
+            idle_fee = 0.0
+            if session.idle_started_at and session.stop_time:
+                elapsed = (session.stop_time - session.idle_started_at).total_seconds() / 60.0
+                past_grace = max(0.0, elapsed - float(charger.idle_grace_minutes or 0))
+                idle_min = int(past_grace)
+                idle_fee = round(idle_min * float(charger.idle_fee_per_min or 0), 2)
+
+            hold = float(session.hold_amount_rm)
+            total = energy_cost + idle_fee
+            # Cap actual at hold (auto-stop should have prevented overrun)
+            if total > hold:
+                logger.warning(
+                    f"[idle-fee] session {transaction_id}: total {total} > hold {hold}, "
+                    f"capping refund at 0"
+                )
+                total = hold
+            refund = round(hold - total, 2)
+
+            session.idle_minutes = idle_min
+            session.idle_fee_amount = Decimal(str(idle_fee))
+            session.refund_amount = Decimal(str(refund))
+            session.refund_status = "pending" if refund > 0 else "not_required"
+            logger.info(
+                f"[idle-fee] session {transaction_id} settled: "
+                f"energy={energy_cost} idle={idle_fee} ({idle_min}min) "
+                f"refund={refund} of hold={hold}"
+            )
+            db.commit()
+    except Exception as e:
+        logger.error(f"[idle-fee] settlement failed for session {transaction_id}: {e}", exc_info=True)
+
+    result = SimpleNamespace(
+        stop_time=session.stop_time,
+        energy_consumed=session.energy_consumed,
+        invoice=None,
+    )
+
+    # Quick-pay / terminal-kiosk post-charge invoice email.
+    # Used to correlate via id_tag="PAY{txn.id}", but the kiosk now
+    # uses the whitelisted "DASHBOARD_USER" tag (to satisfy chargers
+    # like DC3001 that gate on LocalAuthList). Fall back to charger_id
+    # + recency to find the originating payment.
+    try:
+        txn = None
+        if id_tag and id_tag.startswith("PAY") and id_tag[3:].isdigit():
+            # Legacy path — still supported for any charger that
+            # accepts dynamic tags.
+            txn = db.query(PaymentTransaction).filter(
+                PaymentTransaction.id == int(id_tag[3:])
+            ).first()
+        if not txn and charger:
+            # Recency-based lookup: most recent paid charge_payment
+            # txn for this charger. session.start_time is MYT-naive
+            # but paid_at is UTC-naive — to avoid an 8-hour drift
+            # we just take the latest txn in the last 12 hours
+            # using UTC (paid_at's native reference) as the anchor.
+            cutoff = _utcnow() - timedelta(hours=12)
+            txn = (
+                db.query(PaymentTransaction)
+                .filter(
+                    PaymentTransaction.charger_id == charger.charge_point_id,
+                    PaymentTransaction.status == "success",
+                    PaymentTransaction.purpose == "charge_payment",
+                    PaymentTransaction.paid_at >= cutoff,
+                )
+                .order_by(PaymentTransaction.id.desc())
+                .first()
+            )
+        recipient = (txn.customer_email or txn.user_email) if txn else None
+        if txn and recipient and charger:
+            # Compute duration string
+            if session.start_time and session.stop_time:
+                delta = session.stop_time - session.start_time
+                total = int(delta.total_seconds())
+                hh, rem = divmod(total, 3600)
+                mm, ss = divmod(rem, 60)
+                dur_str = f"{hh:02d}:{mm:02d}:{ss:02d}"
+            else:
+                dur_str = "—"
+
+            # Deposit/refund flow extras (terminal kiosk).
+            # Only set when this session went through the
+            # hold/refund flow; legacy quick-pay sessions
+            # leave these None → email shows 'Amount paid'.
+            hold_amt = float(session.hold_amount_rm) if session.hold_amount_rm else None
+            energy_cost = None
+            idle_min = int(session.idle_minutes or 0)
+            idle_fee = float(session.idle_fee_amount or 0)
+            refund_amt = float(session.refund_amount) if session.refund_amount is not None else None
+            if hold_amt is not None:
+                tariff = float(charger.tariff_per_kwh or 0.10) if charger else 0.10
+                energy_cost = round(float(session.energy_consumed or 0) * tariff, 2)
+            result.invoice = dict(
+                to_email=recipient,
+                transaction_ref=txn.transaction_ref,
+                charger_id=charger.charge_point_id,
+                connector_id=int(session.connector_id or txn.connector_id or 1),
+                started_at_str=session.start_time.strftime("%Y-%m-%d %H:%M:%S") if session.start_time else "—",
+                stopped_at_str=session.stop_time.strftime("%Y-%m-%d %H:%M:%S") if session.stop_time else "—",
+                duration_str=dur_str,
+                energy_kwh=float(session.energy_consumed or 0),
+                amount_paid=float(txn.amount or 0),
+                stop_reason=reason or "Local",
+                hold_amount=hold_amt,
+                energy_cost=energy_cost,
+                idle_minutes=idle_min if idle_min > 0 else None,
+                idle_fee=idle_fee if idle_fee > 0 else None,
+                refund_amount=refund_amt,
+            )
+    except Exception as e:
+        logger.error(f"[invoice] failed to prepare post-charge email: {e}", exc_info=True)
+
+    return result
+
+
+def _persist_meter_values(db, cp_id: str, charger_id: int, transaction_id: Optional[int],
+                          total_kwh: Optional[float], last_sample: Optional[Dict]) -> bool:
+    """Roll the message's latest energy register into the session, refresh
+    the latest-sample cache and evaluate the kWh quota — one commit per
+    MeterValues message. The raw samples themselves go through meter_buffer
+    (bulk, write-behind).
+
+    Returns True when the handler should fire RemoteStopTransaction."""
+    remote_stop = False
+    if last_sample is not None:
+        record_latest_sample(db, charger_id, transaction_id, last_sample)
+    # Update session energy consumed
+    if transaction_id and total_kwh:
+        session = db.query(ChargingSession).filter(
+            ChargingSession.transaction_id == transaction_id
+        ).first()
+        if session:
+            session.energy_consumed = total_kwh
+
+            # Auto-stop on quota: quick-pay sessions have a kWh quota
+            # (= amount_paid / tariff). Once delivered ≥ quota, fire
+            # RemoteStopTransaction so the user never consumes more than
+            # what they paid for. Idempotent via session.auto_stopped.
+            try:
+                kwh_limit = session.energy_kwh_limit
+                if (
+                    kwh_limit is not None
+                    and not session.auto_stopped
+                    and session.status == "active"
+                ):
+                    # Energy delivered = current register reading − reading at start.
+                    # meter_start is in Wh, total_kwh is in kWh.
+                    start_kwh = (session.meter_start or 0) / 1000.0
+                    delivered_kwh = max(0.0, total_kwh - start_kwh)
+                    if delivered_kwh >= float(kwh_limit):
+                        session.auto_stopped = True
+                        session.stop_reason = "QuotaReached"
+                        logger.info(
+                            f"[auto-stop] {cp_id} txn={transaction_id} "
+                            f"delivered={delivered_kwh:.3f} kWh ≥ quota={kwh_limit} kWh "
+                            f"→ firing RemoteStopTransaction"
+                        )
+                        remote_stop = True
+            except Exception as quota_err:
+                logger.error(
+                    f"[auto-stop] quota check failed for {cp_id} "
+                    f"txn={transaction_id}: {quota_err}",
+                    exc_info=True,
+                )
+    db.commit()
+
+    return remote_stop
+
+
+def _log_charger_disconnect(db, cp_id: str) -> None:
+    charger = db.query(Charger).filter(Charger.charge_point_id == cp_id).first()
+    if charger:
+        # NOTE: Reverted to leave status unchanged on disconnect.
+        # Marking offline here was correlated with firmware update
+        # failures (chargers download but never report Installed).
+        # During firmware reboot the websocket drops briefly — we
+        # don't want any DB commit that could race with the in-flight
+        # static file download for the firmware bin.
+        # Heartbeat-based offline detection (separate background job)
+        # handles truly-offline chargers.
+        logger.info(
+            f"Charger {cp_id} disconnected; leaving status/availability unchanged "
+            f"(status={charger.status}, availability={charger.availability}, last_heartbeat={charger.last_heartbeat})"
+        )
+
+
+def _mark_charger_offline(db, cp_id: str) -> None:
+    charger = db.query(Charger).filter(Charger.charge_point_id == cp_id).first()
+    if charger:
+        charger.status = "offline"
+        db.commit()
+
+
 # ─── ChargePoint: OCPP 1.6 Message Handlers (Inbound) ─────────────────────
 # Handles: BootNotification, Authorize, StatusNotification, StartTransaction,
 #          StopTransaction, MeterValues, Heartbeat, FirmwareStatusNotification,
 #          DiagnosticsStatusNotification
+# DB work goes through run_db() (ocpp_db.py) so a slow query on one charger
+# never blocks the loop serving every other charger's WebSocket.
 class ChargePoint(cp):
-    def __init__(self, id, connection):
-        super().__init__(id, connection)
-        self.db = SessionLocal()
-    
-    def __del__(self):
-        if hasattr(self, 'db'):
-            self.db.close()
-    
+    # Cached chargers row (pk + read-only hot fields), loaded on connect or
+    # BootNotification so later messages UPDATE by primary key instead of
+    # re-SELECTing by charge_point_id. Admin edits drop it through
+    # invalidate_charger_cache(); the generation counter stops a load that
+    # was in flight during an invalidation from re-caching the stale row.
+    _charger_cache: Optional[SimpleNamespace] = None
+    _charger_cache_gen: int = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Orders every outbound CALL on this connection (ocpp_command_queue.py).
+        self.command_queue = CommandQueue(self.id)
+
+    async def call(self, payload, suppress=True, unique_id=None, skip_schema_validation=False):
+        """python-ocpp call(), queued by priority behind this charger's other
+        outbound commands; identical pending reads share one CALL."""
+        action = payload.__class__.__name__
+        send = super().call
+        key = None
+        if action in COALESCABLE_ACTIONS and unique_id is None:
+            key = f"{action}:{json.dumps(serialize_ocpp_result(payload), sort_keys=True, default=str)}"
+        return await self.command_queue.run(
+            action, lambda: send(payload, suppress, unique_id, skip_schema_validation), coalesce_key=key,
+        )
+
+    async def charger_row(self) -> Optional[SimpleNamespace]:
+        """Cached row for this connection, loading it on a miss. None if the
+        charger isn't registered."""
+        row = self._charger_cache
+        if row is None:
+            gen = self._charger_cache_gen
+            row = await run_db(_load_charger_row, self.id)
+            self.cache_charger_row(row, gen)
+        return row
+
+    def cache_charger_row(self, row: Optional[SimpleNamespace], gen: Optional[int] = None) -> None:
+        if row is not None and (gen is None or gen == self._charger_cache_gen):
+            self._charger_cache = row
+
+    def drop_charger_cache(self) -> None:
+        self._charger_cache_gen += 1
+        self._charger_cache = None
+
+    async def route_message(self, raw_msg):
+        # Every inbound message counts as liveness for the state healer.
+        liveness.message(self.id, self)
+        return await super().route_message(raw_msg)
+
     @on('BootNotification')
     async def on_boot_notification(self, charge_point_model: str, charge_point_vendor: str, **kwargs):
         """Handle BootNotification from charging station"""
         logger.info(f"BootNotification received from {self.id}")
         try:
-            # Get or create charger
-            charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-            
-            if not charger:
-                charger = Charger(
-                    charge_point_id=self.id,
-                    vendor=charge_point_vendor,
-                    model=charge_point_model,
-                    firmware_version=kwargs.get('firmware_version', 'Unknown'),
-                    status="online",
-                    last_heartbeat=_utcnow()
+            async with admission.boot_slot() as got_slot:
+                if not got_slot:
+                    # Reconnect storm: ask the charger to boot again later
+                    # instead of piling another write onto MySQL.
+                    admission.note_boot_pending()
+                    logger.info(f"BootNotification from {self.id} deferred (Pending) — boot path saturated")
+                    return call_result.BootNotification(
+                        current_time=utc_now_iso_z(),
+                        interval=OCPP_BOOT_RETRY_SECONDS,
+                        status=RegistrationStatus.pending,
+                    )
+                charger = await run_db(
+                    _persist_boot_notification, self.id, charge_point_model, charge_point_vendor,
+                    kwargs.get('firmware_version'),
                 )
-                self.db.add(charger)
-            else:
-                charger.vendor = charge_point_vendor
-                charger.model = charge_point_model
-                charger.firmware_version = kwargs.get('firmware_version', charger.firmware_version)
-                charger.status = "online"
-                charger.last_heartbeat = _utcnow()
-                
-                # BootNotification means charger just rebooted — any active/pending sessions
-                # from before the reboot are orphaned (StopTransaction was never received).
-                # Close them now using the last known meter value as final energy reading.
-                orphaned = self.db.query(ChargingSession).filter(
-                        ChargingSession.charger_id == charger.id,
-                    ChargingSession.status.in_(['active', 'pending'])
-                    ).all()
-                    
-                if orphaned:
-                    now = _utcnow()
-                    for s in orphaned:
-                        last_meter = (
-                            self.db.query(MeterValue)
-                            .filter(MeterValue.transaction_id == s.transaction_id)
-                            .order_by(desc(MeterValue.timestamp))
-                            .first()
-                        )
-                        final_energy = (last_meter.total_kwh or 0.0) if last_meter else (s.energy_consumed or 0.0)
-                        s.status = "interrupted"
-                        s.stop_time = now
-                        s.energy_consumed = final_energy
-                        logger.warning(
-                            f"Orphan session {s.id} (tx={s.transaction_id}) closed on charger reboot — "
-                            f"energy={final_energy:.3f} kWh"
-                        )
-                    charger.availability = "available"
-                    logger.info(f"Charger {self.id} rebooted — closed {len(orphaned)} orphan session(s)")
-            
-            # Auto-populate max_power_kw from model name if not manually set (e.g. "30kW" → 30.0)
-            if charger.max_power_kw is None and charge_point_model:
-                match = re.search(r'(\d+\.?\d*)\s*kw', charge_point_model, re.IGNORECASE)
-                if match:
-                    charger.max_power_kw = float(match.group(1))
-
-            # Auto-infer connector_type from power if not manually set (>22kW = DC CCS2, else AC Type 2)
-            if charger.connector_type is None and charger.max_power_kw is not None:
-                charger.connector_type = "CCS2" if charger.max_power_kw > 22 else "Type 2"
-
-            self.db.commit()
+            self.drop_charger_cache()
+            self.cache_charger_row(charger.row)
+            event_bus.publish(ChargerStatusChanged(self.id, {
+                "status": "online", "availability": charger.availability or "available",
+                "firmware_version": charger.firmware_version, "ws_connected": True,
+            }))
 
             # Edge sync → push charger info to VPS
             if _sync:
@@ -255,9 +934,9 @@ class ChargePoint(cp):
 
             # Get charger configuration for heartbeat interval
             # Cap at 30s so ESP32 sends heartbeats frequently - DB default 7200 causes "offline" after 90s
-            raw_interval = getattr(charger, 'heartbeat_interval', None) or 10
+            raw_interval = charger.heartbeat_interval or 10
             heartbeat_interval = min(int(raw_interval), 30)
-            
+
             return call_result.BootNotification(
                 current_time=utc_now_iso_z(),
                 interval=heartbeat_interval,
@@ -265,10 +944,6 @@ class ChargePoint(cp):
             )
         except Exception as e:
             logger.error(f"Error in BootNotification handler for {self.id}: {e}", exc_info=True)
-            try:
-                self.db.rollback()
-            except Exception:
-                pass
             return call_result.BootNotification(
                 current_time=utc_now_iso_z(),
                 interval=30,
@@ -288,25 +963,8 @@ class ChargePoint(cp):
             if id_tag in ("APP_USER", "DASHBOARD_USER", "LOCAL_CHARGING", ""):
                 return call_result.Authorize(id_tag_info={"status": AuthorizationStatus.accepted})
 
-            # quick-pay / terminal-kiosk id_tag format is "PAY{txn.id}".
-            # Accept it only if there's a matching successful PaymentTransaction
-            # for THIS charger — so a leaked tag from another site can't be reused.
-            if id_tag and id_tag.startswith("PAY") and id_tag[3:].isdigit():
-                pay_id = int(id_tag[3:])
-                txn = self.db.query(PaymentTransaction).filter(
-                    PaymentTransaction.id == pay_id,
-                    PaymentTransaction.status == "success",
-                    PaymentTransaction.charger_id == self.id,
-                ).first()
-                if txn:
-                    return call_result.Authorize(id_tag_info={"status": AuthorizationStatus.accepted})
-                logger.warning(f"Authorize: id_tag={id_tag!r} has no matching paid txn for {self.id}")
-
-            # Numeric id_tag may be user_id from app
-            if id_tag and id_tag.isdigit():
-                user = self.db.query(User).filter(User.id == int(id_tag), User.is_active == True).first()
-                if user:
-                    return call_result.Authorize(id_tag_info={"status": AuthorizationStatus.accepted})
+            if await run_db(_authorize_id_tag, self.id, id_tag):
+                return call_result.Authorize(id_tag_info={"status": AuthorizationStatus.accepted})
 
             # Unknown id_tag — block. Add RFID cards via admin dashboard to whitelist.
             logger.warning(f"Authorize BLOCKED unknown id_tag={id_tag!r} on charger {self.id}")
@@ -320,222 +978,40 @@ class ChargePoint(cp):
         """Handle StatusNotification from charging station"""
         try:
             logger.info(f"StatusNotification from {self.id}: connector {connector_id}, status: {status}, error: {error_code}")
-            
-            charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-            if not charger:
+
+            row = await self.charger_row()
+            if row is None:
                 logger.warning(f"StatusNotification received for unknown charger {self.id}")
                 return call_result.StatusNotification()
-
             # OCPP: connector 0 = the charge point as a whole; connector >=1 =
             # the actual socket where the gun plugs in. A connector-0
             # "Available" only means the station box is operable — it must NOT
             # overwrite the socket's real status (Preparing / Charging), or the
             # app sees a charger as "available" while a gun is already plugged
-            # in. Skip availability update for connector-0 "Available".
+            # in. It's liveness only, so coalesce it like a Heartbeat.
             if connector_id == 0 and status == 'Available':
-                charger.last_heartbeat = _utcnow()
-                charger.status = 'online'
-                try:
-                    self.db.commit()
-                except Exception as e:
-                    logger.error(f"Error committing connector-0 StatusNotification for {self.id}: {e}")
-                    self.db.rollback()
+                heartbeat_coalescer.touch(self.id)
+                return call_result.StatusNotification()
+            applied = await run_db(
+                _persist_status_notification, self.id, row.id, connector_id, error_code, status,
+            )
+            if applied is None:
+                self.drop_charger_cache()
                 return call_result.StatusNotification()
 
-            # Map OCPP status to our availability status
-            # If connector is "Charging", set availability to "charging" (charger might be charging locally)
-            status_map = {
-                'Available': 'available',
-                'Preparing': 'preparing',
-                'Charging': 'charging',   # Set to charging if connector status is Charging
-                'SuspendedEVSE': 'preparing',
-                'SuspendedEV': 'preparing',
-                'Finishing': 'preparing',
-                'Reserved': 'unavailable',
-                'Unavailable': 'unavailable',
-                'Faulted': 'faulted'
-            }
-            
-            # ── Idle-fee detection ────────────────────────────────────────
-            # When the connector leaves "Charging" but the plug is still in
-            # (Suspended* / Finishing), the EV has finished drawing power —
-            # mark the active session's charge_complete_at + idle_started_at
-            # so settlement can later compute the post-grace idle penalty.
-            # When the plug is physically removed (Available), stamp it too
-            # in case we missed the in-between state.
-            if status in ('SuspendedEV', 'SuspendedEVSE', 'Finishing', 'Available'):
-                try:
-                    open_session = (
-                        self.db.query(ChargingSession)
-                        .filter(
-                            ChargingSession.charger_id == charger.id,
-                            ChargingSession.status == 'active',
-                            ChargingSession.transaction_id > 0,
-                            ChargingSession.charge_complete_at.is_(None),
-                        )
-                        .first()
-                    )
-                    if open_session:
-                        now = _utcnow()
-                        open_session.charge_complete_at = now
-                        open_session.idle_started_at = now
-                        logger.info(
-                            f"[idle-fee] {self.id}: charge complete "
-                            f"(status={status}) — session {open_session.transaction_id}, "
-                            f"idle timer started"
-                        )
-                except Exception as e:
-                    logger.error(f"[idle-fee] failed to mark charge_complete_at for {self.id}: {e}")
-
-            # Update availability based on actual connector status
-            # Only set to "charging" if connector status is actually "Charging"
-            if status == 'Charging':
-                # Set availability to charging
-                charger.availability = 'charging'
-                # Check if we have an active session, if not, create one (charger might be charging locally)
-                try:
-                    active_session = self.db.query(ChargingSession).filter(
-                        ChargingSession.charger_id == charger.id,
-                        ChargingSession.status == 'active'
-                    ).first()
-                    
-                    if not active_session:
-                        # Charger is charging but no session exists - might be local charging
-                        # Don't create session here - wait for StartTransaction
-                        # Just update availability to charging
-                        logger.info(f"Charger {self.id} is charging but no active session found. Will wait for StartTransaction.")
-                        # Don't create placeholder session - it causes database conflicts
-                        # Session will be created when StartTransaction is received
-                except Exception as e:
-                    logger.error(f"Error checking sessions for charger {self.id}: {e}", exc_info=True)
-                    # Don't fail the StatusNotification - just log the error
-            else:
-                # For other statuses (Available, Preparing, etc.), sync availability with actual charger state
-                # IMPORTANT: Trust the charger's actual status, not just database sessions
-                # If charger says "Available" or "Preparing", it's not charging - sync accordingly
-                try:
-                    active_session = self.db.query(ChargingSession).filter(
-                        ChargingSession.charger_id == charger.id,
-                        ChargingSession.status == 'active',
-                        ChargingSession.transaction_id > 0  # Only consider valid sessions
-                    ).first()
-                    
-                    # Sync availability with actual charger status
-                    # If charger status is "Available" or "Preparing", charger is NOT charging
-                    # Update availability to match actual state, even if we have an active session
-                    # (The session might be stale from before disconnect)
-                    new_availability = status_map.get(status, 'unknown')
-                    
-                    if status in ['Available', 'Preparing']:
-                        # Charger says it's NOT charging - trust the device (source of truth)
-                        # Don't keep 'charging' based on stale session - user may have stopped locally
-                        charger.availability = new_availability
-                        if active_session:
-                            logger.info(
-                                f"Charger {self.id} reports '{status}' - completing stale session "
-                                f"{active_session.transaction_id} (charger stopped charging)"
-                            )
-                            active_session.status = 'completed'
-                            active_session.stop_time = _utcnow()
-                    else:
-                        # Other statuses (Unavailable, Faulted, etc.) - update availability
-                        charger.availability = new_availability
-                    
-                    # Clear placeholder sessions (transaction_id = 0 or negative) if charger is not charging
-                    try:
-                        placeholder_sessions = self.db.query(ChargingSession).filter(
-                            ChargingSession.charger_id == charger.id,
-                            ChargingSession.status.in_(['active', 'pending']),
-                            ChargingSession.transaction_id <= 0  # Clear both 0 and negative transaction_ids
-                        ).all()
-                        for session in placeholder_sessions:
-                            session.status = 'completed'
-                            session.stop_time = _utcnow()
-                            logger.info(f"Cleared placeholder session (transaction_id={session.transaction_id}) for charger {self.id}")
-                    except Exception as e:
-                        logger.error(f"Error clearing placeholder sessions for charger {self.id}: {e}", exc_info=True)
-                        self.db.rollback()
-                except Exception as e:
-                    logger.error(f"Error checking sessions for charger {self.id}: {e}", exc_info=True)
-                    # Fallback: use simple status mapping when error occurs
-                    charger.availability = status_map.get(status, 'unknown')
-
-            # ── Per-connector status tracking ──────────────────────────────
-            # connector >=1 = individual sockets. Track each socket separately
-            # so a multi-connector charger (e.g. a DC unit with 2 guns) is
-            # represented correctly, then derive charger.availability as the
-            # best (most usable) socket — a free socket keeps the charger
-            # usable even if another socket is faulted.
-            try:
-                import json as _json
-                conn_map = {}
-                if charger.connector_status:
-                    try:
-                        conn_map = _json.loads(charger.connector_status) or {}
-                    except Exception:
-                        conn_map = {}
-                if connector_id and connector_id >= 1:
-                    conn_map[str(connector_id)] = status_map.get(status, 'unknown')
-                    charger.connector_status = _json.dumps(conn_map)
-                    _rank = {'available': 0, 'preparing': 1, 'charging': 2,
-                             'finishing': 3, 'reserved': 4, 'unavailable': 5,
-                             'faulted': 6, 'unknown': 7}
-                    best = min(conn_map.values(),
-                               key=lambda s: _rank.get(s, 7), default=None)
-                    if best:
-                        charger.availability = best
-            except Exception as e:
-                logger.error(f"Error updating per-connector status for {self.id}: {e}")
-
-            charger.last_heartbeat = _utcnow()
-            charger.status = 'online'  # Update status to online when we receive StatusNotification
-            
-            # Handle faults
-            if error_code and error_code != 'NoError':
-                fault_type_map = {
-                    'OverCurrentFailure': 'overcurrent',
-                    'GroundFailure': 'ground_fault',
-                    'OtherError': 'cp_error'
-                }
-                fault_type = fault_type_map.get(error_code, 'cp_error')
-                
-                # Check if fault already exists and is not cleared
-                existing_fault = self.db.query(Fault).filter(
-                    Fault.charger_id == charger.id,
-                    Fault.fault_type == fault_type,
-                    Fault.cleared == False
-                ).first()
-                
-                if not existing_fault:
-                    fault = Fault(
-                        charger_id=charger.id,
-                        fault_type=fault_type,
-                        message=f"Error code: {error_code}, Status: {status}",
-                        timestamp=_utcnow()
-                    )
-                    self.db.add(fault)
-            
-            # Clear faults if status is not faulted
-            if status != 'Faulted' and error_code == 'NoError':
-                self.db.query(Fault).filter(
-                    Fault.charger_id == charger.id,
-                    Fault.cleared == False
-                ).update({'cleared': True, 'cleared_at': _utcnow()})
-            
-            try:
-                self.db.commit()
-            except Exception as e:
-                logger.error(f"Error committing StatusNotification for charger {self.id}: {e}", exc_info=True)
-                self.db.rollback()
-                # Don't fail the StatusNotification - just log the error
-                # Return success response to prevent charger from disconnecting
+            event_bus.publish(ChargerStatusChanged(self.id, {
+                "status": "online", "availability": applied.availability,
+                "connector_status": _connector_status_dict(applied.connector_status),
+            }))
+            if applied.fault:
+                event_bus.publish(FaultChanged(self.id, applied.fault, error_code=error_code, status=status))
 
             # Edge sync → push availability update to VPS
             if _sync:
                 _sync.sync_charger(
                     self.id,
                     status="online",
-                    availability=charger.availability,
+                    availability=applied.availability,
                     last_heartbeat=utc_now_iso_z(),
                 )
 
@@ -544,63 +1020,23 @@ class ChargePoint(cp):
             logger.error(f"Unexpected error in StatusNotification handler for charger {self.id}: {e}", exc_info=True)
             # Always return success response to prevent InternalError and charger disconnection
             # The error is logged but we don't want to disconnect the charger
-            try:
-                self.db.rollback()
-            except Exception:
-                pass
             return call_result.StatusNotification()
-    
+
     @on('StartTransaction')
     async def on_start_transaction(self, connector_id: int, id_tag: str, meter_start: int, timestamp: str, **kwargs):
         """Handle StartTransaction from charging station.
-        
+
         NOTE: In OCPP 1.6, the Central System (server) generates and assigns the
         transaction_id — the charger does NOT provide one in StartTransaction.req.
         We use the session's auto-increment DB id as the transaction_id.
         """
         try:
-            charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-            if charger:
-                start_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                
-                # Check if a pending/active session already exists (created by RemoteStart)
-                existing_session = self.db.query(ChargingSession).filter(
-                    ChargingSession.charger_id == charger.id,
-                    ChargingSession.status.in_(["pending", "active"])
-                ).order_by(desc(ChargingSession.start_time)).first()
-                
-                if existing_session:
-                    existing_session.status = "active"
-                    existing_session.start_time = start_dt
-                    existing_session.connector_id = connector_id
-                    existing_session.meter_start = meter_start if meter_start is not None else existing_session.meter_start
-                    if not existing_session.user_id or existing_session.user_id in ("LOCAL_CHARGING", "DASHBOARD_USER"):
-                        existing_session.user_id = id_tag
-                    # Assign transaction_id from DB id if not already a valid one
-                    if not existing_session.transaction_id or existing_session.transaction_id <= 0:
-                        self.db.flush()
-                        existing_session.transaction_id = existing_session.id
-                    transaction_id = existing_session.transaction_id
-                else:
-                    # New session — flush to get auto-increment id, use it as transaction_id
-                    session = ChargingSession(
-                        charger_id=charger.id,
-                        transaction_id=0,  # placeholder; will be replaced with DB id below
-                        connector_id=connector_id,
-                        start_time=start_dt,
-                        status="active",
-                        user_id=id_tag,
-                        meter_start=meter_start,
-                    )
-                    self.db.add(session)
-                    self.db.flush()  # populate session.id
-                    session.transaction_id = session.id
-                    transaction_id = session.transaction_id
-                
-                charger.availability = "charging"
-                charger.status = "online"
-                self.db.commit()
-
+            start_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            row = await self.charger_row()
+            if row is not None:
+                transaction_id = await run_db(
+                    _persist_start_transaction, row.id, connector_id, id_tag, meter_start, start_dt,
+                )
                 # Edge sync → push new session to VPS
                 if _sync:
                     _sync.sync_session_start(
@@ -613,27 +1049,26 @@ class ChargePoint(cp):
                     )
 
                 logger.info(f"Charger {self.id} started charging — assigned transaction_id={transaction_id}")
-                
+                event_bus.publish(SessionStarted(
+                    self.id, transaction_id=transaction_id, connector_id=connector_id,
+                ))
+
                 return call_result.StartTransaction(
                     transaction_id=transaction_id,
                     id_tag_info={'status': AuthorizationStatus.accepted}
                 )
-            
+
             return call_result.StartTransaction(
                 transaction_id=0,
                 id_tag_info={'status': AuthorizationStatus.invalid}
             )
         except Exception as e:
             logger.error(f"Error in StartTransaction handler for {self.id}: {e}", exc_info=True)
-            try:
-                self.db.rollback()
-            except Exception:
-                pass
             return call_result.StartTransaction(
                 transaction_id=0,
                 id_tag_info={'status': AuthorizationStatus.accepted}
             )
-    
+
     @on('StopTransaction')
     async def on_stop_transaction(self, transaction_id: int, id_tag: str, meter_stop: int, timestamp: str, **kwargs):
         """Handle StopTransaction from charging station.
@@ -641,331 +1076,126 @@ class ChargePoint(cp):
         """
         logger.info(f"StopTransaction from {self.id}: transaction {transaction_id}, meter_stop={meter_stop}")
         try:
-            session = self.db.query(ChargingSession).filter(
-                ChargingSession.transaction_id == transaction_id
-            ).first()
-            
-            if session:
-                session.stop_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                session.status = "completed"
-                session.meter_stop = meter_stop
-                session.stop_reason = kwargs.get("reason")
-
-                # Use meter_stop for billing accuracy — OCPP spec: meter_stop is authoritative Wh at session end
-                if meter_stop is not None:
-                    if session.meter_start is not None:
-                        session.energy_consumed = (meter_stop - session.meter_start) / 1000.0  # Wh → kWh
-                    else:
-                        session.energy_consumed = meter_stop / 1000.0  # Fallback: treat as session delta
-                    logger.info(f"Session {transaction_id}: energy={session.energy_consumed:.3f} kWh (meter_stop={meter_stop} Wh)")
-                # Else keep energy_consumed from MeterValues stream
-
-                self.db.commit()
+            stop_dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            stopped = await run_db(
+                _persist_stop_transaction, self.id, transaction_id, id_tag, meter_stop, stop_dt,
+                kwargs.get("reason"),
+            )
+
+            if stopped:
+                event_bus.publish(SessionStopped(
+                    self.id, transaction_id=transaction_id, energy_consumed=stopped.energy_consumed,
+                ))
 
                 # Edge sync → push completed session to VPS
                 if _sync:
                     _sync.sync_session_stop(
                         transaction_id,
-                        stop_time=session.stop_time.isoformat(),
+                        stop_time=stopped.stop_time.isoformat(),
                         meter_stop=meter_stop,
-                        energy_consumed=session.energy_consumed,
+                        energy_consumed=stopped.energy_consumed,
                         stop_reason=kwargs.get("reason"),
                     )
 
-                # Update charger availability
-                charger = self.db.query(Charger).filter(Charger.id == session.charger_id).first()
-                if charger:
-                    charger.availability = "available"
-                    self.db.commit()
-
-                # ── Idle-fee + refund settlement ──────────────────────────
-                # If charger has idle_fee enabled and we have a hold_amount on
-                # this session, compute energy cost + idle fee, then mark the
-                # refund as pending. Actual TNG refund call happens in Phase 5.
-                try:
-                    if charger and charger.idle_fee_enabled and session.hold_amount_rm:
-                        tariff = float(charger.tariff_per_kwh or 0.10)
-                        kwh = float(session.energy_consumed or 0)
-                        energy_cost = round(kwh * tariff, 2)
-
-                        # Idle minutes accrued past grace
-                        idle_min = 0
-                        idle_fee = 0.0
-                        if session.idle_started_at and session.stop_time:
-                            elapsed = (session.stop_time - session.idle_started_at).total_seconds() / 60.0
-                            past_grace = max(0.0, elapsed - float(charger.idle_grace_minutes or 0))
-                            idle_min = int(past_grace)
-                            idle_fee = round(idle_min * float(charger.idle_fee_per_min or 0), 2)
-
-                        hold = float(session.hold_amount_rm)
-                        total = energy_cost + idle_fee
-                        # Cap actual at hold (auto-stop should have prevented overrun)
-                        if total > hold:
-                            logger.warning(
-                                f"[idle-fee] session {transaction_id}: total {total} > hold {hold}, "
-                                f"capping refund at 0"
-                            )
-                            total = hold
-                        refund = round(hold - total, 2)
-
-                        session.idle_minutes = idle_min
-                        session.idle_fee_amount = Decimal(str(idle_fee))
-                        session.refund_amount = Decimal(str(refund))
-                        session.refund_status = "pending" if refund > 0 else "not_required"
+                if stopped.invoice:
+                    try:
+                        # Local import so module load order doesn't matter
+                        from email_service import send_charging_invoice
+                        asyncio.create_task(send_charging_invoice(**stopped.invoice))
                         logger.info(
-                            f"[idle-fee] session {transaction_id} settled: "
-                            f"energy={energy_cost} idle={idle_fee} ({idle_min}min) "
-                            f"refund={refund} of hold={hold}"
-                        )
-                        self.db.commit()
-                except Exception as e:
-                    logger.error(f"[idle-fee] settlement failed for session {transaction_id}: {e}", exc_info=True)
-
-                # Quick-pay / terminal-kiosk post-charge invoice email.
-                # Used to correlate via id_tag="PAY{txn.id}", but the kiosk now
-                # uses the whitelisted "DASHBOARD_USER" tag (to satisfy chargers
-                # like DC3001 that gate on LocalAuthList). Fall back to charger_id
-                # + recency to find the originating payment.
-                try:
-                    txn = None
-                    if id_tag and id_tag.startswith("PAY") and id_tag[3:].isdigit():
-                        # Legacy path — still supported for any charger that
-                        # accepts dynamic tags.
-                        txn = self.db.query(PaymentTransaction).filter(
-                            PaymentTransaction.id == int(id_tag[3:])
-                        ).first()
-                    if not txn and charger:
-                        # Recency-based lookup: most recent paid charge_payment
-                        # txn for this charger. session.start_time is MYT-naive
-                        # but paid_at is UTC-naive — to avoid an 8-hour drift
-                        # we just take the latest txn in the last 12 hours
-                        # using UTC (paid_at's native reference) as the anchor.
-                        cutoff = _utcnow() - timedelta(hours=12)
-                        txn = (
-                            self.db.query(PaymentTransaction)
-                            .filter(
-                                PaymentTransaction.charger_id == charger.charge_point_id,
-                                PaymentTransaction.status == "success",
-                                PaymentTransaction.purpose == "charge_payment",
-                                PaymentTransaction.paid_at >= cutoff,
-                            )
-                            .order_by(PaymentTransaction.id.desc())
-                            .first()
+                            f"[invoice] queued post-charge email → {stopped.invoice['to_email']} "
+                            f"(txn {stopped.invoice['transaction_ref']}, {stopped.energy_consumed:.3f} kWh)"
                         )
-                    if True:
-                        recipient = (txn.customer_email or txn.user_email) if txn else None
-                        if txn and recipient and charger:
-                            # Compute duration string
-                            if session.start_time and session.stop_time:
-                                delta = session.stop_time - session.start_time
-                                total = int(delta.total_seconds())
-                                hh, rem = divmod(total, 3600)
-                                mm, ss = divmod(rem, 60)
-                                dur_str = f"{hh:02d}:{mm:02d}:{ss:02d}"
-                            else:
-                                dur_str = "—"
-
-                            # Local import so module load order doesn't matter
-                            from email_service import send_charging_invoice
-                            # Deposit/refund flow extras (terminal kiosk).
-                            # Only set when this session went through the
-                            # hold/refund flow; legacy quick-pay sessions
-                            # leave these None → email shows 'Amount paid'.
-                            hold_amt = float(session.hold_amount_rm) if session.hold_amount_rm else None
-                            energy_cost = None
-                            idle_min = int(session.idle_minutes or 0)
-                            idle_fee = float(session.idle_fee_amount or 0)
-                            refund_amt = float(session.refund_amount) if session.refund_amount is not None else None
-                            if hold_amt is not None:
-                                tariff = float(charger.tariff_per_kwh or 0.10) if charger else 0.10
-                                energy_cost = round(float(session.energy_consumed or 0) * tariff, 2)
-                            asyncio.create_task(send_charging_invoice(
-                                to_email=recipient,
-                                transaction_ref=txn.transaction_ref,
-                                charger_id=charger.charge_point_id,
-                                connector_id=int(session.connector_id or txn.connector_id or 1),
-                                started_at_str=session.start_time.strftime("%Y-%m-%d %H:%M:%S") if session.start_time else "—",
-                                stopped_at_str=session.stop_time.strftime("%Y-%m-%d %H:%M:%S") if session.stop_time else "—",
-                                duration_str=dur_str,
-                                energy_kwh=float(session.energy_consumed or 0),
-                                amount_paid=float(txn.amount or 0),
-                                stop_reason=kwargs.get("reason") or "Local",
-                                hold_amount=hold_amt,
-                                energy_cost=energy_cost,
-                                idle_minutes=idle_min if idle_min > 0 else None,
-                                idle_fee=idle_fee if idle_fee > 0 else None,
-                                refund_amount=refund_amt,
-                            ))
-                            logger.info(
-                                f"[invoice] queued post-charge email → {recipient} "
-                                f"(txn {txn.transaction_ref}, {session.energy_consumed:.3f} kWh)"
-                            )
-                except Exception as e:
-                    logger.error(f"[invoice] failed to send post-charge email: {e}", exc_info=True)
+                    except Exception as e:
+                        logger.error(f"[invoice] failed to send post-charge email: {e}", exc_info=True)
 
             return call_result.StopTransaction(
                 id_tag_info={'status': AuthorizationStatus.accepted}
             )
         except Exception as e:
             logger.error(f"Error in StopTransaction handler for {self.id}: {e}", exc_info=True)
-            try:
-                self.db.rollback()
-            except Exception:
-                pass
             return call_result.StopTransaction(
                 id_tag_info={'status': AuthorizationStatus.accepted}
             )
-    
+
     @on('MeterValues')
     async def on_meter_values(self, connector_id: int, meter_value: list, transaction_id: int = None, **kwargs):
         """Handle MeterValues from charging station"""
-        charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-        if not charger:
-            return call_result.MeterValues()
-        
+        samples = []
         for mv in meter_value:
-            timestamp = datetime.fromisoformat(mv['timestamp'].replace('Z', '+00:00'))
             # python-ocpp converts camelCase → snake_case, so sampledValue → sampled_value
-            sampled_value = mv.get('sampled_value', mv.get('sampledValue', []))
-            
-            voltage = None
-            current = None
-            power = None
-            total_kwh = None
-            
-            for sv in sampled_value:
-                try:
-                    value = float(sv.get('value', 0) or 0)
-                except (ValueError, TypeError):
-                    value = 0.0
-                measurand = sv.get('measurand', '')
-                # OCPP 1.6: chargers may send power in 'W' or 'kW', energy in
-                # 'Wh' or 'kWh'. Respect the unit field so we always store in
-                # canonical SI prefix expected by the UI (power=kW, energy=kWh).
-                unit = (sv.get('unit') or '').strip()
-
-                if measurand == 'Voltage':
-                    voltage = value
-                elif measurand == 'Current.Import':
-                    current = value
-                elif measurand == 'Power.Active.Import':
-                    # Canonicalise to kW. If unit absent, infer from magnitude
-                    # (anything >1000 is almost certainly watts).
-                    if unit.lower() == 'w' or (not unit and value > 1000):
-                        power = value / 1000.0
-                    else:
-                        power = value  # already kW
-                elif measurand == 'Energy.Active.Import.Register':
-                    # Canonicalise to kWh.
-                    if unit.lower() == 'kwh':
-                        total_kwh = value
-                    else:
-                        total_kwh = value / 1000.0  # Wh → kWh
-            
-            meter_value_obj = MeterValue(
-                charger_id=charger.id,
-                transaction_id=transaction_id,
-                timestamp=timestamp,
-                voltage=voltage,
-                current=current,
-                power=power,
-                total_kwh=total_kwh
-            )
-            self.db.add(meter_value_obj)
-            
-            # Update session energy consumed
-            if transaction_id:
-                session = self.db.query(ChargingSession).filter(
-                    ChargingSession.transaction_id == transaction_id
-                ).first()
-                if session and total_kwh:
-                    session.energy_consumed = total_kwh
-                    self.db.commit()
-
-                    # Auto-stop on quota: quick-pay sessions have a kWh quota
-                    # (= amount_paid / tariff). Once delivered ≥ quota, fire
-                    # RemoteStopTransaction so the user never consumes more than
-                    # what they paid for. Idempotent via session.auto_stopped.
-                    try:
-                        kwh_limit = session.energy_kwh_limit
-                        if (
-                            kwh_limit is not None
-                            and not session.auto_stopped
-                            and session.status == "active"
-                        ):
-                            # Energy delivered = current register reading − reading at start.
-                            # meter_start is in Wh, total_kwh is in kWh.
-                            start_kwh = (session.meter_start or 0) / 1000.0
-                            delivered_kwh = max(0.0, total_kwh - start_kwh)
-                            if delivered_kwh >= float(kwh_limit):
-                                session.auto_stopped = True
-                                session.stop_reason = "QuotaReached"
-                                self.db.commit()
-                                logger.info(
-                                    f"[auto-stop] {self.id} txn={transaction_id} "
-                                    f"delivered={delivered_kwh:.3f} kWh ≥ quota={kwh_limit} kWh "
-                                    f"→ firing RemoteStopTransaction"
-                                )
-                                # Fire RemoteStop async — don't block MeterValues response.
-                                # python-ocpp call() resolves on charger ack; if it raises
-                                # we keep auto_stopped=True (charger will catch up at next
-                                # local stop or we'll retry via admin).
-                                try:
-                                    await self.call(
-                                        call.RemoteStopTransaction(
-                                            transaction_id=transaction_id
-                                        )
-                                    )
-                                except Exception as stop_err:
-                                    logger.error(
-                                        f"[auto-stop] RemoteStop failed for {self.id} "
-                                        f"txn={transaction_id}: {stop_err}",
-                                        exc_info=True,
-                                    )
-                    except Exception as quota_err:
-                        logger.error(
-                            f"[auto-stop] quota check failed for {self.id} "
-                            f"txn={transaction_id}: {quota_err}",
-                            exc_info=True,
-                        )
-
-        self.db.commit()
+            sample = _parse_sampled_values(mv.get('sampled_value', mv.get('sampledValue', [])))
+            sample["timestamp"] = datetime.fromisoformat(mv['timestamp'].replace('Z', '+00:00'))
+            samples.append(sample)
+
+        # Energy register is monotonic — the last non-empty reading in the
+        # message is the one that counts for the session and the quota.
+        latest_kwh = next((s["total_kwh"] for s in reversed(samples) if s["total_kwh"]), None)
+        row = await self.charger_row()
+        if row is None:
+            return call_result.MeterValues()
+        remote_stop = await run_db(
+            _persist_meter_values, self.id, row.id, transaction_id, latest_kwh,
+            samples[-1] if samples else None,
+        )
+
+        await meter_buffer.put([
+            dict(sample, charger_id=row.id, transaction_id=transaction_id)
+            for sample in samples
+        ])
+
+        if transaction_id and samples:
+            last = samples[-1]
+            event_bus.publish(MeterSample(
+                self.id, transaction_id=transaction_id, connector_id=connector_id,
+                energy_kwh=latest_kwh, power=last["power"],
+                voltage=last["voltage"], current=last["current"],
+            ))
+
+        if remote_stop:
+            # Fire RemoteStop as a task — don't block the MeterValues response.
+            # Awaiting it here deadlocks: python-ocpp routes inbound messages
+            # one at a time, so the charger's RemoteStop.conf can't be read
+            # until this handler returns.
+            asyncio.create_task(self._auto_stop(transaction_id))
 
         # Edge sync → push latest meter sample to VPS (only last sample per MeterValues message)
         if _sync and meter_value:
-            last_mv = meter_value[-1]
-            sampled = last_mv.get('sampled_value', last_mv.get('sampledValue', []))
-            _v = _c = _p = _e = None
-            for sv in sampled:
-                try:
-                    val = float(sv.get('value', 0) or 0)
-                except (ValueError, TypeError):
-                    val = 0.0
-                m = sv.get('measurand', '')
-                u = (sv.get('unit') or '').strip().lower()
-                if m == 'Voltage':                          _v = val
-                elif m == 'Current.Import':                 _c = val
-                elif m == 'Power.Active.Import':
-                    # Normalise to kW (same logic as primary handler above).
-                    _p = val / 1000.0 if (u == 'w' or (not u and val > 1000)) else val
-                elif m == 'Energy.Active.Import.Register':
-                    _e = val if u == 'kwh' else val / 1000.0
+            last = samples[-1]
             _sync.sync_meter_value(
                 self.id,
                 transaction_id=transaction_id,
-                timestamp=last_mv.get('timestamp', utc_now_iso_z()),
-                voltage=_v, current=_c, power=_p, total_kwh=_e,
+                timestamp=meter_value[-1].get('timestamp', utc_now_iso_z()),
+                voltage=last["voltage"], current=last["current"],
+                power=last["power"], total_kwh=last["total_kwh"],
             )
 
         return call_result.MeterValues()
 
+    async def _auto_stop(self, transaction_id: int) -> None:
+        """RemoteStop for a session that hit its kWh quota. python-ocpp call()
+        resolves on charger ack; if it raises we keep auto_stopped=True
+        (charger will catch up at next local stop or we'll retry via admin)."""
+        try:
+            await self.call(
+                call.RemoteStopTransaction(
+                    transaction_id=transaction_id
+                )
+            )
+        except Exception as stop_err:
+            logger.error(
+                f"[auto-stop] RemoteStop failed for {self.id} "
+                f"txn={transaction_id}: {stop_err}",
+                exc_info=True,
+            )
+
     @on('FirmwareStatusNotification')
     async def on_firmware_status_notification(self, status: str, **kwargs):
         """Handle FirmwareStatusNotification from charging station."""
         logger.info(f"FirmwareStatusNotification from {self.id}: status={status}")
         try:
-            charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-            fw_version = charger.firmware_version if charger else ""
+            row = await self.charger_row()
+            fw_version = row.firmware_version if row else ""
             if status == "Installed":
                 logger.info(f"Charger {self.id} firmware installed successfully")
             _add_firmware_event(self.id, status, fw_version)
@@ -978,7 +1208,7 @@ class ChargePoint(cp):
         """Handle DiagnosticsStatusNotification from charging station."""
         logger.info(f"DiagnosticsStatusNotification from {self.id}: status={status}")
         return call_result.DiagnosticsStatusNotification()
-    
+
     @on('Heartbeat')
     async def on_heartbeat(self):
         """Handle Heartbeat from charging station"""
@@ -998,30 +1228,21 @@ class ChargePoint(cp):
                 pass
             return call_result.Heartbeat(current_time=utc_now_iso_z())
         try:
-            charger = self.db.query(Charger).filter(Charger.charge_point_id == self.id).first()
-            if charger:
-                charger.last_heartbeat = _utcnow()
-                charger.status = "online"
-                try:
-                    self.db.commit()
-                    logger.debug(f"Heartbeat received from {self.id}, status updated to online")
-                    # Edge sync → lightweight heartbeat ping to VPS
-                    if _sync:
-                        _sync.sync_charger(self.id, status="online", last_heartbeat=utc_now_iso_z())
-                except Exception as e:
-                    logger.error(f"Error committing heartbeat for charger {self.id}: {e}", exc_info=True)
-                    self.db.rollback()
+            # Liveness only — recorded in memory and written in bulk by the
+            # coalescer (heartbeat_coalescer.py), no per-heartbeat commit.
+            if await self.charger_row() is not None:
+                heartbeat_coalescer.touch(self.id)
+                logger.debug(f"Heartbeat received from {self.id}, status updated to online")
+                # Edge sync → lightweight heartbeat ping to VPS
+                if _sync:
+                    _sync.sync_charger(self.id, status="online", last_heartbeat=utc_now_iso_z())
             else:
                 logger.warning(f"Heartbeat received from unknown charger {self.id}")
-            
+
             return call_result.Heartbeat(current_time=utc_now_iso_z())
         except Exception as e:
             logger.error(f"Unexpected error in Heartbeat handler for charger {self.id}: {e}", exc_info=True)
             # Always return success response to prevent InternalError
-            try:
-                self.db.rollback()
-            except Exception:
-                pass
             return call_result.Heartbeat(current_time=utc_now_iso_z())
 
     @on('DataTransfer')
@@ -1463,9 +1684,9 @@ async def on_connect(websocket):
         # - OCPP_REQUIRE_AUTH=1 (default): token required.
         # - OCPP_SHARED_TOKEN=...      : one shared token for all chargers.
         # - OCPP_CHARGER_TOKENS=CP1:t1,CP2:t2 : per-charger token map.
-        require_auth = os.getenv("OCPP_REQUIRE_AUTH", "1").strip().lower() not in ("0", "false", "no")
-        shared_token = os.getenv("OCPP_SHARED_TOKEN", "").strip()
-        charger_tokens = _parse_token_map(os.getenv("OCPP_CHARGER_TOKENS", ""))
+        # - OCPP_CHARGER_TOKENS_FILE   : same map, hot-reloaded on change.
+        # Parsed once in ocpp_admission, not on every connect.
+        auth = admission.auth_config()
         provided_token = _extract_ws_token(websocket, raw_path)
 
         # Fallback: try full request target if path lacks query (some clients send it separately)
@@ -1476,9 +1697,10 @@ async def on_connect(websocket):
             elif hasattr(req, "uri"):
                 provided_token = _extract_ws_token(websocket, getattr(req, "uri", "") or "")
 
-        if require_auth:
-            expected_token = charger_tokens.get(charge_point_id) or shared_token
+        if auth.require_auth:
+            expected_token = auth.expected_token(charge_point_id)
             if not expected_token:
+                admission.note_auth_rejected()
                 logger.warning(
                     "Rejected charger %s: OCPP auth enabled but no token configured (set OCPP_SHARED_TOKEN or OCPP_CHARGER_TOKENS)",
                     charge_point_id,
@@ -1486,6 +1708,7 @@ async def on_connect(websocket):
                 await websocket.close(code=1008, reason="Charger token not configured")
                 return
             if not provided_token or not secrets.compare_digest(provided_token, expected_token):
+                admission.note_auth_rejected()
                 # Debug: log request attributes to diagnose token extraction
                 req = getattr(websocket, "request", None)
                 req_info = ""
@@ -1497,24 +1720,33 @@ async def on_connect(websocket):
                 )
                 await websocket.close(code=1008, reason="Invalid charger token")
                 return
-        
+
+        # Reconnect-storm gate: waits for this handshake's slot in the
+        # connection rate, or refuses it so the charger retries later.
+        # After the (in-memory) token check, so rejected handshakes don't
+        # spend the rate that real chargers need.
+        if not await admission.admit(charge_point_id):
+            await websocket.close(code=1013, reason="Server busy, retry later")
+            return
+
         logger.info(f"🔌 New OCPP connection from charge point: {charge_point_id}")
         
         # Update last_heartbeat immediately for existing chargers (before BootNotification)
+        charger_row = None
         try:
-            db = SessionLocal()
-            charger = db.query(Charger).filter(Charger.charge_point_id == charge_point_id).first()
-            if charger:
-                charger.last_heartbeat = _utcnow()
-                charger.status = "online"
-                db.commit()
+            async with admission.boot_slot() as got_slot:
+                # No slot in time: skip the preload, the first message loads the row.
+                if got_slot:
+                    charger_row = await run_db(_load_charger_row, charge_point_id)
+            if charger_row is not None:
+                heartbeat_coalescer.touch(charge_point_id)
                 logger.info(f"Updated last_heartbeat for {charge_point_id} on connect")
-            db.close()
         except Exception as e:
             logger.warning(f"Could not update heartbeat on connect for {charge_point_id}: {e}")
         
         # Create charge point instance and start handling messages
         charge_point = ChargePoint(charge_point_id, websocket)
+        charge_point.cache_charger_row(charger_row)
 
         # If a previous connection for this charger is still in the pool
         # (e.g. firmware opened a second WS without closing the first), tear
@@ -1543,7 +1775,13 @@ async def on_connect(websocket):
         # Track the task that owns this connection so we can cancel it on
         # admin force-reconnect (ws.close() alone leaves a zombie loop).
         connection_tasks[charge_point_id] = asyncio.current_task()
+        liveness.connected(charge_point_id, charge_point)
         logger.info(f"✅ Charge point {charge_point_id} registered. Total active connections: {len(active_charge_points)}")
+        try:
+            await connection_registry.claim(charge_point_id)
+        except Exception as e:
+            logger.error(f"[on_connect] registry claim failed for {charge_point_id}: {e}")
+        event_bus.publish(ChargerStatusChanged(charge_point_id, {"ws_connected": True}))
 
         try:
             # Start handling OCPP messages from charger
@@ -1560,9 +1798,18 @@ async def on_connect(websocket):
             logger.error(f"Error in charge point {charge_point_id} message handling: {e}", exc_info=True)
             # Log error but let connection close naturally
         finally:
-            # Remove from active connections when disconnected
-            active_charge_points.pop(charge_point_id, None)
-            connection_tasks.pop(charge_point_id, None)
+            # Remove from active connections when disconnected — unless a newer
+            # connection for the same charger already replaced this one.
+            superseded = active_charge_points.get(charge_point_id) not in (None, charge_point)
+            if not superseded:
+                active_charge_points.pop(charge_point_id, None)
+                connection_tasks.pop(charge_point_id, None)
+                liveness.disconnected(charge_point_id, charge_point)
+                try:
+                    await connection_registry.release(charge_point_id)
+                except Exception as e:
+                    logger.error(f"Registry release failed for {charge_point_id}: {e}")
+                event_bus.publish(ChargerStatusChanged(charge_point_id, {"ws_connected": False}))
             _mismatch_strikes.pop(charge_point_id, None)
             logger.info(f"❌ Charge point {charge_point_id} disconnected. Remaining connections: {len(active_charge_points)}")
             
@@ -1572,27 +1819,12 @@ async def on_connect(websocket):
             # the charger is actively communicating (StatusNotification) moments before disconnecting.
             #
             # We therefore do NOT force status=offline here. Instead, we rely on:
-            # - `last_heartbeat` (updated by Heartbeat/StatusNotification handlers)
+            # - `last_heartbeat` (Heartbeat/StatusNotification, via heartbeat_coalescer)
             # - API-side "effective status" computation (based on heartbeat age)
             #
             # This makes the dashboard reflect reality better under flaky WS behavior.
             try:
-                db = SessionLocal()
-                charger = db.query(Charger).filter(Charger.charge_point_id == charge_point_id).first()
-                if charger:
-                    # NOTE: Reverted to leave status unchanged on disconnect.
-                    # Marking offline here was correlated with firmware update
-                    # failures (chargers download but never report Installed).
-                    # During firmware reboot the websocket drops briefly — we
-                    # don't want any DB commit that could race with the in-flight
-                    # static file download for the firmware bin.
-                    # Heartbeat-based offline detection (separate background job)
-                    # handles truly-offline chargers.
-                    logger.info(
-                        f"Charger {charge_point_id} disconnected; leaving status/availability unchanged "
-                        f"(status={charger.status}, availability={charger.availability}, last_heartbeat={charger.last_heartbeat})"
-                    )
-                db.close()
+                await run_db(_log_charger_disconnect, charge_point_id)
             except Exception as e:
                 logger.error(f"Error updating charger status on disconnect: {e}", exc_info=True)
     except UnicodeDecodeError as e:
@@ -1609,9 +1841,65 @@ async def on_connect(websocket):
             pass
 
 
-def get_active_charge_point(charge_point_id: str) -> ChargePoint:
-    """Get active charge point connection"""
-    return active_charge_points.get(charge_point_id)
+def get_active_charge_point(charge_point_id: str):
+    """Get active charge point connection.
+
+    Returns the local ChargePoint when this node holds the socket, a
+    RemoteChargePoint relay when another node does (ocpp_registry.py),
+    or None when the charger is not connected anywhere.
+    """
+    charge_point = active_charge_points.get(charge_point_id)
+    if charge_point is not None:
+        return charge_point
+    owner = connection_registry.owner(charge_point_id)
+    if owner is not None and not owner.is_local:
+        return RemoteChargePoint(charge_point_id, owner)
+    return None
+
+
+def connected_charge_point_ids() -> set:
+    """Every charger with a live WebSocket on any node (one registry read)."""
+    return set(active_charge_points) | connection_registry.connected_ids()
+
+
+def invalidate_charger_cache(charge_point_id: str) -> None:
+    """Drop the connected ChargePoint's cached chargers row so its next
+    message reloads it. Call after any admin write to the charger row.
+    Safe from the API thread — it only swaps attributes."""
+    charge_point = active_charge_points.get(charge_point_id)
+    if charge_point is not None:
+        charge_point.drop_charger_cache()
+        return
+    owner = connection_registry.owner(charge_point_id)
+    if owner is None or owner.is_local:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # no loop to relay from; the owner's cache expires on reconnect
+    loop.create_task(RemoteChargePoint(charge_point_id, owner).relay("drop_charger_cache", [], {}))
+
+
+async def run_relayed_command(charge_point_id: str, command: str,
+                              args: List[Any], kwargs: Dict[str, Any]) -> dict:
+    """Execute a command a peer node relayed to us (ocpp_registry.RemoteChargePoint).
+
+    Only touches sockets held by this process — never relays a second hop.
+    Returns {"connected": bool, "result": JSON-safe OCPP response}.
+    Raises ValueError for commands outside the relay whitelist.
+    """
+    if command not in RELAYABLE_COMMANDS | RELAY_CONTROL_COMMANDS:
+        raise ValueError(f"Command '{command}' cannot be relayed")
+    if command == "force_close":
+        return {"connected": True, "result": await force_close_charge_point(charge_point_id)}
+    charge_point = active_charge_points.get(charge_point_id)
+    if charge_point is None:
+        return {"connected": False, "result": None}
+    if command == "drop_charger_cache":
+        charge_point.drop_charger_cache()
+        return {"connected": True, "result": None}
+    result = await getattr(charge_point, command)(*args, **kwargs)
+    return {"connected": True, "result": serialize_ocpp_result(result)}
 
 
 async def force_close_charge_point(charge_point_id: str) -> dict:
@@ -1626,6 +1914,13 @@ async def force_close_charge_point(charge_point_id: str) -> dict:
     """
     cp = active_charge_points.get(charge_point_id)
     task = connection_tasks.get(charge_point_id)
+    if cp is None and task is None:
+        owner = connection_registry.owner(charge_point_id)
+        if owner is not None and not owner.is_local:
+            resp = await RemoteChargePoint(charge_point_id, owner).relay("force_close", [], {})
+            if resp is not None:
+                return vars(resp)
+            return {"closed_socket": False, "task_cancelled": False, "remaining_active": len(active_charge_points)}
     closed = False
     # 1) Close the WebSocket from our side (sends TCP FIN/RST to charger).
     if cp is not None:
@@ -1654,92 +1949,139 @@ async def force_close_charge_point(charge_point_id: str) -> dict:
     active_charge_points.pop(charge_point_id, None)
     connection_tasks.pop(charge_point_id, None)
     _mismatch_strikes.pop(charge_point_id, None)
+    if cp is not None:
+        liveness.disconnected(charge_point_id, cp)
     # 4) Reset DB flag so the next reconnect is treated as fresh boot.
     try:
-        db = SessionLocal()
-        charger = db.query(Charger).filter(Charger.charge_point_id == charge_point_id).first()
-        if charger:
-            charger.status = "offline"
-            db.commit()
-        db.close()
+        await run_db(_mark_charger_offline, charge_point_id)
     except Exception as e:
         logger.error(f"[force-reconnect] DB update failed for {charge_point_id}: {e}")
     logger.info(f"[force-reconnect] {charge_point_id}: closed={closed} task_cancelled={task is not None}")
     return {"closed_socket": closed, "task_cancelled": task is not None, "remaining_active": len(active_charge_points)}
 
 
-async def ocpp_state_healer_loop(interval_seconds: int = 60):
-    """Background task — every `interval_seconds`, compare DB heartbeat to
-    in-memory WebSocket pool and fix mismatches:
+# Case A strikes before the healer force-reconnects (≈ 2 min at 60s).
+AUTO_RECOVERY_THRESHOLD = 2
+
+# Reported under "state_healer" by /api/admin/ocpp/metrics.
+healer_stats: Dict[str, Any] = {
+    "cycles": 0, "zombies_closed": 0, "mismatch_reconnects": 0,
+    "last_suspects": 0, "last_cycle_ms": 0.0,
+}
+
+
+def _load_heartbeats(db, charge_point_ids: List[str]) -> Dict[str, Optional[datetime]]:
+    """DB last_heartbeat of just these chargers (missing = not registered)."""
+    return dict(
+        db.query(Charger.charge_point_id, Charger.last_heartbeat)
+        .filter(Charger.charge_point_id.in_(charge_point_ids))
+        .all()
+    )
+
+
+def _recently_online_ids(db, since: datetime) -> List[str]:
+    return [cp_id for (cp_id,) in db.query(Charger.charge_point_id).filter(Charger.last_heartbeat >= since)]
+
+
+async def heal_ocpp_state(now: Optional[datetime] = None) -> Tuple[int, int]:
+    """One healer cycle. Work is proportional to the chargers that changed:
+    expired zombie deadlines (Case B) and Case A suspects from ocpp_liveness,
+    whose heartbeats are read in one query. Returns (mismatches, cleaned)."""
+    started = time.monotonic()
+    now = now or _utcnow()
+    cleaned = 0
+
+    # Case B — zombie socket: still in the pool, silent for STALE_AFTER.
+    for cp_id in liveness.due_zombies(now):
+        if cp_id not in active_charge_points:
+            continue
+        last = liveness.last_message(cp_id)
+        silent = f"{(now - last).total_seconds():.0f}s" if last else "too long"
+        logger.warning(f"[ocpp-healer] {cp_id}: in pool but silent for {silent} — closing zombie socket")
+        await force_close_charge_point(cp_id)
+        cleaned += 1
+        healer_stats["zombies_closed"] += 1
+
+    # Case A — mismatch (heartbeat fresh but no socket). Could be a genuine
+    # race (charger reconnecting right now) — so we wait
+    # AUTO_RECOVERY_THRESHOLD consecutive healer cycles before intervening
+    # to avoid disturbing a healthy reconnect.
+    suspects = liveness.suspects()
+    mismatch_count = 0
+    if suspects:
+        heartbeats = await run_db(_load_heartbeats, list(suspects))
+        # Connected on any node — a charger held by a peer is not a mismatch.
+        connected = await asyncio.to_thread(connected_charge_point_ids)
+        fresh_cutoff = now - liveness.fresh_window
+        for cp_id in suspects:
+            hb = heartbeat_coalescer.effective(cp_id, heartbeats.get(cp_id))
+            if cp_id not in heartbeats or cp_id in connected or not hb or hb < fresh_cutoff:
+                # Consistent state — clear any pending strikes.
+                liveness.resolve(cp_id)
+                _mismatch_strikes.pop(cp_id, None)
+                continue
+            mismatch_count += 1
+            strikes = _mismatch_strikes.get(cp_id, 0) + 1
+            _mismatch_strikes[cp_id] = strikes
+            if strikes >= AUTO_RECOVERY_THRESHOLD:
+                logger.warning(
+                    f"[ocpp-healer] {cp_id}: mismatch persisted {strikes} cycles — auto force-reconnect"
+                )
+                try:
+                    await force_close_charge_point(cp_id)
+                    cleaned += 1
+                    healer_stats["mismatch_reconnects"] += 1
+                except Exception as e:
+                    logger.error(f"[ocpp-healer] auto-recovery failed for {cp_id}: {e}")
+                _mismatch_strikes.pop(cp_id, None)
+            else:
+                logger.warning(
+                    f"[ocpp-healer] {cp_id}: DB online but WS missing "
+                    f"(strike {strikes}/{AUTO_RECOVERY_THRESHOLD}) — watching"
+                )
+
+    healer_stats.update(
+        cycles=healer_stats["cycles"] + 1, last_suspects=len(suspects),
+        last_cycle_ms=round((time.monotonic() - started) * 1000, 1),
+    )
+    return mismatch_count, cleaned
+
+
+async def ocpp_state_healer_loop(interval_seconds: int = 60, seed: bool = True):
+    """Background task — every `interval_seconds`, reconcile DB heartbeat
+    with the WebSocket pool and fix mismatches:
 
-      Case A: DB last_heartbeat fresh (<5 min) but charger NOT in
-              active_charge_points → log warning, do NOTHING destructive
-              (heartbeat is the source of truth — if it's updating, the
-              socket IS alive somewhere; the pool just missed it).
+      Case A: DB last_heartbeat fresh (<5 min) but charger NOT connected
+              → watch for AUTO_RECOVERY_THRESHOLD cycles (could be a
+              reconnect in flight), then force-reconnect so the DB flag
+              is reset and the charger comes back through a fresh boot.
 
-      Case B: charger IS in active_charge_points but last_heartbeat
-              > 10 min ago → socket is zombie, close it. The charger's
-              retry loop will reconnect.
+      Case B: charger IS in active_charge_points but has sent nothing for
+              > 10 min → socket is zombie, close it. The charger's retry
+              loop will reconnect.
 
     This catches the 'DB online but RemoteStart says not connected'
-    confusion the admin saw without anyone having to SSH in.
+    confusion the admin saw without anyone having to SSH in. Candidates come
+    from ocpp_liveness (socket events), not from scanning the chargers table;
+    the only fleet-wide query is a one-off seed of recently-online chargers
+    on the first cycle, covering sockets lost in a restart.
+
+    liveness is fed by the process holding the sockets, so the loop runs
+    there: the API process in single-process mode, every worker with
+    OCPP_WORKERS > 1 (only worker 0 seeds, so the seed is not acted on N
+    times).
     """
     logger.info("OCPP state healer started (interval=%ds)", interval_seconds)
+    seeded = not seed
     while True:
         await asyncio.sleep(interval_seconds)
         try:
-            db = SessionLocal()
-            now = _utcnow()
-            fresh_cutoff = now - timedelta(minutes=5)
-            stale_cutoff = now - timedelta(minutes=10)
-
-            rows = db.query(Charger).all()
-            mismatch_count = 0
-            cleaned = 0
-            for c in rows:
-                hb = c.last_heartbeat
-                in_pool = c.charge_point_id in active_charge_points
-
-                # Case B — zombie socket
-                if in_pool and hb and hb < stale_cutoff:
-                    logger.warning(
-                        f"[ocpp-healer] {c.charge_point_id}: in pool but heartbeat "
-                        f"{(now - hb).total_seconds():.0f}s old — closing zombie socket"
-                    )
-                    await force_close_charge_point(c.charge_point_id)
-                    cleaned += 1
-                    continue
-
-                # Case A — mismatch (heartbeat fresh but no socket). Could be
-                # a genuine race (charger reconnecting right now) — so we wait
-                # AUTO_RECOVERY_THRESHOLD consecutive healer cycles before
-                # intervening to avoid disturbing a healthy reconnect.
-                if (not in_pool) and hb and hb >= fresh_cutoff:
-                    mismatch_count += 1
-                    strikes = _mismatch_strikes.get(c.charge_point_id, 0) + 1
-                    _mismatch_strikes[c.charge_point_id] = strikes
-                    AUTO_RECOVERY_THRESHOLD = 2  # ≈ 2 minutes at 60s interval
-                    if strikes >= AUTO_RECOVERY_THRESHOLD:
-                        logger.warning(
-                            f"[ocpp-healer] {c.charge_point_id}: mismatch persisted "
-                            f"{strikes} cycles — auto force-reconnect"
-                        )
-                        try:
-                            await force_close_charge_point(c.charge_point_id)
-                            cleaned += 1
-                        except Exception as e:
-                            logger.error(f"[ocpp-healer] auto-recovery failed for {c.charge_point_id}: {e}")
-                        _mismatch_strikes.pop(c.charge_point_id, None)
-                    else:
-                        logger.warning(
-                            f"[ocpp-healer] {c.charge_point_id}: DB online but WS missing "
-                            f"(strike {strikes}/{AUTO_RECOVERY_THRESHOLD}) — watching"
-                        )
-                else:
-                    # Consistent state — clear any pending strikes.
-                    _mismatch_strikes.pop(c.charge_point_id, None)
-
-            db.close()
+            if not seeded:
+                liveness.seed_suspects(
+                    await run_db(_recently_online_ids, _utcnow() - liveness.fresh_window)
+                )
+                seeded = True
+            mismatch_count, cleaned = await heal_ocpp_state()
             if mismatch_count or cleaned:
                 logger.info(
                     f"[ocpp-healer] cycle: {mismatch_count} mismatch(es), "
@@ -1749,188 +2091,152 @@ async def ocpp_state_healer_loop(interval_seconds: int = 60):
             logger.error(f"[ocpp-healer] loop error: {e}", exc_info=True)
 
 
+# Orphan sweep: sessions with no sample for this long on a charger that is
+# not connected anywhere are closed as "interrupted".
+ORPHAN_STALE_AFTER = timedelta(minutes=30)
+OCPP_ORPHAN_SWEEP_BATCH = max(10, int(os.getenv("OCPP_ORPHAN_SWEEP_BATCH", "500")))
+OCPP_ORPHAN_SWEEP_BUDGET_SECONDS = float(os.getenv("OCPP_ORPHAN_SWEEP_BUDGET_SECONDS", "5"))
+
+# Reported under "orphan_watchdog" by /api/admin/ocpp/metrics. resume_after_id
+# is where a sweep cut short by the time budget picks up next cycle.
+orphan_watchdog_stats: Dict[str, Any] = {
+    "sweeps": 0, "closed": 0, "last_scanned": 0, "last_closed": 0,
+    "last_sweep_ms": 0.0, "max_sweep_ms": 0.0, "last_sweep_at": None,
+    "budget_exhausted": 0, "resume_after_id": 0,
+}
+
+
+def _close_orphan_batch(db, after_id: int, connected: Set[str], now: datetime,
+                        limit: int = OCPP_ORPHAN_SWEEP_BATCH) -> Tuple[int, int, Optional[int]]:
+    """One keyset batch of the orphan sweep, in a fixed number of statements.
+
+    Candidates come from one SELECT joining sessions to their charger and
+    their latest-sample cache row; transactions without a cache row (history
+    from before the cache) are checked with one grouped MAX over meter_values.
+    Closure is a single UPDATE that re-checks status and recency, so a
+    StopTransaction or MeterValues landing mid-sweep wins. Returns
+    (scanned, closed, last_id); last_id is None once the table is exhausted."""
+    cutoff = now - ORPHAN_STALE_AFTER
+    latest = TransactionMeterLatest
+    rows = (
+        db.query(ChargingSession.id, ChargingSession.transaction_id, Charger.charge_point_id, latest.timestamp)
+        .outerjoin(Charger, Charger.id == ChargingSession.charger_id)
+        .outerjoin(latest, latest.transaction_id == ChargingSession.transaction_id)
+        .filter(
+            ChargingSession.status.in_(["active", "pending"]),
+            ChargingSession.id > after_id,
+            ChargingSession.start_time <= cutoff,
+            or_(latest.timestamp.is_(None), latest.timestamp <= cutoff),
+        )
+        .order_by(ChargingSession.id)
+        .limit(limit)
+        .all()
+    )
+    if not rows:
+        return 0, 0, None
+    last_id = rows[-1].id if len(rows) == limit else None
+
+    candidates = [r for r in rows if not (r.charge_point_id and r.charge_point_id in connected)]
+    uncached = [r.transaction_id for r in candidates if r.timestamp is None and r.transaction_id]
+    if uncached:
+        recent = {
+            txn for txn, ts in db.query(MeterValue.transaction_id, func.max(MeterValue.timestamp))
+            .filter(MeterValue.transaction_id.in_(uncached))
+            .group_by(MeterValue.transaction_id)
+            if ts is not None and ts > cutoff
+        }
+        candidates = [r for r in candidates if r.transaction_id not in recent]
+    if not candidates:
+        return len(rows), 0, last_id
+
+    ids = [r.id for r in candidates]
+    final_kwh = (
+        select(latest.total_kwh).where(latest.transaction_id == ChargingSession.transaction_id).scalar_subquery()
+    )
+    closed = db.query(ChargingSession).filter(
+        ChargingSession.id.in_(ids),
+        ChargingSession.status.in_(["active", "pending"]),
+        ~exists().where(latest.transaction_id == ChargingSession.transaction_id, latest.timestamp > cutoff),
+    ).update({
+        ChargingSession.status: "interrupted",
+        ChargingSession.stop_time: now,
+        ChargingSession.energy_consumed: func.coalesce(final_kwh, ChargingSession.energy_consumed, 0.0),
+    }, synchronize_session=False)
+    if not closed:
+        db.rollback()
+        return len(rows), 0, last_id
+
+    done = (
+        db.query(ChargingSession.id, ChargingSession.transaction_id, ChargingSession.charger_id)
+        .filter(ChargingSession.id.in_(ids), ChargingSession.status == "interrupted")
+        .all()
+    )
+    charger_ids = {r.charger_id for r in done if r.charger_id}
+    if charger_ids:
+        db.query(Charger).filter(Charger.id.in_(charger_ids)).update(
+            {"availability": "available"}, synchronize_session=False,
+        )
+    record_bulk_sync_changes(db, ChargingSession, [(r.id, r.transaction_id) for r in done],
+                             ["status", "stop_time", "energy_consumed"])
+    db.commit()
+    logger.warning(
+        f"Watchdog closed {closed} orphan session(s): "
+        + ", ".join(f"{r.id}/tx={r.transaction_id}" for r in done[:20])
+        + (" …" if len(done) > 20 else "")
+    )
+    return len(rows), closed, last_id
+
+
+async def sweep_orphan_sessions(budget_seconds: float = OCPP_ORPHAN_SWEEP_BUDGET_SECONDS,
+                                batch: int = OCPP_ORPHAN_SWEEP_BATCH) -> int:
+    """Close orphaned sessions in keyset batches on the OCPP DB executor —
+    the event loop only awaits. Stops after `budget_seconds`; the next sweep
+    resumes from there. Returns sessions closed."""
+    started = time.monotonic()
+    now = _utcnow()
+    # DbRegistry reads ocpp_connections — keep that off the loop too.
+    connected = await asyncio.to_thread(connected_charge_point_ids)
+    after_id = orphan_watchdog_stats["resume_after_id"]
+    scanned = closed = 0
+    while True:
+        n, c, last_id = await run_db(_close_orphan_batch, after_id, connected, now, batch)
+        scanned += n
+        closed += c
+        if last_id is None:
+            after_id = 0
+            break
+        after_id = last_id
+        if time.monotonic() - started >= budget_seconds:
+            orphan_watchdog_stats["budget_exhausted"] += 1
+            logger.warning(f"Orphan watchdog: time budget spent after {scanned} sessions — resuming next sweep")
+            break
+
+    elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+    orphan_watchdog_stats.update(
+        sweeps=orphan_watchdog_stats["sweeps"] + 1,
+        closed=orphan_watchdog_stats["closed"] + closed,
+        last_scanned=scanned, last_closed=closed, last_sweep_ms=elapsed_ms,
+        max_sweep_ms=max(orphan_watchdog_stats["max_sweep_ms"], elapsed_ms),
+        last_sweep_at=now.isoformat(), resume_after_id=after_id,
+    )
+    if closed:
+        logger.info(f"Orphan watchdog: closed {closed} stuck session(s) in {elapsed_ms:.0f} ms")
+    return closed
+
+
 async def orphan_session_watchdog(interval_seconds: int = 600):
     """
     Background task — runs every `interval_seconds` (default 10 min).
     Closes any charging session that:
       - Is still 'active' or 'pending'
       - Has had no MeterValue update for > 30 minutes
-      - The charger is currently offline (not in active_charge_points)
+      - The charger is not connected to any OCPP node
     This catches sessions that were never properly stopped due to abrupt disconnects.
     """
     logger.info("Orphan session watchdog started (interval=%ds)", interval_seconds)
     while True:
         await asyncio.sleep(interval_seconds)
         try:
-            db = SessionLocal()
-            cutoff = _utcnow() - timedelta(minutes=30)
-
-            stuck_sessions = db.query(ChargingSession).filter(
-                ChargingSession.status.in_(["active", "pending"]),
-                ChargingSession.start_time <= cutoff
-            ).all()
-
-            closed = 0
-            for s in stuck_sessions:
-                charger = db.query(Charger).filter(Charger.id == s.charger_id).first()
-                cp_id = charger.charge_point_id if charger else None
-
-                # Only close if the charger is not currently connected
-                if cp_id and cp_id in active_charge_points:
-                    continue
-
-                # Check last meter value timestamp
-                last_meter = (
-                    db.query(MeterValue)
-                    .filter(MeterValue.transaction_id == s.transaction_id)
-                    .order_by(desc(MeterValue.timestamp))
-                    .first()
-                )
-                if last_meter and last_meter.timestamp > cutoff:
-                    continue  # Still receiving meter updates, skip
-
-                final_energy = (last_meter.total_kwh or 0.0) if last_meter else (s.energy_consumed or 0.0)
-                s.status = "interrupted"
-                s.stop_time = _utcnow()
-                s.energy_consumed = final_energy
-
-                if charger:
-                    charger.availability = "available"
-
-                closed += 1
-                logger.warning(
-                    f"Watchdog closed orphan session {s.id} (charger={cp_id}, "
-                    f"tx={s.transaction_id}, energy={final_energy:.3f} kWh)"
-                )
-
-            if closed:
-                db.commit()
-                logger.info(f"Orphan watchdog: closed {closed} stuck session(s)")
-            db.close()
+            await sweep_orphan_sessions()
         except Exception as e:
             logger.error(f"Orphan session watchdog error: {e}", exc_info=True)
-            try:
-                db.close()
-            except Exception:
-                pass
-
-
-async def scheduled_charging_worker(interval_seconds: int = 60):
-    """
-    Background task — runs every minute.
-    Checks all enabled ChargingSchedule rows. If the current time (Asia/Kuala_Lumpur)
-    matches a schedule's start_time or stop_time AND today is in days_of_week,
-    send RemoteStartTransaction / RemoteStopTransaction via OCPP.
-    """
-    # Malaysia timezone: UTC+8 (no DST)
-    MYT = timezone(timedelta(hours=8))
-    logger.info("Scheduled charging worker started (interval=%ds)", interval_seconds)
-
-    while True:
-        await asyncio.sleep(interval_seconds)
-        try:
-            now = datetime.now(MYT)
-            current_hhmm = now.strftime("%H:%M")
-            # Python weekday(): Monday=0..Sunday=6 — we use Sunday=0..Saturday=6 to match JS Date.getDay()
-            current_dow = (now.weekday() + 1) % 7  # Mon=0->1, Sun=6->0
-
-            db = SessionLocal()
-            schedules = db.query(ChargingSchedule).filter(
-                ChargingSchedule.enabled == True
-            ).all()
-
-            for sch in schedules:
-                # Check if today is an active day
-                days = (sch.days_of_week or "daily").strip().lower()
-                if days != "daily":
-                    active_days = [int(x) for x in days.split(",") if x.strip().isdigit()]
-                    if current_dow not in active_days:
-                        continue
-
-                is_start = current_hhmm == sch.start_time
-                is_stop  = current_hhmm == sch.stop_time
-
-                if not (is_start or is_stop):
-                    continue
-
-                # Fetch live OCPP connection
-                cp_conn = active_charge_points.get(sch.charge_point_id)
-                if cp_conn is None:
-                    logger.warning(
-                        f"[Scheduler] Charger {sch.charge_point_id} offline — "
-                        f"skip {'start' if is_start else 'stop'} trigger"
-                    )
-                    continue
-
-                # Helper: dispatch an OCPP call onto the API event loop.
-                # Prevents "Queue bound to a different event loop" — see API_LOOP docstring.
-                async def _dispatch(coro):
-                    if API_LOOP is not None and API_LOOP.is_running():
-                        fut = asyncio.run_coroutine_threadsafe(coro, API_LOOP)
-                        return await asyncio.wrap_future(fut)
-                    # Fallback: run in current loop (works if API never touched this CP yet)
-                    return await coro
-
-                try:
-                    if is_start:
-                        # Debounce: don't re-trigger within same 2-min window
-                        if sch.last_triggered_start and \
-                                (_utcnow() - sch.last_triggered_start).total_seconds() < 120:
-                            continue
-                        logger.info(
-                            f"[Scheduler] Triggering RemoteStart for {sch.charge_point_id} "
-                            f"(schedule #{sch.id}, user={sch.user_id}, connector={sch.connector_id})"
-                        )
-                        await _dispatch(cp_conn.remote_start_transaction(
-                            connector_id=sch.connector_id,
-                            id_tag=sch.id_tag or "APP_USER",
-                        ))
-                        sch.last_triggered_start = _utcnow()
-                        db.commit()
-
-                    elif is_stop:
-                        if sch.last_triggered_stop and \
-                                (_utcnow() - sch.last_triggered_stop).total_seconds() < 120:
-                            continue
-                        # Find active session on this charger to get transaction_id
-                        charger = db.query(Charger).filter(
-                            Charger.charge_point_id == sch.charge_point_id
-                        ).first()
-                        if not charger:
-                            continue
-                        # Match any unfinished session (status may be "active",
-                        # "interrupted" after a reconnect, etc). stop_time is the
-                        # authoritative signal — NULL means session not yet closed.
-                        active = db.query(ChargingSession).filter(
-                            ChargingSession.charger_id == charger.id,
-                            ChargingSession.stop_time.is_(None),
-                        ).order_by(desc(ChargingSession.start_time)).first()
-                        if not active:
-                            logger.info(
-                                f"[Scheduler] No active session on {sch.charge_point_id} — "
-                                f"skip stop trigger"
-                            )
-                            continue
-                        logger.info(
-                            f"[Scheduler] Triggering RemoteStop for {sch.charge_point_id} "
-                            f"(tx={active.transaction_id}, schedule #{sch.id})"
-                        )
-                        await _dispatch(cp_conn.remote_stop_transaction(
-                            transaction_id=active.transaction_id
-                        ))
-                        sch.last_triggered_stop = _utcnow()
-                        db.commit()
-                except Exception as e:
-                    logger.error(
-                        f"[Scheduler] Error executing schedule #{sch.id}: {e}",
-                        exc_info=True,
-                    )
-
-            db.close()
-        except Exception as e:
-            logger.error(f"Scheduled charging worker error: {e}", exc_info=True)
-            try:
-                db.close()
-            except Exception:
-                pass
-
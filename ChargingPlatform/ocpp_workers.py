@@ -0,0 +1,346 @@
+"""
+PlagSini EV — Multi-process OCPP Server
+
+The OCPP tier used to be one websockets serve() on one event loop in a
+daemon thread. JSON parsing and python-ocpp schema validation are CPU
+bound, so after a site power outage the reconnect storm pinned that one
+core while the rest of the box sat idle.
+
+With OCPP_WORKERS=N (N > 1) main.py starts N worker processes instead.
+Each one binds port 9000 with SO_REUSEPORT — the kernel spreads incoming
+chargers across them — and has its own event loop, DB engine/pool, meter
+buffer and heartbeat coalescer. Workers register as separate nodes in the
+shared connection registry (ocpp_registry.py, requires OCPP_REGISTRY=db)
+and each serves a tiny relay endpoint on OCPP_WORKER_RELAY_PORT + index,
+so API calls reach a charger on whichever worker holds its socket.
+
+The supervisor (main process, alongside FastAPI):
+  - restarts a worker that exits or stops reporting for
+    OCPP_WORKER_STALL_SECONDS (its chargers reconnect to the others);
+  - on shutdown sends SIGTERM: workers stop accepting, close their sockets
+    with 1001 (chargers reconnect elsewhere), flush meter / heartbeat
+    buffers and exit within OCPP_WORKER_SHUTDOWN_SECONDS;
+  - exposes per-worker health for /health via supervisor_status().
+
+Worker index 0 also runs the fleet-wide orphan session watchdog and the
+meter time-series rollup, so they run once, not N times. Every worker runs
+the OCPP state healer over its own sockets (the API process skips it).
+
+Charger events (event_bus.py) are published in the worker that holds the
+socket, but their consumers — /api/live/chargers streams, firmware toasts,
+the webhook wakeup — live in the API process. Each worker forwards its
+events over one shared multiprocessing queue and the supervisor republishes
+them on the API process's bus. The queue is bounded: a worker drops events
+rather than block a handler when the API process falls behind, and the
+live streams' periodic resync covers what was dropped.
+
+Usage:
+    from ocpp_workers import ocpp_worker_count, start_ocpp_workers
+    if ocpp_worker_count() > 1:
+        start_ocpp_workers()
+"""
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OCPP_WORKER_RELAY_HOST = os.getenv("OCPP_WORKER_RELAY_HOST", "127.0.0.1").strip()
+OCPP_WORKER_RELAY_PORT = int(os.getenv("OCPP_WORKER_RELAY_PORT", "9100"))
+OCPP_WORKER_STALL_SECONDS = float(os.getenv("OCPP_WORKER_STALL_SECONDS", "60"))
+OCPP_WORKER_SHUTDOWN_SECONDS = float(os.getenv("OCPP_WORKER_SHUTDOWN_SECONDS", "20"))
+OCPP_WORKER_EVENT_QUEUE = int(os.getenv("OCPP_WORKER_EVENT_QUEUE", "10000"))
+# Worker → supervisor liveness report interval.
+_REPORT_SECONDS = 5.0
+
+# Workers must not share the parent's DB connections, loop or locks.
+_mp = multiprocessing.get_context("spawn")
+
+# Worker side: forwarded / dropped (queue full). Supervisor side: received.
+event_bridge_stats: Dict[str, int] = {"forwarded": 0, "dropped": 0, "received": 0}
+
+
+def ocpp_worker_count() -> int:
+    """OCPP_WORKERS from env; 1 (the default) keeps the in-thread server."""
+    return max(1, int(os.getenv("OCPP_WORKERS", "1")))
+
+
+# ─── Worker process ────────────────────────────────────────────────────────
+
+def _forward_events(events):
+    """Send every event published in this worker to the supervisor.
+    Returns the event_bus subscription."""
+    from event_bus import event_bus
+
+    def _forward(event) -> None:
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            event_bridge_stats["dropped"] += 1
+        else:
+            event_bridge_stats["forwarded"] += 1
+
+    return event_bus.subscribe(_forward)
+
+
+def _worker_main(index: int, connections, last_report, events) -> None:
+    """Process entry point: register as node "<OCPP_NODE_ID>-w<index>" whose
+    relay URL is this worker's own port, then run the server loop."""
+    from ocpp_registry import set_node_identity
+
+    base_node = os.getenv("OCPP_NODE_ID", "").strip() or socket.gethostname()
+    relay_port = OCPP_WORKER_RELAY_PORT + index
+    set_node_identity(f"{base_node}-w{index}", f"http://{OCPP_WORKER_RELAY_HOST}:{relay_port}")
+    logging.basicConfig(level=logging.INFO, format=f"[ocpp-w{index}] %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("websockets.server").setLevel(logging.CRITICAL)
+    _forward_events(events)
+    try:
+        asyncio.run(_serve_worker(index, relay_port, connections, last_report))
+    except KeyboardInterrupt:
+        pass
+
+
+def _relay_app():
+    """Minimal ASGI app with only the relay route — the full api.app would
+    start every FastAPI background loop once per worker."""
+    from fastapi import FastAPI, HTTPException, Request
+    from ocpp_registry import relay_secret_ok
+    from ocpp_server import run_relayed_command
+
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.post("/api/internal/ocpp/relay")
+    async def relay(request: Request):
+        if not relay_secret_ok(request.headers.get("X-Relay-Secret", "")):
+            raise HTTPException(status_code=401, detail="Invalid relay secret")
+        body = await request.json()
+        try:
+            return await run_relayed_command(
+                body.get("charge_point_id", ""), body.get("command", ""),
+                body.get("args") or [], body.get("kwargs") or {},
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return app
+
+
+async def _serve_worker(index: int, relay_port: int, connections, last_report) -> None:
+    import uvicorn
+    try:
+        from websockets.asyncio.server import serve  # websockets >= 13.0
+    except ImportError:
+        from websockets.server import serve  # websockets < 13.0
+
+    from heartbeat_coalescer import drain_heartbeats
+    from meter_ingest import drain_meter_buffer
+    from meter_timeseries import meter_timeseries_worker
+    from ocpp_registry import connection_registry
+    from ocpp_server import active_charge_points, ocpp_state_healer_loop, on_connect, orphan_session_watchdog
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    relay = uvicorn.Server(uvicorn.Config(
+        _relay_app(), host=OCPP_WORKER_RELAY_HOST, port=relay_port,
+        log_level="warning", lifespan="off",
+    ))
+    # Our handlers above drive shutdown; keep uvicorn from taking SIGTERM
+    # (capture_signals on newer uvicorn, install_signal_handlers on older).
+    relay.capture_signals = contextlib.nullcontext
+    relay.install_signal_handlers = lambda: None
+
+    async def _report():
+        while True:
+            connections.value = len(active_charge_points)
+            last_report.value = time.time()
+            await asyncio.sleep(_REPORT_SECONDS)
+
+    async with serve(
+        on_connect,
+        "0.0.0.0",
+        9000,
+        reuse_port=True,
+        subprotocols=["ocpp1.6"],
+        ping_interval=60,
+        ping_timeout=30,
+        close_timeout=10,
+        compression=None,
+    ) as server:
+        logger.info(f"OCPP worker {index} (pid {os.getpid()}) on :9000, relay on :{relay_port}")
+        tasks = [
+            asyncio.create_task(relay.serve()),
+            asyncio.create_task(_report()),
+            asyncio.create_task(connection_registry.run()),
+            asyncio.create_task(ocpp_state_healer_loop(interval_seconds=60, seed=index == 0)),
+        ]
+        if index == 0:
+            tasks.append(asyncio.create_task(orphan_session_watchdog(interval_seconds=600)))
+            tasks.append(asyncio.create_task(meter_timeseries_worker()))
+
+        await stop.wait()
+        logger.info(f"OCPP worker {index} shutting down ({len(active_charge_points)} connection(s))")
+        # close() stops accepting and closes open sockets with 1001 Going Away;
+        # each on_connect finally releases its registry claim.
+        server.close()
+        try:
+            await asyncio.wait_for(server.wait_closed(), timeout=OCPP_WORKER_SHUTDOWN_SECONDS / 2)
+        except asyncio.TimeoutError:
+            logger.warning(f"OCPP worker {index}: sockets still open after {OCPP_WORKER_SHUTDOWN_SECONDS / 2:.0f}s")
+        await drain_meter_buffer()
+        await drain_heartbeats()
+        relay.should_exit = True
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ─── Supervisor (main process) ─────────────────────────────────────────────
+
+class _WorkerSlot:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.connections = _mp.Value("i", 0)
+        self.last_report = _mp.Value("d", 0.0)
+        self.started_at = 0.0
+        self.restarts = 0
+
+    def spawn(self, events) -> None:
+        self.connections.value = 0
+        self.last_report.value = 0.0
+        self.started_at = time.time()
+        self.process = _mp.Process(
+            target=_worker_main, args=(self.index, self.connections, self.last_report, events),
+            name=f"ocpp-worker-{self.index}", daemon=True,
+        )
+        self.process.start()
+
+    def stalled(self, now: float) -> bool:
+        seen = self.last_report.value or self.started_at
+        return now - seen > OCPP_WORKER_STALL_SECONDS
+
+    def status(self, now: float) -> Dict:
+        alive = self.process is not None and self.process.is_alive()
+        reported = self.last_report.value
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process else None,
+            "alive": alive,
+            "healthy": alive and not self.stalled(now),
+            "connections": self.connections.value if alive else 0,
+            "last_report_age_s": round(now - reported, 1) if reported else None,
+            "restarts": self.restarts,
+        }
+
+
+class OcppWorkerSupervisor:
+    def __init__(self, count: int):
+        self.slots: List[_WorkerSlot] = [_WorkerSlot(i) for i in range(count)]
+        self.events = _mp.Queue(maxsize=OCPP_WORKER_EVENT_QUEUE)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pump_thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        for slot in self.slots:
+            slot.spawn(self.events)
+        self._thread = threading.Thread(target=self._watch, name="ocpp-supervisor", daemon=True)
+        self._thread.start()
+        self._pump_thread = threading.Thread(target=self._pump_events, name="ocpp-event-bridge", daemon=True)
+        self._pump_thread.start()
+        logger.info(f"OCPP server started as {len(self.slots)} worker processes on :9000 (SO_REUSEPORT)")
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(_REPORT_SECONDS):
+            now = time.time()
+            for slot in self.slots:
+                proc = slot.process
+                if proc is not None and proc.is_alive() and not slot.stalled(now):
+                    continue
+                if proc is not None and proc.is_alive():
+                    logger.error(f"[ocpp-supervisor] worker {slot.index} (pid {proc.pid}) stalled — killing")
+                    proc.kill()
+                    proc.join(timeout=5)
+                else:
+                    logger.error(f"[ocpp-supervisor] worker {slot.index} exited "
+                                 f"(code {proc.exitcode if proc else None}) — restarting")
+                if self._stopping.is_set():
+                    return
+                slot.restarts += 1
+                slot.spawn(self.events)
+
+    def _pump_events(self) -> None:
+        """Republish the workers' events on this (API) process's bus."""
+        from event_bus import event_bus
+
+        while not self._stopping.is_set():
+            try:
+                event = self.events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return  # queue closed on shutdown
+            event_bridge_stats["received"] += 1
+            event_bus.publish(event)
+
+    def stop(self) -> None:
+        """SIGTERM every worker, wait for graceful exit, then kill stragglers."""
+        self._stopping.set()
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+        deadline = time.time() + OCPP_WORKER_SHUTDOWN_SECONDS
+        for slot in self.slots:
+            if slot.process is None:
+                continue
+            slot.process.join(timeout=max(0.0, deadline - time.time()))
+            if slot.process.is_alive():
+                logger.warning(f"[ocpp-supervisor] worker {slot.index} did not exit — killing")
+                slot.process.kill()
+
+    def status(self) -> Dict:
+        now = time.time()
+        workers = [slot.status(now) for slot in self.slots]
+        return {
+            "workers": workers,
+            "healthy": sum(1 for w in workers if w["healthy"]),
+            "connections": sum(w["connections"] for w in workers),
+            "events_bridged": event_bridge_stats["received"],
+        }
+
+
+_supervisor: Optional[OcppWorkerSupervisor] = None
+
+
+def start_ocpp_workers(count: Optional[int] = None) -> OcppWorkerSupervisor:
+    """Spawn the OCPP worker pool from the main process (main.py)."""
+    global _supervisor
+    _supervisor = OcppWorkerSupervisor(count or ocpp_worker_count())
+    _supervisor.start()
+    return _supervisor
+
+
+def stop_ocpp_workers() -> None:
+    if _supervisor is not None:
+        _supervisor.stop()
+
+
+def ocpp_workers_running() -> bool:
+    """True when the OCPP server runs as worker processes, not in this one."""
+    return _supervisor is not None
+
+
+def supervisor_status() -> Optional[Dict]:
+    """Per-worker health, or None when the OCPP server runs in-thread."""
+    return _supervisor.status() if _supervisor is not None else None
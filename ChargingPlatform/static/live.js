@@ -0,0 +1,97 @@
+// ── Live charger status stream client ──────────────────────────────────────
+// Consumes GET /api/live/chargers (Server-Sent Events) with fetch() so the
+// staff token travels in the X-Staff-Token header like every other call
+// (EventSource can't set headers, and query-string tokens leak into logs).
+//
+//   const live = PlagLive.connect({
+//       tenant: window.currentTenant(),          // optional
+//       topics: 'chargers,sessions',             // optional, default 'chargers'
+//       onSnapshot: list => {...},               // full /api/chargers-shaped list
+//       onCharger:  diff => {...},               // { charge_point_id, <changed fields> }
+//       onRemoved:  cpId => {...},
+//       onSession:  evt  => {...},               // { charge_point_id, event, transaction_id, ... }
+//       onFault:    evt  => {...},
+//       onStatus:   up   => {...},               // true once streaming, false when dropped
+//   });
+//   live.close();
+//
+// Reconnects with backoff (1s → 30s). While down, pages fall back to their
+// old polling via onStatus(false).
+(function () {
+    function parseFrame(frame) {
+        var event = 'message', data = '';
+        frame.split('\n').forEach(function (line) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        if (!data) return null;  // keepalive comment
+        try { return { event: event, data: JSON.parse(data) }; } catch (e) { return null; }
+    }
+
+    function connect(opts) {
+        opts = opts || {};
+        var closed = false, controller = null, backoff = 1000, up = false;
+
+        function setUp(v) {
+            if (up === v) return;
+            up = v;
+            if (opts.onStatus) opts.onStatus(v);
+        }
+
+        function dispatch(msg) {
+            var d = msg.data;
+            if (msg.event === 'snapshot' && opts.onSnapshot) opts.onSnapshot(d);
+            else if (msg.event === 'charger' && opts.onCharger) opts.onCharger(d);
+            else if (msg.event === 'removed' && opts.onRemoved) opts.onRemoved(d.charge_point_id);
+            else if (msg.event === 'session' && opts.onSession) opts.onSession(d);
+            else if (msg.event === 'fault' && opts.onFault) opts.onFault(d);
+        }
+
+        async function run() {
+            var params = new URLSearchParams();
+            if (opts.tenant && opts.tenant !== 'all') params.set('tenant', opts.tenant);
+            if (opts.chargePointId) params.set('charge_point_id', opts.chargePointId);
+            if (opts.topics) params.set('topics', opts.topics);
+            var tok = window.STAFF_AUTH?.token || localStorage.getItem('staffToken') || '';
+            controller = new AbortController();
+            var res = await fetch('/api/live/chargers?' + params.toString(), {
+                headers: tok ? { 'X-Staff-Token': tok } : {},
+                signal: controller.signal,
+            });
+            if (!res.ok || !res.body) throw new Error('live stream HTTP ' + res.status);
+            var reader = res.body.getReader(), decoder = new TextDecoder(), buf = '';
+            while (true) {
+                var chunk = await reader.read();
+                if (chunk.done) break;
+                buf += decoder.decode(chunk.value, { stream: true });
+                var idx;
+                while ((idx = buf.indexOf('\n\n')) >= 0) {
+                    var msg = parseFrame(buf.slice(0, idx));
+                    buf = buf.slice(idx + 2);
+                    if (!msg) continue;
+                    if (msg.event === 'snapshot') { setUp(true); backoff = 1000; }
+                    dispatch(msg);
+                }
+            }
+        }
+
+        (async function loop() {
+            while (!closed) {
+                try { await run(); } catch (e) { if (!closed) console.warn('[live]', e.message || e); }
+                if (closed) break;
+                setUp(false);
+                await new Promise(function (r) { setTimeout(r, backoff); });
+                backoff = Math.min(backoff * 2, 30000);
+            }
+        })();
+
+        return {
+            close: function () {
+                closed = true;
+                if (controller) controller.abort();
+            },
+        };
+    }
+
+    window.PlagLive = { connect: connect };
+})();
@@ -0,0 +1,43 @@
+"""In-memory database fixture for DB-backed tests.
+
+    class MyTests(DbTestCase):
+        def setUp(self):
+            super().setUp()
+            self.override_api_db()
+            self.client = TestClient(api.app)
+"""
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import api
+from database import Base, get_db
+
+
+class DbTestCase(unittest.TestCase):
+    """Fresh sqlite schema per test on one shared connection (StaticPool),
+    so every `self.Session()` and the API see the same data. Dependency
+    overrides are cleared and the engine disposed after each test."""
+
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+        )
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.addCleanup(self.engine.dispose)
+        self.addCleanup(api.app.dependency_overrides.clear)
+
+    def override_api_db(self) -> None:
+        """Serve the API's get_db from this test's database."""
+
+        def _override_get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        api.app.dependency_overrides[get_db] = _override_get_db
@@ -0,0 +1,35 @@
+"""SQL statement counting for query-count regression tests.
+
+    with QueryCounter(engine) as qc:
+        client.get("/api/sessions")
+    assert qc.count == 2
+"""
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Counts statements executed on `engine` while the block runs;
+    `statements` keeps the SQL text for assertion messages."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        return False
+
+    def __str__(self):
+        return "\n".join(f"{i + 1}. {sql}" for i, sql in enumerate(self.statements))
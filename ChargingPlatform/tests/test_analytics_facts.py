@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+import api
+from analytics_facts import fact_by_hour, fact_daily, fact_total, refresh_facts
+from database import AnalyticsFact, Charger, ChargingSession, User, Wallet, WalletTransaction
+from db_case import DbTestCase
+
+
+class AnalyticsFactsTests(DbTestCase):
+    """analytics_facts rebuild (backfill, idempotent refresh) and the
+    analytics endpoints reading from it."""
+
+    NOW = datetime(2026, 7, 14, 12, 30, 0)
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.Session()
+        self._seed()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _seed(self):
+        db = self.db
+        charger = Charger(charge_point_id="AF-CP", status="online", tenant="acme")
+        user = User(email="a@x.test", password_hash="x", created_at=self.NOW - timedelta(days=100))
+        db.add_all([charger, user])
+        db.flush()
+        wallet = Wallet(user_id=user.id, balance=Decimal("5.00"))
+        db.add(wallet)
+        db.flush()
+        for days_ago, amount, status in ((0, "10.00", "completed"), (1, "20.00", "completed"),
+                                         (40, "30.00", "completed"), (1, "99.00", "failed")):
+            db.add(WalletTransaction(
+                user_id=user.id, wallet_id=wallet.id, transaction_type="topup", status=status,
+                amount=Decimal(amount), balance_before=0, balance_after=0, payment_method="tng",
+                created_at=self.NOW - timedelta(days=days_ago),
+            ))
+        for txn, days_ago, kwh in ((1, 0, 5.0), (2, 3, 7.5), (3, 200, 1.0)):
+            db.add(ChargingSession(
+                charger_id=charger.id, transaction_id=txn, status="completed",
+                start_time=(self.NOW - timedelta(days=days_ago)).replace(hour=18), energy_consumed=kwh,
+            ))
+        db.commit()
+        self.charger_id = charger.id
+
+    def test_first_refresh_backfills_history(self):
+        refresh_facts(self.db, days=2, now=self.NOW)
+
+        self.assertEqual(fact_total(self.db, "revenue"), (60.0, 3))
+        self.assertEqual(fact_total(self.db, "revenue", since=self.NOW - timedelta(days=30)), (30.0, 2))
+        self.assertEqual(fact_total(self.db, "energy_kwh"), (13.5, 3))
+        self.assertEqual(fact_total(self.db, "new_users"), (1.0, 1))
+        self.assertEqual(fact_by_hour(self.db, "sessions"), {18: 3})
+        daily = fact_daily(self.db, "revenue", (self.NOW - timedelta(days=1)).date(), 2)
+        self.assertEqual([amount for _, amount, _ in daily], [20.0, 10.0])
+
+    def test_refresh_is_idempotent_and_picks_up_changes(self):
+        refresh_facts(self.db, days=2, now=self.NOW)
+        rows = self.db.query(AnalyticsFact).count()
+        session = self.db.query(ChargingSession).filter(ChargingSession.transaction_id == 1).one()
+        session.energy_consumed = 9.0
+        self.db.commit()
+
+        refresh_facts(self.db, days=2, now=self.NOW)
+
+        self.assertEqual(self.db.query(AnalyticsFact).count(), rows)
+        self.assertEqual(fact_total(self.db, "energy_kwh"), (17.5, 3))
+
+    def test_overview_reads_facts(self):
+        refresh_facts(self.db, days=2, now=self.NOW)
+
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        client = TestClient(api.app)
+        body = client.get("/api/analytics/overview").json()
+
+        self.assertEqual(body["revenue"]["total"], 60.0)
+        self.assertEqual(body["sessions"]["total"], 3)
+        self.assertEqual(body["sessions"]["completed"], 3)
+        self.assertEqual(body["wallet"]["payment_methods"], [{"method": "tng", "count": 3, "total": 60.0}])
+        self.assertEqual(body["chargers"]["details"][0]["total_sessions"], 3)
+        self.assertEqual(len(body["revenue"]["daily"]), 30)
+        impact = [i for i in client.get("/api/analytics/insights").json()["insights"] if i["category"] == "Impact"]
+        self.assertIn("13.5 kWh", impact[0]["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api
+import bulk_commands
+import ocpp_db
+from database import BulkCommandJob, BulkCommandResult, Charger
+from db_case import DbTestCase
+
+
+class FakeChargePoint:
+    """Answers Reset after `delay` with `status`; tracks peak parallelism."""
+
+    in_flight = 0
+    peak = 0
+
+    def __init__(self, status="Accepted", delay=0.01):
+        self.status = status
+        self.delay = delay
+
+    async def reset(self, type):
+        FakeChargePoint.in_flight += 1
+        FakeChargePoint.peak = max(FakeChargePoint.peak, FakeChargePoint.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            FakeChargePoint.in_flight -= 1
+        return SimpleNamespace(status=self.status)
+
+    async def update_firmware(self, location, retrieve_date, retries=None, retry_interval=None):
+        return SimpleNamespace()
+
+
+class BulkCommandTests(DbTestCase):
+    """Bulk jobs: planned up front, run in waves with bounded parallelism,
+    halted by a bad wave, cancellable, and followed over the API."""
+
+    def setUp(self):
+        super().setUp()
+        db = self.Session()
+        db.add_all([Charger(charge_point_id=f"BK-{i:02d}", tenant="fleet-a" if i < 8 else "fleet-b",
+                            model="AION-7" if i % 2 else "AION-22") for i in range(12)])
+        db.commit()
+        db.close()
+
+        self.cps = {f"BK-{i:02d}": FakeChargePoint() for i in range(12)}
+        FakeChargePoint.in_flight = FakeChargePoint.peak = 0
+        patches = [
+            mock.patch.object(ocpp_db, "SessionLocal", self.Session),
+            mock.patch.object(bulk_commands, "BULK_COMMAND_FLUSH_SECONDS", 0.01),
+            mock.patch.object(bulk_commands, "get_active_charge_point", lambda cp_id: self.cps.get(cp_id)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create(self, target_ids, connected=None, **kwargs):
+        db = self.Session()
+        job = bulk_commands.create_job(db, "reset", {"type": "Soft"}, target_ids,
+                                       set(self.cps) if connected is None else connected, **kwargs)
+        job_id = job.id
+        db.close()
+        return job_id
+
+    def _state(self, job_id):
+        db = self.Session()
+        job = db.get(BulkCommandJob, job_id)
+        results = {r.charge_point_id: (r.status, r.wave) for r in
+                   db.query(BulkCommandResult).filter(BulkCommandResult.job_id == job_id)}
+        out = (job.status, job.succeeded, job.failed, job.skipped), results
+        db.close()
+        return out
+
+    def test_targets_and_plan(self):
+        db = self.Session()
+        found, unknown = bulk_commands.resolve_targets(db, tenant="fleet-a", model="AION-7")
+        self.assertEqual(found, ["BK-01", "BK-03", "BK-05", "BK-07"])
+        self.assertEqual(bulk_commands.resolve_targets(db, charge_point_ids=["BK-10", "NOPE"]), (["BK-10"], ["NOPE"]))
+        db.close()
+        with self.assertRaises(ValueError):
+            bulk_commands.validate_params("reset", {"kind": "Soft"})
+        with self.assertRaises(ValueError):
+            bulk_commands.validate_params("remote_stop_transaction", {"transaction_id": 1})
+
+        job_id = self._create(found, connected={"BK-01", "BK-03", "BK-05"}, wave_size=2)
+        counters, results = self._state(job_id)
+        self.assertEqual(counters, ("queued", 0, 0, 1))
+        self.assertEqual(results, {"BK-01": ("pending", 0), "BK-03": ("pending", 0),
+                                   "BK-05": ("pending", 1), "BK-07": ("offline", 0)})
+
+    def test_runs_with_bounded_parallelism(self):
+        self.cps["BK-04"] = FakeChargePoint(status="Rejected")
+        job_id = self._create(sorted(self.cps), concurrency=3)
+        self.assertEqual(asyncio.run(bulk_commands.run_job(job_id)), "completed")
+        self.assertEqual(FakeChargePoint.peak, 3)
+        counters, results = self._state(job_id)
+        self.assertEqual(counters, ("completed", 11, 1, 0))
+        self.assertEqual(results["BK-04"][0], "failed")
+
+        db = self.Session()
+        row = db.query(BulkCommandResult).filter_by(job_id=job_id, charge_point_id="BK-04").one()
+        self.assertEqual((row.error, row.response), ("Status: Rejected", '{"status": "Rejected"}'))
+        db.close()
+
+    def test_bad_wave_halts_rollout(self):
+        for cp_id in ("BK-00", "BK-01", "BK-02"):
+            self.cps[cp_id] = FakeChargePoint(status="Rejected")
+        job_id = self._create(sorted(self.cps), wave_size=4, max_failure_ratio=0.5)
+        self.assertEqual(asyncio.run(bulk_commands.run_job(job_id)), "halted")
+        counters, results = self._state(job_id)
+        self.assertEqual(counters, ("halted", 1, 3, 8))
+        self.assertEqual({s for s, wave in results.values() if wave > 0}, {"skipped"})
+
+    def test_timeout_and_cancel(self):
+        self.cps["BK-00"] = FakeChargePoint(delay=1)
+        status, _, error = asyncio.run(bulk_commands.send_command("reset", {"type": "Hard"}, "BK-00", 0.05))
+        self.assertEqual((status, error), ("timeout", "No response within 0.05s"))
+
+        self.cps.update({cp_id: FakeChargePoint(delay=0.05) for cp_id in self.cps})
+        job_id = self._create(sorted(self.cps), concurrency=1)
+
+        async def run_and_cancel():
+            task = asyncio.create_task(bulk_commands.run_job(job_id))
+            await asyncio.sleep(0.12)
+            db = self.Session()
+            self.assertTrue(bulk_commands.request_cancel(db, job_id))
+            db.close()
+            return await task
+
+        self.assertEqual(asyncio.run(run_and_cancel()), "cancelled")
+        (status, succeeded, failed, skipped), _ = self._state(job_id)
+        self.assertEqual((status, failed), ("cancelled", 0))
+        self.assertGreater(skipped, 0)
+        self.assertEqual(succeeded + skipped, 12)
+
+    def test_api_create_and_firmware_endpoint(self):
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin", "staff_id": 7}
+        api.app.dependency_overrides[api.require_admin_or_staff_admin_stream] = lambda: {"role": "admin"}
+        client = TestClient(api.app)
+        with mock.patch.object(api, "connected_charge_point_ids", lambda: set(self.cps) - {"BK-11"}), \
+                mock.patch.object(api, "start_bulk_job") as start:
+            self.assertEqual(client.post("/api/admin/bulk-commands", json={
+                "command": "reset", "params": {"type": "Soft"}, "target": {}}).status_code, 400)
+            resp = client.post("/api/admin/bulk-commands", json={
+                "command": "reset", "params": {"type": "Soft"}, "target": {"tenant": "fleet-b"}, "wave_size": 2})
+            self.assertEqual(resp.status_code, 202, resp.text)
+            job = resp.json()["job"]
+            self.assertEqual((job["total"], job["skipped"], job["created_by"]), (4, 1, "staff:7"))
+            start.assert_called_once_with(job["id"])
+
+            resp = client.post("/api/ocpp/bulk/update-firmware", json={
+                "charge_point_ids": ["BK-00", "BK-11"], "location": "https://fw.test/a.bin",
+                "retrieve_date": "2026-07-19T00:00:00Z", "delay_between_seconds": 0})
+        body = resp.json()
+        self.assertEqual(body["results"], [
+            {"charge_point_id": "BK-00", "success": True, "message": "Command sent"},
+            {"charge_point_id": "BK-11", "success": False, "message": "Not connected"},
+        ])
+        detail = client.get(f"/api/admin/bulk-commands/{body['job_id']}").json()
+        self.assertEqual(detail["job"]["status"], "completed")
+        with mock.patch.object(api, "SessionLocal", self.Session):
+            stream = client.get(f"/api/admin/bulk-commands/{body['job_id']}/stream").text
+        self.assertEqual(stream.count("event: result"), 2)
+        self.assertTrue(stream.rstrip().split("\n\n")[-1].startswith("event: done"))
+
+
+if __name__ == "__main__":
+    unittest.main()
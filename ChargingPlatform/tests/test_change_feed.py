@@ -0,0 +1,128 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api
+import change_feed
+from change_feed import changes_after, prune_changes
+from database import Charger, ChargingSession, PaymentTransaction, SyncChange, User
+from db_case import DbTestCase
+
+
+class ChangeFeedTests(DbTestCase):
+    """sync_changes captures PaymentTransaction / ChargingSession mutations
+    at commit, and /api/sync/changes serves only the delta."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.Session()
+        settle = mock.patch.object(change_feed, "SYNC_CHANGES_SETTLE_SECONDS", 0)
+        settle.start()
+        self.addCleanup(settle.stop)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _seed(self):
+        db = self.db
+        user = User(email="cf@x.test", password_hash="x")
+        charger = Charger(charge_point_id="CF-1")
+        db.add_all([user, charger])
+        db.commit()
+        txn = PaymentTransaction(transaction_ref="TXN-CF1", user_id=user.id, user_email=user.email,
+                                 amount=Decimal("10.00"), gateway_name="tng", status="pending",
+                                 charger_id="CF-1")
+        db.add(txn)
+        db.commit()
+        return user, charger, txn
+
+    def test_mutations_are_logged_in_commit_order(self):
+        _, charger, txn = self._seed()
+        txn.status = "success"
+        txn.paid_at = datetime(2026, 7, 16, 10, 0, 0)
+        session = ChargingSession(charger_id=charger.id, transaction_id=4242, status="active",
+                                  start_time=datetime(2026, 7, 16, 10, 1, 0))
+        self.db.add(session)
+        self.db.commit()
+        session.energy_consumed = 1.5  # meter tick — not logged
+        self.db.commit()
+        session.status = "completed"
+        self.db.commit()
+
+        self.db.add(PaymentTransaction(transaction_ref="TXN-ROLLED", user_id=txn.user_id, user_email="x",
+                                       amount=Decimal("1.00"), gateway_name="tng"))
+        self.db.flush()
+        self.db.rollback()
+
+        changes, has_more = changes_after(self.db, 0)
+        self.assertFalse(has_more)
+        self.assertEqual(
+            [(c.entity, c.entity_ref, c.op) for c in changes],
+            [("payment_transaction", "TXN-CF1", "insert"),
+             # one commit: inserts are logged before updates
+             ("charging_session", "4242", "insert"),
+             ("payment_transaction", "TXN-CF1", "update"),
+             ("charging_session", "4242", "update")],
+        )
+        self.assertEqual(changes[2].fields, '["paid_at", "status"]')
+        self.assertEqual([c.seq for c in changes], sorted(c.seq for c in changes))
+
+    def test_failed_savepoint_keeps_outer_changes(self):
+        """ocpp_server._enqueue_webhook runs in begin_nested(): its failure
+        must not drop the session's own feed row."""
+        _, charger, txn = self._seed()
+        self.db.add(ChargingSession(charger_id=charger.id, transaction_id=5151, status="active",
+                                    start_time=datetime(2026, 7, 16, 10, 1, 0)))
+        self.db.flush()
+        with self.assertRaises(RuntimeError), self.db.begin_nested():
+            txn.status = "success"
+            self.db.flush()
+            raise RuntimeError("enqueue failed")
+        self.db.commit()
+
+        changes, _ = changes_after(self.db, 0)
+        self.assertEqual([(c.entity_ref, c.op) for c in changes], [("TXN-CF1", "insert"), ("5151", "insert")])
+
+    def test_endpoint_serves_delta_with_current_state(self):
+        _, charger, txn = self._seed()
+
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        client = TestClient(api.app)
+
+        first = client.get("/api/sync/changes").json()
+        self.assertEqual([c["op"] for c in first["changes"]], ["insert"])
+        self.assertEqual(first["changes"][0]["data"]["transaction_ref"], "TXN-CF1")
+
+        session = ChargingSession(charger_id=charger.id, transaction_id=77, status="active",
+                                  start_time=datetime(2026, 7, 16, 11, 0, 0))
+        self.db.add(session)
+        self.db.commit()
+        session.status, session.energy_consumed = "completed", 3.5
+        self.db.commit()
+
+        delta = client.get(f"/api/sync/changes?after_seq={first['last_seq']}&entities=charging_session").json()
+        self.assertEqual([c["op"] for c in delta["changes"]], ["insert", "update"])
+        self.assertEqual(delta["changes"][1]["fields"], ["energy_consumed", "status"])
+        self.assertEqual(delta["changes"][1]["data"]["status"], "completed")
+        self.assertEqual(delta["changes"][1]["data"]["charge_point_id"], "CF-1")
+        empty = client.get(f"/api/sync/changes?after_seq={delta['last_seq']}").json()
+        self.assertEqual((empty["changes"], empty["last_seq"]), ([], delta["last_seq"]))
+        self.assertEqual(client.get("/api/sync/changes?entities=users").status_code, 400)
+
+    def test_settle_window_and_retention(self):
+        self._seed()
+        with mock.patch.object(change_feed, "SYNC_CHANGES_SETTLE_SECONDS", 60):
+            changes, has_more = changes_after(self.db, 0)
+        self.assertEqual((changes, has_more), ([], True))
+
+        with mock.patch.object(change_feed, "SYNC_CHANGES_RETENTION_DAYS", 1):
+            self.assertEqual(prune_changes(self.db, now=datetime.now() + timedelta(days=2)), 1)
+        self.assertEqual(self.db.query(SyncChange).count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
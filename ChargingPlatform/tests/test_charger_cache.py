@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api
+import ocpp_db
+import ocpp_server
+from database import Charger
+from db_case import DbTestCase
+from ocpp_server import ChargePoint, invalidate_charger_cache
+
+
+class ChargerRowCacheTests(DbTestCase):
+    """ChargePoint caches its chargers row per connection; admin writes
+    drop it, and a load racing an invalidation is not cached."""
+
+    def setUp(self):
+        super().setUp()
+        db = self.Session()
+        db.add(Charger(charge_point_id="CC-1", heartbeat_interval=300))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(ocpp_db, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cp = ChargePoint("CC-1", mock.Mock())
+        ocpp_server.active_charge_points["CC-1"] = self.cp
+        self.addCleanup(ocpp_server.active_charge_points.pop, "CC-1", None)
+
+    def _set_interval(self, seconds):
+        db = self.Session()
+        db.query(Charger).filter(Charger.charge_point_id == "CC-1").update({"heartbeat_interval": seconds})
+        db.commit()
+        db.close()
+
+    def test_row_is_cached_until_an_admin_edit(self):
+        self.assertEqual(asyncio.run(self.cp.charger_row()).heartbeat_interval, 300)
+        self._set_interval(120)  # edited behind the cache's back: still served from memory
+        self.assertEqual(asyncio.run(self.cp.charger_row()).heartbeat_interval, 300)
+
+        self.override_api_db()
+        self.cp.change_configuration = mock.AsyncMock(return_value=SimpleNamespace(status="Accepted"))
+        resp = TestClient(api.app).post("/api/chargers/CC-1/configuration/change",
+                                        json={"key": "HeartbeatInterval", "value": "60"})
+        self.assertTrue(resp.json()["success"])
+        self.assertEqual(asyncio.run(self.cp.charger_row()).heartbeat_interval, 60)
+
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        real_run_db = ocpp_server.run_db
+
+        async def racing_run_db(fn, *args):
+            row = await real_run_db(fn, *args)
+            self._set_interval(90)
+            invalidate_charger_cache("CC-1")  # admin edit lands mid-load
+            return row
+
+        with mock.patch.object(ocpp_server, "run_db", racing_run_db):
+            stale = asyncio.run(self.cp.charger_row())
+        self.assertEqual(stale.heartbeat_interval, 300)  # this message used what it read
+        self.assertIsNone(self.cp._charger_cache)
+        self.assertEqual(asyncio.run(self.cp.charger_row()).heartbeat_interval, 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import api
+from database import Charger, ChargingSession, _utcnow
+from db_case import DbTestCase
+
+
+class ChargersQueryCountTests(DbTestCase):
+    """GET /api/chargers must cost the same number of SQL statements for a
+    10-charger fleet as for a 400-charger one (no per-charger session query)."""
+
+    def setUp(self):
+        super().setUp()
+        self.override_api_db()
+        self.client = TestClient(api.app)
+        self.statements = 0
+
+        def _count(*_args, **_kwargs):
+            self.statements += 1
+
+        event.listen(self.engine, "before_cursor_execute", _count)
+
+    def tearDown(self):
+        api.invalidate_chargers_cache()
+
+    def _seed(self, n_chargers: int, start: int = 0) -> None:
+        db = self.Session()
+        now = _utcnow()
+        for i in range(start, start + n_chargers):
+            charger = Charger(
+                charge_point_id=f"CP{i:04d}", status="online",
+                availability="charging" if i % 2 else "available",
+                last_heartbeat=now, tenant="acme" if i % 3 else "other",
+            )
+            db.add(charger)
+            db.flush()
+            if i % 2:
+                # An older completed session plus the live one — only the
+                # newest live session may be reported.
+                db.add(ChargingSession(charger_id=charger.id, transaction_id=10_000 + i,
+                                       start_time=now - timedelta(hours=2), status="completed"))
+                db.add(ChargingSession(charger_id=charger.id, transaction_id=20_000 + i,
+                                       start_time=now - timedelta(minutes=5), status="active"))
+        db.commit()
+        db.close()
+
+    def _count_get(self, url: str) -> int:
+        api.invalidate_chargers_cache()
+        self.statements = 0
+        resp = self.client.get(url, headers={"X-Staff-Token": "x"})
+        self.assertEqual(resp.status_code, 200)
+        return self.statements
+
+    def test_query_count_constant_as_fleet_grows(self):
+        self._seed(10)
+        small = self._count_get("/api/chargers")
+        self._seed(390, start=10)
+        large = self._count_get("/api/chargers")
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 3)
+
+    def test_active_transaction_is_latest_live_session(self):
+        self._seed(4)
+        by_cp = {c["charge_point_id"]: c for c in self.client.get(
+            "/api/chargers", headers={"X-Staff-Token": "x"}).json()}
+        self.assertIsNone(by_cp["CP0000"]["active_transaction_id"])
+        self.assertEqual(by_cp["CP0001"]["active_transaction_id"], 20_001)
+
+    def test_views_share_one_snapshot(self):
+        self._seed(6)
+        self._count_get("/api/chargers")
+        self.statements = 0
+        self.client.get("/api/chargers?tenant=acme")
+        self.client.get("/api/chargers?online_only=1", headers={"X-Staff-Token": "x"})
+        self.assertEqual(self.statements, 0)
+        anon = self.client.get("/api/chargers?tenant=acme").json()
+        self.assertEqual(len(anon), 4)
+        self.assertTrue(all(c["active_transaction_id"] is None for c in anon))
+
+
+if __name__ == "__main__":
+    unittest.main()
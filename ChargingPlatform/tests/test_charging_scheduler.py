@@ -0,0 +1,153 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import charging_scheduler
+import ocpp_db
+import ocpp_server
+from charging_scheduler import ChargingScheduler, next_fire_time
+from database import Charger, ChargingSchedule, ChargingSession
+from db_case import DbTestCase
+from query_counter import QueryCounter
+
+
+class NextFireTimeTests(unittest.TestCase):
+    """HH:MM in MYT → next matching occurrence as naive UTC."""
+
+    # Wednesday 2026-07-15 10:00 MYT
+    WED_10_MYT = datetime(2026, 7, 15, 2, 0)
+
+    def test_same_day_and_rollover(self):
+        self.assertEqual(next_fire_time("22:30", "daily", self.WED_10_MYT), datetime(2026, 7, 15, 14, 30))
+        self.assertEqual(next_fire_time("09:00", "daily", self.WED_10_MYT), datetime(2026, 7, 16, 1, 0))
+        # exactly now is not "after"
+        self.assertEqual(next_fire_time("10:00", "daily", self.WED_10_MYT), datetime(2026, 7, 16, 2, 0))
+
+    def test_day_filters(self):
+        # weekends → Saturday 2026-07-18; "0" (Sunday) → 2026-07-19
+        self.assertEqual(next_fire_time("07:00", "weekends", self.WED_10_MYT), datetime(2026, 7, 17, 23, 0))
+        self.assertEqual(next_fire_time("07:00", "0", self.WED_10_MYT), datetime(2026, 7, 18, 23, 0))
+        self.assertEqual(next_fire_time("07:00", "weekdays", self.WED_10_MYT), datetime(2026, 7, 15, 23, 0))
+        self.assertIsNone(next_fire_time("07:00", "9", self.WED_10_MYT))
+        self.assertIsNone(next_fire_time("7am", "daily", self.WED_10_MYT))
+
+
+class ChargingSchedulerTests(DbTestCase):
+    """Priority queue kept in step by upsert/remove; a persisted claim makes
+    each occurrence fire once, however many schedulers see it."""
+
+    NOW = datetime(2026, 7, 15, 2, 0)  # 10:00 MYT
+
+    def setUp(self):
+        super().setUp()
+        db = self.Session()
+        charger = Charger(charge_point_id="SCH-1")
+        db.add(charger)
+        db.commit()
+        self.charger_pk = charger.id
+        db.close()
+
+        self.cp = SimpleNamespace(
+            remote_start_transaction=mock.AsyncMock(return_value=SimpleNamespace(status="Accepted")),
+            remote_stop_transaction=mock.AsyncMock(return_value=SimpleNamespace(status="Accepted")),
+        )
+        patches = [
+            mock.patch.object(ocpp_db, "SessionLocal", self.Session),
+            mock.patch.object(ocpp_server, "get_active_charge_point", lambda cp_id: self.cp),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _schedule(self, start="10:05", stop="12:00", days="daily", enabled=True):
+        db = self.Session()
+        row = ChargingSchedule(user_id=1, charger_id=self.charger_pk, charge_point_id="SCH-1",
+                               start_time=start, stop_time=stop, days_of_week=days, enabled=enabled)
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+        db.expunge(row)
+        db.close()
+        return row
+
+    def test_upsert_and_remove_keep_queue_in_step(self):
+        sched = ChargingScheduler()
+        row = self._schedule()
+        sched.upsert(row, self.NOW)
+        self.assertEqual(sched.next_due(), datetime(2026, 7, 15, 2, 5))
+
+        row.start_time = "11:00"
+        sched.upsert(row, self.NOW)
+        self.assertEqual(sched.next_due(), datetime(2026, 7, 15, 3, 0))
+        self.assertEqual(sched.pop_due(datetime(2026, 7, 15, 2, 30)), [])  # old 10:05 entry is stale
+
+        row.enabled = False
+        sched.upsert(row, self.NOW)
+        self.assertIsNone(sched.next_due())
+        row.enabled = True
+        sched.upsert(row, self.NOW)
+        sched.remove(row.id)
+        self.assertEqual((len(sched), sched.next_due()), (0, None))
+
+    def test_due_occurrence_fires_once_across_schedulers(self):
+        row = self._schedule()
+        first, second = ChargingScheduler(), ChargingScheduler()
+        for sched in (first, second):
+            sched.upsert(row, self.NOW)
+        due = datetime(2026, 7, 15, 2, 5, 3)
+        self.assertEqual(asyncio.run(first.run_due(due)), 1)
+        self.assertEqual(asyncio.run(second.run_due(due)), 0)
+        self.cp.remote_start_transaction.assert_awaited_once_with(connector_id=1, id_tag="APP_USER")
+        self.assertEqual(second.stats["dedup_skipped"], 1)
+        # Both queued tomorrow's start next.
+        self.assertEqual(first.next_due(), second.next_due())
+
+        db = self.Session()
+        self.assertEqual(db.get(ChargingSchedule, row.id).last_triggered_start, datetime(2026, 7, 15, 2, 5))
+        db.close()
+
+    def test_stop_targets_open_session_and_late_occurrences_skip(self):
+        row = self._schedule(start="09:00", stop="10:30")
+        db = self.Session()
+        db.add(ChargingSession(charger_id=self.charger_pk, transaction_id=77, status="active",
+                               start_time=self.NOW - timedelta(hours=1)))
+        db.commit()
+        db.close()
+
+        sched = ChargingScheduler()
+        sched.upsert(row, self.NOW)
+        self.assertEqual(asyncio.run(sched.run_due(datetime(2026, 7, 15, 2, 30, 10))), 1)
+        self.cp.remote_stop_transaction.assert_awaited_once_with(transaction_id=77)
+
+        # Tomorrow's 09:00 start, seen ten minutes late: skipped, not fired.
+        self.assertEqual(asyncio.run(sched.run_due(datetime(2026, 7, 16, 1, 10))), 0)
+        self.assertEqual(sched.stats["skipped_late"], 1)
+        self.cp.remote_start_transaction.assert_not_awaited()
+
+    def test_deleted_elsewhere_is_dropped_on_claim_miss(self):
+        row = self._schedule()
+        sched = ChargingScheduler()
+        sched.upsert(row, self.NOW)
+        db = self.Session()
+        db.query(ChargingSchedule).delete()
+        db.commit()
+        db.close()
+        self.assertEqual(asyncio.run(sched.run_due(datetime(2026, 7, 15, 2, 5))), 0)
+        self.assertEqual(len(sched), 0)
+        self.cp.remote_start_transaction.assert_not_awaited()
+
+    def test_idle_schedules_cost_nothing(self):
+        for i in range(300):
+            self._schedule(start=f"{(i % 12) + 13:02d}:00", stop="23:59")
+        sched = ChargingScheduler()
+        asyncio.run(sched.resync(None))
+        self.assertEqual(len(sched), 300)
+        with QueryCounter(self.engine) as qc:
+            self.assertEqual(asyncio.run(sched.run_due(self.NOW + timedelta(minutes=30))), 0)
+        self.assertEqual(qc.count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import unittest
+
+from event_bus import ChargerStatusChanged, EventBus, FaultChanged, SessionStarted
+
+
+class EventBusTests(unittest.TestCase):
+    """Typed fan-out across loops; subscribers cannot hurt the publisher
+    or each other."""
+
+    def setUp(self):
+        self.bus = EventBus()
+
+    def test_events_reach_subscribers_on_their_own_loop(self):
+        """Publisher on one thread, subscriber loop on another."""
+        received, ready, done = [], threading.Event(), threading.Event()
+        state = {}
+
+        def consumer():
+            async def main():
+                loop = asyncio.get_running_loop()
+
+                async def on_started(event):
+                    received.append((event.transaction_id, threading.get_ident(), asyncio.get_running_loop()))
+                    done.set()
+
+                self.bus.subscribe(on_started, SessionStarted, loop=loop)
+                state["thread"], state["loop"] = threading.get_ident(), loop
+                ready.set()
+                while not done.is_set():
+                    await asyncio.sleep(0.005)
+
+            asyncio.run(main())
+
+        worker = threading.Thread(target=consumer)
+        worker.start()
+        self.assertTrue(ready.wait(5))
+        self.bus.publish(ChargerStatusChanged("EB-1", {"availability": "charging"}))  # other type: skipped
+        self.bus.publish(SessionStarted("EB-1", transaction_id=42))
+        worker.join(5)
+
+        self.assertEqual(received, [(42, state["thread"], state["loop"])])
+        self.assertEqual(self.bus.stats["delivered"], 1)
+
+    def test_failing_subscriber_is_isolated(self):
+        seen = []
+
+        def broken(event):
+            raise RuntimeError("boom")
+
+        self.bus.subscribe(broken)
+        self.bus.subscribe(seen.append, FaultChanged)
+        with self.assertLogs("event_bus", level="ERROR"):
+            self.bus.publish(FaultChanged("EB-2", "raised", error_code="GroundFailure"))
+
+        self.assertEqual([e.error_code for e in seen], ["GroundFailure"])
+        self.assertEqual((self.bus.stats["errors"], self.bus.stats["delivered"]), (1, 1))
+
+    def test_subscribers_of_closed_loops_are_dropped(self):
+        loop = asyncio.new_event_loop()
+        self.bus.subscribe(lambda event: None, loop=loop)
+        inline = self.bus.subscribe(lambda event: None)
+        loop.close()
+
+        self.bus.publish(SessionStarted("EB-3", transaction_id=1))
+        self.assertEqual(self.bus.subscriber_count, 1)
+        self.bus.unsubscribe(inline)
+        self.assertEqual(self.bus.subscriber_count, 0)
+
+    def test_coroutine_subscriber_needs_a_loop(self):
+        async def handler(event):
+            pass
+
+        with self.assertRaises(ValueError):
+            self.bus.subscribe(handler)
+
+
+if __name__ == "__main__":
+    unittest.main()
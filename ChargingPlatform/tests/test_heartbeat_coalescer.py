@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import heartbeat_coalescer as coalescer_module
+import ocpp_db
+from database import Charger
+from db_case import DbTestCase
+from heartbeat_coalescer import HeartbeatCoalescer
+from query_counter import QueryCounter
+
+
+class HeartbeatCoalescerTests(DbTestCase):
+    """touch() stays in memory; flush() writes each charger's own timestamp
+    in one UPDATE; effective() overlays memory on the DB value."""
+
+    T0 = datetime(2026, 7, 1, 8, 0, 0)
+
+    def setUp(self):
+        super().setUp()
+        db = self.Session()
+        db.add_all([Charger(charge_point_id=f"HB-{i}", status="offline") for i in range(3)])
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(ocpp_db, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.coalescer = HeartbeatCoalescer()
+
+    def _rows(self):
+        db = self.Session()
+        rows = {c.charge_point_id: (c.status, c.last_heartbeat) for c in db.query(Charger)}
+        db.close()
+        return rows
+
+    def test_flush_is_one_case_update(self):
+        for i in range(3):
+            self.coalescer.touch(f"HB-{i}", self.T0 + timedelta(seconds=i))
+        self.coalescer.touch("HB-GONE", self.T0)  # row deleted meanwhile — ignored
+        with QueryCounter(self.engine) as qc:
+            self.assertEqual(asyncio.run(self.coalescer.flush()), 3)
+        self.assertEqual(qc.count, 1)
+        self.assertEqual(self._rows(), {f"HB-{i}": ("online", self.T0 + timedelta(seconds=i)) for i in range(3)})
+        self.assertEqual(self.coalescer.pending, 0)
+        self.assertEqual(asyncio.run(self.coalescer.flush()), 0)
+
+    def test_large_flush_is_chunked(self):
+        for i in range(3):
+            self.coalescer.touch(f"HB-{i}", self.T0)
+        with mock.patch.object(coalescer_module, "_FLUSH_CHUNK", 2), QueryCounter(self.engine) as qc:
+            self.assertEqual(asyncio.run(self.coalescer.flush()), 3)
+        self.assertEqual(qc.count, 2)
+
+    def test_effective_is_the_fresher_timestamp(self):
+        db_value = self.T0.replace(tzinfo=timezone.utc)
+        self.assertEqual(self.coalescer.effective("HB-0", db_value), db_value)
+        self.coalescer.touch("HB-0", self.T0 + timedelta(seconds=30))
+        self.assertEqual(self.coalescer.effective("HB-0", db_value), self.T0 + timedelta(seconds=30))
+        self.assertEqual(self.coalescer.effective("HB-0", None), self.T0 + timedelta(seconds=30))
+        self.assertEqual(self.coalescer.effective("HB-0", self.T0 + timedelta(minutes=5)),
+                         self.T0 + timedelta(minutes=5))
+        self.coalescer.forget("HB-0")
+        self.assertIsNone(self.coalescer.effective("HB-0", None))
+
+    def test_failed_flush_is_requeued_without_overwriting_newer_touches(self):
+        self.coalescer.touch("HB-0", self.T0)
+        self.coalescer.touch("HB-1", self.T0)
+
+        async def failing_run_db(fn, batch):
+            self.coalescer.touch("HB-1", self.T0 + timedelta(seconds=10))  # arrives mid-flush
+            raise RuntimeError("lock wait timeout")
+
+        with mock.patch.object(coalescer_module, "run_db", failing_run_db):
+            self.assertEqual(asyncio.run(self.coalescer.flush()), 0)
+        self.assertEqual(self.coalescer.stats["failed_flushes"], 1)
+        self.assertEqual(self.coalescer.pending, 2)
+
+        self.assertEqual(asyncio.run(self.coalescer.flush()), 2)
+        rows = self._rows()
+        self.assertEqual(rows["HB-0"], ("online", self.T0))
+        self.assertEqual(rows["HB-1"], ("online", self.T0 + timedelta(seconds=10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import csv
+import io
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import api
+import invoice_export
+from database import Charger, ChargingSession, MaintenanceRecord, Pricing
+from db_case import DbTestCase
+
+
+class InvoiceExportTests(DbTestCase):
+    """Streaming invoice exports: charger joined in SQL, chunked output,
+    same rows as /api/invoice/sessions."""
+
+    START = datetime(2026, 7, 1, 8, 0, 0)
+
+    def setUp(self):
+        super().setUp()
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        api.app.dependency_overrides[api.require_admin_or_staff_admin_stream] = lambda: {"role": "admin"}
+        patcher = mock.patch.object(api, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(api.app)
+        self._seed()
+
+    def _seed(self):
+        db = self.Session()
+        chargers = [Charger(charge_point_id="INV-A"), Charger(charge_point_id="INV-B")]
+        db.add_all(chargers)
+        db.add(Pricing(price_per_kwh=Decimal("0.8000"), is_active=True))
+        db.flush()
+        db.add(Pricing(charger_id=chargers[1].id, price_per_kwh=Decimal("1.2000"), is_active=True))
+        for i in range(25):
+            start = self.START + timedelta(hours=i)
+            db.add(ChargingSession(
+                charger_id=chargers[i % 2].id, transaction_id=500 + i, status="completed",
+                start_time=start, stop_time=start + timedelta(minutes=30), energy_consumed=2.5,
+            ))
+        db.commit()
+        db.close()
+
+    def test_csv_export_matches_session_list(self):
+        listed = self.client.get("/api/invoice/sessions", params={"charger_id": "INV-A"}).json()
+        resp = self.client.get("/api/invoice/sessions/export", params={"charger_id": "INV-A"})
+
+        self.assertEqual(resp.status_code, 200, resp.text)
+        self.assertTrue(resp.headers["content-type"].startswith("text/csv"))
+        self.assertIn('filename="invoice_sessions_INV-A_all.csv"', resp.headers["content-disposition"])
+        self.assertEqual(resp.headers["x-accel-buffering"], "no")
+        rows = list(csv.DictReader(io.StringIO(resp.text)))
+        self.assertEqual(len(rows), 13)
+        self.assertEqual([int(r["id"]) for r in rows], [s["id"] for s in listed])
+        self.assertEqual(rows[0]["charge_point_id"], "INV-A")
+        self.assertEqual(rows[0]["start_time"], listed[0]["start_time"])
+        self.assertEqual(float(rows[0]["amount"]), 2.0)
+        self.assertEqual(float(rows[0]["price_per_kwh"]), 0.8)
+        self.assertEqual(float(rows[0]["duration_minutes"]), 30.0)
+
+    def test_csv_is_chunked_and_query_count_is_flat(self):
+        statements = []
+        event.listen(self.engine, "before_cursor_execute", lambda *a, **k: statements.append(1))
+        chunks = list(invoice_export.stream_csv(self.Session(), chunk_rows=10))
+
+        self.assertEqual(len(chunks), 4)  # header + 10 + 10 + 5
+        self.assertEqual(sum(c.count(b"\n") for c in chunks), 26)
+        self.assertEqual(len(statements), 2)  # pricing + one joined SELECT
+
+    def test_summary_aggregates_per_charger_in_sql(self):
+        statements = []
+        event.listen(self.engine, "before_cursor_execute", lambda *a, **k: statements.append(1))
+        body = self.client.get("/api/invoice/summary").json()
+
+        self.assertEqual(body["sessions"], {"total": 25, "completed": 25, "active": 0})
+        self.assertEqual(body["energy"]["total_kwh"], 62.5)
+        # INV-A: 13 × 2.5 kWh × 0.80, INV-B: 12 × 2.5 kWh × 1.20 (its own tariff)
+        self.assertEqual(body["charger_breakdown"]["INV-A"]["revenue"], 26.0)
+        self.assertEqual(body["charger_breakdown"]["INV-B"]["revenue"], 36.0)
+        self.assertEqual(body["revenue"]["total"], 62.0)
+        self.assertEqual(body["charger_breakdown"]["INV-B"]["duration_minutes"], 360.0)
+        self.assertEqual(body["duration"]["total_minutes"], 750.0)
+        self.assertEqual(len(statements), 3)  # prices, GROUP BY, maintenance
+
+        only_b = self.client.get("/api/invoice/summary", params={"charger_id": "INV-B"}).json()
+        self.assertEqual(list(only_b["charger_breakdown"]), ["INV-B"])
+        self.assertEqual(only_b["sessions"]["total"], 12)
+
+    def _python_summary(self, start_dt=None, end_dt=None):
+        """The pre-SQL computation — every session loaded and summed in
+        Python — with each charger billed at its own active tariff."""
+        db = self.Session()
+        prices = {p.charger_id: float(p.price_per_kwh) for p in db.query(Pricing).filter(Pricing.is_active == True)}
+        query = db.query(ChargingSession)
+        if start_dt:
+            query = query.filter(ChargingSession.start_time >= start_dt)
+        if end_dt:
+            query = query.filter(ChargingSession.start_time <= end_dt)
+        counts = {"total": 0, "completed": 0, "active": 0}
+        energy = revenue = minutes = 0.0
+        breakdown = {}
+        for s in query.all():
+            cp_id = db.get(Charger, s.charger_id).charge_point_id
+            kwh = s.energy_consumed or 0
+            price = prices.get(s.charger_id, prices.get(None, 0.50))
+            mins = (s.stop_time - s.start_time).total_seconds() / 60 if s.start_time and s.stop_time else 0
+            counts["total"] += 1
+            counts[s.status] = counts.get(s.status, 0) + 1
+            energy, revenue, minutes = energy + kwh, revenue + kwh * price, minutes + mins
+            row = breakdown.setdefault(cp_id, {"sessions": 0, "energy_kwh": 0, "revenue": 0, "duration_minutes": 0,
+                                               "price_per_kwh": price})
+            row["sessions"] += 1
+            row["energy_kwh"] += kwh
+            row["revenue"] += kwh * price
+            row["duration_minutes"] += mins
+        maintenance = db.query(MaintenanceRecord)
+        if start_dt:
+            maintenance = maintenance.filter(MaintenanceRecord.date_reported >= start_dt)
+        if end_dt:
+            maintenance = maintenance.filter(MaintenanceRecord.date_reported <= end_dt)
+        cost = sum(float(m.cost or 0) for m in maintenance.all())
+        records = maintenance.count()
+        db.close()
+        for row in breakdown.values():
+            row.update(energy_kwh=round(row["energy_kwh"], 2), revenue=round(row["revenue"], 2),
+                       duration_minutes=round(row["duration_minutes"], 1))
+        return {
+            "sessions": {k: counts.get(k, 0) for k in ("total", "completed", "active")},
+            "energy_kwh": round(energy, 2), "revenue": round(revenue, 2),
+            "duration_minutes": round(minutes, 1),
+            "maintenance": {"total_records": records, "total_cost": round(cost, 2)},
+            "net_profit": round(revenue - cost, 2),
+            "charger_breakdown": breakdown,
+        }
+
+    def test_summary_matches_python_computation(self):
+        db = self.Session()
+        fallback = Charger(charge_point_id="INV-C")  # no own tariff: default price
+        db.add(fallback)
+        db.flush()
+        for i, (status, kwh, minutes) in enumerate((("completed", 3.3, 47), ("active", 1.25, None),
+                                                    ("completed", None, 12), ("completed", 7.75, 95))):
+            start = self.START + timedelta(days=i, minutes=7 * i)
+            db.add(ChargingSession(charger_id=fallback.id, transaction_id=900 + i, status=status, start_time=start,
+                                   stop_time=start + timedelta(minutes=minutes) if minutes else None,
+                                   energy_consumed=kwh))
+        for days, cost in ((0, Decimal("10.50")), (1, None), (5, Decimal("99.99"))):
+            db.add(MaintenanceRecord(charger_id=fallback.id, maintenance_type="repair", work_performed="x",
+                                     cost=cost, date_reported=self.START + timedelta(days=days)))
+        db.commit()
+        db.close()
+
+        for params, start_dt, end_dt in (({}, None, None),
+                                         ({"start_date": "2026-07-01T00:00:00", "end_date": "2026-07-02T12:00:00"},
+                                          datetime(2026, 7, 1), datetime(2026, 7, 2, 12, 0, 0))):
+            with self.subTest(params=params):
+                body = self.client.get("/api/invoice/summary", params=params).json()
+                expected = self._python_summary(start_dt, end_dt)
+                self.assertEqual(body["sessions"], expected["sessions"])
+                self.assertEqual(body["energy"]["total_kwh"], expected["energy_kwh"])
+                self.assertEqual(body["revenue"]["total"], expected["revenue"])
+                self.assertEqual(body["duration"]["total_minutes"], expected["duration_minutes"])
+                self.assertEqual(body["maintenance"], expected["maintenance"])
+                self.assertEqual(body["net_profit"], expected["net_profit"])
+                self.assertEqual(body["charger_breakdown"], expected["charger_breakdown"])
+        self.assertEqual(body["charger_breakdown"]["INV-C"]["price_per_kwh"], 0.8)
+        self.assertEqual(body["sessions"]["active"], 1)
+
+    def test_unknown_format_and_missing_pyarrow(self):
+        self.assertEqual(self.client.get("/api/invoice/sessions/export?format=xlsx").status_code, 400)
+        with mock.patch.object(invoice_export, "pa", None):
+            resp = self.client.get("/api/invoice/sessions/export?format=parquet")
+        self.assertEqual(resp.status_code, 501)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import re
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+import api
+from database import Charger, ChargingSession, PaymentTransaction, SupportTicket, User
+from db_case import DbTestCase
+from keyset import InvalidCursor, decode_cursor, encode_cursor
+from ocpi.router import _ocpi_auth
+from query_counter import QueryCounter
+
+
+class KeysetPaginationTests(DbTestCase):
+    """Cursor paging walks every row exactly once — including rows that
+    share a timestamp — and cursor pages skip the COUNT."""
+
+    NOW = datetime(2026, 7, 21, 9, 0, 0)
+    ROWS = 23
+    # Newest first; rows sharing a timestamp by id descending.
+    ORDER = sorted(range(ROWS), key=lambda i: (i // 3, -i))
+
+    def setUp(self):
+        super().setUp()
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        api.app.dependency_overrides[_ocpi_auth] = lambda: None
+        self.client = TestClient(api.app)
+        self._seed()
+
+    def _seed(self):
+        db = self.Session()
+        user = User(email="k@x.test", password_hash="x")
+        charger = Charger(charge_point_id="KS-1")
+        db.add_all([user, charger])
+        db.flush()
+        for i in range(self.ROWS):
+            ts = self.NOW - timedelta(minutes=i // 3)  # three rows per timestamp
+            db.add(PaymentTransaction(transaction_ref=f"TXN-K{i:03d}", user_id=user.id, user_email=user.email,
+                                      amount=Decimal("5.00"), gateway_name="tng", status="success",
+                                      created_at=ts, paid_at=ts))
+            db.add(SupportTicket(ticket_number=f"TK-K{i:03d}", user_email=user.email, category="billing",
+                                 subject="s", description="d", created_at=ts))
+            db.add(ChargingSession(charger_id=charger.id, transaction_id=9000 + i, status="completed",
+                                   start_time=ts, stop_time=ts + timedelta(minutes=5), energy_consumed=1.0))
+        db.commit()
+        db.close()
+
+    def _next(self, resp):
+        link = resp.headers.get("link")
+        return re.match(r"<([^>]+)>", link).group(1) if link else None
+
+    def test_cursor_roundtrip_and_rejects_garbage(self):
+        token = encode_cursor([self.NOW, 42])
+        self.assertEqual(decode_cursor(token, (PaymentTransaction.created_at, PaymentTransaction.id)), (self.NOW, 42))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor", (PaymentTransaction.created_at, PaymentTransaction.id))
+        self.assertEqual(self.client.get("/api/sync/transactions?cursor=zzz").status_code, 400)
+
+    def test_sync_transactions_cursor_walk(self):
+        first = self.client.get("/api/sync/transactions?limit=5").json()
+        self.assertEqual(first["total"], self.ROWS)
+        refs = [t["transaction_ref"] for t in first["transactions"]]
+        cursor = first["next_cursor"]
+        while cursor:
+            with QueryCounter(self.engine) as qc:
+                page = self.client.get(f"/api/sync/transactions?limit=5&cursor={cursor}").json()
+            self.assertFalse(any("count(" in sql.lower() for sql in qc.statements), str(qc))
+            self.assertIsNone(page["total"])
+            refs += [t["transaction_ref"] for t in page["transactions"]]
+            cursor = page["next_cursor"]
+        self.assertEqual(refs, [f"TXN-K{i:03d}" for i in self.ORDER])
+
+        estimated = self.client.get(f"/api/sync/transactions?limit=5&cursor={first['next_cursor']}"
+                                    "&include_total=true").json()
+        self.assertEqual(estimated["total"], self.ROWS)
+
+    def test_tickets_and_sessions_cursor_walk(self):
+        page = self.client.get("/api/tickets?limit=10").json()
+        numbers = [t["ticket_number"] for t in page["tickets"]]
+        while page["next_cursor"]:
+            page = self.client.get(f"/api/tickets?limit=10&cursor={page['next_cursor']}").json()
+            numbers += [t["ticket_number"] for t in page["tickets"]]
+        self.assertEqual(numbers, [f"TK-K{i:03d}" for i in self.ORDER])
+
+        url, txns = "/api/sessions?limit=7", []
+        while url:
+            resp = self.client.get(url)
+            txns += [s["transaction_id"] for s in resp.json()]
+            url = self._next(resp)
+        self.assertEqual(txns, [9000 + i for i in self.ORDER])
+
+    def test_ocpi_link_headers(self):
+        url, ids = "/ocpi/2.2.1/cdrs?limit=10", []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.headers["x-total-count"], str(self.ROWS))
+            self.assertEqual(resp.headers["x-limit"], "10")
+            ids += [c["id"] for c in resp.json()["data"]]
+            url = self._next(resp)
+        self.assertEqual(ids, [str(9000 + i) for i in self.ORDER])
+
+        locations = self.client.get("/ocpi/2.2.1/locations")
+        self.assertNotIn("link", locations.headers)
+        self.assertEqual(len(locations.json()["data"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
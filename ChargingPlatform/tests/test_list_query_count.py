@@ -0,0 +1,134 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api
+from database import (
+    Charger, ChargingSession, Fault, PaymentTransaction, Pricing, StaffSession, SupportStaff, SupportTicket,
+    TicketMessage, User, _utcnow,
+)
+from db_case import DbTestCase
+from ocpi.router import _ocpi_auth
+from query_counter import QueryCounter
+
+
+class ListQueryCountTests(DbTestCase):
+    """List endpoints issue a fixed number of SQL statements whatever the
+    page size — related rows come from joins, batched IN queries or
+    correlated COUNTs, never one lazy query per row."""
+
+    NOW = datetime(2026, 7, 20, 12, 0, 0)
+
+    def setUp(self):
+        super().setUp()
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        api.app.dependency_overrides[_ocpi_auth] = lambda: None
+        self.client = TestClient(api.app)
+        self.seeded = 0
+        db = self.Session()
+        self.user = User(email="q@x.test", password_hash="x")
+        db.add(self.user)
+        db.add(Pricing(price_per_kwh=Decimal("0.6000"), is_active=True))
+        staff = SupportStaff(name="Lead", email="lead@x.test", password_hash="x", department="billing", role="admin")
+        db.add(staff)
+        db.flush()
+        db.add(StaffSession(staff_id=staff.id, token="staff-token", expires_at=_utcnow() + timedelta(hours=1)))
+        db.commit()
+        self.user_id = self.user.id
+        db.close()
+
+    def _seed(self, n: int) -> None:
+        db = self.Session()
+        for i in range(self.seeded, self.seeded + n):
+            charger = Charger(charge_point_id=f"LQ{i:04d}")
+            db.add(charger)
+            db.flush()
+            if i % 2:
+                db.add(Pricing(charger_id=charger.id, price_per_kwh=Decimal("1.0000"), is_active=True))
+            paid_at = self.NOW - timedelta(hours=i)
+            db.add(ChargingSession(charger_id=charger.id, transaction_id=7000 + i, status="completed",
+                                   start_time=paid_at + timedelta(minutes=1),
+                                   stop_time=paid_at + timedelta(minutes=40), energy_consumed=4.0))
+            db.add(Fault(charger_id=charger.id, fault_type="overcurrent"))
+            ticket = SupportTicket(ticket_number=f"TK{i:05d}", user_email="q@x.test", category="billing",
+                                   subject="s", description="d")
+            db.add(ticket)
+            db.flush()
+            for _ in range(i % 3):
+                db.add(TicketMessage(ticket_id=ticket.id, sender_type="user", message="m"))
+            db.add(PaymentTransaction(transaction_ref=f"TXN-{i:05d}", user_id=self.user_id, user_email="q@x.test",
+                                      amount=Decimal("10.00"), gateway_name="tng", status="success",
+                                      charger_id=charger.charge_point_id, paid_at=paid_at, created_at=paid_at))
+        db.commit()
+        db.close()
+        self.seeded += n
+
+    def _count(self, url: str) -> int:
+        with QueryCounter(self.engine) as qc:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200, resp.text)
+        return qc.count
+
+    def test_list_endpoints_statement_count_is_flat(self):
+        urls = ("/api/sessions?limit=500", "/api/faults", "/api/tickets?limit=500",
+                "/api/sync/transactions?limit=500", "/ocpi/2.2.1/sessions?limit=500",
+                "/ocpi/2.2.1/cdrs?limit=500", "/api/staff/my-tickets?token=staff-token")
+        self._seed(3)
+        small = {url: self._count(url) for url in urls}
+        self._seed(40)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self._count(url), small[url])
+                self.assertLessEqual(small[url], 4)  # sync: count, page, chargers, sessions; staff: 2 auth + page
+
+    def test_batched_payloads_match_rows(self):
+        self._seed(6)
+        tickets = self.client.get("/api/tickets").json()["tickets"]
+        self.assertEqual({t["ticket_number"]: t["message_count"] for t in tickets}["TK00005"], 2)
+        mine = self.client.get("/api/staff/my-tickets", params={"token": "staff-token"}).json()["tickets"]
+        self.assertEqual({t["ticket_number"]: t["message_count"] for t in mine}["TK00004"], 1)
+
+        txns = {t["transaction_ref"]: t for t in self.client.get("/api/sync/transactions").json()["transactions"]}
+        self.assertEqual(txns["TXN-00004"]["charger"]["id"], "LQ0004")
+        self.assertEqual(txns["TXN-00004"]["charging_session"]["transaction_id"], 7004)
+        self.assertEqual(txns["TXN-00004"]["charging_session"]["duration_seconds"], 39 * 60)
+
+        cdrs = {c["id"]: c for c in self.client.get("/ocpi/2.2.1/cdrs").json()["data"]}
+        self.assertEqual(cdrs["7000"]["total_cost"], 2.4)  # default tariff
+        self.assertEqual(cdrs["7001"]["total_cost"], 4.0)  # charger's own tariff
+
+        sessions = self.client.get("/api/sessions", params={"charge_point_id": "LQ0002"}).json()
+        self.assertEqual([s["transaction_id"] for s in sessions], [7002])
+        self.assertEqual(self.client.get("/api/sessions", params={"charge_point_id": "nope"}).json(), [])
+
+    def test_sync_match_loads_one_session_per_transaction(self):
+        db = self.Session()
+        charger = Charger(charge_point_id="BUSY-1")
+        db.add(charger)
+        db.flush()
+        db.add_all([ChargingSession(charger_id=charger.id, transaction_id=9000 + i, status="completed",
+                                    start_time=self.NOW + timedelta(minutes=10 * i)) for i in range(300)])
+        txns = [PaymentTransaction(transaction_ref=f"TXN-B{i}", user_id=self.user_id, user_email="q@x.test",
+                                   amount=Decimal("5.00"), gateway_name="tng", status="success", charger_id="BUSY-1",
+                                   paid_at=self.NOW + timedelta(minutes=10 * i - 1), created_at=self.NOW)
+                for i in (0, 5, 6, 250)]
+        db.add_all(txns)
+        db.commit()
+        db.expunge_all()
+        txns = db.query(PaymentTransaction).filter(PaymentTransaction.charger_id == "BUSY-1").all()
+
+        with mock.patch.object(api, "_SYNC_MATCH_CHUNK", 3):
+            related = api._sync_related(db, txns)
+        loaded = [o for o in db.identity_map.values() if isinstance(o, ChargingSession)]
+        self.assertEqual({t.transaction_ref: related[t.id][1].transaction_id for t in txns},
+                         {"TXN-B0": 9000, "TXN-B5": 9005, "TXN-B6": 9006, "TXN-B250": 9250})
+        self.assertEqual(len(loaded), 4)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
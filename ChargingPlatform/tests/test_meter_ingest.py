@@ -0,0 +1,142 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import meter_ingest
+import ocpp_db
+from database import MeterValue
+from db_case import DbTestCase
+from meter_ingest import MeterIngestBuffer
+from query_counter import QueryCounter
+
+
+def _rows(start, n):
+    return [{"charger_id": 1, "transaction_id": 7, "timestamp": datetime(2026, 7, 1, 0, 0, i % 60),
+             "total_kwh": float(start + i)} for i in range(n)]
+
+
+class FakeDb:
+    """Stands in for run_db: records batches, fails or blocks on demand."""
+
+    def __init__(self):
+        self.batches = []
+        self.failures = 0
+        self.gate = None
+
+    async def __call__(self, fn, rows):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("deadlock")
+        self.batches.append([r["total_kwh"] for r in rows])
+        return len(rows)
+
+
+class MeterIngestBufferTests(DbTestCase):
+    """Write-behind: bulk flushes, backpressure, retry, drop, shutdown drain."""
+
+    def setUp(self):
+        super().setUp()
+        self.db = FakeDb()
+        patcher = mock.patch.object(meter_ingest, "run_db", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bulk_insert_is_one_statement(self):
+        buffer = MeterIngestBuffer(batch_size=50, flush_seconds=60)
+
+        async def scenario():
+            await buffer.put(_rows(0, 50))
+            with QueryCounter(self.engine) as qc:
+                await buffer.close()
+            return qc.count
+
+        with mock.patch.object(meter_ingest, "run_db", ocpp_db.run_db), \
+                mock.patch.object(ocpp_db, "SessionLocal", self.Session):
+            statements = asyncio.run(scenario())
+        db = self.Session()
+        self.assertEqual(db.query(MeterValue).count(), 50)
+        db.close()
+        self.assertEqual(statements, 1)
+
+    def test_batch_size_triggers_flush(self):
+        buffer = MeterIngestBuffer(batch_size=3, flush_seconds=60)
+
+        async def scenario():
+            await buffer.put(_rows(0, 2))
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.db.batches, [])
+            await buffer.put(_rows(2, 2))
+            await asyncio.sleep(0.01)
+            await buffer.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.db.batches, [[0.0, 1.0, 2.0], [3.0]])
+
+    def test_full_buffer_waits_then_drops(self):
+        buffer = MeterIngestBuffer(batch_size=2, flush_seconds=60, max_pending=2, put_timeout=0.05)
+
+        async def scenario():
+            self.db.gate = asyncio.Event()
+            await buffer.put(_rows(0, 2))
+            await asyncio.sleep(0.01)  # flush task holds the first batch
+            await buffer.put(_rows(2, 2))
+            self.assertFalse(await buffer.put(_rows(4, 1)))  # DB not draining
+            waiter = asyncio.create_task(buffer.put(_rows(5, 1)))
+            await asyncio.sleep(0.01)
+            self.db.gate.set()
+            self.assertTrue(await waiter)
+            await buffer.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(buffer.stats["dropped"], 1)
+        self.assertEqual(buffer.stats["waits"], 2)
+        self.assertEqual(sum(self.db.batches, []), [0.0, 1.0, 2.0, 3.0, 5.0])
+
+    def test_failed_flush_is_requeued_in_order(self):
+        buffer = MeterIngestBuffer(batch_size=2, flush_seconds=60)
+
+        async def scenario():
+            buffer._rows.extend(_rows(0, 3))
+            self.db.failures = 2
+            self.assertEqual(await buffer.flush(), 0)
+            self.assertEqual(buffer.pending, 3)
+            self.assertEqual(await buffer.flush(), 0)
+            self.assertEqual(await buffer.flush(), 3)
+
+        asyncio.run(scenario())
+        self.assertEqual(self.db.batches, [[0.0, 1.0], [2.0]])
+        self.assertEqual(buffer.stats["failed_flushes"], 2)
+
+    def test_batch_dropped_after_max_attempts(self):
+        buffer = MeterIngestBuffer(batch_size=2, flush_seconds=60)
+
+        async def scenario():
+            buffer._rows.extend(_rows(0, 3))
+            self.db.failures = meter_ingest._MAX_FLUSH_ATTEMPTS
+            for _ in range(meter_ingest._MAX_FLUSH_ATTEMPTS):
+                await buffer.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.db.batches, [[2.0]])  # the next batch goes on
+        self.assertEqual(buffer.stats["dropped"], 2)
+        self.assertEqual(buffer.pending, 0)
+
+    def test_shutdown_drains_and_writes_through(self):
+        buffer = MeterIngestBuffer(batch_size=100, flush_seconds=60)
+
+        async def scenario():
+            await buffer.put(_rows(0, 3))
+            with mock.patch.object(meter_ingest, "meter_buffer", buffer):
+                await meter_ingest.drain_meter_buffer()
+            self.assertEqual(buffer.pending, 0)
+            await buffer.put(_rows(3, 1))  # late sample after close
+
+        asyncio.run(scenario())
+        self.assertEqual(self.db.batches, [[0.0, 1.0, 2.0], [3.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
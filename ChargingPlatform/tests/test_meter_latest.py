@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import api
+from database import Charger, ChargerMeterLatest, MeterValue, TransactionMeterLatest
+from db_case import DbTestCase
+from meter_latest import latest_for_charger, latest_for_transaction, record_latest_sample
+
+
+class MeterLatestTests(DbTestCase):
+    """Latest-sample cache: updated in place, never rewound by late samples,
+    and served by /api/metering/{cp}/latest without touching meter_values."""
+
+    T0 = datetime(2026, 7, 13, 10, 0, 0)
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.Session()
+        charger = Charger(charge_point_id="LATEST-CP", status="online")
+        self.db.add(charger)
+        self.db.commit()
+        self.charger_id = charger.id
+
+    def tearDown(self):
+        self.db.close()
+
+    def _record(self, seconds: int, power: float, transaction_id=None) -> None:
+        record_latest_sample(self.db, self.charger_id, transaction_id, {
+            "timestamp": self.T0 + timedelta(seconds=seconds), "power": power,
+            "voltage": 230.0, "current": 10.0, "total_kwh": seconds / 100.0,
+        })
+        self.db.commit()
+
+    def test_updates_in_place_and_ignores_older_samples(self):
+        self._record(0, 1.0, transaction_id=5)
+        self._record(10, 2.0, transaction_id=5)
+        self._record(5, 99.0, transaction_id=5)  # late, out of order
+
+        self.assertEqual(self.db.query(ChargerMeterLatest).count(), 1)
+        self.assertEqual(self.db.query(TransactionMeterLatest).count(), 1)
+        self.assertEqual(latest_for_charger(self.db, self.charger_id).power, 2.0)
+        self.assertEqual(latest_for_transaction(self.db, 5).power, 2.0)
+
+    def test_offset_timestamps_are_stored_as_wall_time(self):
+        aware = datetime(2026, 7, 13, 10, 0, 0, tzinfo=timezone(timedelta(hours=8)))
+        record_latest_sample(self.db, self.charger_id, None, {"timestamp": aware, "power": 3.0})
+        self.db.commit()
+        self.assertEqual(latest_for_charger(self.db, self.charger_id).timestamp, datetime(2026, 7, 13, 10, 0, 0))
+
+    def test_falls_back_to_meter_values_without_cache_row(self):
+        self.db.add(MeterValue(charger_id=self.charger_id, transaction_id=9, timestamp=self.T0, power=4.0))
+        self.db.commit()
+        self.assertEqual(latest_for_charger(self.db, self.charger_id).power, 4.0)
+        self.assertEqual(latest_for_transaction(self.db, 9).power, 4.0)
+        self.assertIsNone(latest_for_transaction(self.db, 10))
+
+    def test_latest_endpoint_serves_cache(self):
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        client = TestClient(api.app)
+
+        self.assertIsNone(client.get("/api/metering/LATEST-CP/latest").json())
+        self._record(30, 7.5, transaction_id=5)
+        body = client.get("/api/metering/LATEST-CP/latest").json()
+        self.assertEqual((body["power"], body["transaction_id"], body["id"]), (7.5, 5, None))
+        self.assertEqual(client.get("/api/metering/NOPE/latest").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
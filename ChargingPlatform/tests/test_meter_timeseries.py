@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import meter_timeseries
+from database import Charger, MeterRollup15m, MeterRollup1m, MeterValue
+from db_case import DbTestCase
+from meter_timeseries import apply_retention, meter_series, pick_resolution, rollup_pass
+
+
+class MeterTimeseriesTests(DbTestCase):
+    """raw → 1m → 15m downsampling, retention, and resolution choice."""
+
+    NOW = datetime(2026, 7, 12, 12, 0, 0)
+
+    def setUp(self):
+        super().setUp()
+        self.db = self.Session()
+        charger = Charger(charge_point_id="TS-CP", status="online")
+        self.db.add(charger)
+        self.db.commit()
+        self.charger_id = charger.id
+
+    def tearDown(self):
+        self.db.close()
+
+    def _seed(self, start: datetime, minutes: int, transaction_id=None) -> None:
+        """One sample every 10s: power ramps 0..5 kW within each minute."""
+        rows = []
+        for i in range(minutes * 6):
+            rows.append(MeterValue(
+                charger_id=self.charger_id, transaction_id=transaction_id,
+                timestamp=start + timedelta(seconds=10 * i),
+                power=float(i % 6), voltage=230.0, current=1.0, total_kwh=i * 0.01,
+            ))
+        self.db.add_all(rows)
+        self.db.commit()
+
+    def test_rollup_builds_1m_and_15m_buckets(self):
+        start = self.NOW - timedelta(minutes=30)
+        self._seed(start, 30, transaction_id=7)
+
+        # The open minute waits for the write-behind buffer; run just after it closes.
+        stats = rollup_pass(self.db, now=self.NOW + timedelta(seconds=30))
+
+        self.assertEqual(stats["1m"], 30)
+        self.assertEqual(stats["15m"], 2)
+        minute = self.db.query(MeterRollup1m).order_by(MeterRollup1m.bucket_start).first()
+        self.assertEqual(minute.bucket_start, start)
+        self.assertEqual((minute.samples, minute.power_avg, minute.power_max), (6, 2.5, 5.0))
+        self.assertEqual(minute.transaction_id, 7)
+        quarter = self.db.query(MeterRollup15m).order_by(MeterRollup15m.bucket_start).first()
+        self.assertEqual((quarter.samples, quarter.power_avg, quarter.power_max), (90, 2.5, 5.0))
+        self.assertAlmostEqual(quarter.total_kwh_first, 0.0)
+        self.assertAlmostEqual(quarter.total_kwh_last, 0.89)
+
+    def test_rollup_rewind_picks_up_late_samples_idempotently(self):
+        start = self.NOW - timedelta(minutes=5)
+        self._seed(start, 3)
+        rollup_pass(self.db, now=self.NOW)
+        # A sample for an already-rolled minute lands late (edge sync catch-up).
+        self.db.add(MeterValue(charger_id=self.charger_id, timestamp=start + timedelta(seconds=5), power=100.0))
+        self.db.commit()
+
+        rollup_pass(self.db, now=self.NOW)
+
+        self.assertEqual(self.db.query(MeterRollup1m).count(), 3)
+        minute = self.db.query(MeterRollup1m).filter(MeterRollup1m.bucket_start == start).one()
+        self.assertEqual((minute.samples, minute.power_max), (7, 100.0))
+
+    def test_retention_deletes_expired_rows(self):
+        self._seed(self.NOW - timedelta(days=100), 2)
+        self._seed(self.NOW - timedelta(minutes=5), 2)
+        with mock.patch.object(meter_timeseries, "OCPP_METER_RAW_RETENTION_DAYS", 90):
+            stats = apply_retention(self.db, now=self.NOW)
+        self.assertEqual(stats["raw_deleted"], 12)
+        self.assertEqual(self.db.query(MeterValue).count(), 12)
+
+    def test_resolution_follows_range_and_retention(self):
+        with mock.patch.multiple(meter_timeseries, OCPP_METER_RAW_RETENTION_DAYS=90,
+                                 OCPP_METER_1M_RETENTION_DAYS=400):
+            hour = pick_resolution(self.NOW - timedelta(hours=1), self.NOW, 500, now=self.NOW)
+            day = pick_resolution(self.NOW - timedelta(days=1), self.NOW, 2000, now=self.NOW)
+            month = pick_resolution(self.NOW - timedelta(days=30), self.NOW, 500, now=self.NOW)
+            expired = pick_resolution(self.NOW - timedelta(days=120), self.NOW - timedelta(days=119),
+                                      5000, now=self.NOW)
+        self.assertEqual((hour, day, month, expired), ("raw", "1m", "15m", "1m"))
+
+    def test_meter_series_reads_rollups(self):
+        start = self.NOW - timedelta(minutes=30)
+        self._seed(start, 30)
+        rollup_pass(self.db, now=self.NOW + timedelta(seconds=30))
+
+        resolution, points = meter_series(self.db, charger_id=self.charger_id, start=start,
+                                          end=self.NOW, resolution="1m")
+
+        self.assertEqual(resolution, "1m")
+        self.assertEqual(len(points), 30)
+        self.assertEqual(points[0]["timestamp"], start)
+        self.assertEqual(points[0]["samples"], 6)
+        self.assertIsNone(points[0]["transaction_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
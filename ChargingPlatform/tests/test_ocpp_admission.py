@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import ocpp_admission
+import ocpp_server
+from ocpp_admission import OcppAdmission
+
+
+class OcppAdmissionTests(unittest.TestCase):
+    """Reconnect-storm gates: connect-rate bucket, boot semaphore, token map."""
+
+    def setUp(self):
+        patcher = mock.patch.object(ocpp_admission, "OCPP_ADMISSION_LOG_SECONDS", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_rejects_beyond_burst_plus_max_wait(self):
+        with mock.patch.multiple(ocpp_admission, OCPP_CONNECT_RATE=1.0, OCPP_CONNECT_BURST=3.0,
+                                 OCPP_CONNECT_MAX_WAIT_SECONDS=0.0):
+            gate = OcppAdmission()
+
+            async def storm():
+                return [await gate.admit(f"CP{i:03d}") for i in range(10)]
+
+            results = asyncio.run(storm())
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(gate.stats["rejected_rate"], 7)
+        self.assertEqual(gate.stats["accepted"], 3)
+
+    def test_bucket_queues_within_max_wait(self):
+        with mock.patch.multiple(ocpp_admission, OCPP_CONNECT_RATE=50.0, OCPP_CONNECT_BURST=1.0,
+                                 OCPP_CONNECT_MAX_WAIT_SECONDS=1.0):
+            gate = OcppAdmission()
+
+            async def storm():
+                return await asyncio.gather(*(gate.admit(f"CP{i:03d}") for i in range(5)))
+
+            results = asyncio.run(storm())
+        self.assertTrue(all(results))
+        self.assertEqual(gate.stats["queued"], 4)
+        self.assertEqual(gate.stats["queued_now"], 0)
+
+    def test_boot_slot_times_out_when_saturated(self):
+        with mock.patch.object(ocpp_admission, "OCPP_BOOT_CONCURRENCY", 1):
+            gate = OcppAdmission()
+
+            async def scenario():
+                async with gate.boot_slot() as first:
+                    async with gate.boot_slot(timeout=0.05) as second:
+                        return first, second
+
+            first, second = asyncio.run(scenario())
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(gate.stats["boot_waited"], 1)
+        self.assertEqual(gate.stats["boot_active_now"], 0)
+
+    def test_token_file_is_hot_reloaded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tokens")
+            with open(path, "w") as fh:
+                fh.write("# fleet A\nCP001:alpha\n")
+            env = {"OCPP_CHARGER_TOKENS_FILE": path, "OCPP_CHARGER_TOKENS": "CP002:beta"}
+            with mock.patch.dict(os.environ, env), \
+                    mock.patch.object(ocpp_admission, "_TOKEN_FILE_CHECK_SECONDS", 0):
+                gate = OcppAdmission()
+                self.assertEqual(gate.auth_config().expected_token("CP001"), "alpha")
+                self.assertEqual(gate.auth_config().expected_token("CP002"), "beta")
+
+                with open(path, "w") as fh:
+                    fh.write("CP001:rotated\n")
+                os.utime(path, (1, 1))  # force an mtime change even within the same second
+                self.assertEqual(gate.auth_config().expected_token("CP001"), "rotated")
+                self.assertEqual(gate.stats["token_reloads"], 1)
+
+    def test_bad_token_handshakes_do_not_spend_connect_rate(self):
+        env = {"OCPP_REQUIRE_AUTH": "1", "OCPP_SHARED_TOKEN": "good", "OCPP_CHARGER_TOKENS": "",
+               "OCPP_CHARGER_TOKENS_FILE": ""}
+        with mock.patch.dict(os.environ, env), \
+                mock.patch.multiple(ocpp_admission, OCPP_CONNECT_RATE=0.001, OCPP_CONNECT_BURST=1.0,
+                                    OCPP_CONNECT_MAX_WAIT_SECONDS=0.0):
+            gate = OcppAdmission()
+            sockets = [SimpleNamespace(request=SimpleNamespace(path="/CP001?token=forged", headers={}),
+                                       close=mock.AsyncMock()) for _ in range(5)]
+
+            async def storm():
+                for ws in sockets:
+                    await ocpp_server.on_connect(ws)
+                return await gate.admit("CP001")
+
+            with mock.patch.object(ocpp_server, "admission", gate):
+                admitted = asyncio.run(storm())
+        self.assertTrue(admitted)  # the one slot is still there for a real charger
+        self.assertEqual([ws.close.await_args.kwargs["code"] for ws in sockets], [1008] * 5)
+        self.assertEqual((gate.stats["rejected_auth"], gate.stats["rejected_rate"]), (5, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
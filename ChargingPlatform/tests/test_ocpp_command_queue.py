@@ -0,0 +1,140 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import ocpp_server
+from ocpp_command_queue import CommandQueue, CommandQueueFull
+
+
+class CommandQueueTests(unittest.TestCase):
+    """One CALL on the wire; waiters ordered by priority, identical reads
+    shared, depth bounded, stale commands dropped."""
+
+    def _run(self, scenario):
+        return asyncio.run(scenario())
+
+    @staticmethod
+    async def _hold(queue, action="DataTransfer"):
+        """Put a command on the wire that stays there until released."""
+        gate = asyncio.Event()
+
+        async def send():
+            await gate.wait()
+            return action
+
+        task = asyncio.create_task(queue.run(action, send))
+        await asyncio.sleep(0)
+        return gate, task
+
+    def test_priority_order_behind_in_flight_call(self):
+        async def scenario():
+            queue = CommandQueue("CQ-1")
+            gate, first = await self._hold(queue)
+            sent = []
+
+            def submit(action):
+                async def send():
+                    sent.append(action)
+                    return action
+                return asyncio.create_task(queue.run(action, send))
+
+            tasks = [submit(a) for a in ("GetDiagnostics", "GetConfiguration", "RemoteStopTransaction",
+                                         "ChangeConfiguration", "RemoteStartTransaction")]
+            await asyncio.sleep(0)
+            self.assertEqual((queue.depth, sent), (5, []))
+            gate.set()
+            await asyncio.gather(first, *tasks)
+            return sent
+
+        self.assertEqual(self._run(scenario), ["RemoteStopTransaction", "RemoteStartTransaction",
+                                               "ChangeConfiguration", "GetConfiguration", "GetDiagnostics"])
+
+    def test_identical_reads_coalesce_until_a_write(self):
+        async def scenario():
+            queue = CommandQueue("CQ-2")
+            gate, first = await self._hold(queue)
+            calls = []
+
+            def read(n):
+                async def send():
+                    calls.append(n)
+                    return f"config-{n}"
+                return asyncio.create_task(queue.run("GetConfiguration", send, coalesce_key="GetConfiguration:all"))
+
+            shared = [read(1), read(2)]
+            write = asyncio.create_task(queue.run("ChangeConfiguration", mock.AsyncMock(return_value="ok")))
+            await asyncio.sleep(0)
+            after_write = read(3)
+            await asyncio.sleep(0)
+            gate.set()
+            results = await asyncio.gather(*shared, write, after_write)
+            await first
+            return calls, results
+
+        calls, results = self._run(scenario)
+        self.assertEqual(calls, [1, 3])
+        self.assertEqual(results, ["config-1", "config-1", "ok", "config-3"])
+
+    def test_full_queue_refuses_or_displaces(self):
+        async def scenario():
+            queue = CommandQueue("CQ-3", max_depth=2)
+            gate, first = await self._hold(queue)
+            ok = mock.AsyncMock(return_value="ok")
+            diag = asyncio.create_task(queue.run("GetDiagnostics", ok))
+            conf = asyncio.create_task(queue.run("GetConfiguration", ok))
+            await asyncio.sleep(0)
+            with self.assertRaises(CommandQueueFull):
+                await queue.run("UpdateFirmware", ok)  # does not outrank anything queued
+            stop = asyncio.create_task(queue.run("RemoteStopTransaction", ok))
+            await asyncio.sleep(0)
+            with self.assertRaises(CommandQueueFull):
+                await diag
+            gate.set()
+            return await asyncio.gather(first, conf, stop)
+
+        self.assertEqual(self._run(scenario), ["DataTransfer", "ok", "ok"])
+
+    def test_command_not_dispatched_in_time_is_dropped(self):
+        async def scenario():
+            queue = CommandQueue("CQ-4", wait_seconds=0.05)
+            gate, first = await self._hold(queue)
+            late = mock.AsyncMock(return_value="late")
+            with self.assertRaises(asyncio.TimeoutError):
+                await queue.run("Reset", late)
+            self.assertEqual(queue.depth, 0)
+            gate.set()
+            await first
+            late.assert_not_awaited()
+            return await queue.run("Reset", mock.AsyncMock(return_value="next"))
+
+        self.assertEqual(self._run(scenario), "next")
+
+
+class ChargePointQueueTests(unittest.TestCase):
+    """ChargePoint.call() routes through the connection's queue."""
+
+    def test_concurrent_get_configuration_sends_once(self):
+        sent = []
+
+        async def base_call(self, payload, suppress=True, unique_id=None, skip_schema_validation=False):
+            sent.append(payload.__class__.__name__)
+            await asyncio.sleep(0.01)
+            return SimpleNamespace(configuration_key=[{"key": "HeartbeatInterval", "value": "300"}], unknown_key=[])
+
+        async def scenario():
+            with mock.patch.object(ocpp_server.cp, "call", base_call):
+                charge_point = ocpp_server.ChargePoint("CQ-CP", connection=mock.Mock())
+                busy = asyncio.create_task(charge_point.reset("Soft"))
+                await asyncio.sleep(0)
+                reads = await asyncio.gather(*(charge_point.get_configuration(["HeartbeatInterval"]) for _ in range(3)))
+                await busy
+            return reads
+
+        reads = asyncio.run(scenario())
+        self.assertEqual(sent, ["Reset", "GetConfiguration"])
+        self.assertEqual({id(r) for r in reads}, {id(reads[0])})
+
+
+if __name__ == "__main__":
+    unittest.main()
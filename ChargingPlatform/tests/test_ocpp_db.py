@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import ocpp_db
+from database import Charger
+from db_case import DbTestCase
+from ocpp_db import db_executor_stats, run_db
+
+
+class RunDbTests(DbTestCase):
+    """run_db: a fresh Session per call, rollback + re-raise on error,
+    slow-call accounting, and queued counts that survive cancellation."""
+
+    def setUp(self):
+        super().setUp()
+        self.opened = []
+
+        def _session_factory():
+            db = self.Session()
+            db.close = mock.Mock(wraps=db.close)
+            self.opened.append(db)
+            return db
+
+        patcher = mock.patch.object(ocpp_db, "SessionLocal", _session_factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_each_call_gets_its_own_closed_session(self):
+        async def scenario():
+            return await run_db(lambda db: db), await run_db(lambda db, n: n * 2, 21)
+
+        first, doubled = asyncio.run(scenario())
+        self.assertEqual(doubled, 42)
+        self.assertIs(first, self.opened[0])
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(all(db.close.called for db in self.opened))
+
+    def test_error_rolls_back_and_reraises(self):
+        def _insert_then_fail(db):
+            db.add(Charger(charge_point_id="DB-1"))
+            db.flush()
+            raise ValueError("constraint")
+
+        failed = db_executor_stats()["failed"]
+        with self.assertRaises(ValueError):
+            asyncio.run(run_db(_insert_then_fail))
+        db = self.Session()
+        self.assertEqual(db.query(Charger).count(), 0)
+        db.close()
+        self.assertEqual(db_executor_stats()["failed"], failed + 1)
+
+    def test_slow_calls_are_counted_and_logged(self):
+        slow = db_executor_stats()["slow"]
+        with mock.patch.object(ocpp_db, "OCPP_DB_SLOW_MS", 0), self.assertLogs("ocpp_db", level="WARNING"):
+            asyncio.run(run_db(lambda db: None))
+        self.assertEqual(db_executor_stats()["slow"], slow + 1)
+
+    def test_cancelled_queued_call_is_uncounted(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        release, ran = threading.Event(), []
+        queued = db_executor_stats()["queued"]
+
+        async def scenario():
+            busy = asyncio.ensure_future(run_db(lambda db: release.wait(5)))
+            waiting = asyncio.ensure_future(run_db(lambda db: ran.append(db)))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.sleep(0.01)
+            release.set()
+            await busy
+
+        with mock.patch.object(ocpp_db, "_executor", executor):
+            asyncio.run(scenario())
+        self.assertEqual(ran, [])
+        self.assertEqual(db_executor_stats()["queued"], queued)
+
+
+if __name__ == "__main__":
+    unittest.main()
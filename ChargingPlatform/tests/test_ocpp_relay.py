@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from ocpp.v16 import call_result
+
+import api
+import ocpp_registry
+import ocpp_server
+
+
+class _FakeChargePoint:
+    def __init__(self):
+        self.calls = []
+
+    async def reset(self, type):
+        self.calls.append(("reset", type))
+        return call_result.Reset(status="Accepted")
+
+
+class OcppRelayTests(unittest.TestCase):
+    """POST /api/internal/ocpp/relay runs a peer node's command on the local
+    socket — only with the shared secret, only for whitelisted commands."""
+
+    URL = "/api/internal/ocpp/relay"
+
+    def setUp(self):
+        self.cp = _FakeChargePoint()
+        ocpp_server.active_charge_points["RELAY-CP"] = self.cp
+        self.addCleanup(ocpp_server.active_charge_points.pop, "RELAY-CP", None)
+        patcher = mock.patch.object(ocpp_registry, "OCPP_RELAY_SECRET", "relay-secret")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(api.app)
+
+    def _post(self, body, secret="relay-secret"):
+        return self.client.post(self.URL, json=body, headers={"X-Relay-Secret": secret})
+
+    def test_runs_command_and_serializes_response(self):
+        resp = self._post({"charge_point_id": "RELAY-CP", "command": "reset", "args": ["Soft"]})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"connected": True, "result": {"status": "Accepted"}})
+        self.assertEqual(self.cp.calls, [("reset", "Soft")])
+
+    def test_rejects_wrong_secret(self):
+        resp = self._post({"charge_point_id": "RELAY-CP", "command": "reset", "args": ["Soft"]}, secret="nope")
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(self.cp.calls, [])
+
+    def test_rejects_non_command_methods(self):
+        resp = self._post({"charge_point_id": "RELAY-CP", "command": "start"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_reports_charger_not_on_this_node(self):
+        resp = self._post({"charge_point_id": "ELSEWHERE", "command": "reset", "args": ["Soft"]})
+        self.assertEqual(resp.json(), {"connected": False, "result": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
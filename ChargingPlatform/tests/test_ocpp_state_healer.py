@@ -0,0 +1,138 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import api
+import ocpp_db
+import ocpp_server
+import ocpp_workers
+from database import Charger, _utcnow
+from db_case import DbTestCase
+from ocpp_liveness import ConnectionLiveness
+from query_counter import QueryCounter
+
+
+class ConnectionLivenessTests(unittest.TestCase):
+    """Deadline heap: messages push deadlines out lazily, replaced or closed
+    connections never surface, closed sockets become Case A suspects."""
+
+    T0 = datetime(2026, 7, 18, 12, 0, 0)
+
+    def test_only_silent_connections_are_due(self):
+        live = ConnectionLiveness(stale_after=timedelta(minutes=10))
+        chatty, silent = object(), object()
+        live.connected("HL-1", chatty, at=self.T0)
+        live.connected("HL-2", silent, at=self.T0)
+        live.message("HL-1", chatty, at=self.T0 + timedelta(minutes=8))
+
+        self.assertEqual(live.due_zombies(self.T0 + timedelta(minutes=9)), [])
+        self.assertEqual(live.due_zombies(self.T0 + timedelta(minutes=11)), ["HL-2"])
+        # HL-1 was re-armed at its last message; HL-2 re-armed, not repeated.
+        self.assertEqual(live.due_zombies(self.T0 + timedelta(minutes=12)), [])
+        self.assertEqual(sorted(live.due_zombies(self.T0 + timedelta(minutes=22))), ["HL-1", "HL-2"])
+
+    def test_replaced_and_closed_connections(self):
+        live = ConnectionLiveness(stale_after=timedelta(minutes=10))
+        old, new = object(), object()
+        live.connected("HL-3", old, at=self.T0)
+        live.connected("HL-3", new, at=self.T0 + timedelta(minutes=5))
+        live.disconnected("HL-3", old, at=self.T0 + timedelta(minutes=6))  # stale close: ignored
+        self.assertEqual(live.suspects(), {})
+        self.assertEqual(live.due_zombies(self.T0 + timedelta(minutes=11)), [])
+
+        live.message("HL-3", old, at=self.T0 + timedelta(minutes=7))  # zombie task still talking
+        self.assertIn("HL-3", live.suspects())
+        live.resolve("HL-3")
+        live.disconnected("HL-3", new, at=self.T0 + timedelta(minutes=8))
+        self.assertEqual(live.suspects(), {"HL-3": self.T0 + timedelta(minutes=8)})
+        self.assertEqual(live.due_zombies(self.T0 + timedelta(hours=1)), [])
+
+
+class StateHealerTests(DbTestCase):
+    """heal_ocpp_state: Case B from the deadline heap, Case A only for
+    suspects — one DB statement per cycle whatever the fleet size."""
+
+    def setUp(self):
+        super().setUp()
+        self.now = _utcnow()
+        db = self.Session()
+        db.add_all([Charger(charge_point_id=f"HF-{i:03d}", status="online", last_heartbeat=self.now)
+                    for i in range(200)])
+        db.add(Charger(charge_point_id="HF-STALE", status="online", last_heartbeat=self.now - timedelta(hours=1)))
+        db.commit()
+        db.close()
+
+        self.live = ConnectionLiveness()
+        self.force_close = mock.AsyncMock()
+        self.pool = {}
+        patches = [
+            mock.patch.object(ocpp_db, "SessionLocal", self.Session),
+            mock.patch.object(ocpp_server, "liveness", self.live),
+            mock.patch.object(ocpp_server, "force_close_charge_point", self.force_close),
+            mock.patch.object(ocpp_server, "connected_charge_point_ids", lambda: set(self.pool)),
+            mock.patch.dict(ocpp_server.active_charge_points, {}, clear=True),
+            mock.patch.dict(ocpp_server._mismatch_strikes, {}, clear=True),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _cycle(self, minutes=0):
+        return asyncio.run(ocpp_server.heal_ocpp_state(self.now + timedelta(minutes=minutes)))
+
+    def test_zombie_socket_closed_without_db_reads(self):
+        quiet, busy = object(), object()
+        for cp_id, conn in (("HF-001", quiet), ("HF-002", busy)):
+            self.live.connected(cp_id, conn, at=self.now)
+            ocpp_server.active_charge_points[cp_id] = conn
+            self.pool[cp_id] = conn
+        self.live.message("HF-002", busy, at=self.now + timedelta(minutes=9))
+
+        with QueryCounter(self.engine) as qc:
+            self.assertEqual(self._cycle(minutes=11), (0, 1))
+        self.force_close.assert_awaited_once_with("HF-001")
+        self.assertEqual(qc.count, 0)
+
+    def test_case_a_strikes_then_reconnects_and_reads_only_suspects(self):
+        conn = object()
+        self.live.connected("HF-010", conn, at=self.now)
+        self.live.disconnected("HF-010", conn, at=self.now)
+        self.live.seed_suspects(["HF-STALE", "HF-011"])
+        self.pool["HF-011"] = object()  # held by a peer node
+
+        with QueryCounter(self.engine) as qc:
+            self.assertEqual(self._cycle(), (1, 0))
+        self.assertEqual(qc.count, 1)
+        self.force_close.assert_not_awaited()
+        self.assertEqual(set(self.live.suspects()), {"HF-010"})  # consistent ones resolved
+
+        self.assertEqual(self._cycle(minutes=1), (1, 1))
+        self.force_close.assert_awaited_once_with("HF-010")
+
+    def test_no_suspects_no_queries(self):
+        with QueryCounter(self.engine) as qc:
+            self.assertEqual(self._cycle(), (0, 0))
+        self.assertEqual(qc.count, 0)
+
+    def _seed_queries(self, seed):
+        heal = mock.AsyncMock(side_effect=[(0, 0), asyncio.CancelledError()])
+        with mock.patch.object(ocpp_server, "heal_ocpp_state", heal), QueryCounter(self.engine) as qc:
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(ocpp_server.ocpp_state_healer_loop(interval_seconds=0, seed=seed))
+        return qc.count
+
+    def test_only_the_seeding_process_reads_the_fleet(self):
+        self.assertEqual(self._seed_queries(seed=True), 1)
+        self.assertEqual(self._seed_queries(seed=False), 0)
+        self.assertEqual(len(self.live.suspects()), 200)
+
+    def test_api_process_skips_healer_when_workers_hold_the_sockets(self):
+        with mock.patch.object(ocpp_workers, "_supervisor", object()), \
+                mock.patch.object(api, "ocpp_state_healer_loop") as healer_loop:
+            asyncio.run(api._start_ocpp_state_healer())
+        healer_loop.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
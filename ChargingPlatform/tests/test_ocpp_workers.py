@@ -0,0 +1,46 @@
+import queue
+import threading
+import unittest
+
+import ocpp_workers
+from event_bus import ChargerStatusChanged, FirmwareStatus, event_bus
+
+
+class WorkerEventBridgeTests(unittest.TestCase):
+    """Events published in a worker process reach the API process's bus."""
+
+    def test_worker_events_are_republished_by_the_supervisor(self):
+        events = queue.Queue(maxsize=2)
+        forward = ocpp_workers._forward_events(events)
+        try:
+            event_bus.publish(ChargerStatusChanged("W-1", {"availability": "charging"}))
+            event_bus.publish(FirmwareStatus("W-1", status="Installed"))
+            event_bus.publish(FirmwareStatus("W-2", status="Installed"))  # queue full: dropped
+        finally:
+            event_bus.unsubscribe(forward)
+        self.assertEqual(events.qsize(), 2)
+
+        received, done = [], threading.Event()
+
+        def collect(event):
+            received.append(event)
+            if len(received) == 2:
+                done.set()
+
+        sub = event_bus.subscribe(collect)
+        supervisor = ocpp_workers.OcppWorkerSupervisor(0)
+        supervisor.events = events
+        pump = threading.Thread(target=supervisor._pump_events, daemon=True)
+        pump.start()
+        try:
+            self.assertTrue(done.wait(5))
+        finally:
+            supervisor._stopping.set()
+            pump.join(5)
+            event_bus.unsubscribe(sub)
+        self.assertEqual([(type(e).__name__, e.charge_point_id) for e in received],
+                         [("ChargerStatusChanged", "W-1"), ("FirmwareStatus", "W-1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
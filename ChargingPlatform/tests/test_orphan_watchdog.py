@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import ocpp_db
+import ocpp_server
+from database import Charger, ChargingSession, MeterValue, SyncChange, TransactionMeterLatest, _utcnow
+from db_case import DbTestCase
+from query_counter import QueryCounter
+
+
+class OrphanWatchdogTests(DbTestCase):
+    """Orphan sweep: set-based candidate query, one bulk UPDATE per batch,
+    connected chargers and recently sampled sessions left alone."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ocpp_db, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ocpp_server.orphan_watchdog_stats.update, resume_after_id=0)
+        self.now = _utcnow()
+
+        db = self.Session()
+        db.add_all([Charger(charge_point_id=cp, availability="charging") for cp in ("OW-A", "OW-B", "OW-C")])
+        db.commit()
+        self.chargers = {c.charge_point_id: c.id for c in db.query(Charger)}
+        db.close()
+        self.next_txn = 1
+
+    def _session(self, cp, status="active", started_ago=120, sample_ago=None, raw_sample_ago=None,
+                 energy=0.0, total_kwh=None):
+        db = self.Session()
+        txn = self.next_txn
+        self.next_txn += 1
+        db.add(ChargingSession(charger_id=self.chargers[cp], transaction_id=txn, status=status,
+                               start_time=self.now - timedelta(minutes=started_ago), energy_consumed=energy))
+        if sample_ago is not None:
+            db.add(TransactionMeterLatest(transaction_id=txn, charger_id=self.chargers[cp],
+                                          timestamp=self.now - timedelta(minutes=sample_ago), total_kwh=total_kwh))
+        if raw_sample_ago is not None:
+            db.add(MeterValue(charger_id=self.chargers[cp], transaction_id=txn,
+                              timestamp=self.now - timedelta(minutes=raw_sample_ago)))
+        db.commit()
+        db.close()
+        return txn
+
+    def _status(self):
+        db = self.Session()
+        out = {s.transaction_id: (s.status, s.energy_consumed) for s in db.query(ChargingSession)}
+        db.close()
+        return out
+
+    def test_closes_only_stale_disconnected_sessions(self):
+        stale = self._session("OW-A", sample_ago=60, total_kwh=7.5)
+        no_samples = self._session("OW-A", energy=1.2)
+        connected = self._session("OW-B", sample_ago=60)
+        fresh_cache = self._session("OW-C", sample_ago=5)
+        fresh_raw = self._session("OW-C", status="pending", raw_sample_ago=5)
+        young = self._session("OW-A", started_ago=10)
+        done = self._session("OW-C", status="completed")
+
+        db = self.Session()
+        scanned, closed, last_id = ocpp_server._close_orphan_batch(db, 0, {"OW-B"}, self.now)
+        db.close()
+
+        self.assertEqual((scanned, closed, last_id), (4, 2, None))
+        status = self._status()
+        self.assertEqual(status[stale], ("interrupted", 7.5))
+        self.assertEqual(status[no_samples], ("interrupted", 1.2))
+        for txn in (connected, fresh_cache, young):
+            self.assertEqual(status[txn][0], "active")
+        self.assertEqual(status[fresh_raw][0], "pending")
+        self.assertEqual(status[done][0], "completed")
+
+        db = self.Session()
+        self.assertEqual(db.get(Charger, self.chargers["OW-A"]).availability, "available")
+        self.assertEqual(db.get(Charger, self.chargers["OW-C"]).availability, "charging")
+        feed = db.query(SyncChange).filter(SyncChange.entity == "charging_session", SyncChange.op == "update").all()
+        self.assertEqual(sorted(int(c.entity_ref) for c in feed), [stale, no_samples])
+        db.close()
+
+    def test_statement_count_does_not_grow_with_backlog(self):
+        counts = []
+        for n in (3, 40):
+            for _ in range(n):
+                self._session("OW-A", sample_ago=45)
+            self._session("OW-C")  # one uncached session per batch
+            db = self.Session()
+            with QueryCounter(self.engine) as qc:
+                _, closed, _ = ocpp_server._close_orphan_batch(db, 0, set(), self.now, limit=100)
+            db.close()
+            self.assertEqual(closed, n + 1)
+            counts.append(qc.count)
+        # candidates, uncached MAX, UPDATE, closed ids, chargers, feed insert
+        self.assertEqual(counts, [6, 6])
+
+    def test_sweep_walks_batches_and_reports_metrics(self):
+        for _ in range(25):
+            self._session("OW-A", sample_ago=45)
+        with mock.patch.object(ocpp_server, "connected_charge_point_ids", return_value=set()):
+            closed = asyncio.run(ocpp_server.sweep_orphan_sessions(batch=10))
+        self.assertEqual(closed, 25)
+        stats = ocpp_server.orphan_watchdog_stats
+        self.assertEqual((stats["last_scanned"], stats["last_closed"], stats["resume_after_id"]), (25, 25, 0))
+        self.assertGreaterEqual(stats["last_sweep_ms"], 0)
+
+    def test_budget_cuts_sweep_and_next_one_resumes(self):
+        for _ in range(25):
+            self._session("OW-B", sample_ago=45)  # connected: scanned, never closed
+        self._session("OW-A", sample_ago=45)
+        with mock.patch.object(ocpp_server, "connected_charge_point_ids", return_value={"OW-B"}):
+            first = asyncio.run(ocpp_server.sweep_orphan_sessions(budget_seconds=0, batch=10))
+            self.assertEqual(first, 0)
+            self.assertEqual(ocpp_server.orphan_watchdog_stats["last_scanned"], 10)
+            second = asyncio.run(ocpp_server.sweep_orphan_sessions(batch=10))
+        self.assertEqual(second, 1)
+        self.assertEqual(ocpp_server.orphan_watchdog_stats["last_scanned"], 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import api
+from database import Charger, ChargingSession, Fault, User, Wallet, WalletTransaction, _utcnow
+from db_case import DbTestCase
+from time_buckets import bucket_counts, bucket_series
+
+
+class ReportQueryCountTests(DbTestCase):
+    """Admin and analytics reports run a fixed number of SQL statements —
+    one GROUP BY per chart, not one query per day / band / row."""
+
+    # Pinned statement counts per request (auth bypassed).
+    USER_REPORT_STATEMENTS = 3
+    WALLET_REPORT_STATEMENTS = 4
+    OVERVIEW_STATEMENTS = 28
+
+    def setUp(self):
+        super().setUp()
+        self.override_api_db()
+        api.app.dependency_overrides[api.get_admin_token_from_request] = lambda: "token"
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        patcher = mock.patch.object(api, "verify_admin_token", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(api.app)
+        self.statements = 0
+
+        def _count(*_args, **_kwargs):
+            self.statements += 1
+
+        event.listen(self.engine, "before_cursor_execute", _count)
+        self.seeded = 0
+
+    def _seed(self, n: int) -> None:
+        db = self.Session()
+        now = _utcnow()
+        for i in range(self.seeded, self.seeded + n):
+            user = User(email=f"u{i}@x.test", password_hash="x", created_at=now - timedelta(days=i % 40),
+                        is_active=bool(i % 2), last_login=now if i % 3 else None)
+            charger = Charger(charge_point_id=f"RQ{i:04d}", status="online" if i % 2 else "offline")
+            db.add_all([user, charger])
+            db.flush()
+            wallet = Wallet(user_id=user.id, balance=Decimal(i * 7 % 150))
+            db.add(wallet)
+            db.flush()
+            db.add(WalletTransaction(user_id=user.id, wallet_id=wallet.id, transaction_type="topup",
+                                     amount=Decimal("10.00"), balance_before=0, balance_after=10,
+                                     created_at=now - timedelta(days=i % 40)))
+            db.add(ChargingSession(charger_id=charger.id, transaction_id=1000 + i, start_time=now,
+                                   status="completed", energy_consumed=1.0))
+            db.add(Fault(charger_id=charger.id, fault_type="overcurrent", cleared=bool(i % 2)))
+        db.commit()
+        db.close()
+        self.seeded += n
+
+    def _statements_for(self, url: str) -> int:
+        self.statements = 0
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200, resp.text)
+        return self.statements
+
+    def test_reports_run_fixed_statement_count(self):
+        for url, expected in (("/api/admin/reports/users", self.USER_REPORT_STATEMENTS),
+                              ("/api/admin/reports/wallet", self.WALLET_REPORT_STATEMENTS),
+                              ("/api/analytics/overview", self.OVERVIEW_STATEMENTS)):
+            with self.subTest(url=url):
+                self._seed(5)
+                small = self._statements_for(url)
+                self._seed(60)
+                large = self._statements_for(url)
+                self.assertEqual(small, expected)
+                self.assertEqual(large, expected)
+
+    def test_bucket_series_is_zero_filled_single_query(self):
+        self._seed(10)
+        db = self.Session()
+        start = (_utcnow() - timedelta(days=29)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.statements = 0
+        series = bucket_series(db, User.created_at, start, start + timedelta(days=30))
+        self.assertEqual(self.statements, 1)
+        self.assertEqual(len(series), 30)
+        self.assertEqual(sum(count for _, count in series), 10)
+        self.assertEqual(series[-1][0], _utcnow().strftime("%Y-%m-%d"))
+
+        dist = bucket_counts(db, Wallet.balance, [("zero", Wallet.balance == 0), ("some", Wallet.balance > 0)])
+        self.assertEqual(dist, {"zero": 1, "some": 9})
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
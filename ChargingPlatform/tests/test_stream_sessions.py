@@ -0,0 +1,121 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+import api
+from database import User, get_db
+from db_case import DbTestCase
+from live_status import live_status
+from security import create_access_token
+
+
+def _dependency_calls(dependant):
+    for dep in dependant.dependencies:
+        yield dep.call
+        yield from _dependency_calls(dep)
+
+
+class StreamingEndpointSessionTests(unittest.TestCase):
+    """Streaming responses outlive the request, and get_db is only closed
+    after the body finishes — streams must not depend on it at all."""
+
+    STREAMS = (
+        ("GET", "/api/live/chargers"),
+        ("GET", "/api/admin/bulk-commands/{job_id}/stream"),
+        ("GET", "/api/invoice/sessions/export"),
+    )
+
+    def test_streams_do_not_hold_a_request_session(self):
+        routes = {(method, route.path): route for route in api.app.routes
+                  for method in getattr(route, "methods", ())}
+        for key in self.STREAMS:
+            with self.subTest(route=key):
+                self.assertNotIn(get_db, set(_dependency_calls(routes[key].dependant)))
+
+
+class _Request:
+    """Stands in for the client side: connected for `polls` loop turns."""
+
+    def __init__(self, polls):
+        self.polls = polls
+        self.headers = {}
+
+    async def is_disconnected(self):
+        self.polls -= 1
+        return self.polls < 0
+
+
+class LiveStreamTests(unittest.TestCase):
+    """A stream patches its own state from events; the shared /api/chargers
+    snapshot is left alone and may lag without undoing the patch."""
+
+    def test_event_patches_stream_without_busting_shared_cache(self):
+        stale = {"CP-L": {"charge_point_id": "CP-L", "availability": "available", "last_heartbeat": None}}
+
+        async def scenario():
+            api._CHARGERS_CACHE["snapshot"] = marker = {"exp": float("inf"), "rows": [], "views": {}}
+            resp = await api.live_chargers_stream(_Request(polls=6), tenant=None, charge_point_id=None,
+                                                 topics="chargers", credentials=None)
+            frames = []
+            async for frame in resp.body_iterator:
+                frames.append(frame)
+                if frame.startswith("event: snapshot"):
+                    live_status._charger("CP-L", availability="charging")
+            return frames, api._CHARGERS_CACHE.get("snapshot") is marker
+
+        with mock.patch.object(api, "_live_view", lambda *a: json.loads(json.dumps(stale))), \
+                mock.patch.object(api, "LIVE_STREAM_RESYNC_SECONDS", 0.01), \
+                mock.patch.object(api, "_authorize_in_own_session", mock.AsyncMock(return_value=(True, False))):
+            frames, cache_kept = asyncio.run(scenario())
+        api._CHARGERS_CACHE.clear()
+
+        self.assertTrue(cache_kept)
+        events = [f.split("\n")[0] for f in frames if f.startswith("event:")]
+        self.assertEqual(events, ["event: snapshot", "event: charger"])
+        self.assertIn('"availability": "charging"', frames[1])
+
+
+class LiveStreamTopicTests(DbTestCase):
+    """session / fault events are admin-only, like /api/sessions and
+    /api/faults; any signed-in user still gets the full charger view."""
+
+    def _frames(self, is_admin):
+        db = self.Session()
+        user = User(email=f"live-{is_admin}@x.test", password_hash="x", is_admin=is_admin)
+        db.add(user)
+        db.commit()
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer",
+                                                   credentials=create_access_token(user.id, user.email, is_admin))
+        db.close()
+        view = {"CP-T": {"charge_point_id": "CP-T", "availability": "available", "last_heartbeat": None}}
+
+        async def scenario():
+            resp = await api.live_chargers_stream(_Request(polls=8), tenant=None, charge_point_id=None,
+                                                 topics="chargers,sessions,faults", credentials=credentials)
+            frames = []
+            async for frame in resp.body_iterator:
+                frames.append(frame)
+                if frame.startswith("event: snapshot"):
+                    live_status._session("CP-T", "started", transaction_id=9)
+                    live_status.publish({"type": "fault", "charge_point_id": "CP-T", "event": "raised"})
+                    live_status._charger("CP-T", availability="charging")
+            return [f.split("\n")[0] for f in frames if f.startswith("event:")]
+
+        with mock.patch.object(api, "SessionLocal", self.Session), \
+                mock.patch.object(api, "_live_view", lambda *a: json.loads(json.dumps(view))), \
+                mock.patch.object(api, "LIVE_STREAM_KEEPALIVE_SECONDS", 0.01):
+            return asyncio.run(scenario())
+
+    def test_plain_user_gets_only_charger_frames(self):
+        self.assertEqual(self._frames(is_admin=False), ["event: snapshot", "event: charger"])
+
+    def test_admin_gets_session_and_fault_frames(self):
+        self.assertEqual(self._frames(is_admin=True),
+                         ["event: snapshot", "event: session", "event: fault", "event: charger"])
+
+
+if __name__ == "__main__":
+    unittest.main()
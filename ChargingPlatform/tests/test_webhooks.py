@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import httpx
+from fastapi.testclient import TestClient
+
+import api
+import ocpp_db
+import webhook_delivery
+from database import Charger, PartnerAPIKey, PaymentTransaction, WebhookOutbox, _utcnow
+from db_case import DbTestCase
+from ocpp_server import _persist_start_transaction, _persist_stop_transaction
+
+
+class WebhookTests(DbTestCase):
+    """Partner webhooks: outbox rows written with the OCPP session change,
+    delivered in signed per-partner batches, retried and dead-lettered."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ocpp_db, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        db = self.Session()
+        self.charger = Charger(charge_point_id="WH-1", tenant="fleet-a")
+        db.add(self.charger)
+        db.add_all([
+            PartnerAPIKey(partner_name="acme", key_hash=api._hash_partner_key("acme-key"), active=True,
+                          webhook_url="https://acme.test/hooks", webhook_secret="acme-secret"),
+            PartnerAPIKey(partner_name="fleet", key_hash="f" * 64, active=True, controls_tenant="fleet-a",
+                          webhook_url="https://fleet.test/hooks", webhook_secret="fleet-secret",
+                          webhook_events="session.stopped"),
+            PartnerAPIKey(partner_name="other", key_hash="o" * 64, active=True,
+                          webhook_url="https://other.test/hooks", webhook_secret="other-secret"),
+        ])
+        db.add(PaymentTransaction(
+            transaction_ref="TXN-ACME-1", user_id=1, user_email="x@partner.test", amount=0,
+            payment_method="external", gateway_name="partner:acme", status="success",
+            purpose="charge_payment", charger_id="WH-1", paid_at=_utcnow(),
+        ))
+        db.commit()
+        self.charger_pk = self.charger.id
+        db.close()
+
+    def _charge(self):
+        db = self.Session()
+        txn_id = _persist_start_transaction(db, self.charger_pk, 1, "DASHBOARD_USER", 1000, _utcnow())
+        _persist_stop_transaction(db, "WH-1", txn_id, "DASHBOARD_USER", 6500, _utcnow(), "Remote")
+        db.close()
+        return txn_id
+
+    def _outbox(self):
+        db = self.Session()
+        rows = db.query(WebhookOutbox).order_by(WebhookOutbox.id).all()
+        db.expunge_all()
+        db.close()
+        return rows
+
+    def _deliver(self, handler):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return await webhook_delivery.deliver_once(client)
+        return asyncio.run(run())
+
+    def test_start_and_stop_enqueue_for_interested_partners(self):
+        txn_id = self._charge()
+        rows = self._outbox()
+        routed = sorted((r.partner_id, r.event_type) for r in rows)
+        # acme started it (both events); fleet owns the tenant (stops only); other gets nothing
+        self.assertEqual(routed, [(1, "session.started"), (1, "session.stopped"), (2, "session.stopped")])
+        stopped = json.loads(next(r.payload for r in rows if r.partner_id == 1 and r.event_type == "session.stopped"))
+        self.assertEqual(stopped["data"]["transaction_ref"], "TXN-ACME-1")
+        self.assertEqual(stopped["data"]["transaction_id"], txn_id)
+        self.assertEqual(stopped["data"]["energy_kwh"], 5.5)
+        fleet = json.loads(next(r.payload for r in rows if r.partner_id == 2))
+        self.assertIsNone(fleet["data"]["transaction_ref"])
+
+    def test_walk_in_sessions_are_not_attributed_to_a_partner(self):
+        self._charge()  # acme's customer — claims TXN-ACME-1
+        self._charge()  # walk-in right after, same charger
+        db = self.Session()
+        db.query(PaymentTransaction).update({PaymentTransaction.paid_at: _utcnow() - timedelta(hours=3)})
+        db.commit()
+        db.close()
+        self._charge()  # walk-in hours after an acme payment nobody used
+        routed = [(r.partner_id, r.event_type) for r in self._outbox()]
+        self.assertEqual(routed.count((1, "session.started")), 1)
+        self.assertEqual(routed.count((1, "session.stopped")), 1)
+        self.assertEqual(routed.count((2, "session.stopped")), 3)
+
+    def test_delivery_batches_per_partner_and_signs(self):
+        self._charge()
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
+
+        self.assertEqual(self._deliver(handler), 3)
+        self.assertEqual(len(requests), 2)  # one POST per partner
+        acme = next(r for r in requests if r.url.host == "acme.test")
+        body = acme.content
+        self.assertEqual([e["type"] for e in json.loads(body)["events"]], ["session.started", "session.stopped"])
+        ts, v1 = (part.split("=", 1)[1] for part in acme.headers["X-PlagSini-Signature"].split(","))
+        expected = hmac.new(b"acme-secret", f"{ts}.".encode() + body, hashlib.sha256).hexdigest()
+        self.assertEqual(v1, expected)
+        self.assertEqual({r.status for r in self._outbox()}, {"delivered"})
+        self.assertEqual(self._deliver(handler), 0)
+
+    def test_failures_back_off_then_dead_letter_and_replay(self):
+        self._charge()
+        with mock.patch.object(webhook_delivery, "WEBHOOK_MAX_ATTEMPTS", 2):
+            self._deliver(lambda request: httpx.Response(503, text="down"))
+            rows = self._outbox()
+            self.assertEqual({r.status for r in rows}, {"pending"})
+            self.assertEqual({r.attempts for r in rows}, {1})
+            delay = (rows[0].next_attempt_at - _utcnow()).total_seconds()
+            self.assertGreater(delay, webhook_delivery.WEBHOOK_BACKOFF_BASE_SECONDS * 0.7)
+            self.assertEqual(self._deliver(lambda request: httpx.Response(200)), 0)  # not due yet
+
+            db = self.Session()
+            db.query(WebhookOutbox).update({WebhookOutbox.next_attempt_at: _utcnow() - timedelta(seconds=1)})
+            db.commit()
+            db.close()
+            self._deliver(lambda request: httpx.Response(500))
+        rows = self._outbox()
+        self.assertEqual({r.status for r in rows}, {"dead"})
+        self.assertTrue(rows[0].last_error.startswith("HTTP 500"))
+
+        self.override_api_db()
+        api.app.dependency_overrides[api.require_admin_or_staff_admin] = lambda: {"role": "admin"}
+        resp = TestClient(api.app).post("/api/admin/partners/1/webhook/replay")
+        self.assertEqual(resp.json()["requeued"], 2)
+        self.assertEqual(self._deliver(lambda request: httpx.Response(204)), 2)
+
+    def test_partner_registration(self):
+        self.override_api_db()
+        client = TestClient(api.app)
+        headers = {"X-Partner-API-Key": "acme-key"}
+        self.assertEqual(client.put("/api/partner/webhook", headers=headers,
+                                    json={"url": "http://insecure.test/x"}).status_code, 400)
+        resp = client.put("/api/partner/webhook", headers=headers,
+                          json={"url": "https://new.acme.test/hooks", "events": ["session.stopped"]})
+        self.assertEqual(resp.status_code, 200, resp.text)
+        self.assertEqual(len(resp.json()["secret"]), 64)
+        self.assertEqual(resp.json()["webhook"]["events"], ["session.stopped"])
+
+        self._charge()
+        self.assertEqual(sorted((r.partner_id, r.event_type) for r in self._outbox() if r.partner_id == 1),
+                         [(1, "session.stopped")])
+        self.assertEqual(client.delete("/api/partner/webhook", headers=headers).status_code, 200)
+        self._deliver(lambda request: httpx.Response(200))
+        acme = [r for r in self._outbox() if r.partner_id == 1]
+        self.assertEqual([(r.status, r.last_error) for r in acme], [("dead", "partner webhook disabled")])
+
+
+if __name__ == "__main__":
+    unittest.main()
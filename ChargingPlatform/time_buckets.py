@@ -0,0 +1,102 @@
+"""
+PlagSini EV — Time-bucketed Report Queries
+
+Admin reports built their charts one bucket at a time: the user report ran
+30 COUNTs for its registration trend, the wallet report five COUNTs for its
+balance distribution. Each chart is now ONE grouped query:
+
+  bucket_series()     — COUNT / SUM per day, hour or month over [start, end),
+                        zero-filled in Python. The bucket key is a
+                        date-truncation expression rendered per dialect
+                        (DATE_FORMAT on MySQL, strftime on SQLite, to_char on
+                        PostgreSQL), so it always comes back as the same
+                        'YYYY-MM-DD…' string.
+  bucket_counts()     — COUNT per value band (CASE … END), e.g. balance
+                        distribution.
+  duration_seconds()  — stop − start in seconds as a SQL expression, for
+                        SUM()ming session durations in the database.
+
+Usage:
+    from time_buckets import bucket_series, bucket_counts
+    trend = bucket_series(db, User.created_at, start, end)      # [("2026-07-01", 3), ...]
+    dist = bucket_counts(db, Wallet.balance, [("zero", Wallet.balance == 0), ...])
+"""
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, text
+
+# grain → (strftime / DATE_FORMAT pattern, PostgreSQL to_char pattern)
+_GRAINS = {
+    "hour": ("%Y-%m-%d %H:00", "YYYY-MM-DD HH24:00"),
+    "day": ("%Y-%m-%d", "YYYY-MM-DD"),
+    "month": ("%Y-%m", "YYYY-MM"),
+}
+
+
+def bucket_expr(db, column, grain: str = "day"):
+    """SQL expression truncating `column` to `grain`, as a string label."""
+    pattern, pg_pattern = _GRAINS[grain]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        return func.date_format(column, pattern)
+    if dialect == "postgresql":
+        return func.to_char(column, pg_pattern)
+    return func.strftime(pattern, column)
+
+
+def duration_seconds(db, start, stop):
+    """SQL expression for `stop - start` in seconds (NULL if either is)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        return func.timestampdiff(text("SECOND"), start, stop)
+    if dialect == "postgresql":
+        return func.extract("epoch", stop - start)
+    return (func.julianday(stop) - func.julianday(start)) * 86400.0
+
+
+def bucket_labels(start: datetime, end: datetime, grain: str = "day") -> List[str]:
+    """Every bucket label in [start, end), oldest first."""
+    pattern = _GRAINS[grain][0]
+    labels: List[str] = []
+    if grain == "hour":
+        cursor = start.replace(minute=0, second=0, microsecond=0)
+        step = timedelta(hours=1)
+    else:
+        cursor = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        step = timedelta(days=1)
+    while cursor < end:
+        label = cursor.strftime(pattern)
+        if not labels or labels[-1] != label:  # month grain walks days
+            labels.append(label)
+        cursor += step
+    return labels
+
+
+def bucket_series(db, column, start: datetime, end: datetime, grain: str = "day",
+                  value: Optional[Any] = None, filters: Sequence[Any] = ()) -> List[Tuple[str, float]]:
+    """[(label, COUNT(*) or SUM(value))] per bucket of `column` in
+    [start, end), zero-filled — a single GROUP BY."""
+    bucket = bucket_expr(db, column, grain).label("bucket")
+    measure = func.count() if value is None else func.coalesce(func.sum(value), 0)
+    rows = (
+        db.query(bucket, measure)
+        .filter(column >= start, column < end, *filters)
+        .group_by(bucket)
+        .all()
+    )
+    found = {label: total for label, total in rows}
+    cast = int if value is None else float
+    return [(label, cast(found.get(label, 0))) for label in bucket_labels(start, end, grain)]
+
+
+def bucket_counts(db, column, bands: Sequence[Tuple[str, Any]], filters: Sequence[Any] = ()) -> dict:
+    """{band label: row count} for (label, condition) bands — the first
+    matching band wins, rows matching none are ignored. One GROUP BY."""
+    band = case(*[(condition, label) for label, condition in bands], else_=None).label("band")
+    rows = db.query(band, func.count()).filter(column.isnot(None), *filters).group_by(band).all()
+    counts = {label: 0 for label, _ in bands}
+    for label, count in rows:
+        if label is not None:
+            counts[label] = int(count)
+    return counts
@@ -0,0 +1,352 @@
+"""
+PlagSini EV — Partner Webhook Delivery
+
+Partners learned that a session had started or stopped by polling
+/api/partner/charging/sessions/{ref} every few seconds — most of the partner
+traffic we served, and a stop was still only noticed one poll later.
+
+Partners now register an HTTPS endpoint (PUT /api/partner/webhook) and get
+`session.started` / `session.stopped` pushed to it.
+
+Outbox: the StartTransaction / StopTransaction persist functions write one
+webhook_outbox row per interested partner in the same transaction as the
+session change (enqueue_session_event), so an event exists exactly when the
+change committed — nothing is lost if the process dies before delivery. A
+partner is interested in a session it started and in every session on
+chargers of its controls_tenant. "Started" means its `partner:<name>` payment
+on that charger was settled just before the session began and no earlier
+session on the charger already claimed that payment — a walk-in session
+after a partner's customer left is not the partner's.
+
+Delivery (webhook_delivery_worker, API process):
+  * claim  — due rows are claimed with a per-pass token and leased for
+             WEBHOOK_LEASE_SECONDS, so concurrent workers never send the same
+             row twice and a crashed worker's rows come back after the lease.
+  * batch  — all claimed events of one partner go in a single POST
+             {"events": [...]}, oldest first; partners dedupe on event `id`.
+  * send   — one pooled httpx.AsyncClient (keep-alive), partners in parallel.
+  * sign   — X-PlagSini-Signature: t=<unix ts>,v1=<hex HMAC-SHA256 of
+             "<t>.<raw body>" keyed with the partner's webhook secret>.
+  * retry  — non-2xx / network error: exponential backoff with ±20 % jitter
+             (WEBHOOK_BACKOFF_BASE_SECONDS doubling, capped at
+             WEBHOOK_BACKOFF_MAX_SECONDS); after WEBHOOK_MAX_ATTEMPTS the row
+             is dead-lettered (status "dead") and can be replayed by an admin.
+
+The worker polls every WEBHOOK_POLL_SECONDS and is also woken by the
+SessionStarted / SessionStopped events on event_bus, so a partner normally
+hears about a session well under a second after the charger reported it.
+
+Env:
+    WEBHOOK_POLL_SECONDS           idle poll interval (1)
+    WEBHOOK_BATCH_SIZE             rows claimed per pass (100)
+    WEBHOOK_TIMEOUT_SECONDS        per-request timeout (10)
+    WEBHOOK_MAX_ATTEMPTS           attempts before dead-lettering (12)
+    WEBHOOK_BACKOFF_BASE_SECONDS   first retry delay (5)
+    WEBHOOK_BACKOFF_MAX_SECONDS    retry delay cap (3600)
+    WEBHOOK_LEASE_SECONDS          claim lease (60)
+
+Usage:
+    from webhook_delivery import enqueue_session_event
+    enqueue_session_event(db, "session.stopped", session)   # before db.commit()
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import exists
+from sqlalchemy.orm import aliased
+
+from database import Charger, ChargingSession, PartnerAPIKey, PaymentTransaction, WebhookOutbox, _utcnow
+from event_bus import SessionStarted, SessionStopped, event_bus
+from ocpp_db import run_db
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "12"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "5"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "3600"))
+WEBHOOK_LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+
+EVENT_TYPES = ("session.started", "session.stopped")
+SIGNATURE_HEADER = "X-PlagSini-Signature"
+
+# A partner payment starts the first session on its charger that begins
+# within this long after paid_at (RemoteStart → plug-in → StartTransaction)…
+_OWNER_START_WINDOW = timedelta(minutes=5)
+# …allowing for a charger clock this far behind ours (as partner stop does).
+_OWNER_CLOCK_SKEW = timedelta(minutes=2)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def subscribed_events(partner: PartnerAPIKey) -> Tuple[str, ...]:
+    """Event types a partner receives (NULL / empty = all)."""
+    wanted = [e.strip() for e in (partner.webhook_events or "").split(",") if e.strip()]
+    return tuple(wanted) or EVENT_TYPES
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """Value of the X-PlagSini-Signature header for `body`."""
+    mac = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts` (1 = first retry)."""
+    delay = min(WEBHOOK_BACKOFF_MAX_SECONDS, WEBHOOK_BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+# ─── Enqueue (inside the OCPP persist transaction) ──────────────────────────
+
+def _originating_partner_payment(db, charger: Charger, session) -> Optional[PaymentTransaction]:
+    """The partner payment that started `session`: settled shortly before
+    its start_time and not already used by an earlier session on the same
+    charger. None for walk-in / app sessions."""
+    if session.start_time is None:
+        return None
+    earlier = aliased(ChargingSession)
+    return (
+        db.query(PaymentTransaction)
+        .filter(
+            PaymentTransaction.charger_id == charger.charge_point_id,
+            PaymentTransaction.gateway_name.like("partner:%"),
+            PaymentTransaction.status == "success",
+            PaymentTransaction.paid_at >= session.start_time - _OWNER_START_WINDOW,
+            PaymentTransaction.paid_at <= session.start_time + _OWNER_CLOCK_SKEW,
+            ~exists().where(
+                earlier.charger_id == charger.id,
+                earlier.start_time >= PaymentTransaction.paid_at - _OWNER_CLOCK_SKEW,
+                earlier.start_time < session.start_time,
+            ),
+        )
+        .order_by(PaymentTransaction.paid_at.desc(), PaymentTransaction.id.desc())
+        .first()
+    )
+
+
+def enqueue_session_event(db, event_type: str, session, now: Optional[datetime] = None) -> int:
+    """Add one outbox row per partner subscribed to `event_type` for this
+    session. Does not commit — call before the persist function's commit so
+    the event and the session change land together. Returns rows added."""
+    partners = (
+        db.query(PartnerAPIKey)
+        .filter(PartnerAPIKey.active.is_(True), PartnerAPIKey.webhook_url.isnot(None))
+        .all()
+    )
+    partners = [p for p in partners if event_type in subscribed_events(p)]
+    if not partners:
+        return 0
+
+    now = now or _utcnow()
+    charger = db.query(Charger).filter(Charger.id == session.charger_id).first()
+    if charger is None:
+        return 0
+    owner_txn = _originating_partner_payment(db, charger, session)
+    owner = owner_txn.gateway_name.split(":", 1)[1] if owner_txn else None
+
+    added = 0
+    for partner in partners:
+        started_it = partner.partner_name == owner
+        in_tenant = bool(partner.controls_tenant) and partner.controls_tenant == charger.tenant
+        if not (started_it or in_tenant):
+            continue
+        event_id = str(uuid.uuid4())
+        payload = {
+            "id": event_id,
+            "type": event_type,
+            "created_at": now.isoformat() + "Z",
+            "data": {
+                "transaction_ref": owner_txn.transaction_ref if started_it else None,
+                "transaction_id": session.transaction_id,
+                "charger_id": charger.charge_point_id,
+                "connector_id": session.connector_id,
+                "status": session.status,
+                "start_time": _iso(session.start_time),
+                "stop_time": _iso(session.stop_time),
+                "meter_start": session.meter_start,
+                "meter_stop": session.meter_stop,
+                "energy_kwh": round(float(session.energy_consumed or 0), 3),
+                "stop_reason": session.stop_reason,
+            },
+        }
+        db.add(WebhookOutbox(
+            partner_id=partner.id, event_id=event_id, event_type=event_type,
+            payload=json.dumps(payload, separators=(",", ":")), status="pending",
+            attempts=0, next_attempt_at=now, created_at=now,
+        ))
+        added += 1
+    return added
+
+
+# ─── Delivery ────────────────────────────────────────────────────────────────
+
+def claim_due(db, now: Optional[datetime] = None, limit: int = WEBHOOK_BATCH_SIZE) -> List[tuple]:
+    """Claim up to `limit` due rows and group them per partner.
+
+    Returns [(partner_id, url, secret, [(outbox_id, payload), ...]), ...].
+    Rows of partners whose webhook was removed meanwhile are dead-lettered."""
+    now = now or _utcnow()
+    ids = [
+        row_id for (row_id,) in db.query(WebhookOutbox.id)
+        .filter(WebhookOutbox.status == "pending", WebhookOutbox.next_attempt_at <= now)
+        .order_by(WebhookOutbox.next_attempt_at, WebhookOutbox.id)
+        .limit(limit)
+    ]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Guarded UPDATE: only rows still pending and due are taken, so a row
+    # another worker claimed in between is skipped rather than sent twice.
+    db.query(WebhookOutbox).filter(
+        WebhookOutbox.id.in_(ids),
+        WebhookOutbox.status == "pending",
+        WebhookOutbox.next_attempt_at <= now,
+    ).update({
+        WebhookOutbox.claim_token: token,
+        WebhookOutbox.next_attempt_at: now + timedelta(seconds=WEBHOOK_LEASE_SECONDS),
+    }, synchronize_session=False)
+    db.commit()
+
+    rows = (
+        db.query(WebhookOutbox.id, WebhookOutbox.partner_id, WebhookOutbox.payload,
+                 PartnerAPIKey.webhook_url, PartnerAPIKey.webhook_secret, PartnerAPIKey.active)
+        .join(PartnerAPIKey, PartnerAPIKey.id == WebhookOutbox.partner_id)
+        .filter(WebhookOutbox.claim_token == token)
+        .order_by(WebhookOutbox.id)
+        .all()
+    )
+    batches: Dict[int, tuple] = {}
+    disabled = []
+    for row_id, partner_id, payload, url, secret, active in rows:
+        if not (active and url and secret):
+            disabled.append(row_id)
+            continue
+        batches.setdefault(partner_id, (partner_id, url, secret, []))[3].append((row_id, payload))
+    if disabled:
+        db.query(WebhookOutbox).filter(WebhookOutbox.id.in_(disabled)).update({
+            WebhookOutbox.status: "dead",
+            WebhookOutbox.claim_token: None,
+            WebhookOutbox.last_error: "partner webhook disabled",
+        }, synchronize_session=False)
+        db.commit()
+    return list(batches.values())
+
+
+def record_results(db, delivered: Iterable[int], failed: Dict[int, str],
+                   now: Optional[datetime] = None) -> int:
+    """Mark delivered rows, schedule retries for failed ones (dead-letter at
+    WEBHOOK_MAX_ATTEMPTS). Returns the number dead-lettered."""
+    now = now or _utcnow()
+    delivered = list(delivered)
+    if delivered:
+        db.query(WebhookOutbox).filter(WebhookOutbox.id.in_(delivered)).update({
+            WebhookOutbox.status: "delivered",
+            WebhookOutbox.delivered_at: now,
+            WebhookOutbox.claim_token: None,
+            WebhookOutbox.last_error: None,
+        }, synchronize_session=False)
+    dead = 0
+    if failed:
+        for row in db.query(WebhookOutbox).filter(WebhookOutbox.id.in_(list(failed))):
+            row.attempts = (row.attempts or 0) + 1
+            row.last_error = failed[row.id][:500]
+            row.claim_token = None
+            if row.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                row.status = "dead"
+                dead += 1
+            else:
+                row.next_attempt_at = now + timedelta(seconds=backoff_delay(row.attempts))
+    db.commit()
+    return dead
+
+
+async def post_batch(client: httpx.AsyncClient, url: str, secret: str,
+                     payloads: List[str]) -> Optional[str]:
+    """POST one signed batch. Returns None on a 2xx, else the error text."""
+    body = ('{"events":[' + ",".join(payloads) + "]}").encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": "PlagSini-Webhooks/1.0",
+        SIGNATURE_HEADER: sign(secret, int(time.time()), body),
+    }
+    try:
+        resp = await client.post(url, content=body, headers=headers)
+    except httpx.HTTPError as e:
+        return f"{type(e).__name__}: {e}"
+    if 200 <= resp.status_code < 300:
+        return None
+    return f"HTTP {resp.status_code}: {resp.text[:200]}"
+
+
+async def deliver_once(client: httpx.AsyncClient) -> int:
+    """One claim → send → record pass. Returns rows claimed."""
+    batches = await run_db(claim_due)
+    if not batches:
+        return 0
+    errors = await asyncio.gather(*(
+        post_batch(client, url, secret, [payload for _, payload in rows])
+        for _, url, secret, rows in batches
+    ))
+    delivered: List[int] = []
+    failed: Dict[int, str] = {}
+    for (partner_id, _, _, rows), error in zip(batches, errors):
+        ids = [row_id for row_id, _ in rows]
+        if error is None:
+            delivered.extend(ids)
+        else:
+            logger.warning(f"[webhooks] partner {partner_id}: {len(ids)} events failed — {error}")
+            failed.update((row_id, error) for row_id in ids)
+    dead = await run_db(record_results, delivered, failed)
+    if dead:
+        logger.error(f"[webhooks] {dead} events dead-lettered after {WEBHOOK_MAX_ATTEMPTS} attempts")
+    return sum(len(rows) for *_, rows in batches)
+
+
+def make_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by all deliveries."""
+    return httpx.AsyncClient(
+        timeout=WEBHOOK_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        follow_redirects=False,
+    )
+
+
+async def webhook_delivery_worker(poll_seconds: float = WEBHOOK_POLL_SECONDS):
+    """Background loop (API process): drain the outbox. Woken early by
+    session events so deliveries do not wait for the next poll."""
+    wake = asyncio.Event()
+    sub = event_bus.subscribe(lambda _event: wake.set(), SessionStarted, SessionStopped,
+                              loop=asyncio.get_running_loop())
+    logger.info("Partner webhook delivery started")
+    try:
+        async with make_client() as client:
+            while True:
+                wake.clear()
+                claimed = 0
+                try:
+                    claimed = await deliver_once(client)
+                except Exception as e:
+                    logger.error(f"[webhooks] delivery pass failed: {e}", exc_info=True)
+                if claimed >= WEBHOOK_BATCH_SIZE:
+                    continue  # backlog — go again straight away
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        event_bus.unsubscribe(sub)